@@ -5,22 +5,41 @@ API endpoints для управления перераспределением 
 """
 
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from typing import Dict, Optional
 
 from config import Config
-from db_factory import get_database
+from db_factory import get_async_database, init_database, close_database
 from api.auth import validate_telegram_web_app_data
+from utils.diagnostics import bind_user
+from utils.user_context import UserContext, load_user_context
+from workers.cookie_import import shutdown_cookie_import_pipeline
+from workers.queue import shutdown_task_queue
+from wb_api.internal_client import probe_session
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown: общий адаптер БД процесса и подключение к очереди задач"""
+    init_database()
+    yield
+    # Импорты cookies, запущенные из API, живут в loop uvicorn
+    await shutdown_cookie_import_pipeline()
+    # Встроенную очередь могут читать воркеры в другом потоке - её не закрываем
+    await shutdown_task_queue(local=False)
+    close_database()
+
+
 # Создаём FastAPI приложение
 app = FastAPI(
     title="WB Redistribution API",
     description="API для управления перераспределением остатков WB",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS для Mini App
@@ -71,13 +90,41 @@ async def get_current_user(
             detail="Missing Telegram init data"
         )
 
-    return validate_telegram_web_app_data(x_telegram_init_data, Config.get_bot_token())
+    user = validate_telegram_web_app_data(x_telegram_init_data, Config.get_bot_token())
+    # Диагностика запроса привязана к пользователю (трассировка)
+    bind_user(user['user_id'])
+    return user
 
 
 # Dependency для БД
 def get_db():
-    """Возвращает экземпляр базы данных (SQLite или PostgreSQL)"""
-    return get_database()
+    """Возвращает асинхронный адаптер базы данных (SQLite или PostgreSQL)"""
+    return get_async_database()
+
+
+# Dependency для контекста пользователя (поставщики, токены, сессия)
+async def get_user_context(user: Dict = Depends(get_current_user)) -> UserContext:
+    """Контекст текущего пользователя из кэша или одним запросом к БД"""
+    return await load_user_context(get_async_database(), user['user_id'])
+
+
+async def get_live_session(ctx: UserContext) -> Optional[Dict]:
+    """
+    Активная браузерная сессия пользователя, если WB её ещё принимает.
+
+    Вызывается перед браузерной работой и постановкой задач в очередь:
+    сессия проверяется одним HTTP запросом (результат кэшируется). Мёртвая
+    сессия помечается expired и не возвращается; если проверить не удалось,
+    сессия возвращается как есть.
+    """
+    session = ctx.session
+    if not session or not session.get('cookies_encrypted'):
+        return session
+
+    if await probe_session(session['cookies_encrypted'], session['id']) is False:
+        await get_async_database().update_browser_session_status(session['id'], 'expired')
+        return None
+    return session
 
 
 @app.get("/")
@@ -111,7 +158,7 @@ async def health_check():
 
 
 # Подключаем роутеры
-from api.routes import suppliers, products, stocks, warehouses, requests, sessions
+from api.routes import suppliers, products, stocks, warehouses, requests, sessions, admin
 
 app.include_router(suppliers.router, prefix="/api", tags=["suppliers"])
 app.include_router(products.router, prefix="/api", tags=["products"])
@@ -119,6 +166,7 @@ app.include_router(stocks.router, prefix="/api", tags=["stocks"])
 app.include_router(warehouses.router, prefix="/api", tags=["warehouses"])
 app.include_router(requests.router, prefix="/api", tags=["requests"])
 app.include_router(sessions.router, prefix="/api", tags=["sessions"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,358 @@
+"""
+API для администраторов: состояние очереди, БД и авторизаций, диагностика, dead-letter очередь задач перемещения.
+
+Доступно только пользователям из ADMIN_IDS.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from api.main import get_current_user
+from config import Config
+from db_factory import get_async_database
+from utils.diagnostics import get_diagnostics
+from utils.session_cache import get_session_cache_stats
+from utils.session_state import get_session_state_stats
+from utils.user_context import get_user_context_stats
+from wb_api.internal_client import get_probe_stats
+from wb_api.profiles import get_profile_stats
+from workers.queue import get_task_queue
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Фоновые повторные запуски из dead-letter очереди (последние REPLAY_JOBS_KEEP)
+REPLAY_JOBS_KEEP = 50
+_replay_jobs: 'OrderedDict[str, Dict]' = OrderedDict()
+_replay_tasks: Set[asyncio.Task] = set()
+
+
+class DiagnosticsSettings(BaseModel):
+    """Уровень диагностики"""
+    level: str                           # off, sampled или full
+    sample_rate: Optional[float] = None  # Доля событий для sampled
+
+
+class ReplayRequest(BaseModel):
+    """Запрос на повторный запуск задач из dead-letter очереди"""
+    entry_ids: Optional[List[str]] = None  # Если не указаны - по фильтрам
+    user_id: Optional[int] = None
+    reason: Optional[str] = None
+    since: Optional[str] = None
+    all: bool = False  # Без entry_ids и фильтров - только явно вся очередь
+    rate_per_minute: int = 30
+
+
+async def get_admin_user(user: Dict = Depends(get_current_user)) -> Dict:
+    """Проверяет, что пользователь - администратор"""
+    if user['user_id'] not in Config.ADMIN_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return user
+
+
+async def get_connected_queue():
+    """Возвращает подключённую очередь задач"""
+    queue = await get_task_queue()
+    if not queue.is_connected:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Task queue is not available"
+        )
+    return queue
+
+
+@router.get("/admin/queue")
+async def get_queue_state(
+    pending_limit: int = Query(100, ge=1, le=1000),
+    admin: Dict = Depends(get_admin_user)
+):
+    """
+    Статистика очереди и задачи в обработке.
+
+    Для stream бэкенда включает lag consumer group и владельцев pending записей.
+    """
+    queue = await get_connected_queue()
+    return {
+        "stats": await queue.get_queue_stats(),
+        "tenants": await queue.get_tenant_stats(),
+        "pending_entries": await queue.get_pending_entries(pending_limit)
+    }
+
+
+@router.get("/admin/db")
+async def get_db_state(admin: Dict = Depends(get_admin_user)):
+    """Метрики пулов подключений к БД, потоков async адаптера и кэшей"""
+    executor = get_async_database().get_executor_stats()
+    caches = {"session_cache": get_session_cache_stats(),
+              "user_context": get_user_context_stats(),
+              "session_probe": get_probe_stats(),
+              "profiles": get_profile_stats()}
+    if not Config.DATABASE_URL:
+        return {"backend": "sqlite", "pools": [], "executor": executor, **caches}
+
+    from database_pg import get_pool_stats
+    return {"backend": "postgres", "pools": get_pool_stats(), "executor": executor, **caches}
+
+
+@router.get("/admin/retention")
+async def get_retention_state(admin: Dict = Depends(get_admin_user)):
+    """Метрики архивации заявок и очистки сессий"""
+    from db_retention import get_retention_job
+    return get_retention_job().get_stats()
+
+
+@router.get("/admin/session-refresh")
+async def get_session_refresh_state(admin: Dict = Depends(get_admin_user)):
+    """Метрики фонового обновления cookies сессий, снимков storage state и импорта cookies"""
+    from workers.cookie_import import get_cookie_import_stats
+    from workers.session_refresh import get_session_refresh_job
+    return {
+        **get_session_refresh_job().get_stats(),
+        "storage_state": get_session_state_stats(),
+        "cookie_import": get_cookie_import_stats(),
+    }
+
+
+@router.get("/admin/auth")
+async def get_auth_state(admin: Dict = Depends(get_admin_user)):
+    """Слоты SMS авторизации: занятые, очередь, память страниц, время создания контекстов"""
+    from browser.auth import get_auth_service
+    from browser.browser_service import get_context_stats
+    return {**get_auth_service().get_slot_stats(), "browser": get_context_stats()}
+
+
+@router.get("/admin/diagnostics")
+async def get_diagnostics_state(
+    user_id: Optional[int] = Query(None),
+    admin: Dict = Depends(get_admin_user)
+):
+    """Уровень диагностики, трассировки и артефакты в буфере (новые первыми)"""
+    diagnostics = get_diagnostics()
+    return {**diagnostics.get_stats(), "items": diagnostics.list_artifacts(user_id)}
+
+
+@router.put("/admin/diagnostics")
+async def set_diagnostics_level(
+    settings: DiagnosticsSettings,
+    admin: Dict = Depends(get_admin_user)
+):
+    """Сменить уровень диагностики (до перезапуска процесса)"""
+    diagnostics = get_diagnostics()
+    try:
+        diagnostics.set_level(settings.level, settings.sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    logger.info(f"Admin {admin['user_id']} set diagnostics level to {diagnostics.level}")
+    return diagnostics.get_stats()
+
+
+@router.post("/admin/diagnostics/trace/{user_id}")
+async def start_user_trace(
+    user_id: int,
+    minutes: Optional[float] = Query(None, gt=0, le=24 * 60),
+    admin: Dict = Depends(get_admin_user)
+):
+    """Включить полную диагностику для пользователя на время"""
+    seconds = get_diagnostics().start_trace(user_id, minutes)
+    return {"user_id": user_id, "expires_in": round(seconds)}
+
+
+@router.delete("/admin/diagnostics/trace/{user_id}")
+async def stop_user_trace(
+    user_id: int,
+    admin: Dict = Depends(get_admin_user)
+):
+    """Выключить трассировку пользователя"""
+    return {"user_id": user_id, "stopped": get_diagnostics().stop_trace(user_id)}
+
+
+@router.get("/admin/diagnostics/{artifact_id}")
+async def get_diagnostics_artifact(
+    artifact_id: int,
+    admin: Dict = Depends(get_admin_user)
+):
+    """Получить артефакт диагностики (скриншот)"""
+    artifact = get_diagnostics().get_artifact(artifact_id)
+
+    if not artifact:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Artifact not found"
+        )
+
+    return Response(content=artifact.content, media_type=artifact.media_type)
+
+
+@router.get("/admin/dlq")
+async def list_dead_letters(
+    user_id: Optional[int] = Query(None),
+    reason: Optional[str] = Query(None),
+    since: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    admin: Dict = Depends(get_admin_user)
+):
+    """
+    Получить записи dead-letter очереди.
+
+    Query params:
+    - user_id: фильтр по пользователю
+    - reason: подстрока причины ошибки
+    - since: упавшие не раньше (ISO)
+    """
+    queue = await get_connected_queue()
+    items = await queue.get_dead_letters(
+        user_id=user_id, reason=reason, since=since, limit=limit
+    )
+    return {"items": items, "count": len(items)}
+
+
+@router.get("/admin/dlq/{entry_id}/screenshot")
+async def get_dead_letter_screenshot(
+    entry_id: str,
+    admin: Dict = Depends(get_admin_user)
+):
+    """Получить последний скриншот упавшей задачи"""
+    queue = await get_connected_queue()
+
+    item = await queue.get_dead_letter(entry_id)
+    screenshot = await queue.get_dead_letter_screenshot(item['screenshot_ref']) if item else None
+
+    if not screenshot:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Screenshot not found"
+        )
+
+    return Response(content=screenshot, media_type="image/png")
+
+
+async def _run_replay(job: Dict, queue, entry_ids: List[str], rate_per_minute: Optional[int]) -> None:
+    """Повторный запуск в фоне с обновлением прогресса задачи"""
+    def on_progress(processed: int, replayed: int, skipped: int) -> None:
+        job['processed'] = processed
+        job['replayed'] = replayed
+        job['skipped'] = skipped
+
+    try:
+        await queue.replay_dead_letters(entry_ids, rate_per_minute=rate_per_minute, on_progress=on_progress)
+        job['status'] = 'done'
+    except asyncio.CancelledError:
+        job['status'] = 'cancelled'
+        raise
+    except Exception as e:
+        logger.error(f"Dead-letter replay {job['job_id']} failed: {e}", exc_info=True)
+        job['status'] = 'failed'
+        job['error'] = str(e)
+    finally:
+        job['finished_at'] = datetime.now().isoformat()
+        logger.info(
+            f"Dead-letter replay {job['job_id']}: {job['status']}, "
+            f"{job['replayed']}/{job['requested']} replayed, {job['skipped']} skipped"
+        )
+
+
+@router.post("/admin/dlq/replay", status_code=status.HTTP_202_ACCEPTED)
+async def replay_dead_letters(
+    request: ReplayRequest,
+    admin: Dict = Depends(get_admin_user)
+):
+    """
+    Повторно поставить задачи из dead-letter очереди.
+
+    Задачи ставятся в очередь в фоне не быстрее rate_per_minute (300 записей
+    при 30/мин - 10 минут), дальше действуют лимиты планировщика по
+    аккаунтам. Ответ возвращается сразу, прогресс -
+    GET /admin/dlq/replay/{job_id}.
+
+    Нужны entry_ids, хотя бы один фильтр или all=true - пустой запрос
+    не запускает всю очередь.
+    """
+    has_filters = any(value is not None for value in (request.user_id, request.reason, request.since))
+    if not request.entry_ids and not has_filters and not request.all:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Specify entry_ids, a filter (user_id, reason, since) or all=true"
+        )
+
+    queue = await get_connected_queue()
+
+    entry_ids = request.entry_ids
+    if not entry_ids:
+        items = await queue.get_dead_letters(
+            user_id=request.user_id,
+            reason=request.reason,
+            since=request.since,
+            limit=queue.DLQ_MAXLEN
+        )
+        entry_ids = [item['entry_id'] for item in reversed(items)]  # Старые первыми
+
+    logger.info(f"Admin {admin['user_id']} replaying {len(entry_ids)} dead-letter entries")
+
+    job = {
+        'job_id': uuid.uuid4().hex[:12],
+        'status': 'running',
+        'requested': len(entry_ids),
+        'processed': 0,
+        'replayed': 0,
+        'skipped': 0,  # Нет активной сессии пользователя - запись осталась в DLQ
+        'rate_per_minute': request.rate_per_minute or None,
+        'admin_id': admin['user_id'],
+        'started_at': datetime.now().isoformat(),
+        'finished_at': None,
+        'error': None,
+    }
+    _replay_jobs[job['job_id']] = job
+    while len(_replay_jobs) > REPLAY_JOBS_KEEP:
+        _replay_jobs.popitem(last=False)
+
+    task = asyncio.create_task(_run_replay(job, queue, entry_ids, job['rate_per_minute']))
+    _replay_tasks.add(task)
+    task.add_done_callback(_replay_tasks.discard)
+
+    return job
+
+
+@router.get("/admin/dlq/replay/{job_id}")
+async def get_replay_job(
+    job_id: str,
+    admin: Dict = Depends(get_admin_user)
+):
+    """Прогресс повторного запуска: status running/done/failed, processed/replayed/skipped из requested"""
+    job = _replay_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Replay job not found"
+        )
+    return job
+
+
+@router.delete("/admin/dlq/{entry_id}")
+async def purge_dead_letter(
+    entry_id: str,
+    admin: Dict = Depends(get_admin_user)
+):
+    """Удалить запись из dead-letter очереди"""
+    queue = await get_connected_queue()
+    purged = await queue.purge_dead_letters([entry_id])
+
+    if not purged:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Entry not found"
+        )
+
+    return {"message": "Entry deleted"}
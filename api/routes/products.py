@@ -6,34 +6,33 @@ API для поиска товаров WB по артикулу.
 """
 
 import logging
-import json
 import aiohttp
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Dict, Optional, List
 
-from database import Database
-from api.main import get_current_user, get_db
-from utils.encryption import decrypt_token
+from api.main import get_live_session, get_user_context
+from utils.session_cache import get_session_cookies
+from utils.user_context import UserContext
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-async def get_warehouse_remains_via_api(cookies_encrypted: str) -> List[Dict]:
+async def get_warehouse_remains_via_api(cookies_encrypted: str, session_id: int = None) -> List[Dict]:
     """
     Получает остатки товаров через внутренний API WB.
 
     Args:
         cookies_encrypted: Зашифрованные cookies из browser_session
+        session_id: ID сессии (ключ кэша расшифрованных cookies)
 
     Returns:
         Список товаров с остатками по складам
     """
-    # Расшифровываем cookies
+    # Расшифрованные cookies (из кэша сессий)
     try:
-        cookies_json = decrypt_token(cookies_encrypted)
-        cookies_list = json.loads(cookies_json)
+        cookies_list = get_session_cookies(cookies_encrypted, session_id)
 
         # Преобразуем в словарь для aiohttp
         # Фильтруем только cookies для seller.wildberries.ru
@@ -208,8 +207,7 @@ def extract_warehouse_stocks(item: Dict) -> List[Dict]:
 async def search_product(
     q: str = Query(..., min_length=1, description="Артикул WB (nmId)"),
     supplier_id: Optional[int] = Query(None, description="ID поставщика"),
-    user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    ctx: UserContext = Depends(get_user_context)
 ):
     """
     Поиск товара по артикулу WB (nmId).
@@ -217,10 +215,8 @@ async def search_product(
     Использует внутренний API WB через сохраненные cookies браузерной сессии.
     Возвращает информацию о товаре и остатки по складам.
     """
-    user_id = user['user_id']
-
-    # Получаем браузерную сессию с cookies
-    session = db.get_browser_session(user_id)
+    # Браузерная сессия с cookies из контекста пользователя
+    session = ctx.session
     if not session:
         raise HTTPException(
             status_code=401,
@@ -250,11 +246,21 @@ async def search_product(
             "message": "Введите числовой артикул WB (nmId)"
         }
 
+    # Мёртвую сессию отсекаем до запросов к API и запуска браузера
+    if await get_live_session(ctx) is None:
+        raise HTTPException(
+            status_code=401,
+            detail={
+                "error": "session_expired",
+                "message": "Сессия WB истекла. Пройдите повторную авторизацию через /auth"
+            }
+        )
+
     logger.info(f"Searching for product: {nm_id}")
 
     try:
         # Сначала пробуем через HTTP API
-        remains = await get_warehouse_remains_via_api(cookies_encrypted)
+        remains = await get_warehouse_remains_via_api(cookies_encrypted, session['id'])
 
         # Если HTTP не сработал, пробуем через Playwright (перехват API из модалки)
         if not remains:
@@ -266,7 +272,9 @@ async def search_product(
                 # Используем поиск через модальное окно "Перераспределить остатки"
                 # Передаём только первые 3-4 цифры артикула для автокомплита
                 search_query = str(nm_id)[:4] if len(str(nm_id)) > 3 else str(nm_id)
-                remains = await service.search_product_via_modal(cookies_encrypted, query=search_query)
+                remains = await service.search_product_via_modal(
+                    cookies_encrypted, query=search_query, session_id=session['id']
+                )
                 if remains:
                     logger.info(f"Got {len(remains)} items via Playwright modal search")
             except Exception as e:
@@ -5,23 +5,28 @@ CRUD операции над redistribution_requests.
 """
 
 import logging
+import uuid
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 
 logger = logging.getLogger(__name__)
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
-from database import Database
+from db_async import AsyncDatabase
 from wb_api.client import WBApiClient
 from wb_api.supplies import SuppliesAPI, CargoType
-from api.main import get_current_user, get_db
-from utils.encryption import decrypt_token
+from api.main import get_current_user, get_db, get_live_session, get_user_context
+from utils.user_context import UserContext
+from workers.queue import Task, get_task_queue, has_consumers
 
 
 router = APIRouter()
 
+# Максимум строк в одном запросе /requests/bulk
+BULK_MAX_ITEMS = 200
+
 
 class RequestCreate(BaseModel):
     """Модель для создания заявки"""
@@ -32,7 +37,30 @@ class RequestCreate(BaseModel):
     source_warehouse_name: str
     target_warehouse_id: int
     target_warehouse_name: str
-    quantity: int
+    quantity: int = Field(gt=0)
+
+    @model_validator(mode='after')
+    def check_warehouses(self) -> 'RequestCreate':
+        if self.source_warehouse_id == self.target_warehouse_id:
+            raise ValueError("Source and target warehouses are the same")
+        return self
+
+
+class BulkRequestCreate(BaseModel):
+    """Модель для создания нескольких заявок"""
+    # Строки валидируются по одной (RequestCreate), чтобы ошибка
+    # в одной строке не отклоняла весь запрос
+    items: List[Dict[str, Any]]
+    execute: bool = True  # Сразу поставить в очередь воркеров
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    """Краткое описание ошибок валидации строки bulk-запроса"""
+    parts = []
+    for err in error.errors():
+        loc = ".".join(str(part) for part in err.get("loc", ()))
+        parts.append(f"{loc}: {err['msg']}" if loc else err["msg"])
+    return "; ".join(parts)
 
 
 class RequestUpdate(BaseModel):
@@ -63,7 +91,7 @@ class RequestResponse(BaseModel):
 async def get_requests(
     status_filter: Optional[str] = Query(None, alias="status"),
     user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
     Получить заявки пользователя.
@@ -72,15 +100,15 @@ async def get_requests(
     - status: pending, searching, completed, cancelled
     """
     user_id = user['user_id']
-    requests = db.get_redistribution_requests(user_id, status_filter)
+    requests = await db.get_redistribution_requests(user_id, status_filter)
     return requests
 
 
 @router.post("/requests", status_code=status.HTTP_201_CREATED)
 async def create_request(
     request: RequestCreate,
-    user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    ctx: UserContext = Depends(get_user_context),
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
     Создать заявку на перемещение.
@@ -88,18 +116,17 @@ async def create_request(
     После создания заявка переходит в статус 'pending'
     и бот начинает искать доступные слоты.
     """
-    user_id = user['user_id']
+    user_id = ctx.user_id
 
     # Проверяем поставщика
-    supplier = db.get_supplier(request.supplier_id)
-    if not supplier or supplier['user_id'] != user_id:
+    if not ctx.get_supplier(request.supplier_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Supplier not found"
         )
 
     # Создаём заявку
-    request_id = db.add_redistribution_request(
+    request_id = await db.add_redistribution_request(
         user_id=user_id,
         supplier_id=request.supplier_id,
         nm_id=request.nm_id,
@@ -120,16 +147,93 @@ async def create_request(
     }
 
 
+@router.post("/requests/bulk", status_code=status.HTTP_201_CREATED)
+async def create_requests_bulk(
+    bulk: BulkRequestCreate,
+    ctx: UserContext = Depends(get_user_context),
+    db: AsyncDatabase = Depends(get_db)
+):
+    """
+    Создать несколько заявок за один запрос.
+
+    Корректные строки сохраняются одной транзакцией и (если execute=true
+    и есть активная браузерная сессия) ставятся в очередь воркеров одной
+    пачкой. Ошибки возвращаются по каждой строке отдельно.
+    """
+    user_id = ctx.user_id
+
+    if len(bulk.items) > BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many items (max {BULK_MAX_ITEMS})"
+        )
+
+    results = [{"index": i, "id": None, "task_id": None, "error": None}
+               for i in range(len(bulk.items))]
+    valid = []
+    for result, raw in zip(results, bulk.items):
+        try:
+            item = RequestCreate.model_validate(raw)
+        except ValidationError as e:
+            result["error"] = _format_validation_error(e)
+            continue
+        if not ctx.get_supplier(item.supplier_id):
+            result["error"] = "Supplier not found"
+        else:
+            valid.append((result, item))
+
+    request_ids = await db.add_redistribution_requests(
+        user_id, [item.dict() for _, item in valid]
+    )
+    for (result, _), request_id in zip(valid, request_ids):
+        result["id"] = request_id
+
+    queued = 0
+    session = (
+        await get_live_session(ctx)
+        if bulk.execute and valid and has_consumers() else None
+    )
+    if session:
+        tasks = [
+            Task(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                session_id=session['id'],
+                request_id=result["id"],
+                nm_id=item.nm_id,
+                source_warehouse_id=item.source_warehouse_id,
+                target_warehouse_id=item.target_warehouse_id,
+                quantity=item.quantity
+            )
+            for result, item in valid
+        ]
+        queue = await get_task_queue()
+        if await queue.add_tasks(tasks):
+            await db.update_redistribution_requests_status(request_ids, 'searching')
+            for (result, _), task in zip(valid, tasks):
+                result["task_id"] = task.id
+            queued = len(tasks)
+        else:
+            logger.warning(f"Failed to queue {len(tasks)} bulk requests of user {user_id}")
+
+    return {
+        "created": len(request_ids),
+        "queued": queued,
+        "failed": len(results) - len(request_ids),
+        "items": results
+    }
+
+
 @router.get("/requests/{request_id}", response_model=RequestResponse)
 async def get_request(
     request_id: int,
     user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Получить заявку по ID"""
     user_id = user['user_id']
 
-    request = db.get_redistribution_request(request_id)
+    request = await db.get_redistribution_request(request_id)
     if not request or request['user_id'] != user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -144,7 +248,7 @@ async def update_request(
     request_id: int,
     request_update: RequestUpdate,
     user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
     Обновить заявку.
@@ -156,7 +260,7 @@ async def update_request(
     user_id = user['user_id']
 
     # Проверяем заявку
-    request = db.get_redistribution_request(request_id)
+    request = await db.get_redistribution_request(request_id)
     if not request or request['user_id'] != user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -170,7 +274,7 @@ async def update_request(
     if updates.get('status') in ('completed', 'cancelled'):
         updates['completed_at'] = datetime.now().isoformat()
 
-    success = db.update_redistribution_request(request_id, **updates)
+    success = await db.update_redistribution_request(request_id, **updates)
 
     if not success:
         raise HTTPException(
@@ -184,14 +288,14 @@ async def update_request(
 @router.delete("/requests/{request_id}")
 async def delete_request(
     request_id: int,
-    user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    ctx: UserContext = Depends(get_user_context),
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Удалить заявку"""
-    user_id = user['user_id']
+    user_id = ctx.user_id
 
     # Проверяем заявку
-    request = db.get_redistribution_request(request_id)
+    request = await db.get_redistribution_request(request_id)
     if not request or request['user_id'] != user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -201,9 +305,7 @@ async def delete_request(
     # Если есть supply_id - отменяем поставку
     if request.get('supply_id'):
         try:
-            supplier = db.get_supplier(request['supplier_id'])
-            token = db.get_wb_token(user_id, supplier['token_id'])
-            decrypted_token = decrypt_token(token['encrypted_token'])
+            decrypted_token = ctx.get_token(ctx.get_supplier(request['supplier_id']))
 
             async with WBApiClient(decrypted_token) as client:
                 api = SuppliesAPI(client)
@@ -213,7 +315,7 @@ async def delete_request(
             logger.error(f"Failed to cancel supply: {e}")
 
     # Удаляем заявку
-    success = db.delete_redistribution_request(request_id)
+    success = await db.delete_redistribution_request(request_id)
 
     if not success:
         raise HTTPException(
@@ -227,18 +329,21 @@ async def delete_request(
 @router.post("/requests/{request_id}/execute")
 async def execute_request(
     request_id: int,
-    user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    ctx: UserContext = Depends(get_user_context),
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
-    Выполнить заявку - создать поставку WB.
+    Выполнить заявку.
 
-    Создаёт реальную поставку через WB API.
+    Если у пользователя есть активная браузерная сессия и очередь читают
+    воркеры (в этом процессе или через общий Redis), заявка ставится в
+    очередь и ответ возвращается сразу (статус 'searching'). Иначе создаёт
+    поставку через WB API в рамках запроса.
     """
-    user_id = user['user_id']
+    user_id = ctx.user_id
 
     # Получаем заявку
-    request = db.get_redistribution_request(request_id)
+    request = await db.get_redistribution_request(request_id)
     if not request or request['user_id'] != user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -251,19 +356,41 @@ async def execute_request(
             detail="Request is not in pending status"
         )
 
-    # Получаем токен
-    supplier = db.get_supplier(request['supplier_id'])
-    token = db.get_wb_token(user_id, supplier['token_id'])
-
-    if not token:
+    # Выполнение через очередь воркеров (браузер), если сессия жива и
+    # очередь кто-то читает (uvicorn без run.py воркеров не запускает)
+    session = await get_live_session(ctx) if has_consumers() else None
+    if session:
+        queue = await get_task_queue()
+        task = Task(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            session_id=session['id'],
+            request_id=request_id,
+            nm_id=request['nm_id'],
+            source_warehouse_id=request['source_warehouse_id'],
+            target_warehouse_id=request['target_warehouse_id'],
+            quantity=request['quantity']
+        )
+        if await queue.add_task(task):
+            await db.update_redistribution_request(request_id, status='searching')
+            return {
+                "success": True,
+                "queued": True,
+                "task_id": task.id,
+                "message": "Request queued"
+            }
+        logger.warning(f"Failed to queue request {request_id}, executing inline")
+
+    # Получаем расшифрованный токен поставщика
+    supplier = ctx.get_supplier(request['supplier_id'])
+    decrypted_token = ctx.get_token(supplier) if supplier else None
+
+    if not decrypted_token:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Token not found"
         )
 
-    # Расшифровываем токен
-    decrypted_token = decrypt_token(token['encrypted_token'])
-
     try:
         # Создаём поставку
         async with WBApiClient(decrypted_token) as client:
@@ -278,7 +405,7 @@ async def execute_request(
 
             if result.success:
                 # Обновляем заявку
-                db.update_redistribution_request(
+                await db.update_redistribution_request(
                     request_id,
                     status='completed',
                     supply_id=result.supply_id,
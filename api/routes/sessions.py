@@ -5,14 +5,14 @@ API endpoints для управления сессиями WB.
 """
 
 import logging
-import json
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 
-from database import Database
-from api.main import get_current_user, get_db
-from utils.encryption import encrypt_token
+from db_async import AsyncDatabase
+from api.main import get_current_user, get_db, get_live_session, get_user_context
+from utils.user_context import UserContext
+from workers.cookie_import import get_cookie_import_job, get_cookie_import_pipeline, normalize_cookies
 
 logger = logging.getLogger(__name__)
 
@@ -37,11 +37,10 @@ class ImportCookiesRequest(BaseModel):
     cookies: List[CookieItem]
 
 
-@router.post("/sessions/import-cookies")
+@router.post("/sessions/import-cookies", status_code=202)
 async def import_cookies_from_browser(
     request: ImportCookiesRequest,
-    user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    user: Dict = Depends(get_current_user)
 ):
     """
     Импорт cookies из браузера для обновления сессии.
@@ -55,107 +54,67 @@ async def import_cookies_from_browser(
     3. Используйте расширение Cookie-Editor для экспорта cookies
     4. Отправьте cookies в этот endpoint
 
+    Cookies проверяются и сохраняются в фоне (workers.cookie_import) -
+    ответ возвращается сразу, результат - GET /sessions/import-cookies/{job_id}.
+
     Returns:
-        Информация об обновлённой сессии
+        Задача импорта (status: queued)
     """
     user_id = user['user_id']
 
-    try:
-        # Фильтруем только wildberries cookies
-        wb_cookies = []
-        for cookie in request.cookies:
-            if 'wildberries' in cookie.domain.lower():
-                # Валидируем sameSite - Playwright требует строго Strict|Lax|None
-                same_site = cookie.sameSite
-                if same_site not in ['Strict', 'Lax', 'None']:
-                    same_site = 'Lax'  # По умолчанию
-
-                # Cookie-Editor использует expirationDate вместо expires
-                expires_value = cookie.expires if cookie.expires else cookie.expirationDate
-                if expires_value is None:
-                    expires_value = -1
-
-                # Преобразуем в формат Playwright
-                wb_cookies.append({
-                    'name': cookie.name,
-                    'value': cookie.value,
-                    'domain': cookie.domain,
-                    'path': cookie.path,
-                    'expires': expires_value,
-                    'httpOnly': cookie.httpOnly if cookie.httpOnly is not None else False,
-                    'secure': cookie.secure if cookie.secure is not None else False,
-                    'sameSite': same_site
-                })
-
-        if not wb_cookies:
-            raise HTTPException(
-                status_code=400,
-                detail="No Wildberries cookies found. Make sure you're logged in to seller.wildberries.ru"
-            )
-
-        logger.info(f"Importing {len(wb_cookies)} Wildberries cookies for user {user_id}")
-
-        # Проверяем наличие важных cookies
-        important_cookies = ['WILDAUTHNEW_V3', 'WBToken', 'x-supplier-id']
-        found_cookies = [c['name'] for c in wb_cookies]
-        missing = [c for c in important_cookies if c not in found_cookies]
-
-        if missing:
-            logger.warning(f"Missing important cookies: {missing}")
-
-        # Сериализуем и шифруем
-        cookies_json = json.dumps(wb_cookies)
-        cookies_encrypted = encrypt_token(cookies_json)
-
-        # Сохраняем cookies в БД
-        # Сначала деактивируем старые сессии
-        db.invalidate_browser_session(user_id)
-        # Затем создаём новую сессию
-        db.add_browser_session(
-            user_id=user_id,
-            phone="",  # Телефон не требуется при импорте cookies
-            cookies_encrypted=cookies_encrypted,
-            supplier_name=None,
-            expires_days=7  # Ставим 7 дней как у WB
+    wb_cookies = normalize_cookies([cookie.dict() for cookie in request.cookies])
+    if not wb_cookies:
+        raise HTTPException(
+            status_code=400,
+            detail="No Wildberries cookies found. Make sure you're logged in to seller.wildberries.ru"
         )
-        logger.info(f"Imported browser session for user {user_id}")
 
-        return {
-            "success": True,
-            "message": f"Successfully imported {len(wb_cookies)} cookies",
-            "cookies_count": len(wb_cookies),
-            "important_cookies_found": [c for c in important_cookies if c in found_cookies],
-            "expires_days": 7
-        }
+    job = get_cookie_import_pipeline().submit(user_id, wb_cookies)
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error importing cookies: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to import cookies: {str(e)}"
-        )
+    return {
+        "success": True,
+        "message": f"Importing {len(wb_cookies)} cookies",
+        **job.to_dict()
+    }
+
+
+@router.get("/sessions/import-cookies/{job_id}")
+async def get_cookie_import_status(
+    job_id: str,
+    user: Dict = Depends(get_current_user)
+):
+    """
+    Состояние импорта cookies.
+
+    Returns:
+        Задача импорта: status queued/checking/saving/profiles - в работе,
+        done/expired/failed - завершена
+    """
+    job = get_cookie_import_job(job_id, user['user_id'])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
 
 
 @router.post("/sessions/refresh")
 async def refresh_session(
-    user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    ctx: UserContext = Depends(get_user_context),
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
     Попытка обновить существующую сессию без SMS.
 
-    Открывает главную страницу WB с текущими cookies.
-    Если сессия ещё валидна, обновляет cookies.
+    Сначала проверяет сессию одним HTTP запросом: мёртвая сессия сразу
+    помечается expired. Живую открывает в браузере на главной странице WB
+    и сохраняет обновлённые cookies.
 
     Returns:
         Результат попытки обновления
     """
-    user_id = user['user_id']
+    user_id = ctx.user_id
 
-    # Получаем текущую сессию
-    session = db.get_browser_session(user_id)
+    # Текущая сессия из контекста пользователя
+    session = ctx.session
     if not session:
         raise HTTPException(
             status_code=404,
@@ -169,24 +128,37 @@ async def refresh_session(
             detail="No cookies in session. Please authenticate first."
         )
 
+    # Мёртвую сессию браузер не оживит - не запускаем его
+    if await get_live_session(ctx) is None:
+        logger.warning(f"Session refresh skipped for user {user_id} - session expired (HTTP probe)")
+        return {
+            "success": False,
+            "message": "Session expired. Please re-authenticate with SMS or import cookies from browser.",
+            "requires_reauth": True
+        }
+
     try:
         from browser.redistribution import WBRedistributionService
 
         service = WBRedistributionService()
-        new_cookies_encrypted = await service.refresh_session(cookies_encrypted)
+        new_cookies_encrypted = await service.refresh_session(cookies_encrypted, session['id'])
 
         if new_cookies_encrypted:
             # Обновляем сессию с новыми cookies
             # Деактивируем старые сессии
-            db.invalidate_browser_session(user_id)
+            await db.invalidate_browser_session(user_id)
             # Создаём новую с обновлёнными cookies
-            db.add_browser_session(
+            new_session_id = await db.add_browser_session(
                 user_id=user_id,
                 phone="",
                 cookies_encrypted=new_cookies_encrypted,
                 supplier_name=None,
                 expires_days=7
             )
+            # Снимок storage state переходит к новой сессии
+            state_encrypted = await db.get_browser_session_state(session['id'])
+            if state_encrypted:
+                await db.save_browser_session_state(new_session_id, state_encrypted)
 
             logger.info(f"Session refreshed successfully for user {user_id}")
             return {
@@ -3,13 +3,11 @@ API для получения остатков товаров на склада
 """
 
 from fastapi import APIRouter, Depends, HTTPException
-from typing import Dict
 
-from database import Database
 from wb_api.client import WBApiClient
 from wb_api.stocks import StocksAPI
-from api.main import get_current_user, get_db
-from utils.encryption import decrypt_token
+from api.main import get_user_context
+from utils.user_context import UserContext
 
 
 router = APIRouter()
@@ -19,8 +17,7 @@ router = APIRouter()
 async def get_stocks_by_nm_id(
     nm_id: int,
     supplier_id: int,
-    user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    ctx: UserContext = Depends(get_user_context)
 ):
     """
     Получить остатки товара по складам.
@@ -32,20 +29,15 @@ async def get_stocks_by_nm_id(
     Returns:
         Список остатков по складам
     """
-    user_id = user['user_id']
-
-    # Получаем поставщика и токен
-    supplier = db.get_supplier(supplier_id)
-    if not supplier or supplier['user_id'] != user_id:
+    # Поставщик и расшифрованный токен из контекста пользователя
+    supplier = ctx.get_supplier(supplier_id)
+    if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
 
-    token = db.get_wb_token(user_id, supplier['token_id'])
-    if not token:
+    decrypted_token = ctx.get_token(supplier)
+    if not decrypted_token:
         raise HTTPException(status_code=404, detail="Token not found")
 
-    # Расшифровываем токен
-    decrypted_token = decrypt_token(token['encrypted_token'])
-
     try:
         async with WBApiClient(decrypted_token) as client:
             api = StocksAPI(client)
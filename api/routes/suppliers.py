@@ -7,7 +7,7 @@ from pydantic import BaseModel
 from typing import List, Dict, Any
 from datetime import datetime
 
-from database import Database
+from db_async import AsyncDatabase
 from api.main import get_current_user, get_db
 from config import Config
 
@@ -38,7 +38,7 @@ class SupplierResponse(BaseModel):
 @router.get("/suppliers", response_model=List[SupplierResponse])
 async def get_suppliers(
     user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
     Получить список поставщиков пользователя.
@@ -62,7 +62,7 @@ async def get_suppliers(
     if is_admin:
         logger.info(f"[GET /suppliers] ADMIN user detected: {user_id}")
 
-    suppliers = db.get_suppliers(user_id)
+    suppliers = await db.get_suppliers(user_id)
     logger.info(f"[GET /suppliers] Existing suppliers: {len(suppliers)}")
 
     # АДМИНСКИЙ РЕЖИМ: создаем моковые suppliers для тестирования
@@ -70,7 +70,7 @@ async def get_suppliers(
         logger.info(f"[GET /suppliers] Creating MOCK suppliers for admin")
         try:
             # Создаем фейковый токен
-            token_id = db.add_wb_token(
+            token_id = await db.add_wb_token(
                 user_id=user_id,
                 encrypted_token="admin_mock_session",
                 name="Admin DEMO Token"
@@ -85,7 +85,7 @@ async def get_suppliers(
             ]
 
             for i, supplier_name in enumerate(mock_suppliers):
-                supplier_id = db.add_supplier(
+                supplier_id = await db.add_supplier(
                     user_id=user_id,
                     name=supplier_name,
                     token_id=token_id,
@@ -94,7 +94,7 @@ async def get_suppliers(
                 logger.info(f"[GET /suppliers] Created admin supplier_id={supplier_id}: {supplier_name}")
 
             # Перезагружаем suppliers
-            suppliers = db.get_suppliers(user_id)
+            suppliers = await db.get_suppliers(user_id)
             logger.info(f"[GET /suppliers] Created {len(suppliers)} MOCK suppliers for admin")
 
         except Exception as e:
@@ -103,7 +103,7 @@ async def get_suppliers(
     # Fallback для старых browser_sessions (миграция)
     # Если suppliers пуст, но есть активная browser_session - создаем supplier
     if not suppliers and not is_admin:
-        sessions = db.get_browser_sessions(user_id, active_only=True)
+        sessions = await db.get_browser_sessions(user_id, active_only=True)
         logger.info(f"[GET /suppliers] Active browser_sessions: {len(sessions) if sessions else 0}")
         if sessions:
             # Берем первую активную сессию
@@ -113,7 +113,7 @@ async def get_suppliers(
 
             try:
                 # Создаем фейковый токен для browser-based авторизации
-                token_id = db.add_wb_token(
+                token_id = await db.add_wb_token(
                     user_id=user_id,
                     encrypted_token="browser_session",
                     name=f"Browser Session ({session['phone'][-4:]})"
@@ -121,7 +121,7 @@ async def get_suppliers(
                 logger.info(f"[GET /suppliers] Created token_id={token_id}")
 
                 # Создаем supplier
-                supplier_id = db.add_supplier(
+                supplier_id = await db.add_supplier(
                     user_id=user_id,
                     name=supplier_name,
                     token_id=token_id,
@@ -130,7 +130,7 @@ async def get_suppliers(
                 logger.info(f"[GET /suppliers] Created supplier_id={supplier_id}")
 
                 # Перезагружаем список suppliers
-                suppliers = db.get_suppliers(user_id)
+                suppliers = await db.get_suppliers(user_id)
                 logger.info(f"[GET /suppliers] After creation: {len(suppliers)} suppliers")
             except Exception as e:
                 logger.error(f"[GET /suppliers] Error creating supplier: {e}", exc_info=True)
@@ -146,7 +146,7 @@ async def get_suppliers(
 async def create_supplier(
     supplier: SupplierCreate,
     user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
     Создать нового поставщика.
@@ -156,14 +156,14 @@ async def create_supplier(
     user_id = user['user_id']
 
     # Проверяем что токен принадлежит пользователю
-    token = db.get_wb_token(user_id, supplier.token_id)
+    token = await db.get_wb_token(user_id, supplier.token_id)
     if not token:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Token not found"
         )
 
-    supplier_id = db.add_supplier(
+    supplier_id = await db.add_supplier(
         user_id=user_id,
         name=supplier.name,
         token_id=supplier.token_id,
@@ -177,18 +177,18 @@ async def create_supplier(
 async def delete_supplier(
     supplier_id: int,
     user: Dict = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Удалить поставщика"""
     # Проверяем что поставщик принадлежит пользователю
-    supplier = db.get_supplier(supplier_id)
+    supplier = await db.get_supplier(supplier_id)
     if not supplier or supplier['user_id'] != user['user_id']:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Supplier not found"
         )
 
-    success = db.delete_supplier(supplier_id)
+    success = await db.delete_supplier(supplier_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -7,6 +7,7 @@ WB Redistribution Bot - Бот для перераспределения ост
 """
 
 import asyncio
+import json
 import logging
 import sys
 from typing import Optional
@@ -18,8 +19,9 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.client.default import DefaultBotProperties
 
 from config import Config
-from db_factory import get_database
+from db_factory import init_database, close_database
 from handlers import redistribution_router, browser_auth_router
+from workers.cookie_import import IMPORTED_SESSION_DAYS, get_cookie_import_pipeline, normalize_cookies
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
@@ -283,106 +285,55 @@ async def callback_import_cookies(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-async def handle_cookies_json(message: Message, state: FSMContext):
-    """Обработка JSON с cookies"""
-    user_id = message.from_user.id
-
-    try:
-        import json
-        from api.routes.sessions import CookieItem
-
-        # Парсим JSON
-        cookies_data = json.loads(message.text)
-
-        if not isinstance(cookies_data, list):
-            await message.answer(
-                "❌ Неверный формат! JSON должен быть массивом cookies.\n\n"
-                "Ожидается: <code>[{...}, {...}]</code>",
-                parse_mode=ParseMode.HTML
-            )
-            return
-
-        # Преобразуем в наш формат
-        cookies = []
-        for cookie in cookies_data:
-            try:
-                cookies.append(CookieItem(
-                    name=cookie.get('name', ''),
-                    value=cookie.get('value', ''),
-                    domain=cookie.get('domain', ''),
-                    path=cookie.get('path', '/'),
-                    expires=cookie.get('expirationDate'),
-                    httpOnly=cookie.get('httpOnly', False),
-                    secure=cookie.get('secure', False),
-                    sameSite=cookie.get('sameSite')
-                ))
-            except Exception as e:
-                logger.warning(f"Failed to parse cookie: {e}")
-                continue
+# Сообщения о ходе импорта cookies (workers.cookie_import)
+COOKIE_IMPORT_PROGRESS = {
+    'queued': "⏳ <b>Импорт принят</b>\n\nCookies: {cookies_count}. Ожидает очереди...",
+    'checking': "⏳ <b>Проверяю cookies в WB...</b>\n\nCookies: {cookies_count}",
+    'saving': "⏳ <b>Сохраняю сессию и кабинеты...</b>",
+    'profiles': "⏳ <b>Сессия сохранена, загружаю кабинеты...</b>\n\nЭто может занять до минуты.",
+}
 
-        if not cookies:
-            await message.answer("❌ Не удалось распарсить cookies из JSON")
-            return
 
-        # Фильтруем только wildberries cookies
-        wb_cookies = [c for c in cookies if 'wildberries' in c.domain.lower()]
+def format_cookie_import(job) -> str:
+    """Текст сообщения о задаче импорта cookies"""
+    if job.status in COOKIE_IMPORT_PROGRESS:
+        return COOKIE_IMPORT_PROGRESS[job.status].format(cookies_count=job.cookies_count)
 
-        if not wb_cookies:
-            await message.answer(
-                "❌ В предоставленных cookies нет Wildberries cookies!\n\n"
-                "Убедитесь что вы экспортировали cookies со страницы <code>seller.wildberries.ru</code>",
-                parse_mode=ParseMode.HTML
-            )
-            return
-
-        # Импортируем cookies
-        from utils.encryption import encrypt_token
-        cookies_json = json.dumps([c.dict() for c in wb_cookies])
-
-        # Преобразуем в формат Playwright
-        playwright_cookies = []
-        for c in wb_cookies:
-            # Валидируем sameSite - Playwright требует строго Strict|Lax|None
-            same_site = c.sameSite
-            if same_site not in ['Strict', 'Lax', 'None']:
-                same_site = 'Lax'  # По умолчанию
-
-            playwright_cookies.append({
-                'name': c.name,
-                'value': c.value,
-                'domain': c.domain,
-                'path': c.path,
-                'expires': c.expires if c.expires else -1,
-                'httpOnly': c.httpOnly if c.httpOnly is not None else False,
-                'secure': c.secure if c.secure is not None else False,
-                'sameSite': same_site
-            })
-
-        cookies_encrypted = encrypt_token(json.dumps(playwright_cookies))
-
-        # Сохраняем в БД
-        # Сначала деактивируем старые сессии
-        db.invalidate_browser_session(user_id)
-        # Затем создаём новую сессию
-        db.add_browser_session(
-            user_id=user_id,
-            phone="",  # Телефон не требуется при импорте cookies
-            cookies_encrypted=cookies_encrypted,
-            supplier_name=None,
-            expires_days=7
+    if job.status == 'expired':
+        return (
+            "❌ <b>Cookies больше не действуют</b>\n\n"
+            "Войдите на <code>seller.wildberries.ru</code> заново, экспортируйте cookies "
+            "и отправьте их ещё раз, или авторизуйтесь по SMS: /auth"
         )
+    if job.status == 'failed':
+        return f"❌ Ошибка при импорте cookies:\n<code>{job.error}</code>"
+
+    if job.profiles > 1:
+        supplier_info = f"📛 Доступно кабинетов: {job.profiles}\n"
+    elif job.supplier_name:
+        supplier_info = f"📛 Магазин: {job.supplier_name}\n"
+    else:
+        supplier_info = ""
+    return (
+        f"✅ <b>Cookies импортированы успешно!</b>\n\n"
+        f"📊 Импортировано: {job.cookies_count} cookies\n"
+        f"{supplier_info}"
+        f"⏰ Срок действия: {IMPORTED_SESSION_DAYS} дней\n\n"
+        f"Теперь можете использовать бота без SMS авторизации!"
+    )
 
-        await message.answer(
-            f"✅ <b>Cookies импортированы успешно!</b>\n\n"
-            f"📊 Импортировано: {len(wb_cookies)} cookies\n"
-            f"⏰ Срок действия: 7 дней\n\n"
-            f"Теперь можете использовать бота без SMS авторизации!",
-            parse_mode=ParseMode.HTML
-        )
 
-        # Очищаем состояние
-        await state.clear()
+async def handle_cookies_json(message: Message, state: FSMContext):
+    """
+    Обработка JSON с cookies.
 
+    Здесь только разбор JSON - проверка cookies в WB, сохранение сессии и
+    кабинетов идут в фоне, ход импорта обновляется в ответном сообщении.
+    """
+    user_id = message.from_user.id
+
+    try:
+        cookies = normalize_cookies(json.loads(message.text or ''))
     except json.JSONDecodeError:
         await message.answer(
             "❌ Неверный JSON формат!\n\n"
@@ -390,13 +341,36 @@ async def handle_cookies_json(message: Message, state: FSMContext):
             "JSON должен начинаться с <code>[</code> и заканчиваться <code>]</code>",
             parse_mode=ParseMode.HTML
         )
-    except Exception as e:
-        logger.error(f"Error importing cookies: {e}", exc_info=True)
+        return
+    except ValueError:
         await message.answer(
-            f"❌ Ошибка при импорте cookies:\n<code>{str(e)}</code>",
+            "❌ Неверный формат! JSON должен быть массивом cookies.\n\n"
+            "Ожидается: <code>[{...}, {...}]</code>",
             parse_mode=ParseMode.HTML
         )
-        await state.clear()
+        return
+
+    if not cookies:
+        await message.answer(
+            "❌ В предоставленных cookies нет Wildberries cookies!\n\n"
+            "Убедитесь что вы экспортировали cookies со страницы <code>seller.wildberries.ru</code>",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    await state.clear()
+
+    pipeline = get_cookie_import_pipeline()
+    progress_msg = await message.answer(
+        COOKIE_IMPORT_PROGRESS['queued'].format(cookies_count=len(cookies)),
+        parse_mode=ParseMode.HTML
+    )
+
+    async def on_progress(job) -> None:
+        await progress_msg.edit_text(format_cookie_import(job), parse_mode=ParseMode.HTML)
+
+    job = pipeline.submit(user_id, cookies, on_progress=on_progress)
+    logger.info(f"User {user_id} cookie import {job.id} accepted")
 
 
 async def main():
@@ -413,9 +387,8 @@ async def main():
     logger.info(f"🔐 ADMIN_IDS type: {type(Config.ADMIN_IDS)}")
     logger.info(f"🔐 ADMIN_IDS count: {len(Config.ADMIN_IDS)}")
 
-    # Инициализация БД
-    db = get_database()
-    logger.info("Database initialized")
+    # Инициализация БД (общий адаптер процесса)
+    db = init_database()
 
     # Инициализация бота
     bot = Bot(
@@ -460,39 +433,42 @@ async def main():
     max_retries = 5
     retry_delay = 10  # секунд
 
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Attempt {attempt + 1}/{max_retries} to start polling...")
-            await dp.start_polling(bot)
-            break  # Если успешно - выходим из цикла
-        except Exception as e:
-            error_msg = str(e).lower()
-            if 'conflict' in error_msg or 'terminated by other getupdates' in error_msg:
-                if attempt < max_retries - 1:
-                    logger.warning(f"⚠️  TelegramConflictError on attempt {attempt + 1}")
-                    logger.warning(f"Old bot instance still running. Waiting {retry_delay}s before retry...")
-                    await bot.session.close()
-                    await asyncio.sleep(retry_delay)
-                    # Пересоздаем bot для нового соединения
-                    bot = Bot(
-                        token=Config.get_bot_token(),
-                        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-                    )
-                    continue
+    try:
+        for attempt in range(max_retries):
+            try:
+                logger.info(f"Attempt {attempt + 1}/{max_retries} to start polling...")
+                await dp.start_polling(bot)
+                break  # Если успешно - выходим из цикла
+            except Exception as e:
+                error_msg = str(e).lower()
+                if 'conflict' in error_msg or 'terminated by other getupdates' in error_msg:
+                    if attempt < max_retries - 1:
+                        logger.warning(f"⚠️  TelegramConflictError on attempt {attempt + 1}")
+                        logger.warning(f"Old bot instance still running. Waiting {retry_delay}s before retry...")
+                        await bot.session.close()
+                        await asyncio.sleep(retry_delay)
+                        # Пересоздаем bot для нового соединения
+                        bot = Bot(
+                            token=Config.get_bot_token(),
+                            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+                        )
+                        continue
+                    else:
+                        logger.error("❌ TelegramConflictError: Failed after all retries!")
+                        logger.error("Old bot deployment is stuck. Manual intervention needed.")
+                        await bot.session.close()
+                        sys.exit(1)
                 else:
-                    logger.error("❌ TelegramConflictError: Failed after all retries!")
-                    logger.error("Old bot deployment is stuck. Manual intervention needed.")
-                    await bot.session.close()
-                    sys.exit(1)
-            else:
-                # Другая ошибка - пробрасываем дальше
-                raise
+                    # Другая ошибка - пробрасываем дальше
+                    raise
 
-    # Cleanup
-    try:
-        await bot.session.close()
-    except:
-        pass
+    finally:
+        # Cleanup
+        try:
+            await bot.session.close()
+        except:
+            pass
+        close_database()
 
 
 if __name__ == "__main__":
@@ -12,18 +12,40 @@ Flow авторизации:
 """
 
 import asyncio
+import json
 import logging
 import re
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, Any
-
-from playwright.async_api import BrowserContext, Page, TimeoutError as PlaywrightTimeout
-
+from typing import Optional, Any, List, Tuple
+
+from playwright.async_api import BrowserContext, Error as PlaywrightError, Page, TimeoutError as PlaywrightTimeout
+
+from config import Config
+from utils.diagnostics import get_diagnostics
+from utils.encryption import encrypt_token
+from utils.session_state import capture_storage_state
+from wb_api.internal_client import SessionExpiredError
+from wb_api.profiles import get_profiles, record_dom_fallback
+from .auth_fields import FIELD_DETECTOR_JS, FieldMatch, wait_for_field
+from .auth_phases import PhaseStats, PhaseTimer
+from .auth_reaper import AuthReaper
+from .auth_slots import AuthSlot, AuthSlotPool, PositionCallback
 from .browser_service import BrowserService, get_browser_service
 
 logger = logging.getLogger(__name__)
 
+# Сохранение console errors страницы (для диагностики)
+CONSOLE_ERRORS_JS = '''
+window.__console_errors__ = [];
+const originalError = console.error;
+console.error = function(...args) {
+    window.__console_errors__.push(args.join(' '));
+    originalError.apply(console, args);
+};
+'''
+
 
 class AuthStatus(Enum):
     """Статусы авторизации"""
@@ -53,7 +75,10 @@ class AuthSession:
     supplier_name: Optional[str] = None  # Название поставщика из ЛК
     available_profiles: Optional[list] = None  # Список всех доступных профилей (для мультиаккаунта)
     captcha_screenshot: Optional[bytes] = None  # Скриншот captcha для отправки пользователю
-    keep_alive_task: Optional[asyncio.Task] = None  # Background task для поддержания сессии
+    storage_state: Optional[dict] = None  # Снимок localStorage/sessionStorage ЛК (utils/session_state.py)
+    code_expires_at: Optional[float] = None  # Когда истекает SMS код (time.monotonic)
+    busy: bool = False                   # Идёт ввод кода или запрос нового (контекст закрывать нельзя)
+    timer: PhaseTimer = field(default_factory=PhaseTimer)  # Длительности этапов
 
 
 class WBAuthService:
@@ -129,10 +154,27 @@ class WBAuthService:
         'supplier_name': '[class*="supplier"], [class*="company"], [class*="header"] span, h1, h2',
     }
 
+    # Сколько ждать поле кода после каждого способа отправки номера (мс)
+    SUBMIT_CHECK_TIMEOUT = 5000
+
+    # Причина закрытия авторизации планировщиком -> (статус, сообщение)
+    EXPIRY_REASONS = {
+        'code': (AuthStatus.CODE_EXPIRED, "Код истёк"),
+        'idle': (AuthStatus.FAILED, "Превышено время ожидания кода"),
+        'flow': (AuthStatus.FAILED, "Превышено время авторизации"),
+        'page': (AuthStatus.FAILED, "Страница авторизации закрылась"),
+    }
+
+    # Через сколько секунд перепроверить дедлайн авторизации, занятой вводом кода
+    BUSY_RECHECK = 5.0
+
     def __init__(self):
         self._sessions: dict[int, AuthSession] = {}  # user_id -> AuthSession
+        self._slots = AuthSlotPool()  # Ограничение одновременных SMS авторизаций
+        # Один планировщик дедлайнов и пингов страниц для всех авторизаций
+        self._reaper = AuthReaper(self._reap, self._ping_sessions, Config.AUTH_PING_INTERVAL)
         self._browser_service: Optional[BrowserService] = None
-        self._code_digit_inputs: Optional[list] = None  # 6 отдельных полей для цифр кода
+        self._phase_stats = PhaseStats()  # Длительности этапов и стратегии поиска полей
 
     async def _get_browser(self) -> BrowserService:
         """Получить browser service"""
@@ -180,68 +222,228 @@ class WBAuthService:
         }
         return session.status in active_statuses
 
-    async def start_auth(self, user_id: int, phone: str) -> AuthSession:
+    async def acquire_auth_slot(self, user_id: int, on_position: PositionCallback = None) -> AuthSlot:
+        """
+        Занять слот авторизации (или дождаться его в очереди).
+
+        Если все слоты заняты, сначала закрываются авторизации с истёкшими дедлайнами.
+
+        Args:
+            user_id: Telegram user ID
+            on_position: Callback с позицией в очереди (для сообщения пользователю)
+
+        Raises:
+            AuthSlotError: Очередь переполнена или истекло время ожидания
+        """
+        if not self._slots.get(user_id) and self._slots.full:
+            await self.reap_expired()
+        slot = await self._slots.acquire(user_id, on_position)
+
+        # Дедлайны авторизации отслеживает общий планировщик
+        self._reaper.start()
+        self._schedule_deadline(user_id)
+        return slot
+
+    def _deadline(self, user_id: int) -> Optional[Tuple[float, str]]:
+        """
+        Ближайший дедлайн авторизации пользователя.
+
+        Returns:
+            (time.monotonic дедлайна, причина) или None, если слота нет
+        """
+        slot = self._slots.get(user_id)
+        if not slot:
+            return None
+
+        deadlines = [
+            (slot.acquired_at + Config.AUTH_FLOW_TIMEOUT, 'flow'),
+            (slot.last_activity + self._slots.idle_timeout, 'idle'),
+        ]
+        session = self._sessions.get(user_id)
+        if session and session.code_expires_at:
+            deadlines.append((session.code_expires_at, 'code'))
+        return min(deadlines)
+
+    def _schedule_deadline(self, user_id: int) -> None:
+        """Передать планировщику актуальный дедлайн пользователя"""
+        deadline = self._deadline(user_id)
+        if deadline:
+            self._reaper.schedule(user_id, deadline[0])
+        else:
+            self._reaper.cancel(user_id)
+
+    def _code_sent(self, session: AuthSession) -> None:
+        """SMS код отправлен: запускаем отсчёт его срока действия"""
+        session.code_expires_at = time.monotonic() + Config.AUTH_CODE_TTL
+        self._schedule_deadline(session.user_id)
+
+    async def _reap(self, user_ids: List[int]) -> int:
+        """
+        Закрыть авторизации с наступившими дедлайнами (вызывается планировщиком).
+
+        Дедлайн перепроверяется: после активности пользователя он сдвигается,
+        такие авторизации планируются заново. Авторизации, занятые вводом кода
+        или запросом нового (вход, cookies, профили - 15+ секунд), не
+        закрываются: код введён вовремя, дедлайн проверяется после шага.
+
+        Returns:
+            Количество закрытых авторизаций
+        """
+        now = time.monotonic()
+        expired = []
+        for user_id in user_ids:
+            deadline = self._deadline(user_id)
+            if deadline is None:
+                continue
+            session = self._sessions.get(user_id)
+            if session and session.busy:
+                self._reaper.schedule(user_id, max(deadline[0], now + self.BUSY_RECHECK))
+                continue
+            if deadline[0] <= now + AuthReaper.TICK:
+                expired.append((user_id, deadline[1]))
+            else:
+                self._reaper.schedule(user_id, deadline[0])
+
+        return await self._close_expired(expired)
+
+    async def reap_expired(self) -> int:
+        """
+        Закрыть все авторизации с истёкшими дедлайнами.
+
+        Returns:
+            Количество закрытых авторизаций
+        """
+        return await self._reap(self._slots.user_ids())
+
+    async def _close_expired(self, expired: List[Tuple[int, str]]) -> int:
+        """Закрыть пачку авторизаций и учесть освобождённую память"""
+        if not expired:
+            return 0
+
+        sessions = []
+        freed = 0
+        for user_id, reason in expired:
+            session = self._sessions.pop(user_id, None)
+            if session:
+                session.status, session.error_message = self.EXPIRY_REASONS[reason]
+                sessions.append(session)
+
+            slot = self._slots.release(user_id)
+            if slot:
+                self._slots.record_reclaim(slot)
+                freed += slot.memory_bytes
+            self._reaper.cancel(user_id)
+
+        # Контексты закрываются параллельно
+        await asyncio.gather(*(self._dispose_session(session) for session in sessions))
+
+        reasons = ', '.join(f"{user_id}:{reason}" for user_id, reason in expired)
+        logger.info(
+            f"Auth reaper closed {len(expired)} flows ({reasons}), "
+            f"reclaimed ~{freed / 1024 / 1024:.1f} MB"
+        )
+        return len(expired)
+
+    async def _ping_sessions(self) -> None:
+        """Пинг всех страниц авторизации: замер памяти, закрытие умерших"""
+        # Во время ввода кода страница переходит в ЛК - evaluate может упасть на навигации
+        sessions = [session for session in self._sessions.values() if session.page and not session.busy]
+        results = await asyncio.gather(
+            *(self._sample_memory(session.user_id, session.page) for session in sessions),
+            return_exceptions=True
+        )
+
+        dead = []
+        for session, result in zip(sessions, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Auth page ping failed for user {session.user_id}: {result}")
+                dead.append((session.user_id, 'page'))
+        await self._close_expired(dead)
+
+    async def _sample_memory(self, user_id: int, page: Page) -> None:
+        """Замерить JS heap страницы авторизации (заодно проверяет, что страница жива)"""
+        used = await page.evaluate(
+            '() => performance.memory ? performance.memory.usedJSHeapSize : 0'
+        )
+        slot = self._slots.get(user_id)
+        if slot:
+            slot.memory_bytes = int(used or 0)
+
+    def get_slot_stats(self) -> dict:
+        """Метрики пула слотов, планировщика дедлайнов и этапов авторизации"""
+        stats = self._slots.get_stats()
+        stats['reaper'] = self._reaper.get_stats()
+        stats.update(self._phase_stats.get_stats())
+        return stats
+
+    async def start_auth(
+        self,
+        user_id: int,
+        phone: str,
+        on_queue_position: PositionCallback = None
+    ) -> AuthSession:
         """
         Начать процесс авторизации.
 
         Args:
             user_id: Telegram user ID
             phone: Номер телефона
+            on_queue_position: Callback с позицией в очереди, если все слоты заняты
 
         Returns:
             AuthSession с статусом PENDING_CODE или FAILED
+
+        Raises:
+            AuthSlotError: Не удалось получить слот авторизации
         """
+        timer = PhaseTimer()
+
         try:
             # Нормализуем номер
             normalized_phone = self.normalize_phone(phone)
             logger.info(f"Начало авторизации для user {user_id}, phone {normalized_phone[:5]}***")
 
+            # Предыдущая авторизация пользователя: закрываем браузер, слот сохраняем
+            previous = self._sessions.pop(user_id, None)
+            if previous:
+                await self._dispose_session(previous)
+
+            await self.acquire_auth_slot(user_id, on_queue_position)
+            self._phase_stats.record('slot', timer.mark('slot'))
+
+            # Детектор полей телефона и кода ставится вместе со stealth
+            # одним init script контекста (переживает навигации);
+            # console errors перехватываем только при включённой диагностике
+            verbose = get_diagnostics().verbose(user_id)
+            init_scripts = (FIELD_DETECTOR_JS, CONSOLE_ERRORS_JS) if verbose else (FIELD_DETECTOR_JS,)
+
             # Создаём сессию с увеличенным timeout (5 минут вместо 30 секунд)
             browser = await self._get_browser()
-            context = await browser.create_context()
+            context = await browser.create_context(init_scripts=init_scripts)
 
             # Устанавливаем долгий timeout для страницы (5 минут)
             # Это нужно, чтобы сессия не истекала пока пользователь вводит SMS код
             page = await browser.create_page(context)
             page.set_default_timeout(300000)  # 5 минут в миллисекундах
 
-            # Перехватываем console errors для диагностики
-            console_errors = []
-
-            def handle_console(msg):
-                """Обработчик console messages"""
-                if msg.type in ['error', 'warning']:
-                    error_text = f"[{msg.type.upper()}] {msg.text}"
-                    console_errors.append(error_text)
-                    logger.warning(f"Browser console {msg.type}: {msg.text}")
+            if verbose:
+                def handle_console(msg):
+                    """Обработчик console messages"""
+                    if msg.type in ['error', 'warning']:
+                        logger.warning(f"Browser console {msg.type}: {msg.text}")
 
-            page.on('console', handle_console)
-
-            # Инжектируем скрипт для сохранения console errors
-            await page.add_init_script('''
-                window.__console_errors__ = [];
-                const originalError = console.error;
-                console.error = function(...args) {
-                    window.__console_errors__.push(args.join(' '));
-                    originalError.apply(console, args);
-                };
-            ''')
+                page.on('console', handle_console)
 
             session = AuthSession(
                 user_id=user_id,
                 phone=normalized_phone,
                 status=AuthStatus.PENDING_PHONE,
                 context=context,
-                page=page
+                page=page,
+                timer=timer
             )
             self._sessions[user_id] = session
 
-            # Запускаем keep-alive task для поддержания сессии
-            # Будет пинговать страницу каждые 30 секунд, пока ждём SMS код
-            keep_alive_task = asyncio.create_task(self._keep_session_alive(user_id, page))
-            # Сохраняем task в сессию для последующей отмены
-            session.keep_alive_task = keep_alive_task
-
             # Пробуем разные URL для авторизации (WB может менять структуру)
             phone_input = None
 
@@ -285,9 +487,7 @@ class WBAuthService:
                     continue
             if not phone_input:
                 # Сохраняем скриншот для диагностики
-                screenshot = await browser.take_screenshot(page)
-                if screenshot:
-                    logger.error(f"Страница при ошибке сохранена (screenshot available)")
+                await get_diagnostics().screenshot(page, 'auth_no_phone_field', user_id)
 
                 # Получаем HTML для диагностики
                 page_content = await page.content()
@@ -300,6 +500,8 @@ class WBAuthService:
                 logger.error(session.error_message)
                 return session
 
+            self._mark(session, 'phone_field')
+
             # Вводим номер телефона (без +7, т.к. на странице WB уже есть префикс +7)
             phone_digits = normalized_phone.replace('+7', '').replace('+', '')
             logger.info(f"Будем вводить: {phone_digits[:3]}*** ({len(phone_digits)} цифр)")
@@ -394,8 +596,12 @@ class WBAuthService:
                 session.error_message = "Номер телефона не сохранился в поле. Попробуйте ещё раз."
                 return session
 
-            # Пробуем отправить форму несколькими способами
+            self._mark(session, 'phone_input')
+
+            # Пробуем отправить форму несколькими способами.
+            # После каждого способа ждём поле кода (появится сразу, как WB его покажет)
             submitted = False
+            code_input: Optional[FieldMatch] = None
 
             # Сначала закрываем любые открытые dropdown'ы
             await page.keyboard.press('Escape')
@@ -411,9 +617,8 @@ class WBAuthService:
                 try:
                     await submit_button.evaluate('el => el.click()')
                     logger.info("Выполнен JavaScript click по кнопке")
-                    await browser.human_delay(2000, 3000)  # Ускорено: 3000-4000ms → 2000-3000ms
 
-                    code_input = await self._find_code_input(page)
+                    code_input = await self._find_code_input(page, self.SUBMIT_CHECK_TIMEOUT)
                     if code_input:
                         submitted = True
                         logger.info("Форма отправлена через JS click")
@@ -434,9 +639,8 @@ class WBAuthService:
                     await browser.human_delay(100, 200)
 
                     await page.mouse.click(btn_x, btn_y)
-                    await browser.human_delay(2000, 3000)  # Ускорено: 3000-4000ms → 2000-3000ms
 
-                    code_input = await self._find_code_input(page)
+                    code_input = await self._find_code_input(page, self.SUBMIT_CHECK_TIMEOUT)
                     if code_input:
                         submitted = True
                         logger.info("Форма отправлена через координатный клик")
@@ -450,9 +654,8 @@ class WBAuthService:
                     await browser.human_delay(200, 300)
 
                 await page.keyboard.press('Enter')
-                await browser.human_delay(2000, 3000)  # Ускорено: 3000-4000ms → 2000-3000ms
 
-                code_input = await self._find_code_input(page)
+                code_input = await self._find_code_input(page, self.SUBMIT_CHECK_TIMEOUT)
                 if code_input:
                     submitted = True
                     logger.info("Форма отправлена через Enter")
@@ -469,92 +672,19 @@ class WBAuthService:
                         }
                         return false;
                     ''')
-                    await browser.human_delay(2000, 3000)  # Ускорено: 3000-4000ms → 2000-3000ms
 
-                    code_input = await self._find_code_input(page)
+                    code_input = await self._find_code_input(page, self.SUBMIT_CHECK_TIMEOUT)
                     if code_input:
                         submitted = True
                         logger.info("Форма отправлена через JS form.submit()")
                 except Exception as e:
                     logger.warning(f"JS form submit не сработал: {e}")
 
-            # ДИАГНОСТИКА: Проверяем состояние страницы после submit
-            body_text = await page.inner_text('body')
-            logger.info(f"=== ДИАГНОСТИКА ПОСЛЕ SUBMIT ===")
-            logger.info(f"URL: {page.url}")
-            logger.info(f"Текст страницы (первые 400 символов): {body_text[:400]}")
-
-            # Проверяем console errors
-            console_errors = []
-            try:
-                # Получаем console logs через evaluate
-                console_logs = await page.evaluate('''() => {
-                    return window.__console_errors__ || [];
-                }''')
-                if console_logs:
-                    logger.warning(f"Console errors: {console_logs}")
-                    console_errors = console_logs
-            except Exception as e:
-                logger.debug(f"Не удалось получить console errors: {e}")
-
-            # Проверяем наличие сообщения об ошибке или предупреждения (скрытые элементы)
-            try:
-                error_elements = await page.query_selector_all('[class*="error"], [class*="warning"], [class*="alert"]')
-                for elem in error_elements:
-                    is_visible = await elem.is_visible()
-                    text = await elem.inner_text() if is_visible else await elem.text_content()
-                    if text and text.strip():
-                        logger.warning(f"Найден элемент с ошибкой/предупреждением (visible={is_visible}): {text.strip()[:200]}")
-            except Exception as e:
-                logger.debug(f"Не удалось проверить error elements: {e}")
-
-            # Проверяем, есть ли конкретное сообщение об отправке SMS
-            sms_sent_indicators = [
-                'код отправлен',
-                'смс отправлен',
-                'sms sent',
-                'введите код',
-                'запросить заново',
-            ]
-            sms_sent = any(indicator in body_text.lower() for indicator in sms_sent_indicators)
-            logger.info(f"Индикаторы отправки SMS на странице: {sms_sent}")
-
-            # Проверяем наличие таймера "Запросить заново через X секунд"
-            import re
-            timer_match = re.search(r'запросить.*?через\s+(\d+)\s*(секунд|минут)', body_text, re.IGNORECASE)
-            if timer_match:
-                time_value = timer_match.group(1)
-                time_unit = timer_match.group(2)
-                logger.info(f"✅ Найден таймер повторной отправки: через {time_value} {time_unit}")
-                logger.info("Это указывает, что WB действительно инициировал отправку SMS")
-            else:
-                logger.warning("⚠️ НЕ НАЙДЕН таймер 'Запросить заново через X секунд'")
-                logger.warning("Возможно, WB не отправил SMS, а только показал форму!")
-
-            if not sms_sent and not timer_match:
-                logger.error("❌ КРИТИЧНО: Нет никаких признаков отправки SMS!")
-                logger.error("Полный текст страницы для анализа:")
-                logger.error(body_text[:1000])  # Первая 1000 символов
-
-            # Проверяем, есть ли поле телефона и что в нём
-            phone_field_after = await self._find_phone_input(page)
-            if phone_field_after:
-                value_after_submit = await phone_field_after.input_value()
-                logger.info(f"Значение в поле телефона ПОСЛЕ SUBMIT: '{value_after_submit}'")
-                if not value_after_submit or len(value_after_submit.replace(' ', '').replace('-', '')) < 10:
-                    logger.error("!!! ПРОБЛЕМА: Номер был очищен после клика на кнопку!")
-
-            # Сохраняем скриншот в файл для визуальной диагностики
-            try:
-                screenshot = await browser.take_screenshot(page)
-                if screenshot:
-                    import os
-                    screenshot_path = "/tmp/wb_auth_debug.png"
-                    with open(screenshot_path, "wb") as f:
-                        f.write(screenshot)
-                    logger.info(f"Скриншот сохранён: {screenshot_path}")
-            except Exception as e:
-                logger.warning(f"Не удалось сохранить скриншот: {e}")
+            # ДИАГНОСТИКА: состояние страницы после submit (только при включённой диагностике)
+            diagnostics = get_diagnostics()
+            if diagnostics.verbose(session.user_id):
+                await self._log_submit_state(page)
+            await diagnostics.screenshot(page, 'auth_after_submit', session.user_id)
 
             # Проверяем ошибки на странице
             error = await self._check_error(page)
@@ -564,42 +694,29 @@ class WBAuthService:
                 logger.error(f"Ошибка авторизации: {error}")
                 return session
 
-            # Проверяем появление поля для кода (оптимизированное ожидание)
-            # WB может долго обрабатывать запрос
-            code_input = None
-            max_attempts = 3  # Уменьшено: 5 → 3
-            for attempt in range(max_attempts):
-                logger.info(f"Ищем поле кода, попытка {attempt + 1}/{max_attempts}...")
+            # Поле для кода: если ни один способ отправки его не дождался,
+            # ждём ещё (WB может долго обрабатывать запрос)
+            if not code_input:
+                logger.info("Поле кода не появилось после отправки, ждём дольше...")
                 code_input = await self._find_code_input(page)
-                if code_input:
-                    break
-                # Ждём между попытками (ускорено)
-                await browser.human_delay(1000, 1500)  # Ускорено: 2000-3000ms → 1000-1500ms
 
             if code_input:
                 session.status = AuthStatus.PENDING_CODE
+                self._code_sent(session)
+                self._mark(session, 'code_field')
                 logger.info(f"SMS отправлено на {normalized_phone[:5]}***")
             else:
-                # Последняя попытка - ждём ещё немного
-                logger.info("Поле кода не найдено после всех попыток, ждём ещё 2 секунды...")
-                await browser.human_delay(2000, 3000)  # Ускорено: 5000-6000ms → 2000-3000ms
-                code_input = await self._find_code_input(page)
-
-                if code_input:
-                    session.status = AuthStatus.PENDING_CODE
-                    logger.info(f"SMS отправлено на {normalized_phone[:5]}*** (после дополнительного ожидания)")
+                # Проверяем, не появилась ли captcha после отправки формы
+                if await self._detect_captcha(page):
+                    logger.warning("Captcha появилась после отправки формы!")
+                    screenshot = await browser.take_screenshot(page)
+                    session.status = AuthStatus.CAPTCHA_REQUIRED
+                    session.captcha_screenshot = screenshot
+                    session.error_message = "Wildberries требует ввод капчи. Попробуйте позже или с другого IP."
                 else:
-                    # Проверяем, не появилась ли captcha после отправки формы
-                    if await self._detect_captcha(page):
-                        logger.warning("Captcha появилась после отправки формы!")
-                        screenshot = await browser.take_screenshot(page)
-                        session.status = AuthStatus.CAPTCHA_REQUIRED
-                        session.captcha_screenshot = screenshot
-                        session.error_message = "Wildberries требует ввод капчи. Попробуйте позже или с другого IP."
-                    else:
-                        session.status = AuthStatus.FAILED
-                        session.error_message = "Не появилось поле для ввода кода. Возможно, WB показал ошибку или форма не отправилась."
-                    logger.error(session.error_message)
+                    session.status = AuthStatus.FAILED
+                    session.error_message = "Не появилось поле для ввода кода. Возможно, WB показал ошибку или форма не отправилась."
+                logger.error(session.error_message)
 
             return session
 
@@ -630,6 +747,7 @@ class WBAuthService:
         session = self._sessions.get(user_id)
         if not session:
             raise ValueError(f"Сессия не найдена для user {user_id}")
+        self._slots.touch(user_id)
 
         # Можно отправлять код если ждём первый код или после запроса нового
         if session.status not in {AuthStatus.PENDING_CODE, AuthStatus.NEW_CODE_SENT}:
@@ -642,22 +760,47 @@ class WBAuthService:
             session.error_message = "Код должен содержать 6 цифр"
             return session
 
+        self._set_busy(session, True)
+        try:
+            return await self._submit_code(session, code)
+        finally:
+            self._set_busy(session, False)
+
+    def _set_busy(self, session: AuthSession, busy: bool) -> None:
+        """
+        Отметить шаг авторизации с браузером (ввод кода, запрос нового).
+
+        Пока шаг идёт, планировщик не закрывает контекст; после шага
+        дедлайн пересчитывается от новой активности.
+        """
+        session.busy = busy
+        if busy:
+            return
+        if session.status == AuthStatus.SUCCESS:
+            # Код использован - его срок больше не ограничивает авторизацию
+            session.code_expires_at = None
+        if session.user_id in self._sessions:
+            self._slots.touch(session.user_id)
+            self._schedule_deadline(session.user_id)
+
+    async def _submit_code(self, session: AuthSession, code: str) -> AuthSession:
+        """Ввод кода, вход в ЛК, cookies и профили (session.busy)"""
+        user_id = session.user_id
         browser = await self._get_browser()
         page = session.page
+        # Ожидание кода пользователем в этапы не входит
+        session.timer.restart()
 
         try:
-            # Сначала проверяем и принимаем cookie баннер если он есть
-            await self._accept_cookie_banner(page)
-
-            # Находим поля для кода
-            code_input = await self._find_code_input(page)
+            # Находим поля для кода (cookie баннер закрывается там же)
+            code_input = await self._find_code_input(page, self.SUBMIT_CHECK_TIMEOUT)
             if not code_input:
                 session.status = AuthStatus.FAILED
                 session.error_message = "Поле ввода кода не найдено"
                 return session
 
             # Проверяем, есть ли 6 отдельных полей для цифр (новый UI WB)
-            digit_inputs = getattr(self, '_code_digit_inputs', None)
+            digit_inputs = code_input.elements if code_input.cells else None
 
             if digit_inputs and len(digit_inputs) >= len(code):
                 # Новый UI: вводим каждую цифру в отдельное поле
@@ -689,22 +832,22 @@ class WBAuthService:
                 logger.info("Ввод кода в одно поле (классический UI)")
 
                 # Очищаем поле и вводим код
-                await code_input.fill('')
+                await code_input.element.fill('')
                 await browser.human_delay(300, 500)
 
                 for digit in code:
                     await page.keyboard.type(digit, delay=100)
                     await browser.human_delay(50, 150)
 
-            await browser.human_delay(1000, 2000)
+            self._mark(session, 'code_input')
 
-            # WB может автоматически отправить форму после ввода 6 цифр
-            # Проверяем, не изменился ли уже URL или контент
-            await browser.human_delay(500, 1000)
+            # WB может автоматически отправить форму после ввода 6 цифр:
+            # ждём переход в ЛК или ошибку, а не фиксированную паузу
+            result_ready = await self._wait_for_code_result(page, self.SUBMIT_CHECK_TIMEOUT // 2)
 
             # Если ещё на той же странице - пробуем нажать кнопку
             current_url = page.url
-            if '/login' in current_url or 'auth' in current_url.lower():
+            if not result_ready and ('/login' in current_url or 'auth' in current_url.lower()):
                 submit_button = await self._find_submit_button(page)
                 if submit_button:
                     try:
@@ -713,8 +856,8 @@ class WBAuthService:
                     except Exception as e:
                         logger.debug(f"Не удалось нажать кнопку: {e}")
 
-            # Ждём результат
-            await browser.human_delay(3000, 5000)
+                # Ждём результат
+                await self._wait_for_code_result(page, int(Config.AUTH_LOGIN_TIMEOUT * 1000))
 
             # Закрываем промо-попапы (Джем, подписки и т.д.)
             await self._close_promo_popups(page)
@@ -739,6 +882,7 @@ class WBAuthService:
             # Проверяем успешную авторизацию (должен быть редирект на ЛК)
             if await self._check_logged_in(page):
                 session.status = AuthStatus.SUCCESS
+                self._mark(session, 'login')
 
                 # Получаем cookies из контекста
                 all_cookies = await session.context.cookies()
@@ -770,6 +914,7 @@ class WBAuthService:
 
                 session.cookies = all_cookies
                 session.supplier_name = await self._get_supplier_name(page)
+                self._mark(session, 'cookies')
 
                 # Получаем список всех доступных профилей (поставщиков)
                 session.available_profiles = await self._get_available_profiles(page)
@@ -777,8 +922,16 @@ class WBAuthService:
                     logger.info(f"Найдено {len(session.available_profiles)} доступных профилей для user {user_id}")
                     for profile in session.available_profiles:
                         logger.info(f"  - {profile.get('name')} (ИНН: {profile.get('inn')}, ID: {profile.get('id')})")
+                self._mark(session, 'profiles')
 
-                logger.info(f"Успешная авторизация для user {user_id}")
+                # Снимок localStorage/sessionStorage ЛК - сохраняется вместе с сессией
+                if Config.SESSION_STATE_ENABLED:
+                    try:
+                        session.storage_state = await capture_storage_state(session.context, page)
+                    except Exception as e:
+                        logger.warning(f"Не удалось снять storage state для user {user_id}: {e}")
+
+                logger.info(f"Успешная авторизация для user {user_id}: {session.timer.summary()}")
             else:
                 session.status = AuthStatus.FAILED
                 session.error_message = "Не удалось войти в аккаунт"
@@ -812,9 +965,18 @@ class WBAuthService:
         session = self._sessions.get(user_id)
         if not session:
             raise ValueError(f"Сессия не найдена для user {user_id}")
+        self._slots.touch(user_id)
 
-        browser = await self._get_browser()
+        self._set_busy(session, True)
+        try:
+            return await self._request_new_code(session, max_wait_seconds)
+        finally:
+            self._set_busy(session, False)
+
+    async def _request_new_code(self, session: AuthSession, max_wait_seconds: int) -> AuthSession:
+        """Ожидание и нажатие кнопки запроса нового кода (session.busy)"""
         page = session.page
+        session.timer.restart()
 
         # Селекторы для кнопки запроса нового кода
         new_code_selectors = [
@@ -882,12 +1044,13 @@ class WBAuthService:
         try:
             await button_found.click()
             logger.info("[REQUEST_NEW_CODE] Кнопка нажата")
-            await browser.human_delay(2000, 3000)
 
             # Проверяем, появилось ли поле для ввода нового кода
-            code_input = await self._find_code_input(page)
+            code_input = await self._find_code_input(page, self.SUBMIT_CHECK_TIMEOUT)
             if code_input:
                 session.status = AuthStatus.NEW_CODE_SENT
+                self._code_sent(session)
+                self._mark(session, 'new_code')
                 logger.info("[REQUEST_NEW_CODE] Новый код запрошен успешно")
             else:
                 # Проверяем ошибки
@@ -898,6 +1061,7 @@ class WBAuthService:
                 else:
                     # Возможно код уже отправлен, но поле не обнаружено
                     session.status = AuthStatus.NEW_CODE_SENT
+                    self._code_sent(session)
                     logger.info("[REQUEST_NEW_CODE] Код запрошен (поле не найдено, но ошибок нет)")
 
         except Exception as e:
@@ -907,170 +1071,16 @@ class WBAuthService:
 
         return session
 
-    async def _find_phone_input(self, page: Page) -> Optional[Any]:
+    async def _find_phone_input(self, page: Page, timeout_ms: int = None) -> Optional[Any]:
         """
         Найти поле ввода телефона (цифры номера, НЕ dropdown выбора страны).
 
         WB имеет сложный компонент: dropdown выбора страны (+7, +374, ...)
-        и отдельное поле для ввода цифр номера.
+        и отдельное поле для ввода цифр номера. Ждёт появления поля
+        не дольше timeout_ms (по умолчанию AUTH_FIELD_TIMEOUT).
         """
-        # Ждём загрузки страницы
-        await page.wait_for_load_state('domcontentloaded')
-
-        # Стратегия 1: Ищем поле по placeholder с цифрами/форматом номера
-        placeholder_selectors = [
-            'input[placeholder*="000"]',           # Placeholder "000 000 0000" или подобный
-            'input[placeholder*="___"]',           # Placeholder с подчёркиваниями
-            'input[placeholder*="9"]',             # Placeholder начинающийся с 9
-            'input[placeholder*="номер" i]',       # "Введите номер"
-            'input[placeholder*="phone" i]',       # "phone"
-        ]
-
-        # Оптимизация: пробуем все селекторы параллельно
-        try:
-            elements = await asyncio.gather(
-                *[page.query_selector(selector) for selector in placeholder_selectors],
-                return_exceptions=True
-            )
-
-            for selector, element in zip(placeholder_selectors, elements):
-                if isinstance(element, Exception) or not element:
-                    continue
-                try:
-                    if await element.is_visible():
-                        placeholder = await element.get_attribute('placeholder') or ''
-                        logger.info(f"Найдено поле телефона по placeholder: '{placeholder}' через {selector}")
-                        return element
-                except Exception as e:
-                    logger.debug(f"Селектор {selector} не сработал: {e}")
-        except Exception as e:
-            logger.debug(f"Стратегия 1 не сработала: {e}")
-
-        # Стратегия 2: Ищем все input[type="tel"] и берём последний (обычно это поле цифр)
-        try:
-            tel_inputs = await page.query_selector_all('input[type="tel"]')
-            logger.info(f"Найдено {len(tel_inputs)} элементов input[type='tel']")
-
-            # Оптимизация: собираем атрибуты всех tel inputs параллельно
-            if tel_inputs:
-                all_attrs = await asyncio.gather(
-                    *[asyncio.gather(
-                        inp.get_attribute('placeholder'),
-                        inp.get_attribute('name'),
-                        inp.get_attribute('class'),
-                        return_exceptions=True
-                    ) for inp in tel_inputs],
-                    return_exceptions=True
-                )
-
-                for i, attrs in enumerate(all_attrs):
-                    if isinstance(attrs, Exception):
-                        continue
-                    placeholder, name, class_attr = attrs
-                    placeholder = '' if isinstance(placeholder, Exception) else (placeholder or '')
-                    name = '' if isinstance(name, Exception) else (name or '')
-                    class_attr = '' if isinstance(class_attr, Exception) else (class_attr or '')
-                    logger.info(f"  tel input [{i}]: placeholder='{placeholder}', name='{name}', class='{class_attr[:50]}'")
-
-                # Если есть несколько tel inputs, берём последний (обычно это поле для цифр)
-                # Первый часто является частью dropdown выбора страны
-                if len(tel_inputs) >= 2:
-                    element = tel_inputs[-1]  # Последний input
-                    if await element.is_visible():
-                        logger.info("Используем последний input[type='tel'] (поле для цифр)")
-                        return element
-                elif len(tel_inputs) == 1:
-                    # Только один tel input - используем его, но сначала кликаем мимо dropdown
-                    element = tel_inputs[0]
-                    if await element.is_visible():
-                        logger.info("Найден единственный input[type='tel']")
-                        return element
-        except Exception as e:
-            logger.warning(f"Ошибка при поиске input[type='tel']: {e}")
-
-        # Стратегия 3: Ищем input рядом с текстом "+7" или в форме
-        try:
-            # Ищем форму авторизации и внутри неё input
-            form_selectors = [
-                'form input[type="tel"]',
-                'form input[type="text"]',
-                '[class*="auth"] input',
-                '[class*="login"] input',
-                '[class*="phone-input"] input',
-            ]
-
-            # Оптимизация: собираем все элементы из всех селекторов параллельно
-            all_selector_results = await asyncio.gather(
-                *[page.query_selector_all(selector) for selector in form_selectors],
-                return_exceptions=True
-            )
-
-            # Объединяем все элементы
-            all_elements = []
-            for result in all_selector_results:
-                if not isinstance(result, Exception) and result:
-                    all_elements.extend(result)
-
-            # Проверяем элементы параллельно
-            if all_elements:
-                checks = await asyncio.gather(
-                    *[asyncio.gather(el.is_visible(), el.bounding_box(), return_exceptions=True)
-                      for el in all_elements],
-                    return_exceptions=True
-                )
-
-                for i, (element, check_results) in enumerate(zip(all_elements, checks)):
-                    if isinstance(check_results, Exception):
-                        continue
-                    is_visible, box = check_results
-                    if not isinstance(is_visible, Exception) and is_visible and \
-                       not isinstance(box, Exception) and box and box['width'] > 100:
-                        logger.info(f"Найдено поле телефона в форме, width={box['width']}")
-                        return element
-        except Exception as e:
-            logger.warning(f"Ошибка при поиске в форме: {e}")
-
-        # Стратегия 4: Последняя попытка - любой видимый input подходящего типа
-        try:
-            inputs = await page.query_selector_all('input')
-            logger.info(f"Найдено {len(inputs)} input элементов всего")
-
-            # Оптимизация: проверяем все inputs параллельно
-            if inputs:
-                checks = await asyncio.gather(
-                    *[asyncio.gather(
-                        inp.is_visible(),
-                        inp.get_attribute('type'),
-                        inp.bounding_box(),
-                        return_exceptions=True
-                    ) for inp in inputs],
-                    return_exceptions=True
-                )
-
-                for inp, check_results in zip(inputs, checks):
-                    if isinstance(check_results, Exception):
-                        continue
-
-                    is_visible, input_type, box = check_results
-
-                    if isinstance(is_visible, Exception) or not is_visible:
-                        continue
-                    if isinstance(input_type, Exception):
-                        input_type = 'text'
-                    else:
-                        input_type = input_type or 'text'
-
-                    if input_type not in ['tel', 'text', 'number']:
-                        continue
-
-                    # Проверяем размер - поле для номера должно быть достаточно широким
-                    if not isinstance(box, Exception) and box and box['width'] > 100:
-                        logger.info(f"Используем input type={input_type}, width={box['width']} как поле телефона")
-                        return inp
-        except Exception as e:
-            logger.error(f"Ошибка при поиске input: {e}")
-
-        return None
+        match = await self._wait_for_field(page, 'phone', timeout_ms)
+        return match.element if match else None
 
     async def _accept_cookie_banner(self, page: Page) -> bool:
         """
@@ -1129,7 +1139,7 @@ class WBAuthService:
             logger.warning(f"Ошибка при проверке cookie баннера: {e}")
             return False
 
-    async def _find_code_input(self, page: Page) -> Optional[Any]:
+    async def _find_code_input(self, page: Page, timeout_ms: int = None) -> Optional[FieldMatch]:
         """
         Найти поле ввода SMS кода.
 
@@ -1137,245 +1147,66 @@ class WBAuthService:
         1. Одно поле с maxlength=6 (старый вариант)
         2. 6 отдельных полей с maxlength=1 (новый вариант)
 
+        Ждёт появления поля не дольше timeout_ms (по умолчанию AUTH_FIELD_TIMEOUT).
+
         Returns:
-            Элемент для ввода (первое поле если их 6) или None
+            FieldMatch (при cells=True в elements поля цифр по порядку) или None
         """
-        try:
-            # Сначала проверяем и принимаем cookie баннер если он есть
-            # (он может появиться на любом этапе)
-            await self._accept_cookie_banner(page)
-
-            # Проверим текст страницы - есть ли сообщение об отправке кода
-            body_text = await page.inner_text('body')
-            body_lower = body_text.lower()
-
-            # ВАЖНО: Сначала проверяем наличие текста про КОД!
-            # WB - это SPA, и оба текста (про телефон и про код) могут быть в DOM одновременно.
-            # Если есть текст про код - значит мы на странице кода, независимо от других текстов.
-            has_code_text = any(phrase in body_lower for phrase in [
-                'введите код', 'enter code', 'код из sms', 'код подтверждения',
-                'отправили код', 'отправлен код', 'мы отправили', 'sms с кодом',
-                'запросить заново через'  # Это тоже признак страницы кода
-            ])
-            logger.info(f"Текст страницы содержит упоминание кода: {has_code_text}")
-
-            if has_code_text:
-                # Мы на странице ввода кода - продолжаем поиск полей
-                logger.info("Обнаружен текст про код - мы на странице ввода кода")
-            else:
-                # Нет текста про код - проверяем, может мы всё ещё на странице телефона
-                still_on_phone_page = any(phrase in body_lower for phrase in [
-                    'введите номер телефона',
-                    'enter phone number',
-                    'введите номер, чтобы войти',
-                ])
-
-                if still_on_phone_page:
-                    logger.warning("Мы всё ещё на странице ввода телефона - форма не отправилась!")
-                    return None
-
-                logger.warning("На странице нет текста о вводе кода - возможно форма не отправилась")
-                logger.info(f"Текст страницы: {body_text[:300]}")
-                return None
-
-            # === СТРАТЕГИЯ 1: Ищем 6 отдельных полей для цифр (новый UI WB) ===
-            logger.info("Стратегия 1: Ищем 6 отдельных полей для цифр...")
-
-            # Сначала ищем по классу InputCell (WB использует этот класс без maxlength)
-            digit_inputs = await page.query_selector_all('input.InputCell-PB5beCCt55')
-            if not digit_inputs:
-                # Fallback: ищем input[maxlength="1"]
-                digit_inputs = await page.query_selector_all('input[maxlength="1"]')
-            logger.info(f"Найдено {len(digit_inputs)} полей для цифр")
-
-            if len(digit_inputs) >= 4:  # Минимум 4 поля для кода (некоторые сайты используют 4)
-                # Проверяем что это действительно поля для кода
-                # Оптимизация: кэшируем результаты проверок в одном проходе
-                valid_digit_inputs = []
-                for inp in digit_inputs:
-                    try:
-                        # Одновременно получаем видимость и box за один раз
-                        is_visible, box = await asyncio.gather(
-                            inp.is_visible(),
-                            inp.bounding_box(),
-                            return_exceptions=True
-                        )
-
-                        # Проверяем результаты
-                        if isinstance(is_visible, Exception) or not is_visible:
-                            continue
-                        if isinstance(box, Exception) or not box:
-                            continue
-
-                        # Поле для цифры обычно квадратное или почти квадратное
-                        if not (20 < box['width'] < 100 and 20 < box['height'] < 100):
-                            continue
-
-                        # Получаем атрибуты параллельно
-                        input_type, inputmode = await asyncio.gather(
-                            inp.get_attribute('type'),
-                            inp.get_attribute('inputmode'),
-                            return_exceptions=True
-                        )
-
-                        input_type = '' if isinstance(input_type, Exception) else (input_type or '')
-                        inputmode = '' if isinstance(inputmode, Exception) else (inputmode or '')
-
-                        # Должно быть числовым
-                        if input_type in ['tel', 'text', 'number'] or inputmode == 'numeric':
-                            valid_digit_inputs.append(inp)
-                    except Exception as e:
-                        logger.debug(f"Ошибка проверки digit input: {e}")
-                        continue
-
-                logger.info(f"Валидных полей для цифр: {len(valid_digit_inputs)}")
-
-                if len(valid_digit_inputs) >= 4:
-                    # Сохраняем все поля для метода submit_code
-                    self._code_digit_inputs = valid_digit_inputs
-                    logger.info(f"Найдено {len(valid_digit_inputs)} полей для ввода цифр кода (новый UI)")
-                    # Возвращаем первое поле
-                    return valid_digit_inputs[0]
-
-            # === СТРАТЕГИЯ 2: Ищем поля с селекторами для digit inputs ===
-            logger.info("Стратегия 2: Ищем по селекторам digit inputs...")
-            try:
-                digit_selector = self.SELECTORS['code_digit_inputs']
-                digit_elements = await page.query_selector_all(digit_selector)
-
-                # Оптимизация: проверяем видимость параллельно для всех элементов
-                if digit_elements:
-                    visibility_checks = await asyncio.gather(
-                        *[el.is_visible() for el in digit_elements],
-                        return_exceptions=True
-                    )
-                    visible_digits = [
-                        el for el, is_vis in zip(digit_elements, visibility_checks)
-                        if not isinstance(is_vis, Exception) and is_vis
-                    ]
-
-                    logger.info(f"Найдено {len(visible_digits)} видимых элементов по digit selectors")
-
-                    if len(visible_digits) >= 4:
-                        self._code_digit_inputs = visible_digits
-                        logger.info(f"Найдено {len(visible_digits)} полей по digit selectors")
-                        return visible_digits[0]
-            except Exception as e:
-                logger.debug(f"Стратегия 2 не сработала: {e}")
-
-            # === СТРАТЕГИЯ 3: Классический подход - одно поле с maxlength=6 ===
-            logger.info("Стратегия 3: Ищем классическое поле с maxlength=6...")
-            self._code_digit_inputs = None  # Сбрасываем если были
-
-            try:
-                element = await page.wait_for_selector(
-                    self.SELECTORS['code_input'],
-                    timeout=5000,
-                    state='visible'
-                )
-
-                if element:
-                    # Диагностика: что за элемент нашли
-                    placeholder = await element.get_attribute('placeholder') or ''
-                    maxlength = await element.get_attribute('maxlength') or ''
-                    input_type = await element.get_attribute('type') or ''
-                    value = await element.input_value()
-                    logger.info(f"Найдено поле кода: type={input_type}, maxlength={maxlength}, placeholder='{placeholder}', value='{value}'")
-
-                    # Валидация: это ДОЛЖНО быть поле для кода, а не что-то другое
-                    is_valid_code_field = (
-                        maxlength == '6' or
-                        (input_type == 'tel' and not value) or
-                        'код' in placeholder.lower() or
-                        'code' in placeholder.lower()
-                    )
-
-                    if not is_valid_code_field:
-                        logger.warning(f"Найденный элемент не похож на поле кода (type={input_type}, maxlength={maxlength})")
-                    elif value and len(value) > 6:
-                        logger.warning(f"Поле содержит значение '{value}' - это поле телефона, не кода!")
-                    else:
-                        return element
-            except PlaywrightTimeout:
-                logger.debug("Timeout при поиске классического поля кода")
-
-            # === СТРАТЕГИЯ 4: Fallback - ищем любые видимые input рядом с текстом "код" ===
-            logger.info("Стратегия 4: Fallback - ищем input рядом с текстом про код...")
-            try:
-                # Находим все видимые input и проверяем их родителей на наличие текста про код
-                all_inputs = await page.query_selector_all('input:visible')
-                for inp in all_inputs:
-                    try:
-                        maxlength = await inp.get_attribute('maxlength') or ''
-                        if maxlength in ['1', '6']:
-                            # Проверяем родительский контейнер
-                            parent_text = await inp.evaluate('el => el.closest("div, form, section")?.innerText || ""')
-                            if any(kw in parent_text.lower() for kw in ['код', 'code', 'sms', 'смс']):
-                                logger.info(f"Найдено поле через fallback (maxlength={maxlength})")
-                                return inp
-                    except Exception:
-                        continue
-            except Exception as e:
-                logger.debug(f"Стратегия 4 не сработала: {e}")
-
-            logger.warning("Не удалось найти поле для ввода кода ни одной стратегией")
+        # Cookie баннер может появиться на любом этапе и перекрыть форму
+        await self._accept_cookie_banner(page)
+        return await self._wait_for_field(page, 'code', timeout_ms)
+
+    async def _wait_for_field(self, page: Page, kind: str, timeout_ms: int = None) -> Optional[FieldMatch]:
+        """Дождаться поля детектором в странице и учесть сработавшую стратегию"""
+        if timeout_ms is None:
+            timeout_ms = int(Config.AUTH_FIELD_TIMEOUT * 1000)
+
+        match = await wait_for_field(page, kind, timeout_ms)
+        if match:
+            logger.info(
+                f"Поле {kind} найдено: стратегия {match.strategy}, "
+                f"{len(match.elements)} эл., ожидание {match.waited_ms} мс"
+            )
+        elif timeout_ms:
+            logger.warning(f"Поле {kind} не появилось за {timeout_ms} мс")
 
-            # ДИАГНОСТИКА: Выводим все input элементы на странице (только в debug режиме)
-            if logger.level <= logging.DEBUG:
-                try:
-                    all_inputs = await page.query_selector_all('input')
-                    logger.info(f"=== ДИАГНОСТИКА: Все input элементы на странице ({len(all_inputs)}) ===")
-
-                    # Оптимизация: собираем атрибуты всех элементов параллельно
-                    if all_inputs:
-                        all_attrs = await asyncio.gather(
-                            *[asyncio.gather(
-                                inp.get_attribute('type'),
-                                inp.get_attribute('name'),
-                                inp.get_attribute('id'),
-                                inp.get_attribute('class'),
-                                inp.get_attribute('placeholder'),
-                                inp.get_attribute('maxlength'),
-                                inp.input_value(),
-                                inp.is_visible(),
-                                return_exceptions=True
-                            ) for inp in all_inputs],
-                            return_exceptions=True
-                        )
-
-                        for i, attrs in enumerate(all_attrs):
-                            try:
-                                if isinstance(attrs, Exception):
-                                    logger.debug(f"  Input[{i}]: Ошибка при чтении атрибутов: {attrs}")
-                                    continue
-
-                                input_type, name, id_attr, class_attr, placeholder, maxlength, value, is_visible = attrs
-
-                                # Обрабатываем возможные исключения в отдельных атрибутах
-                                input_type = '' if isinstance(input_type, Exception) else (input_type or '')
-                                name = '' if isinstance(name, Exception) else (name or '')
-                                id_attr = '' if isinstance(id_attr, Exception) else (id_attr or '')
-                                class_attr = '' if isinstance(class_attr, Exception) else (class_attr or '')
-                                placeholder = '' if isinstance(placeholder, Exception) else (placeholder or '')
-                                maxlength = '' if isinstance(maxlength, Exception) else (maxlength or '')
-                                value = '' if isinstance(value, Exception) else (value or '')
-                                is_visible = False if isinstance(is_visible, Exception) else is_visible
-
-                                logger.info(
-                                    f"  Input[{i}]: type='{input_type}', name='{name}', id='{id_attr}', "
-                                    f"class='{class_attr[:50]}', placeholder='{placeholder}', "
-                                    f"maxlength='{maxlength}', value='{value[:20]}', visible={is_visible}"
-                                )
-                            except Exception as e:
-                                logger.debug(f"  Input[{i}]: Ошибка при обработке атрибутов: {e}")
-                except Exception as e:
-                    logger.error(f"Ошибка при диагностике input элементов: {e}")
+        # Разовые проверки (timeout_ms=0) в статистику не попадают
+        if timeout_ms:
+            self._phase_stats.record_field(kind, match.strategy if match else None)
+        return match
 
-            return None
+    async def _wait_for_code_result(self, page: Page, timeout_ms: int) -> bool:
+        """
+        Дождаться результата ввода кода: перехода в ЛК или сообщения об ошибке.
 
+        Returns:
+            True, если результат появился за timeout_ms
+        """
+        try:
+            await page.wait_for_function(
+                '''(errorSelector) => {
+                    if (location.hostname === 'seller.wildberries.ru' && !location.href.includes('/login')) {
+                        return true;
+                    }
+                    return Array.from(document.querySelectorAll(errorSelector))
+                        .some((el) => el.offsetParent !== null && el.innerText.trim());
+                }''',
+                arg=self.SELECTORS['error_message'],
+                timeout=timeout_ms
+            )
+            return True
         except PlaywrightTimeout:
-            logger.warning("Timeout при поиске поля кода - поле не появилось")
-            return None
+            return False
+        except PlaywrightError as e:
+            # Навигация во время ожидания - результат проверят _check_error/_check_logged_in
+            logger.debug(f"Ожидание результата ввода кода прервано: {e}")
+            return True
+
+    def _mark(self, session: AuthSession, phase: str) -> None:
+        """Закрыть этап авторизации и учесть его длительность"""
+        elapsed = session.timer.mark(phase)
+        self._phase_stats.record(phase, elapsed)
+        logger.info(f"[AUTH] user {session.user_id}: этап {phase} {elapsed} мс")
 
     async def _find_submit_button(self, page: Page) -> Optional[Any]:
         """Найти кнопку отправки формы"""
@@ -1482,6 +1313,70 @@ class WBAuthService:
         except Exception as e:
             logger.debug(f"Ошибка при закрытии попапов: {e}")
 
+    async def _log_submit_state(self, page: Page) -> None:
+        """Подробный лог состояния страницы после отправки номера (диагностика)"""
+        body_text = await page.inner_text('body')
+        logger.info(f"=== ДИАГНОСТИКА ПОСЛЕ SUBMIT ===")
+        logger.info(f"URL: {page.url}")
+        logger.info(f"Текст страницы (первые 400 символов): {body_text[:400]}")
+
+        # Проверяем console errors
+        try:
+            # Получаем console logs через evaluate
+            console_logs = await page.evaluate('''() => {
+                return window.__console_errors__ || [];
+            }''')
+            if console_logs:
+                logger.warning(f"Console errors: {console_logs}")
+        except Exception as e:
+            logger.debug(f"Не удалось получить console errors: {e}")
+
+        # Проверяем наличие сообщения об ошибке или предупреждения (скрытые элементы)
+        try:
+            error_elements = await page.query_selector_all('[class*="error"], [class*="warning"], [class*="alert"]')
+            for elem in error_elements:
+                is_visible = await elem.is_visible()
+                text = await elem.inner_text() if is_visible else await elem.text_content()
+                if text and text.strip():
+                    logger.warning(f"Найден элемент с ошибкой/предупреждением (visible={is_visible}): {text.strip()[:200]}")
+        except Exception as e:
+            logger.debug(f"Не удалось проверить error elements: {e}")
+
+        # Проверяем, есть ли конкретное сообщение об отправке SMS
+        sms_sent_indicators = [
+            'код отправлен',
+            'смс отправлен',
+            'sms sent',
+            'введите код',
+            'запросить заново',
+        ]
+        sms_sent = any(indicator in body_text.lower() for indicator in sms_sent_indicators)
+        logger.info(f"Индикаторы отправки SMS на странице: {sms_sent}")
+
+        # Проверяем наличие таймера "Запросить заново через X секунд"
+        timer_match = re.search(r'запросить.*?через\s+(\d+)\s*(секунд|минут)', body_text, re.IGNORECASE)
+        if timer_match:
+            time_value = timer_match.group(1)
+            time_unit = timer_match.group(2)
+            logger.info(f"✅ Найден таймер повторной отправки: через {time_value} {time_unit}")
+            logger.info("Это указывает, что WB действительно инициировал отправку SMS")
+        else:
+            logger.warning("⚠️ НЕ НАЙДЕН таймер 'Запросить заново через X секунд'")
+            logger.warning("Возможно, WB не отправил SMS, а только показал форму!")
+
+        if not sms_sent and not timer_match:
+            logger.error("❌ КРИТИЧНО: Нет никаких признаков отправки SMS!")
+            logger.error("Полный текст страницы для анализа:")
+            logger.error(body_text[:1000])  # Первая 1000 символов
+
+        # Проверяем, есть ли поле телефона и что в нём
+        phone_field_after = await self._find_phone_input(page, timeout_ms=0)
+        if phone_field_after:
+            value_after_submit = await phone_field_after.input_value()
+            logger.info(f"Значение в поле телефона ПОСЛЕ SUBMIT: '{value_after_submit}'")
+            if not value_after_submit or len(value_after_submit.replace(' ', '').replace('-', '')) < 10:
+                logger.error("!!! ПРОБЛЕМА: Номер был очищен после клика на кнопку!")
+
     async def _check_error(self, page: Page) -> Optional[str]:
         """Проверить наличие ошибки на странице"""
         try:
@@ -1670,9 +1565,10 @@ class WBAuthService:
         """
         Получить список всех доступных профилей (поставщиков) из WB.
 
-        После авторизации по номеру телефона, в правом верхнем углу есть dropdown
-        с переключателем профилей. Если пользователь добавлен как менеджер
-        в несколько кабинетов - они все будут доступны.
+        Если пользователь добавлен как менеджер в несколько кабинетов - они
+        все будут доступны. Список запрашивается по HTTP с cookies страницы
+        (wb_api.profiles); разбор dropdown в шапке ЛК - только если HTTP не
+        сработал.
 
         Returns:
             Список словарей с данными профилей:
@@ -1688,30 +1584,28 @@ class WBAuthService:
             ]
         """
         try:
-            logger.info("Получаем список доступных профилей...")
-            import re
-            import json
+            cookies = await page.context.cookies()
+            profiles = await get_profiles(encrypt_token(json.dumps(cookies)), use_cache=False)
+            if profiles:
+                return profiles
+        except Exception as e:
+            logger.warning(f"Профили по HTTP не получены: {e}")
 
-            browser = await self._get_browser()
+        return await self._scrape_profiles(page)
 
-            # Логируем ВСЕ network запросы чтобы найти API профилей
-            captured_api_data = []
+    async def _scrape_profiles(self, page: Page) -> Optional[list]:
+        """
+        Профили разбором dropdown переключателя профилей в шапке ЛК
+        (fallback для _get_available_profiles).
 
-            async def log_response(response):
-                """Логируем все API ответы"""
-                try:
-                    url = response.url
-                    if response.status == 200 and 'api' in url.lower():
-                        try:
-                            body = await response.json()
-                            logger.info(f"📡 API: {url}")
-                            captured_api_data.append({'url': url, 'data': body})
-                        except:
-                            pass
-                except:
-                    pass
+        В правом верхнем углу ЛК есть dropdown с переключателем профилей,
+        профили в нём распознаются по строке "ИНН".
+        """
+        record_dom_fallback()
+        try:
+            logger.info("Получаем список доступных профилей из dropdown...")
 
-            page.on('response', log_response)
+            browser = await self._get_browser()
 
             # Ищем кнопку профиля в правом верхнем углу по тексту
             # WB показывает имя пользователя в header
@@ -1779,14 +1673,6 @@ class WBAuthService:
             # Ждём появления dropdown панели
             await browser.human_delay(800, 1200)
 
-            # Делаем скриншот для отладки
-            try:
-                screenshot_path = '/tmp/wb_dropdown_debug.png'
-                await page.screenshot(path=screenshot_path)
-                logger.info(f"Скриншот сохранён: {screenshot_path}")
-            except Exception as e:
-                logger.debug(f"Не удалось сохранить скриншот: {e}")
-
             profiles = []
 
             # Ищем dropdown контейнер - обычно это popup/dropdown который появился после hover
@@ -1917,22 +1803,6 @@ class WBAuthService:
             await page.keyboard.press('Escape')
             await browser.human_delay(200, 300)
 
-            # Отписываемся от events
-            try:
-                page.remove_listener('response', log_response)
-            except:
-                pass
-
-            # Логируем все перехваченные API для анализа
-            if captured_api_data:
-                logger.info(f"📊 Перехвачено {len(captured_api_data)} API ответов:")
-                for item in captured_api_data:
-                    logger.info(f"  URL: {item['url']}")
-                    data_str = json.dumps(item['data'], ensure_ascii=False)
-                    if len(data_str) > 300:
-                        data_str = data_str[:300] + "..."
-                    logger.info(f"  Data: {data_str}")
-
             logger.info(f"Успешно получено {len(profiles)} профилей из UI")
             return profiles if profiles else None
 
@@ -1940,56 +1810,33 @@ class WBAuthService:
             logger.warning(f"Ошибка при получении профилей: {e}")
             return None
 
-    async def _keep_session_alive(self, user_id: int, page: Page) -> None:
-        """
-        Background task для поддержания сессии активной.
-        Периодически пингует страницу, чтобы она не истекла.
-        """
-        try:
-            while True:
-                # Проверяем, существует ли ещё сессия
-                if user_id not in self._sessions:
-                    logger.debug(f"Keep-alive stopped: session removed for user {user_id}")
-                    break
-
-                # Ждём 30 секунд между пингами
-                await asyncio.sleep(30)
-
-                # Пингуем страницу - просто вызываем evaluate, чтобы убедиться что страница жива
-                try:
-                    await page.evaluate('() => document.title')
-                    logger.debug(f"Keep-alive ping successful for user {user_id}")
-                except Exception as e:
-                    logger.warning(f"Keep-alive ping failed for user {user_id}: {e}")
-                    # Если страница мертва - прекращаем пинги
-                    break
-        except asyncio.CancelledError:
-            logger.debug(f"Keep-alive task cancelled for user {user_id}")
-        except Exception as e:
-            logger.error(f"Keep-alive task error for user {user_id}: {e}")
-
     async def get_session(self, user_id: int) -> Optional[AuthSession]:
         """Получить текущую сессию пользователя"""
         return self._sessions.get(user_id)
 
     async def close_session(self, user_id: int) -> None:
-        """Закрыть сессию авторизации"""
-        session = self._sessions.get(user_id)
+        """Закрыть сессию авторизации и освободить слот (или место в очереди)"""
+        session = self._sessions.pop(user_id, None)
         if session:
-            # Останавливаем keep-alive task если он существует
-            if session.keep_alive_task and not session.keep_alive_task.done():
-                session.keep_alive_task.cancel()
-                try:
-                    await session.keep_alive_task
-                except asyncio.CancelledError:
-                    pass
+            await self._dispose_session(session)
+            logger.debug(f"Сессия закрыта для user {user_id}")
+
+        self._slots.release(user_id)
+        self._reaper.cancel(user_id)
 
-            # Закрываем browser context
-            if session.context:
+    async def _dispose_session(self, session: AuthSession) -> None:
+        """Закрыть browser context сессии"""
+        if session.context:
+            try:
                 await session.context.close()
+            except Exception as e:
+                logger.warning(f"Failed to close auth context of user {session.user_id}: {e}")
 
-            del self._sessions[user_id]
-            logger.debug(f"Сессия закрыта для user {user_id}")
+    async def shutdown(self) -> None:
+        """Закрыть все авторизации и остановить планировщик"""
+        await self._reaper.stop()
+        for user_id in list(self._sessions):
+            await self.close_session(user_id)
 
     async def take_screenshot(self, user_id: int) -> Optional[bytes]:
         """
@@ -2007,16 +1854,38 @@ class WBAuthService:
             return await browser.take_screenshot(session.page)
         return None
 
-    async def refresh_profiles_with_cookies(self, cookies: list) -> list:
+    async def refresh_profiles_with_cookies(
+        self,
+        cookies: list,
+        cookies_encrypted: str = None,
+        session_id: int = None
+    ) -> list:
         """
         Перепарсить профили из WB используя существующие cookies.
 
+        Сначала одним HTTP запросом (с кэшем на сессию), браузер - только
+        если HTTP не сработал.
+
         Args:
             cookies: Список cookies из browser_session
+            cookies_encrypted: Те же cookies в зашифрованном виде (если есть)
+            session_id: ID сессии (ключ кэша профилей)
 
         Returns:
             Список профилей [{name, company, inn, id}, ...]
         """
+        try:
+            profiles = await get_profiles(
+                cookies_encrypted or encrypt_token(json.dumps(cookies)),
+                session_id
+            )
+            if profiles:
+                return profiles
+        except SessionExpiredError:
+            # Мёртвую сессию браузер не оживит
+            logger.warning(f"Сессия {session_id} истекла - профили не получить")
+            return []
+
         profiles = []
 
         try:
@@ -2025,8 +1894,7 @@ class WBAuthService:
             await browser_service.start()
 
             # Создаём context с cookies
-            context = await browser_service.create_context()
-            await context.add_cookies(cookies)
+            context = await browser_service.create_context(cookies=cookies)
 
             page = await browser_service.create_page(context)
 
@@ -2036,8 +1904,8 @@ class WBAuthService:
                 await page.goto('https://seller.wildberries.ru/', wait_until='networkidle', timeout=30000)
                 await asyncio.sleep(2)
 
-                # Парсим профили используя существующий метод
-                profiles = await self._get_available_profiles(page)
+                # Парсим профили из dropdown
+                profiles = await self._scrape_profiles(page)
                 logger.info(f"Получено профилей: {len(profiles) if profiles else 0}")
 
             except Exception as e:
@@ -2061,3 +1929,11 @@ def get_auth_service() -> WBAuthService:
     if _auth_service is None:
         _auth_service = WBAuthService()
     return _auth_service
+
+
+async def shutdown_auth_service() -> None:
+    """Закрыть все авторизации и остановить планировщик"""
+    global _auth_service
+    if _auth_service:
+        await _auth_service.shutdown()
+        _auth_service = None
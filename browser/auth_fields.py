@@ -0,0 +1,246 @@
+"""
+Поиск полей телефона и SMS кода на странице авторизации WB.
+
+Детектор внедряется в страницу один раз (init script контекста -
+BrowserService.create_context(init_scripts=...)) и ищет поле прямо в
+браузере: стратегии перебираются одним проходом по DOM, а ожидание
+построено на MutationObserver - поиск повторяется только когда страница
+меняется, без sleep и десятков round-trip query_selector из Python.
+
+Стратегии (в порядке приоритета):
+    phone: placeholder, tel, form, any
+    code:  cells (6 полей по цифре), cell_selectors, single (одно поле),
+           near_text (input рядом с текстом про код)
+
+Пример:
+    context = await browser.create_context(init_scripts=(FIELD_DETECTOR_JS,))
+    ...
+    match = await wait_for_field(page, 'code', timeout_ms=10000)
+    if match and match.cells:
+        ...
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from playwright.async_api import Error as PlaywrightError, Page
+
+logger = logging.getLogger(__name__)
+
+# Детектор: window.__wbAuthFields.wait(kind, timeoutMs) -> {strategy, cells, elements} | null
+FIELD_DETECTOR_JS = r'''
+(() => {
+    if (window.__wbAuthFields) return;
+
+    const visible = (el) => {
+        const r = el.getBoundingClientRect();
+        return r.width > 0 && r.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const width = (el) => el.getBoundingClientRect().width;
+    const all = (selector) => Array.from(document.querySelectorAll(selector)).filter(visible);
+    const bodyText = () => (document.body ? document.body.innerText : '').toLowerCase();
+
+    const CODE_TEXT = [
+        'введите код', 'enter code', 'код из sms', 'код подтверждения',
+        'отправили код', 'отправлен код', 'мы отправили', 'sms с кодом',
+        'запросить заново через',
+    ];
+    const CELL_SELECTORS = [
+        'input[class*="InputCell"]',
+        'input[maxlength="1"][type="tel"]',
+        'input[maxlength="1"][type="text"]',
+        'input[maxlength="1"][inputmode="numeric"]',
+        '[class*="code"] input[maxlength="1"]',
+        '[class*="sms"] input[maxlength="1"]',
+        '[class*="otp"] input',
+        '[class*="verification"] input[maxlength="1"]',
+    ].join(', ');
+    const CODE_SELECTORS = [
+        'input[type="tel"][maxlength="6"]',
+        'input[type="text"][maxlength="6"]',
+        'input[name="code"]',
+        'input[placeholder*="код"]',
+        'input[placeholder*="Код"]',
+        'input[class*="code"]',
+        'input[class*="Code"]',
+        'input[autocomplete="one-time-code"]',
+        '[data-testid*="code"] input',
+    ].join(', ');
+
+    const phone = () => {
+        const placeholder = all([
+            'input[placeholder*="000"]',
+            'input[placeholder*="___"]',
+            'input[placeholder*="9"]',
+            'input[placeholder*="номер" i]',
+            'input[placeholder*="phone" i]',
+        ].join(', '));
+        if (placeholder.length) return ['placeholder', [placeholder[0]]];
+
+        // Несколько tel: первый обычно часть dropdown выбора страны
+        const tel = all('input[type="tel"]');
+        if (tel.length) return ['tel', [tel[tel.length - 1]]];
+
+        const form = all('form input[type="tel"], form input[type="text"], [class*="auth"] input, '
+            + '[class*="login"] input, [class*="phone-input"] input').filter((el) => width(el) > 100);
+        if (form.length) return ['form', [form[0]]];
+
+        const any = all('input').filter((el) =>
+            ['tel', 'text', 'number'].includes(el.type || 'text') && width(el) > 100);
+        if (any.length) return ['any', [any[0]]];
+        return null;
+    };
+
+    const code = () => {
+        // SPA: тексты про телефон и код могут быть в DOM одновременно,
+        // без текста про код поле кода не ищем
+        const text = bodyText();
+        if (!CODE_TEXT.some((phrase) => text.includes(phrase))) return null;
+
+        const cells = all('input.InputCell-PB5beCCt55, input[maxlength="1"]').filter((el) => {
+            const r = el.getBoundingClientRect();
+            return r.width > 20 && r.width < 100 && r.height > 20 && r.height < 100
+                && (['tel', 'text', 'number'].includes(el.type) || el.inputMode === 'numeric');
+        });
+        if (cells.length >= 4) return ['cells', cells];
+
+        const selectorCells = all(CELL_SELECTORS);
+        if (selectorCells.length >= 4) return ['cell_selectors', selectorCells];
+
+        const single = all(CODE_SELECTORS).find((el) => {
+            const placeholder = (el.placeholder || '').toLowerCase();
+            const looksLikeCode = el.maxLength === 6 || (el.type === 'tel' && !el.value)
+                || placeholder.includes('код') || placeholder.includes('code');
+            // Значение длиннее 6 символов - это поле телефона
+            return looksLikeCode && el.value.length <= 6;
+        });
+        if (single) return ['single', [single]];
+
+        const near = all('input[maxlength="1"], input[maxlength="6"]').find((el) => {
+            const container = el.closest('div, form, section');
+            const containerText = (container ? container.innerText : '').toLowerCase();
+            return ['код', 'code', 'sms', 'смс'].some((kw) => containerText.includes(kw));
+        });
+        if (near) return ['near_text', [near]];
+        return null;
+    };
+
+    const STRATEGIES = { phone, code };
+    const CELLS = ['cells', 'cell_selectors'];
+
+    const find = (kind) => {
+        const found = STRATEGIES[kind]();
+        return found && { strategy: found[0], cells: CELLS.includes(found[0]), elements: found[1] };
+    };
+
+    // Поиск сразу и после изменений DOM; редкая страховочная
+    // проверка ловит изменения только стилей (без мутаций)
+    const wait = (kind, timeoutMs) => new Promise((resolve) => {
+        let done = false;
+        let observer = null;
+        let backstop = null;
+        let timer = null;
+        const finish = (result) => {
+            if (done) return;
+            done = true;
+            if (observer) observer.disconnect();
+            clearInterval(backstop);
+            clearTimeout(timer);
+            resolve(result);
+        };
+        const check = () => {
+            const result = find(kind);
+            if (result) finish(result);
+        };
+        // Пачка мутаций (рендер SPA) - одна проверка
+        let scheduled = false;
+        const schedule = () => {
+            if (scheduled || done) return;
+            scheduled = true;
+            setTimeout(() => { scheduled = false; check(); }, 50);
+        };
+
+        check();
+        if (done) return;
+        observer = new MutationObserver(schedule);
+        observer.observe(document.documentElement, {
+            childList: true, subtree: true, attributes: true, characterData: true,
+        });
+        backstop = setInterval(check, 500);
+        timer = setTimeout(() => finish(null), timeoutMs);
+    });
+
+    window.__wbAuthFields = { find, wait };
+})();
+'''
+
+
+# Ожидание поля; детектор ставится заново, если документ открыт без init script
+_WAIT_JS = (
+    '([kind, timeoutMs]) => { if (!window.__wbAuthFields) { '
+    + FIELD_DETECTOR_JS
+    + ' } return window.__wbAuthFields.wait(kind, timeoutMs); }'
+)
+
+
+@dataclass
+class FieldMatch:
+    """Найденное поле"""
+    kind: str                 # 'phone' или 'code'
+    strategy: str             # Сработавшая стратегия
+    cells: bool               # Код вводится по цифре в отдельные поля
+    elements: List[Any]       # ElementHandle: одно поле или поля цифр по порядку
+    waited_ms: int            # Сколько ждали появления
+
+    @property
+    def element(self) -> Any:
+        """Основное (первое) поле"""
+        return self.elements[0]
+
+
+async def wait_for_field(page: Page, kind: str, timeout_ms: int) -> Optional[FieldMatch]:
+    """
+    Дождаться поля телефона ('phone') или кода ('code').
+
+    Навигация во время ожидания прерывает поиск в старом документе -
+    поиск продолжается в новом до общего таймаута.
+
+    Returns:
+        FieldMatch или None, если поле не появилось за timeout_ms
+    """
+    started = time.monotonic()
+    deadline = started + timeout_ms / 1000
+
+    while True:
+        # timeout_ms=0 - одна проверка без ожидания
+        remaining = max(0, int((deadline - time.monotonic()) * 1000))
+        try:
+            handle = await page.evaluate_handle(_WAIT_JS, [kind, remaining])
+            try:
+                if await handle.evaluate('r => r === null'):
+                    return None
+                strategy, cells = await handle.evaluate('r => [r.strategy, r.cells]')
+                properties = await (await handle.get_property('elements')).get_properties()
+            finally:
+                await handle.dispose()
+        except PlaywrightError as e:
+            # Контекст страницы уничтожен навигацией - ищем в новом документе
+            logger.debug(f"Field detector interrupted ({kind}): {e}")
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(0.1)
+            continue
+
+        indexes = sorted(int(key) for key in properties if key.isdigit())
+        elements = [properties[str(i)].as_element() for i in indexes]
+
+        return FieldMatch(
+            kind=kind,
+            strategy=strategy,
+            cells=cells,
+            elements=elements,
+            waited_ms=int((time.monotonic() - started) * 1000)
+        )
@@ -0,0 +1,94 @@
+"""
+Замеры длительности этапов SMS авторизации.
+
+Каждая авторизация ведёт свой PhaseTimer: этап закрывается вызовом
+mark(), время ожидания пользователя (ввод кода в Telegram) в этапы не
+входит - перед следующим этапом вызывается restart(). Сводка по всем
+авторизациям процесса (PhaseStats) и стратегии, которыми найдены поля,
+видны в GET /api/admin/auth.
+
+Этапы:
+    slot         - ожидание слота авторизации
+    phone_field  - открытие страницы входа и появление поля телефона
+    phone_input  - ввод номера
+    code_field   - отправка номера и появление поля кода
+    code_input   - ввод SMS кода
+    login        - вход после ввода кода
+    cookies      - получение cookies ЛК
+    profiles     - список профилей поставщика
+    new_code     - запрос нового кода
+"""
+
+import time
+from typing import Dict
+
+
+class PhaseTimer:
+    """Этапы одной авторизации"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._last = self.started
+        self.phases: Dict[str, int] = {}  # этап -> мс
+
+    def mark(self, phase: str) -> int:
+        """
+        Закрыть этап: время с прошлой отметки.
+
+        Returns:
+            Длительность этапа в мс
+        """
+        now = time.monotonic()
+        elapsed = int((now - self._last) * 1000)
+        self._last = now
+        self.phases[phase] = self.phases.get(phase, 0) + elapsed
+        return elapsed
+
+    def restart(self) -> None:
+        """Начать отсчёт следующего этапа с текущего момента"""
+        self._last = time.monotonic()
+
+    def summary(self) -> str:
+        """Этапы для лога: 'slot=0ms phone_field=2300ms ...'"""
+        return ' '.join(f"{phase}={ms}ms" for phase, ms in self.phases.items())
+
+
+class PhaseStats:
+    """Сводка по этапам и стратегиям поиска полей всех авторизаций"""
+
+    def __init__(self):
+        self._phases: Dict[str, Dict[str, int]] = {}
+        self._strategies: Dict[str, Dict[str, int]] = {}
+        self._misses: Dict[str, int] = {}
+
+    def record(self, phase: str, elapsed_ms: int) -> None:
+        """Учесть длительность этапа"""
+        stats = self._phases.setdefault(phase, {'count': 0, 'total_ms': 0, 'max_ms': 0})
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        stats['last_ms'] = elapsed_ms
+
+    def record_field(self, kind: str, strategy: str = None) -> None:
+        """Учесть найденное поле (strategy) или ненайденное (None)"""
+        if strategy is None:
+            self._misses[kind] = self._misses.get(kind, 0) + 1
+        else:
+            counts = self._strategies.setdefault(kind, {})
+            counts[strategy] = counts.get(strategy, 0) + 1
+
+    def get_stats(self) -> Dict:
+        """Средние и максимальные длительности этапов, стратегии полей"""
+        return {
+            'phases': {
+                phase: {
+                    'count': stats['count'],
+                    'avg_ms': stats['total_ms'] // stats['count'],
+                    'max_ms': stats['max_ms'],
+                    'last_ms': stats['last_ms'],
+                }
+                for phase, stats in self._phases.items()
+            },
+            'field_strategies': {kind: dict(counts) for kind, counts in self._strategies.items()},
+            'field_misses': dict(self._misses),
+        }
@@ -0,0 +1,144 @@
+"""
+Планировщик дедлайнов SMS авторизаций.
+
+Одна фоновая задача вместо keep-alive задачи на каждую авторизацию:
+хранит дедлайны в куче (min-heap) и просыпается только к ближайшему
+дедлайну или к очередному пингу страниц. Дедлайны, истекающие в пределах
+одного тика (TICK секунд), обрабатываются одной пачкой.
+
+Куча ленивая: повторный schedule() для того же пользователя не удаляет
+старую запись, а делает её устаревшей. Владелец (WBAuthService) в on_due
+перепроверяет фактический дедлайн и при необходимости планирует заново.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AuthReaper:
+    """Один таймер на все авторизации процесса"""
+
+    # Гранулярность: дедлайны ближе TICK секунд друг к другу закрываются вместе
+    TICK = 1.0
+
+    def __init__(
+        self,
+        on_due: Callable[[List[int]], Awaitable[None]],
+        on_ping: Callable[[], Awaitable[None]],
+        ping_interval: float
+    ):
+        """
+        Args:
+            on_due: Вызывается с ID пользователей, чьи дедлайны наступили
+            on_ping: Периодический пинг страниц (замер памяти, проверка живости)
+            ping_interval: Период пинга в секундах
+        """
+        self._on_due = on_due
+        self._on_ping = on_ping
+        self.ping_interval = ping_interval
+
+        self._heap: List[Tuple[float, int]] = []
+        self._deadlines: Dict[int, float] = {}   # user_id -> актуальный дедлайн
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self._sweeps = 0
+        self._pings = 0
+        self._due = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def schedule(self, user_id: int, deadline: float) -> None:
+        """Установить (заменить) дедлайн пользователя, time.monotonic()"""
+        previous = self._deadlines.get(user_id)
+        self._deadlines[user_id] = deadline
+        heapq.heappush(self._heap, (deadline, user_id))
+        # Будим планировщик, только если дедлайн стал ближайшим
+        if self._wakeup and (previous is None or deadline < previous) and self._heap[0][1] == user_id:
+            self._wakeup.set()
+
+    def cancel(self, user_id: int) -> None:
+        """Снять дедлайн пользователя (запись в куче станет устаревшей)"""
+        self._deadlines.pop(user_id, None)
+
+    def _pop_due(self, now: float) -> List[int]:
+        """Пользователи с наступившими (с точностью до TICK) дедлайнами"""
+        due = []
+        while self._heap and self._heap[0][0] <= now + self.TICK:
+            deadline, user_id = heapq.heappop(self._heap)
+            if self._deadlines.get(user_id) == deadline:
+                del self._deadlines[user_id]
+                due.append(user_id)
+        return due
+
+    async def _run(self) -> None:
+        next_ping = time.monotonic() + self.ping_interval
+
+        while True:
+            now = time.monotonic()
+
+            due = self._pop_due(now)
+            if due:
+                self._sweeps += 1
+                self._due += len(due)
+                try:
+                    await self._on_due(due)
+                except Exception as e:
+                    logger.error(f"Auth reaper sweep failed: {e}", exc_info=True)
+
+            if now >= next_ping:
+                self._pings += 1
+                next_ping = now + self.ping_interval
+                if self._deadlines:
+                    try:
+                        await self._on_ping()
+                    except Exception as e:
+                        logger.error(f"Auth reaper ping failed: {e}", exc_info=True)
+
+            wake_at = next_ping
+            if self._heap:
+                wake_at = min(wake_at, self._heap[0][0])
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, wake_at - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Запустить планировщик в текущем event loop (повторный вызов - no-op)"""
+        if not self.running:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info("Auth reaper started")
+
+    async def stop(self) -> None:
+        """Остановить планировщик"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict:
+        """Метрики планировщика"""
+        now = time.monotonic()
+        return {
+            'running': self.running,
+            'scheduled': len(self._deadlines),
+            'heap_size': len(self._heap),
+            'next_deadline_in': round(min(self._deadlines.values()) - now, 1) if self._deadlines else None,
+            'sweeps': self._sweeps,
+            'pings': self._pings,
+            'due': self._due,
+        }
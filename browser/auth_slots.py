@@ -0,0 +1,254 @@
+"""
+Пул слотов SMS авторизации.
+
+Каждая SMS авторизация держит в общем Chromium свой BrowserContext и
+страницу, пока пользователь вводит код (до нескольких минут). Пул
+ограничивает число одновременных авторизаций (AUTH_MAX_CONCURRENT),
+остальные ждут в FIFO очереди и получают свою позицию через callback.
+
+Для каждого слота учитывается время последней активности и память
+страницы (JS heap). Слоты без активности дольше AUTH_FLOW_IDLE_TIMEOUT
+считаются брошенными и закрываются планировщиком дедлайнов
+(browser/auth_reaper.py).
+
+Пример:
+    slot = await pool.acquire(user_id, on_position=notify)
+    ...
+    pool.release(user_id)
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Callback позиции в очереди: await on_position(position), позиции с 1
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class AuthSlotError(Exception):
+    """Слот авторизации не выдан (очередь переполнена, таймаут, отмена)"""
+    pass
+
+
+@dataclass
+class AuthSlot:
+    """Занятый слот авторизации"""
+    user_id: int
+    acquired_at: float = field(default_factory=time.monotonic)
+    last_activity: float = field(default_factory=time.monotonic)
+    memory_bytes: int = 0                # Последний замер JS heap страницы
+    waited_seconds: float = 0.0          # Сколько ждал в очереди
+
+    def touch(self) -> None:
+        """Отметить активность пользователя"""
+        self.last_activity = time.monotonic()
+
+    def idle_seconds(self, now: float = None) -> float:
+        return (now or time.monotonic()) - self.last_activity
+
+
+@dataclass
+class _Waiter:
+    """Ожидающий в очереди"""
+    user_id: int
+    future: asyncio.Future
+    on_position: Optional[PositionCallback]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    position: int = 0
+
+
+class AuthSlotPool:
+    """Ограниченный пул слотов с FIFO очередью (в одном event loop)"""
+
+    def __init__(
+        self,
+        max_slots: int = None,
+        max_waiting: int = None,
+        wait_timeout: float = None,
+        idle_timeout: float = None
+    ):
+        """
+        Args:
+            max_slots: Максимум одновременных авторизаций (AUTH_MAX_CONCURRENT)
+            max_waiting: Максимум ожидающих в очереди (AUTH_QUEUE_MAX)
+            wait_timeout: Сколько секунд ждать слот (AUTH_QUEUE_TIMEOUT)
+            idle_timeout: Через сколько секунд без активности слот брошен
+                (AUTH_FLOW_IDLE_TIMEOUT)
+        """
+        self.max_slots = max(1, Config.AUTH_MAX_CONCURRENT if max_slots is None else max_slots)
+        self.max_waiting = Config.AUTH_QUEUE_MAX if max_waiting is None else max_waiting
+        self.wait_timeout = Config.AUTH_QUEUE_TIMEOUT if wait_timeout is None else wait_timeout
+        self.idle_timeout = Config.AUTH_FLOW_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+
+        self._slots: Dict[int, AuthSlot] = {}
+        self._waiters: Deque[_Waiter] = deque()
+
+        # Метрики
+        self._granted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._reclaimed = 0
+        self._reclaimed_bytes = 0
+        self._max_wait = 0.0
+
+    @property
+    def full(self) -> bool:
+        """Все слоты заняты"""
+        return len(self._slots) >= self.max_slots
+
+    def get(self, user_id: int) -> Optional[AuthSlot]:
+        """Слот пользователя или None"""
+        return self._slots.get(user_id)
+
+    def touch(self, user_id: int) -> None:
+        """Отметить активность пользователя (ввод кода, запрос нового кода)"""
+        slot = self._slots.get(user_id)
+        if slot:
+            slot.touch()
+
+    def is_waiting(self, user_id: int) -> bool:
+        """Пользователь стоит в очереди"""
+        return any(w.user_id == user_id and not w.future.done() for w in self._waiters)
+
+    async def acquire(self, user_id: int, on_position: PositionCallback = None) -> AuthSlot:
+        """
+        Получить слот (или уже занятый слот пользователя).
+
+        Если свободных слотов нет, ждёт в очереди не дольше wait_timeout,
+        сообщая позицию через on_position.
+
+        Raises:
+            AuthSlotError: Очередь переполнена, истёк таймаут или ожидание отменено
+        """
+        slot = self._slots.get(user_id)
+        if slot:
+            slot.touch()
+            return slot
+
+        if self.is_waiting(user_id):
+            raise AuthSlotError("Вы уже в очереди на авторизацию")
+
+        if len(self._slots) < self.max_slots and not self._waiters:
+            return self._grant(user_id)
+
+        if len(self._waiters) >= self.max_waiting:
+            self._rejected += 1
+            raise AuthSlotError("Сервис авторизации перегружен")
+
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future(), on_position)
+        self._waiters.append(waiter)
+        self._queued += 1
+        self._notify_positions()
+        logger.info(f"Auth slot queue: user {user_id} waiting, position {len(self._waiters)}")
+
+        try:
+            return await asyncio.wait_for(waiter.future, self.wait_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise AuthSlotError("Истекло время ожидания в очереди на авторизацию")
+        except asyncio.CancelledError:
+            # Слот мог быть выдан в момент отмены - возвращаем его в пул
+            future = waiter.future
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(user_id)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._notify_positions()
+
+    def release(self, user_id: int) -> Optional[AuthSlot]:
+        """
+        Освободить слот пользователя и передать его первому в очереди.
+
+        Ожидание в очереди этого пользователя отменяется.
+
+        Returns:
+            Освобождённый слот или None
+        """
+        for waiter in list(self._waiters):
+            if waiter.user_id == user_id:
+                self._waiters.remove(waiter)
+                if not waiter.future.done():
+                    waiter.future.set_exception(AuthSlotError("Авторизация отменена"))
+
+        slot = self._slots.pop(user_id, None)
+        self._grant_waiting()
+        return slot
+
+    def record_reclaim(self, slot: AuthSlot) -> None:
+        """Учесть принудительно освобождённый слот"""
+        self._reclaimed += 1
+        self._reclaimed_bytes += slot.memory_bytes
+
+    def user_ids(self) -> List[int]:
+        """ID пользователей с занятыми слотами"""
+        return list(self._slots)
+
+    def _grant(self, user_id: int, waited: float = 0.0) -> AuthSlot:
+        slot = AuthSlot(user_id=user_id, waited_seconds=waited)
+        self._slots[user_id] = slot
+        self._granted += 1
+        self._max_wait = max(self._max_wait, waited)
+        return slot
+
+    def _grant_waiting(self) -> None:
+        """Выдать освободившиеся слоты ожидающим по порядку"""
+        while self._waiters and len(self._slots) < self.max_slots:
+            waiter = self._waiters.popleft()
+            if waiter.future.done():
+                continue
+            waited = time.monotonic() - waiter.enqueued_at
+            waiter.future.set_result(self._grant(waiter.user_id, waited))
+            logger.info(f"Auth slot granted to user {waiter.user_id} after {waited:.1f}s in queue")
+        self._notify_positions()
+
+    def _notify_positions(self) -> None:
+        """Сообщить ожидающим их новую позицию (только при изменении)"""
+        for position, waiter in enumerate(self._waiters, start=1):
+            if waiter.position != position and waiter.on_position and not waiter.future.done():
+                waiter.position = position
+                asyncio.create_task(self._call_position(waiter, position))
+
+    @staticmethod
+    async def _call_position(waiter: _Waiter, position: int) -> None:
+        try:
+            await waiter.on_position(position)
+        except Exception as e:
+            logger.debug(f"Auth queue position callback failed for user {waiter.user_id}: {e}")
+
+    def get_stats(self) -> Dict:
+        """Метрики пула"""
+        now = time.monotonic()
+        memory = sum(slot.memory_bytes for slot in self._slots.values())
+        return {
+            'max_slots': self.max_slots,
+            'active': len(self._slots),
+            'waiting': len(self._waiters),
+            'max_waiting': self.max_waiting,
+            'memory_mb': round(memory / 1024 / 1024, 1),
+            'granted': self._granted,
+            'queued': self._queued,
+            'rejected': self._rejected,
+            'timeouts': self._timeouts,
+            'reclaimed': self._reclaimed,
+            'reclaimed_mb': round(self._reclaimed_bytes / 1024 / 1024, 1),
+            'max_wait_seconds': round(self._max_wait, 1),
+            'slots': [
+                {
+                    'user_id': slot.user_id,
+                    'age_seconds': round(now - slot.acquired_at),
+                    'idle_seconds': round(slot.idle_seconds(now)),
+                    'memory_mb': round(slot.memory_bytes / 1024 / 1024, 1),
+                }
+                for slot in self._slots.values()
+            ],
+        }
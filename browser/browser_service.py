@@ -12,13 +12,38 @@ import asyncio
 import json
 import logging
 import random
-from typing import Optional
+import time
+from typing import Dict, Optional, Tuple
 from pathlib import Path
 
 from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 
+from .stealth import get_init_bundle
+
 logger = logging.getLogger(__name__)
 
+# Метрики создания контекстов (все экземпляры BrowserService)
+_context_stats = {'count': 0, 'total_ms': 0, 'max_ms': 0, 'last_ms': 0}
+
+
+def _record_context(elapsed_ms: int) -> None:
+    _context_stats['count'] += 1
+    _context_stats['total_ms'] += elapsed_ms
+    _context_stats['max_ms'] = max(_context_stats['max_ms'], elapsed_ms)
+    _context_stats['last_ms'] = elapsed_ms
+
+
+def get_context_stats() -> Dict:
+    """Время создания browser context (мс) и размер init script"""
+    count = _context_stats['count']
+    return {
+        'contexts': count,
+        'avg_ms': _context_stats['total_ms'] // count if count else 0,
+        'max_ms': _context_stats['max_ms'],
+        'last_ms': _context_stats['last_ms'],
+        'init_script_bytes': len(get_init_bundle()),
+    }
+
 
 class BrowserService:
     """Сервис для управления браузером Playwright"""
@@ -60,6 +85,8 @@ class BrowserService:
             return
 
         logger.info("Запуск Playwright...")
+        # Stealth bundle собирается один раз, до первого контекста
+        get_init_bundle()
         self._playwright = await async_playwright().start()
 
         # Запускаем Chromium с расширенными параметрами для stealth
@@ -122,7 +149,10 @@ class BrowserService:
     async def create_context(
         self,
         cookies: Optional[list] = None,
-        proxy: Optional[dict] = None
+        proxy: Optional[dict] = None,
+        init_scripts: Tuple[str, ...] = (),
+        storage_state: Optional[dict] = None,
+        session_scripts: Tuple[str, ...] = ()
     ) -> BrowserContext:
         """
         Создание нового browser context с настройками stealth.
@@ -130,6 +160,12 @@ class BrowserService:
         Args:
             cookies: Список cookies для восстановления сессии
             proxy: Настройки прокси {'server': 'http://...', 'username': '...', 'password': '...'}
+            init_scripts: Дополнительные init скрипты сценария (ставятся
+                одним bundle вместе со stealth, см. browser/stealth.py)
+            storage_state: localStorage сессии в формате Playwright
+                (см. utils/session_state.py)
+            session_scripts: Init скрипты конкретной сессии (sessionStorage);
+                в отличие от init_scripts не кэшируются
 
         Returns:
             BrowserContext с настройками stealth
@@ -137,6 +173,8 @@ class BrowserService:
         if not self._browser:
             await self.start()
 
+        started = time.monotonic()
+
         # Случайный user agent
         user_agent = random.choice(self.USER_AGENTS)
 
@@ -155,258 +193,22 @@ class BrowserService:
         if proxy:
             context_params['proxy'] = proxy
 
+        if storage_state:
+            context_params['storage_state'] = storage_state
+
         context = await self._browser.new_context(**context_params)
 
-        # Применяем stealth скрипты
-        await self._apply_stealth(context)
+        # Stealth и скрипты сценария - одним init script
+        await context.add_init_script(get_init_bundle(tuple(init_scripts), tuple(session_scripts)))
 
         # Восстанавливаем cookies если есть
         if cookies:
             await context.add_cookies(cookies)
             logger.debug(f"Восстановлено {len(cookies)} cookies")
 
+        _record_context(int((time.monotonic() - started) * 1000))
         return context
 
-    async def _apply_stealth(self, context: BrowserContext) -> None:
-        """
-        Применение продвинутых stealth скриптов для маскировки автоматизации.
-
-        Обходит:
-        - navigator.webdriver detection
-        - Chrome automation flags
-        - Headless detection
-        - WebGL fingerprint checks
-        - Canvas fingerprint checks
-        - AudioContext fingerprint
-        - Permission API anomalies
-        """
-        stealth_script = """
-        // =====================================================
-        // COMPREHENSIVE STEALTH SCRIPT v2.0
-        // =====================================================
-
-        // 1. Скрываем webdriver
-        Object.defineProperty(navigator, 'webdriver', {
-            get: () => undefined,
-            configurable: true
-        });
-
-        // Также убираем из prototype
-        delete Navigator.prototype.webdriver;
-
-        // 2. Подделываем chrome object (как в реальном Chrome)
-        window.chrome = {
-            app: {
-                isInstalled: false,
-                InstallState: {DISABLED: 'disabled', INSTALLED: 'installed', NOT_INSTALLED: 'not_installed'},
-                RunningState: {CANNOT_RUN: 'cannot_run', READY_TO_RUN: 'ready_to_run', RUNNING: 'running'}
-            },
-            runtime: {
-                OnInstalledReason: {CHROME_UPDATE: 'chrome_update', INSTALL: 'install', SHARED_MODULE_UPDATE: 'shared_module_update', UPDATE: 'update'},
-                OnRestartRequiredReason: {APP_UPDATE: 'app_update', OS_UPDATE: 'os_update', PERIODIC: 'periodic'},
-                PlatformArch: {ARM: 'arm', ARM64: 'arm64', MIPS: 'mips', MIPS64: 'mips64', X86_32: 'x86-32', X86_64: 'x86-64'},
-                PlatformNaclArch: {ARM: 'arm', MIPS: 'mips', MIPS64: 'mips64', X86_32: 'x86-32', X86_64: 'x86-64'},
-                PlatformOs: {ANDROID: 'android', CROS: 'cros', LINUX: 'linux', MAC: 'mac', OPENBSD: 'openbsd', WIN: 'win'},
-                RequestUpdateCheckStatus: {NO_UPDATE: 'no_update', THROTTLED: 'throttled', UPDATE_AVAILABLE: 'update_available'},
-                connect: function() {},
-                sendMessage: function() {}
-            },
-            csi: function() { return {}; },
-            loadTimes: function() {
-                return {
-                    commitLoadTime: Date.now() / 1000 - Math.random() * 5,
-                    connectionInfo: 'http/1.1',
-                    finishDocumentLoadTime: Date.now() / 1000 - Math.random() * 2,
-                    finishLoadTime: Date.now() / 1000 - Math.random(),
-                    firstPaintAfterLoadTime: 0,
-                    firstPaintTime: Date.now() / 1000 - Math.random() * 3,
-                    navigationType: 'Other',
-                    npnNegotiatedProtocol: 'unknown',
-                    requestTime: Date.now() / 1000 - Math.random() * 10,
-                    startLoadTime: Date.now() / 1000 - Math.random() * 8,
-                    wasAlternateProtocolAvailable: false,
-                    wasFetchedViaSpdy: false,
-                    wasNpnNegotiated: false
-                };
-            }
-        };
-
-        // 3. Подделываем plugins (как в реальном Chrome)
-        const makePluginArray = () => {
-            const plugins = [
-                { name: 'Chrome PDF Plugin', description: 'Portable Document Format', filename: 'internal-pdf-viewer', mimeTypes: ['application/x-google-chrome-pdf'] },
-                { name: 'Chrome PDF Viewer', description: '', filename: 'mhjfbmdgcfjbbpaeojofohoefgiehjai', mimeTypes: ['application/pdf'] },
-                { name: 'Native Client', description: '', filename: 'internal-nacl-plugin', mimeTypes: ['application/x-nacl', 'application/x-pnacl'] }
-            ];
-
-            const pluginArray = [];
-            plugins.forEach((p, i) => {
-                const plugin = Object.create(Plugin.prototype);
-                Object.defineProperties(plugin, {
-                    name: { value: p.name, enumerable: true },
-                    description: { value: p.description, enumerable: true },
-                    filename: { value: p.filename, enumerable: true },
-                    length: { value: p.mimeTypes.length, enumerable: true }
-                });
-                pluginArray.push(plugin);
-            });
-
-            Object.setPrototypeOf(pluginArray, PluginArray.prototype);
-            return pluginArray;
-        };
-
-        Object.defineProperty(navigator, 'plugins', {
-            get: () => makePluginArray(),
-            configurable: true
-        });
-
-        // 4. Подделываем mimeTypes
-        Object.defineProperty(navigator, 'mimeTypes', {
-            get: () => {
-                const mimes = ['application/pdf', 'application/x-google-chrome-pdf', 'application/x-nacl', 'application/x-pnacl'];
-                const mimeArray = [];
-                mimes.forEach(m => {
-                    const mimeType = Object.create(MimeType.prototype);
-                    Object.defineProperties(mimeType, {
-                        type: { value: m, enumerable: true },
-                        suffixes: { value: m === 'application/pdf' ? 'pdf' : '', enumerable: true },
-                        description: { value: '', enumerable: true }
-                    });
-                    mimeArray.push(mimeType);
-                });
-                Object.setPrototypeOf(mimeArray, MimeTypeArray.prototype);
-                return mimeArray;
-            },
-            configurable: true
-        });
-
-        // 5. Подделываем languages
-        Object.defineProperty(navigator, 'languages', {
-            get: () => Object.freeze(['ru-RU', 'ru', 'en-US', 'en']),
-            configurable: true
-        });
-
-        // 6. Скрываем headless mode
-        Object.defineProperty(navigator, 'hardwareConcurrency', {
-            get: () => 8,  // Типичное значение для desktop
-            configurable: true
-        });
-
-        Object.defineProperty(navigator, 'deviceMemory', {
-            get: () => 8,  // 8GB RAM
-            configurable: true
-        });
-
-        // 7. Подделываем permissions API
-        const originalQuery = window.navigator.permissions.query;
-        window.navigator.permissions.query = async function(parameters) {
-            if (parameters.name === 'notifications') {
-                return { state: 'prompt', onchange: null };
-            }
-            if (parameters.name === 'geolocation') {
-                return { state: 'granted', onchange: null };
-            }
-            try {
-                return await originalQuery.call(this, parameters);
-            } catch (e) {
-                return { state: 'prompt', onchange: null };
-            }
-        };
-
-        // 8. Скрываем WebDriver-related свойства
-        const propertiesToDelete = [
-            'cdc_adoQpoasnfa76pfcZLmcfl_Array',
-            'cdc_adoQpoasnfa76pfcZLmcfl_Promise',
-            'cdc_adoQpoasnfa76pfcZLmcfl_Symbol',
-            '__webdriver_evaluate',
-            '__selenium_evaluate',
-            '__webdriver_script_function',
-            '__webdriver_script_func',
-            '__webdriver_script_fn',
-            '__fxdriver_evaluate',
-            '__driver_unwrapped',
-            '__webdriver_unwrapped',
-            '__driver_evaluate',
-            '__selenium_unwrapped',
-            '__fxdriver_unwrapped',
-            '_Selenium_IDE_Recorder',
-            '_selenium',
-            'calledSelenium',
-            '$cdc_asdjflasutopfhvcZLmcfl_',
-            '$chrome_asyncScriptInfo',
-            '__$webdriverAsyncExecutor'
-        ];
-
-        propertiesToDelete.forEach(prop => {
-            try {
-                delete window[prop];
-            } catch (e) {}
-        });
-
-        // 9. Подделываем connection info (скрываем headless)
-        Object.defineProperty(navigator, 'connection', {
-            get: () => ({
-                effectiveType: '4g',
-                rtt: 50,
-                downlink: 10,
-                saveData: false,
-                onchange: null
-            }),
-            configurable: true
-        });
-
-        // 10. Консистентный screen (не выдаёт headless)
-        Object.defineProperty(window, 'outerWidth', { get: () => window.innerWidth, configurable: true });
-        Object.defineProperty(window, 'outerHeight', { get: () => window.innerHeight + 85, configurable: true });
-
-        // 11. Защита от canvas fingerprint detection
-        const originalToDataURL = HTMLCanvasElement.prototype.toDataURL;
-        HTMLCanvasElement.prototype.toDataURL = function(type) {
-            if (type === 'image/png' && this.width === 16 && this.height === 16) {
-                // Это скорее всего fingerprint check - добавляем шум
-                const ctx = this.getContext('2d');
-                const imageData = ctx.getImageData(0, 0, this.width, this.height);
-                for (let i = 0; i < imageData.data.length; i += 4) {
-                    imageData.data[i] = imageData.data[i] ^ (Math.random() * 2 | 0);
-                }
-                ctx.putImageData(imageData, 0, 0);
-            }
-            return originalToDataURL.apply(this, arguments);
-        };
-
-        // 12. Маскируем Notification API
-        if (window.Notification) {
-            Object.defineProperty(Notification, 'permission', {
-                get: () => 'default',
-                configurable: true
-            });
-        }
-
-        // 13. Console log trap (некоторые сайты проверяют console)
-        const originalConsoleLog = console.log;
-        console.log = function() {
-            // Скрываем логи Playwright
-            const args = Array.from(arguments);
-            const isPlaywrightLog = args.some(arg =>
-                typeof arg === 'string' &&
-                (arg.includes('playwright') || arg.includes('puppeteer') || arg.includes('selenium'))
-            );
-            if (!isPlaywrightLog) {
-                originalConsoleLog.apply(console, arguments);
-            }
-        };
-
-        // 14. Скрываем iframe detection
-        Object.defineProperty(window, 'frameElement', {
-            get: () => null,
-            configurable: true
-        });
-
-        console.log('[Stealth] Anti-detection scripts loaded');
-        """
-
-        await context.add_init_script(stealth_script)
-
     async def create_page(self, context: BrowserContext) -> Page:
         """
         Создание новой страницы с настройками.
@@ -12,12 +12,16 @@ import asyncio
 import logging
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional
+import time
+from typing import List, Optional, Tuple
 
 from playwright.async_api import BrowserContext, Page, TimeoutError as PlaywrightTimeout
 
 from .browser_service import BrowserService, get_browser_service
-from utils.encryption import decrypt_token, encrypt_token
+from utils.diagnostics import get_diagnostics
+from utils.encryption import encrypt_token
+from utils.session_cache import get_session_cookies
+from utils.session_state import context_options, load_session_state, record_restore, save_session_state
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +46,15 @@ class RedistributionResult:
     screenshot: Optional[bytes] = None  # Скриншот для отладки
 
 
+@dataclass
+class RedistributionItem:
+    """Параметры одного перемещения"""
+    nm_id: int
+    source_warehouse_id: int
+    target_warehouse_id: int
+    quantity: int
+
+
 class WBRedistributionService:
     """Сервис перемещения остатков"""
 
@@ -87,18 +100,42 @@ class WBRedistributionService:
         await service.start()
         return service
 
+    async def _open_context(
+        self,
+        browser: BrowserService,
+        cookies_encrypted: str,
+        session_id: Optional[int] = None
+    ) -> Tuple[BrowserContext, bool]:
+        """
+        Контекст восстановленной сессии: cookies и снимок storage state
+        (localStorage/sessionStorage ЛК), если он сохранён.
+
+        Returns:
+            (context, восстановлен ли снимок)
+        """
+        cookies = get_session_cookies(cookies_encrypted, session_id)
+        snapshot = await load_session_state(session_id)
+        context = await browser.create_context(cookies=cookies, **context_options(snapshot))
+        return context, snapshot is not None
+
     async def refresh_session(
         self,
-        cookies_encrypted: str
+        cookies_encrypted: str,
+        session_id: Optional[int] = None,
+        raise_errors: bool = False
     ) -> Optional[str]:
         """
         Попытка обновить сессию без SMS.
 
         Открывает главную страницу WB с существующими cookies.
-        Если авторизация всё ещё валидна, WB может обновить cookies.
+        Если авторизация всё ещё валидна, WB может обновить cookies,
+        а снимок storage state сессии обновляется.
 
         Args:
             cookies_encrypted: Текущие зашифрованные cookies
+            session_id: ID сессии (для снимка storage state)
+            raise_errors: Пробрасывать ошибки браузера (сбой, таймаут) вместо
+                None - чтобы отличить их от истёкшей сессии
 
         Returns:
             Новые зашифрованные cookies если успешно, None если сессия истекла
@@ -108,15 +145,14 @@ class WBRedistributionService:
         page: Optional[Page] = None
 
         try:
-            cookies_json = decrypt_token(cookies_encrypted)
-            cookies = browser.deserialize_cookies(cookies_json)
-
-            context = await browser.create_context(cookies=cookies)
+            context, restored = await self._open_context(browser, cookies_encrypted, session_id)
             page = await browser.create_page(context)
 
             # Открываем главную страницу (не требовательную)
             logger.info(f"Attempting to refresh session by opening {self.MAIN_PAGE_URL}")
+            started = time.monotonic()
             await page.goto(self.MAIN_PAGE_URL, wait_until='domcontentloaded', timeout=30000)
+            warmup_ms = int((time.monotonic() - started) * 1000)
             await browser.human_delay(2000, 3000)
 
             # Проверяем URL после навигации
@@ -124,7 +160,9 @@ class WBRedistributionService:
             logger.info(f"Current URL after refresh attempt: {current_url}")
 
             # Если редирект на логин - сессия истекла
-            if '/login' in current_url or '/auth' in current_url or 'passport' in current_url:
+            expired = '/login' in current_url or '/auth' in current_url or 'passport' in current_url
+            record_restore(restored, expired, warmup_ms)
+            if expired:
                 logger.warning("Session expired, refresh failed - need full re-authentication")
                 return None
 
@@ -134,11 +172,15 @@ class WBRedistributionService:
             new_cookies_json = browser.serialize_cookies(new_cookies)
             new_cookies_encrypted = encrypt_token(new_cookies_json)
 
+            await save_session_state(session_id, context, page)
+
             logger.info(f"Session refreshed successfully, extracted {len(new_cookies)} cookies")
             return new_cookies_encrypted
 
         except Exception as e:
             logger.error(f"Error refreshing session: {e}", exc_info=True)
+            if raise_errors:
+                raise
             return None
 
         finally:
@@ -151,7 +193,8 @@ class WBRedistributionService:
         nm_id: int,
         source_warehouse_id: int,
         target_warehouse_id: int,
-        quantity: int
+        quantity: int,
+        session_id: Optional[int] = None
     ) -> RedistributionResult:
         """
         Выполнить перемещение остатков.
@@ -162,25 +205,105 @@ class WBRedistributionService:
             source_warehouse_id: ID склада-источника
             target_warehouse_id: ID склада-назначения
             quantity: Количество
+            session_id: ID сессии (для снимка storage state)
 
         Returns:
             RedistributionResult с результатом
         """
+        results = await self.execute_batch(
+            cookies_encrypted,
+            [RedistributionItem(
+                nm_id=nm_id,
+                source_warehouse_id=source_warehouse_id,
+                target_warehouse_id=target_warehouse_id,
+                quantity=quantity
+            )],
+            session_id
+        )
+        return results[0]
+
+    async def execute_batch(
+        self,
+        cookies_encrypted: str,
+        items: List[RedistributionItem],
+        session_id: Optional[int] = None
+    ) -> List[RedistributionResult]:
+        """
+        Выполнить несколько перемещений одного аккаунта в одном браузере.
+
+        Запуск браузера и восстановление cookies выполняются
+        один раз на всю пачку.
+
+        Args:
+            cookies_encrypted: Зашифрованные cookies сессии
+            items: Перемещения для выполнения
+            session_id: ID сессии (для снимка storage state)
+
+        Returns:
+            Список RedistributionResult в том же порядке, что и items
+        """
+        results: List[RedistributionResult] = []
         browser = await self._get_browser()
         context: Optional[BrowserContext] = None
         page: Optional[Page] = None
 
         try:
-            # Расшифровываем и парсим cookies
-            cookies_json = decrypt_token(cookies_encrypted)
-            cookies = browser.deserialize_cookies(cookies_json)
-
-            # Создаём контекст с сессией
-            context = await browser.create_context(cookies=cookies)
+            # Создаём контекст с сессией (cookies из кэша сессий, снимок storage state)
+            context, restored = await self._open_context(browser, cookies_encrypted, session_id)
             page = await browser.create_page(context)
 
-            # Открываем страницу перемещения
-            logger.info(f"Opening redistribution page for nm_id={nm_id}")
+            for item in items:
+                result = await self._execute_item(page, browser, item)
+                results.append(result)
+                if len(results) == 1:
+                    record_restore(restored, result.status == RedistributionStatus.SESSION_EXPIRED)
+
+                if result.status == RedistributionStatus.SESSION_EXPIRED:
+                    # Остальные перемещения тоже не выполнить
+                    break
+
+        except Exception as e:
+            logger.error(f"Error during redistribution batch: {e}", exc_info=True)
+            screenshot = await browser.take_screenshot(page) if page else None
+            results.append(RedistributionResult(
+                status=RedistributionStatus.ERROR,
+                message=f"Ошибка: {str(e)}",
+                screenshot=screenshot
+            ))
+
+        finally:
+            if context:
+                await context.close()
+            if browser:
+                await browser.stop()
+
+        # Для невыполненных перемещений повторяем последний (фатальный) результат
+        while len(results) < len(items):
+            last = results[-1]
+            results.append(RedistributionResult(status=last.status, message=last.message))
+
+        return results
+
+    async def _execute_item(
+        self,
+        page: Page,
+        browser: BrowserService,
+        item: RedistributionItem
+    ) -> RedistributionResult:
+        """
+        Выполнить одно перемещение на уже открытой странице.
+
+        Args:
+            page: Страница с восстановленной сессией
+            browser: Browser service
+            item: Параметры перемещения
+
+        Returns:
+            RedistributionResult с результатом
+        """
+        try:
+            # Открываем страницу перемещения (сбрасывает состояние после прошлого товара)
+            logger.info(f"Opening redistribution page for nm_id={item.nm_id}")
             await page.goto(self.REDISTRIBUTION_URL, wait_until='networkidle')
             await browser.human_delay(2000, 3000)
 
@@ -194,19 +317,19 @@ class WBRedistributionService:
                 )
 
             # Ищем артикул
-            result = await self._search_article(page, browser, nm_id)
+            result = await self._search_article(page, browser, item.nm_id)
             if result:
                 return result
 
             # Выбираем склады
             result = await self._select_warehouses(
-                page, browser, source_warehouse_id, target_warehouse_id
+                page, browser, item.source_warehouse_id, item.target_warehouse_id
             )
             if result:
                 return result
 
             # Вводим количество
-            result = await self._enter_quantity(page, browser, quantity)
+            result = await self._enter_quantity(page, browser, item.quantity)
             if result:
                 return result
 
@@ -215,28 +338,20 @@ class WBRedistributionService:
 
         except PlaywrightTimeout as e:
             logger.error(f"Timeout during redistribution: {e}")
-            screenshot = await browser.take_screenshot(page) if page else None
             return RedistributionResult(
                 status=RedistributionStatus.ERROR,
                 message="Превышено время ожидания. Попробуйте позже.",
-                screenshot=screenshot
+                screenshot=await browser.take_screenshot(page)
             )
 
         except Exception as e:
             logger.error(f"Error during redistribution: {e}", exc_info=True)
-            screenshot = await browser.take_screenshot(page) if page else None
             return RedistributionResult(
                 status=RedistributionStatus.ERROR,
                 message=f"Ошибка: {str(e)}",
-                screenshot=screenshot
+                screenshot=await browser.take_screenshot(page)
             )
 
-        finally:
-            if context:
-                await context.close()
-            if browser:
-                await browser.stop()
-
     async def _search_article(
         self,
         page: Page,
@@ -472,7 +587,8 @@ class WBRedistributionService:
     async def check_quota(
         self,
         cookies_encrypted: str,
-        warehouse_id: int
+        warehouse_id: int,
+        session_id: Optional[int] = None
     ) -> Optional[int]:
         """
         Проверить квоту на складе.
@@ -480,6 +596,7 @@ class WBRedistributionService:
         Args:
             cookies_encrypted: Зашифрованные cookies
             warehouse_id: ID склада
+            session_id: ID сессии (для снимка storage state)
 
         Returns:
             Доступная квота или None если не удалось определить
@@ -488,10 +605,7 @@ class WBRedistributionService:
         context: Optional[BrowserContext] = None
 
         try:
-            cookies_json = decrypt_token(cookies_encrypted)
-            cookies = browser.deserialize_cookies(cookies_json)
-
-            context = await browser.create_context(cookies=cookies)
+            context, _ = await self._open_context(browser, cookies_encrypted, session_id)
             page = await browser.create_page(context)
 
             await page.goto(self.REDISTRIBUTION_URL, wait_until='networkidle')
@@ -516,7 +630,8 @@ class WBRedistributionService:
     async def search_product_via_modal(
         self,
         cookies_encrypted: str,
-        query: str
+        query: str,
+        session_id: Optional[int] = None
     ) -> list:
         """
         Поиск товара через модальное окно "Перераспределить остатки".
@@ -527,6 +642,7 @@ class WBRedistributionService:
         Args:
             cookies_encrypted: Зашифрованные cookies
             query: Артикул или часть артикула
+            session_id: ID сессии (для снимка storage state)
 
         Returns:
             Список найденных товаров
@@ -536,14 +652,13 @@ class WBRedistributionService:
         page: Optional[Page] = None
 
         try:
-            cookies_json = decrypt_token(cookies_encrypted)
-            cookies = browser.deserialize_cookies(cookies_json)
-
-            context = await browser.create_context(cookies=cookies)
+            context, restored = await self._open_context(browser, cookies_encrypted, session_id)
             page = await browser.create_page(context)
 
             # Перехватываем API ответы (особенно autocomplete)
             captured_data = []
+            diagnostics = get_diagnostics()
+            verbose = diagnostics.verbose()
 
             async def capture_response(response):
                 url = response.url
@@ -554,7 +669,8 @@ class WBRedistributionService:
                         try:
                             data = await response.json()
                             captured_data.append({'url': url, 'data': data})
-                            logger.info(f"📡 Captured API: {url[:100]}")
+                            if verbose:
+                                logger.info(f"📡 Captured API: {url[:100]}")
                         except Exception as e:
                             pass  # Не все ответы JSON
 
@@ -562,18 +678,19 @@ class WBRedistributionService:
 
             # Открываем страницу остатков
             logger.info(f"Opening {self.STOCKS_URL} for product search")
+            started = time.monotonic()
             await page.goto(self.STOCKS_URL, wait_until='networkidle', timeout=30000)
+            warmup_ms = int((time.monotonic() - started) * 1000)
             await browser.human_delay(1500, 2500)
 
             # Проверяем авторизацию
             current_url = page.url
             logger.info(f"Current URL after navigation: {current_url}")
-            if '/login' in current_url or 'auth' in current_url:
+            expired = '/login' in current_url or 'auth' in current_url
+            record_restore(restored, expired, warmup_ms)
+            if expired:
                 logger.warning(f"Session expired - redirected to: {current_url}")
-                # Сохраняем скриншот для отладки
-                screenshot_path = "/tmp/wb_session_expired.png"
-                await browser.take_screenshot(page, path=screenshot_path)
-                logger.info(f"Session expired screenshot saved to {screenshot_path}")
+                await diagnostics.screenshot(page, 'session_expired')
                 return []
 
             # ОБЯЗАТЕЛЬНО: Настраиваем таблицу (включаем "Артикул WB")
@@ -674,10 +791,7 @@ class WBRedistributionService:
 
             if not redistribute_btn:
                 logger.warning("Redistribute button not found, trying search on page directly")
-                # Сохраняем скриншот для отладки
-                screenshot_path = "/tmp/wb_debug_screenshot.png"
-                await browser.take_screenshot(page, path=screenshot_path)
-                logger.info(f"Screenshot saved to {screenshot_path}")
+                await diagnostics.screenshot(page, 'redistribute_button_not_found')
 
                 # Пробуем найти поле поиска прямо на странице
                 search_selectors = [
@@ -762,11 +876,12 @@ class WBRedistributionService:
                 data = item['data']
 
                 # Логируем все API для отладки
-                logger.info(f"API: {url[:120]}")
-                if isinstance(data, dict):
-                    logger.info(f"  Keys: {list(data.keys())[:10]}")
-                elif isinstance(data, list):
-                    logger.info(f"  List with {len(data)} items")
+                if verbose:
+                    logger.info(f"API: {url[:120]}")
+                    if isinstance(data, dict):
+                        logger.info(f"  Keys: {list(data.keys())[:10]}")
+                    elif isinstance(data, list):
+                        logger.info(f"  List with {len(data)} items")
 
                 # Проверяем разные варианты структуры ответа
                 if isinstance(data, list) and len(data) > 0:
@@ -809,7 +924,8 @@ class WBRedistributionService:
     async def get_warehouse_stocks(
         self,
         cookies_encrypted: str,
-        query: Optional[str] = None
+        query: Optional[str] = None,
+        session_id: Optional[int] = None
     ) -> list:
         """
         Получить все остатки из таблицы на странице warehouse-remains.
@@ -817,6 +933,7 @@ class WBRedistributionService:
         Args:
             cookies_encrypted: Зашифрованные cookies
             query: Опциональный артикул для поиска (фильтрует результаты)
+            session_id: ID сессии (для снимка storage state)
 
         Returns:
             Список товаров с остатками
@@ -826,14 +943,13 @@ class WBRedistributionService:
         page: Optional[Page] = None
 
         try:
-            cookies_json = decrypt_token(cookies_encrypted)
-            cookies = browser.deserialize_cookies(cookies_json)
-
-            context = await browser.create_context(cookies=cookies)
+            context, restored = await self._open_context(browser, cookies_encrypted, session_id)
             page = await browser.create_page(context)
 
             # Перехватываем API ответы
             captured_data = []
+            diagnostics = get_diagnostics()
+            verbose = diagnostics.verbose()
 
             async def capture_response(response):
                 url = response.url
@@ -844,9 +960,9 @@ class WBRedistributionService:
                         try:
                             data = await response.json()
                             captured_data.append({'url': url, 'data': data})
-                            # Логируем больше информации
-                            data_info = f"list[{len(data)}]" if isinstance(data, list) else f"dict keys: {list(data.keys())[:5]}" if isinstance(data, dict) else type(data).__name__
-                            logger.info(f"📡 Captured API: {url[:100]} -> {data_info}")
+                            if verbose:
+                                data_info = f"list[{len(data)}]" if isinstance(data, list) else f"dict keys: {list(data.keys())[:5]}" if isinstance(data, dict) else type(data).__name__
+                                logger.info(f"📡 Captured API: {url[:100]} -> {data_info}")
                         except Exception as e:
                             pass  # Не все ответы JSON
 
@@ -854,14 +970,18 @@ class WBRedistributionService:
 
             # Открываем страницу с увеличенным timeout
             logger.info(f"Opening {self.STOCKS_URL}")
+            started = time.monotonic()
             await page.goto(self.STOCKS_URL, wait_until='domcontentloaded', timeout=60000)
+            warmup_ms = int((time.monotonic() - started) * 1000)
 
             # Проверяем URL после загрузки
             current_url = page.url
             logger.info(f"Current URL after navigation: {current_url}")
 
             # Проверяем редирект на логин
-            if '/login' in current_url or '/auth' in current_url or 'passport' in current_url:
+            expired = '/login' in current_url or '/auth' in current_url or 'passport' in current_url
+            record_restore(restored, expired, warmup_ms)
+            if expired:
                 logger.error(f"Session expired - redirected to login: {current_url}")
                 return []
 
@@ -917,16 +1037,16 @@ class WBRedistributionService:
             logger.info(f"After delay, captured {len(captured_data)} APIs")
 
             # Логируем что перехватили
-            logger.info(f"Total captured APIs: {len(captured_data)}")
-            for item in captured_data:
-                logger.info(f"API URL: {item['url'][:120]}")
-                data = item['data']
-                if isinstance(data, dict):
-                    logger.info(f"  Keys: {list(data.keys())[:10]}")
-                elif isinstance(data, list):
-                    logger.info(f"  List with {len(data)} items")
-                    if data and isinstance(data[0], dict):
-                        logger.info(f"  First item keys: {list(data[0].keys())[:10]}")
+            if verbose:
+                for item in captured_data:
+                    logger.info(f"API URL: {item['url'][:120]}")
+                    data = item['data']
+                    if isinstance(data, dict):
+                        logger.info(f"  Keys: {list(data.keys())[:10]}")
+                    elif isinstance(data, list):
+                        logger.info(f"  List with {len(data)} items")
+                        if data and isinstance(data[0], dict):
+                            logger.info(f"  First item keys: {list(data[0].keys())[:10]}")
 
             # Пробуем извлечь данные из API ответов
             # Приоритет: balances > remains > stocks
@@ -953,7 +1073,8 @@ class WBRedistributionService:
                                     logger.info(f"✅ Found stock data in '{key}' from {url[:60]}")
                                     return val
                             elif isinstance(val, dict):
-                                logger.info(f"  Key '{key}' contains dict with keys: {list(val.keys())[:5]}")
+                                if verbose:
+                                    logger.info(f"  Key '{key}' contains dict with keys: {list(val.keys())[:5]}")
                                 # Проверяем вложенные данные в словаре
                                 for nested_key in ['table', 'items', 'rows', 'data', 'content', 'list', 'results']:
                                     if nested_key in val:
@@ -963,9 +1084,9 @@ class WBRedistributionService:
                                             if len(nested_val) > 0:
                                                 logger.info(f"✅ Found stock data in nested '{key}.{nested_key}' from {url[:60]}")
                                                 return nested_val
-                                        elif isinstance(nested_val, dict):
+                                        elif verbose and isinstance(nested_val, dict):
                                             logger.info(f"    Nested '{key}.{nested_key}' is dict with keys: {list(nested_val.keys())[:5]}")
-                                        else:
+                                        elif verbose:
                                             logger.info(f"    Nested '{key}.{nested_key}' is {type(nested_val).__name__}: {str(nested_val)[:100]}")
 
             # Fallback: любые данные с nmId
@@ -996,10 +1117,7 @@ class WBRedistributionService:
         results = []
 
         try:
-            # Сохраняем скриншот для отладки
-            screenshot_path = "/tmp/wb_table_debug.png"
-            await page.screenshot(path=screenshot_path)
-            logger.info(f"Table page screenshot saved to {screenshot_path}")
+            await get_diagnostics().screenshot(page, 'stocks_table')
 
             # Ждем таблицу с увеличенным таймаутом
             await page.wait_for_selector('table', timeout=30000)
@@ -0,0 +1,318 @@
+"""
+Stealth скрипты (маскировка автоматизации) и общий init script контекста.
+
+Скрипт маскировки готовится один раз на процесс: комментарии и отступы
+вырезаются (minify_js), вместе с дополнительными скриптами сценария
+(например, детектор полей авторизации) он склеивается в один bundle и
+ставится в новый контекст одним вызовом add_init_script. Каждая часть
+bundle выполняется в своём блоке: ошибка в одной не мешает остальным.
+
+Маскирует:
+- navigator.webdriver detection
+- Chrome automation flags
+- Headless detection
+- WebGL fingerprint checks
+- Canvas fingerprint checks
+- AudioContext fingerprint
+- Permission API anomalies
+
+Пример:
+    await context.add_init_script(get_init_bundle((FIELD_DETECTOR_JS,)))
+"""
+
+from functools import lru_cache
+from typing import Tuple
+
+STEALTH_JS = r'''
+// =====================================================
+// COMPREHENSIVE STEALTH SCRIPT v2.0
+// =====================================================
+
+// 1. Скрываем webdriver
+Object.defineProperty(navigator, 'webdriver', {
+    get: () => undefined,
+    configurable: true
+});
+
+// Также убираем из prototype
+delete Navigator.prototype.webdriver;
+
+// 2. Подделываем chrome object (как в реальном Chrome)
+window.chrome = {
+    app: {
+        isInstalled: false,
+        InstallState: {DISABLED: 'disabled', INSTALLED: 'installed', NOT_INSTALLED: 'not_installed'},
+        RunningState: {CANNOT_RUN: 'cannot_run', READY_TO_RUN: 'ready_to_run', RUNNING: 'running'}
+    },
+    runtime: {
+        OnInstalledReason: {CHROME_UPDATE: 'chrome_update', INSTALL: 'install', SHARED_MODULE_UPDATE: 'shared_module_update', UPDATE: 'update'},
+        OnRestartRequiredReason: {APP_UPDATE: 'app_update', OS_UPDATE: 'os_update', PERIODIC: 'periodic'},
+        PlatformArch: {ARM: 'arm', ARM64: 'arm64', MIPS: 'mips', MIPS64: 'mips64', X86_32: 'x86-32', X86_64: 'x86-64'},
+        PlatformNaclArch: {ARM: 'arm', MIPS: 'mips', MIPS64: 'mips64', X86_32: 'x86-32', X86_64: 'x86-64'},
+        PlatformOs: {ANDROID: 'android', CROS: 'cros', LINUX: 'linux', MAC: 'mac', OPENBSD: 'openbsd', WIN: 'win'},
+        RequestUpdateCheckStatus: {NO_UPDATE: 'no_update', THROTTLED: 'throttled', UPDATE_AVAILABLE: 'update_available'},
+        connect: function() {},
+        sendMessage: function() {}
+    },
+    csi: function() { return {}; },
+    loadTimes: function() {
+        return {
+            commitLoadTime: Date.now() / 1000 - Math.random() * 5,
+            connectionInfo: 'http/1.1',
+            finishDocumentLoadTime: Date.now() / 1000 - Math.random() * 2,
+            finishLoadTime: Date.now() / 1000 - Math.random(),
+            firstPaintAfterLoadTime: 0,
+            firstPaintTime: Date.now() / 1000 - Math.random() * 3,
+            navigationType: 'Other',
+            npnNegotiatedProtocol: 'unknown',
+            requestTime: Date.now() / 1000 - Math.random() * 10,
+            startLoadTime: Date.now() / 1000 - Math.random() * 8,
+            wasAlternateProtocolAvailable: false,
+            wasFetchedViaSpdy: false,
+            wasNpnNegotiated: false
+        };
+    }
+};
+
+// 3. Подделываем plugins (как в реальном Chrome)
+const makePluginArray = () => {
+    const plugins = [
+        { name: 'Chrome PDF Plugin', description: 'Portable Document Format', filename: 'internal-pdf-viewer', mimeTypes: ['application/x-google-chrome-pdf'] },
+        { name: 'Chrome PDF Viewer', description: '', filename: 'mhjfbmdgcfjbbpaeojofohoefgiehjai', mimeTypes: ['application/pdf'] },
+        { name: 'Native Client', description: '', filename: 'internal-nacl-plugin', mimeTypes: ['application/x-nacl', 'application/x-pnacl'] }
+    ];
+
+    const pluginArray = [];
+    plugins.forEach((p, i) => {
+        const plugin = Object.create(Plugin.prototype);
+        Object.defineProperties(plugin, {
+            name: { value: p.name, enumerable: true },
+            description: { value: p.description, enumerable: true },
+            filename: { value: p.filename, enumerable: true },
+            length: { value: p.mimeTypes.length, enumerable: true }
+        });
+        pluginArray.push(plugin);
+    });
+
+    Object.setPrototypeOf(pluginArray, PluginArray.prototype);
+    return pluginArray;
+};
+
+Object.defineProperty(navigator, 'plugins', {
+    get: () => makePluginArray(),
+    configurable: true
+});
+
+// 4. Подделываем mimeTypes
+Object.defineProperty(navigator, 'mimeTypes', {
+    get: () => {
+        const mimes = ['application/pdf', 'application/x-google-chrome-pdf', 'application/x-nacl', 'application/x-pnacl'];
+        const mimeArray = [];
+        mimes.forEach(m => {
+            const mimeType = Object.create(MimeType.prototype);
+            Object.defineProperties(mimeType, {
+                type: { value: m, enumerable: true },
+                suffixes: { value: m === 'application/pdf' ? 'pdf' : '', enumerable: true },
+                description: { value: '', enumerable: true }
+            });
+            mimeArray.push(mimeType);
+        });
+        Object.setPrototypeOf(mimeArray, MimeTypeArray.prototype);
+        return mimeArray;
+    },
+    configurable: true
+});
+
+// 5. Подделываем languages
+Object.defineProperty(navigator, 'languages', {
+    get: () => Object.freeze(['ru-RU', 'ru', 'en-US', 'en']),
+    configurable: true
+});
+
+// 6. Скрываем headless mode
+Object.defineProperty(navigator, 'hardwareConcurrency', {
+    get: () => 8,  // Типичное значение для desktop
+    configurable: true
+});
+
+Object.defineProperty(navigator, 'deviceMemory', {
+    get: () => 8,  // 8GB RAM
+    configurable: true
+});
+
+// 7. Подделываем permissions API
+const originalQuery = window.navigator.permissions.query;
+window.navigator.permissions.query = async function(parameters) {
+    if (parameters.name === 'notifications') {
+        return { state: 'prompt', onchange: null };
+    }
+    if (parameters.name === 'geolocation') {
+        return { state: 'granted', onchange: null };
+    }
+    try {
+        return await originalQuery.call(this, parameters);
+    } catch (e) {
+        return { state: 'prompt', onchange: null };
+    }
+};
+
+// 8. Скрываем WebDriver-related свойства
+const propertiesToDelete = [
+    'cdc_adoQpoasnfa76pfcZLmcfl_Array',
+    'cdc_adoQpoasnfa76pfcZLmcfl_Promise',
+    'cdc_adoQpoasnfa76pfcZLmcfl_Symbol',
+    '__webdriver_evaluate',
+    '__selenium_evaluate',
+    '__webdriver_script_function',
+    '__webdriver_script_func',
+    '__webdriver_script_fn',
+    '__fxdriver_evaluate',
+    '__driver_unwrapped',
+    '__webdriver_unwrapped',
+    '__driver_evaluate',
+    '__selenium_unwrapped',
+    '__fxdriver_unwrapped',
+    '_Selenium_IDE_Recorder',
+    '_selenium',
+    'calledSelenium',
+    '$cdc_asdjflasutopfhvcZLmcfl_',
+    '$chrome_asyncScriptInfo',
+    '__$webdriverAsyncExecutor'
+];
+
+propertiesToDelete.forEach(prop => {
+    try {
+        delete window[prop];
+    } catch (e) {}
+});
+
+// 9. Подделываем connection info (скрываем headless)
+Object.defineProperty(navigator, 'connection', {
+    get: () => ({
+        effectiveType: '4g',
+        rtt: 50,
+        downlink: 10,
+        saveData: false,
+        onchange: null
+    }),
+    configurable: true
+});
+
+// 10. Консистентный screen (не выдаёт headless)
+Object.defineProperty(window, 'outerWidth', { get: () => window.innerWidth, configurable: true });
+Object.defineProperty(window, 'outerHeight', { get: () => window.innerHeight + 85, configurable: true });
+
+// 11. Защита от canvas fingerprint detection
+const originalToDataURL = HTMLCanvasElement.prototype.toDataURL;
+HTMLCanvasElement.prototype.toDataURL = function(type) {
+    if (type === 'image/png' && this.width === 16 && this.height === 16) {
+        // Это скорее всего fingerprint check - добавляем шум
+        const ctx = this.getContext('2d');
+        const imageData = ctx.getImageData(0, 0, this.width, this.height);
+        for (let i = 0; i < imageData.data.length; i += 4) {
+            imageData.data[i] = imageData.data[i] ^ (Math.random() * 2 | 0);
+        }
+        ctx.putImageData(imageData, 0, 0);
+    }
+    return originalToDataURL.apply(this, arguments);
+};
+
+// 12. Маскируем Notification API
+if (window.Notification) {
+    Object.defineProperty(Notification, 'permission', {
+        get: () => 'default',
+        configurable: true
+    });
+}
+
+// 13. Console log trap (некоторые сайты проверяют console)
+const originalConsoleLog = console.log;
+console.log = function() {
+    // Скрываем логи Playwright
+    const args = Array.from(arguments);
+    const isPlaywrightLog = args.some(arg =>
+        typeof arg === 'string' &&
+        (arg.includes('playwright') || arg.includes('puppeteer') || arg.includes('selenium'))
+    );
+    if (!isPlaywrightLog) {
+        originalConsoleLog.apply(console, arguments);
+    }
+};
+
+// 14. Скрываем iframe detection
+Object.defineProperty(window, 'frameElement', {
+    get: () => null,
+    configurable: true
+});
+'''
+
+
+def _strip_comment(line: str) -> str:
+    """Строка без комментария // (вне строковых литералов)"""
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '\'"`':
+            quote = char
+        elif line.startswith('//', i) and (i == 0 or line[i - 1] in ' \t;,{}()'):
+            return line[:i]
+        i += 1
+    return line
+
+
+def minify_js(source: str) -> str:
+    """
+    Убрать комментарии //, отступы и пустые строки.
+
+    Переводы строк сохраняются - автоматическая расстановка ';' в JS
+    работает так же, как в исходнике.
+    """
+    lines = (_strip_comment(line).strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def _wrap(script: str) -> str:
+    """Скрипт в своём блоке (ошибка не выходит наружу)"""
+    return f'{{ try {{\n{script}\n}} catch (e) {{}} }}'
+
+
+def _block(script: str) -> str:
+    """Минифицированный скрипт в своём блоке"""
+    return _wrap(minify_js(script))
+
+
+@lru_cache(maxsize=64)
+def _static_block(script: str) -> str:
+    """_block для статических скриптов (STEALTH_JS, скрипты сценария) - из кэша"""
+    return _block(script)
+
+
+def build_init_script(*scripts: str) -> str:
+    """Склеить скрипты в один init script (каждый в своём блоке, без кэша)"""
+    return '\n'.join(_block(script) for script in scripts)
+
+
+def get_init_bundle(
+    extra_scripts: Tuple[str, ...] = (),
+    session_scripts: Tuple[str, ...] = ()
+) -> str:
+    """
+    Init script контекста: маскировка и дополнительные скрипты.
+
+    Args:
+        extra_scripts: Статические скрипты сценария - минифицируются
+            один раз, дальше берутся из кэша
+        session_scripts: Скрипты конкретной сессии (например, восстановление
+            sessionStorage) - содержат токены, поэтому не кэшируются, и
+            данные, поэтому не минифицируются (splitlines режет строки
+            и по U+2028/U+2029)
+    """
+    blocks = [_static_block(script) for script in (STEALTH_JS, *extra_scripts)]
+    blocks.extend(_wrap(script) for script in session_scripts)
+    return '\n'.join(blocks)
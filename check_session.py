@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
-"""Проверка browser_session в БД"""
+"""Проверка browser_session в БД и живости сессии одним HTTP запросом"""
 
+import asyncio
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -8,6 +9,7 @@ from dotenv import load_dotenv
 load_dotenv(Path(__file__).parent / '.env')
 
 from db_factory import get_database
+from wb_api.internal_client import probe_session
 
 db = get_database()
 
@@ -25,6 +27,11 @@ if session:
             print(f"   {key}: {value[:50]}..." if value else f"   {key}: None")
         else:
             print(f"   {key}: {value}")
+
+    if session.get('cookies_encrypted'):
+        alive = asyncio.run(probe_session(session['cookies_encrypted'], session['id'], use_cache=False))
+        status = {True: "✅ alive", False: "❌ dead (login required)", None: "⚠️ unknown"}[alive]
+        print(f"   HTTP probe: {status}")
 else:
     print("❌ No session found")
 
@@ -49,6 +49,43 @@ class Config:
     # ========== DATABASE ==========
     DATABASE_URL: str = os.getenv('DATABASE_URL', '')  # PostgreSQL URL (Railway)
     DATABASE_PATH: str = os.getenv('DATABASE_PATH', 'bot_data.db')  # SQLite fallback
+    # SQLite: WAL + долгоживущее подключение на поток (0 - подключение на каждый запрос)
+    SQLITE_TUNED: bool = os.getenv('SQLITE_TUNED', '1') == '1'
+    SQLITE_BUSY_TIMEOUT: int = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # мс
+    SQLITE_CACHE_MB: int = int(os.getenv('SQLITE_CACHE_MB', '16'))
+    SQLITE_MMAP_MB: int = int(os.getenv('SQLITE_MMAP_MB', '128'))
+    SQLITE_STATEMENT_CACHE: int = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+    # Пул подключений PostgreSQL (на процесс)
+    DB_POOL_MIN: int = int(os.getenv('DB_POOL_MIN', '1'))
+    DB_POOL_MAX: int = int(os.getenv('DB_POOL_MAX', '10'))
+    DB_POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+
+    # ========== RETENTION ==========
+    RETENTION_ENABLED: bool = os.getenv('RETENTION_ENABLED', '1') == '1'
+    RETENTION_INTERVAL_HOURS: float = float(os.getenv('RETENTION_INTERVAL_HOURS', '6'))
+    # Завершённые заявки старше N дней переносятся в архив
+    REQUESTS_ARCHIVE_DAYS: int = int(os.getenv('REQUESTS_ARCHIVE_DAYS', '30'))
+    # Неактивные сессии старше N дней удаляются
+    SESSIONS_PURGE_DAYS: int = int(os.getenv('SESSIONS_PURGE_DAYS', '7'))
+    RETENTION_BATCH_SIZE: int = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+
+    # ========== ОБНОВЛЕНИЕ СЕССИЙ ==========
+    SESSION_REFRESH_ENABLED: bool = os.getenv('SESSION_REFRESH_ENABLED', '1') == '1'
+    SESSION_REFRESH_INTERVAL_MINUTES: float = float(os.getenv('SESSION_REFRESH_INTERVAL_MINUTES', '30'))
+    # Обновлять сессии, истекающие в ближайшие N часов
+    SESSION_REFRESH_AHEAD_HOURS: float = float(os.getenv('SESSION_REFRESH_AHEAD_HOURS', '24'))
+    # ... или не обновлявшиеся дольше N часов
+    SESSION_REFRESH_STALE_HOURS: float = float(os.getenv('SESSION_REFRESH_STALE_HOURS', '12'))
+    SESSION_REFRESH_BATCH: int = int(os.getenv('SESSION_REFRESH_BATCH', '50'))
+    SESSION_REFRESH_CONCURRENCY: int = int(os.getenv('SESSION_REFRESH_CONCURRENCY', '3'))
+    # После N неудач подряд сессия помечается expired
+    SESSION_REFRESH_MAX_FAILURES: int = int(os.getenv('SESSION_REFRESH_MAX_FAILURES', '3'))
+    # На сколько дней продлевается expires_at после обновления
+    SESSION_REFRESH_EXTEND_DAYS: int = int(os.getenv('SESSION_REFRESH_EXTEND_DAYS', '7'))
+    # Снимки localStorage/sessionStorage сессий для восстановления в браузере
+    SESSION_STATE_ENABLED: bool = os.getenv('SESSION_STATE_ENABLED', '1') == '1'
+    # Импортов cookies (проверка, профили, сохранение) одновременно в фоне
+    COOKIE_IMPORT_CONCURRENCY: int = int(os.getenv('COOKIE_IMPORT_CONCURRENCY', '4'))
 
     # ========== WB API ==========
     WB_API_BASE_URL: str = os.getenv(
@@ -67,9 +104,62 @@ class Config:
 
     # ========== ШИФРОВАНИЕ ==========
     WB_ENCRYPTION_KEY: str = os.getenv('WB_ENCRYPTION_KEY', '')
+    # Кэш расшифрованных cookies/телефонов сессий (записей и секунд жизни)
+    SESSION_CACHE_SIZE: int = int(os.getenv('SESSION_CACHE_SIZE', '256'))
+    SESSION_CACHE_TTL: int = int(os.getenv('SESSION_CACHE_TTL', '300'))
+    # HTTP проверка живости сессии: результат кэшируется на N секунд, таймаут запроса
+    SESSION_PROBE_TTL: int = int(os.getenv('SESSION_PROBE_TTL', '60'))
+    SESSION_PROBE_TIMEOUT: float = float(os.getenv('SESSION_PROBE_TIMEOUT', '10'))
+    # Список профилей (кабинетов) сессии кэшируется на N секунд
+    PROFILES_CACHE_TTL: int = int(os.getenv('PROFILES_CACHE_TTL', '600'))
+    # Кэш контекста пользователя в API (поставщики, токены, сессия), секунд
+    USER_CONTEXT_TTL: int = int(os.getenv('USER_CONTEXT_TTL', '30'))
 
     # ========== REDIS (опционально) ==========
     REDIS_URL: str = os.getenv('REDIS_URL', '')
+    # Бэкенд очереди задач: redis (sorted set), stream (Redis Streams + consumer group)
+    # или local (в памяти процесса + SQLite). Без REDIS_URL всегда local
+    QUEUE_BACKEND: str = os.getenv('QUEUE_BACKEND', 'redis')
+    # Файл встроенной очереди (QUEUE_BACKEND=local или без Redis)
+    QUEUE_DB_PATH: str = os.getenv('QUEUE_DB_PATH', 'queue.db')
+    # Имя consumer в группе (по умолчанию hostname-pid)
+    QUEUE_CONSUMER_NAME: str = os.getenv('QUEUE_CONSUMER_NAME', '')
+    # Через сколько секунд без ACK задачу можно забрать у упавшего consumer
+    QUEUE_CLAIM_IDLE: int = int(os.getenv('QUEUE_CLAIM_IDLE', '600'))
+
+    # ========== WORKERS ==========
+    # Максимум одновременных задач на один WB аккаунт (защита от антибота)
+    WORKER_MAX_PER_SESSION: int = int(os.getenv('WORKER_MAX_PER_SESSION', '1'))
+    # Сколько задач одного аккаунта выполнять в одном браузерном контексте
+    WORKER_BATCH_SIZE: int = int(os.getenv('WORKER_BATCH_SIZE', '10'))
+
+    # ========== SMS АВТОРИЗАЦИЯ ==========
+    # Максимум одновременных SMS авторизаций (браузерных контекстов)
+    AUTH_MAX_CONCURRENT: int = int(os.getenv('AUTH_MAX_CONCURRENT', '3'))
+    # Максимум ожидающих в очереди и сколько секунд ждать слот
+    AUTH_QUEUE_MAX: int = int(os.getenv('AUTH_QUEUE_MAX', '20'))
+    AUTH_QUEUE_TIMEOUT: float = float(os.getenv('AUTH_QUEUE_TIMEOUT', '300'))
+    # Через сколько секунд без активности авторизация закрывается принудительно
+    AUTH_FLOW_IDLE_TIMEOUT: float = float(os.getenv('AUTH_FLOW_IDLE_TIMEOUT', '600'))
+    # Срок действия SMS кода и максимальная длительность авторизации, секунд
+    AUTH_CODE_TTL: float = float(os.getenv('AUTH_CODE_TTL', '300'))
+    AUTH_FLOW_TIMEOUT: float = float(os.getenv('AUTH_FLOW_TIMEOUT', '900'))
+    # Период пинга страниц авторизации (проверка живости, замер памяти)
+    AUTH_PING_INTERVAL: float = float(os.getenv('AUTH_PING_INTERVAL', '30'))
+    # Сколько секунд ждать появления поля телефона/кода и входа в ЛК после кода
+    AUTH_FIELD_TIMEOUT: float = float(os.getenv('AUTH_FIELD_TIMEOUT', '15'))
+    AUTH_LOGIN_TIMEOUT: float = float(os.getenv('AUTH_LOGIN_TIMEOUT', '15'))
+
+    # ========== ДИАГНОСТИКА ==========
+    # Скриншоты и подробные логи браузерных сценариев: off, sampled или full
+    DIAGNOSTICS_LEVEL: str = os.getenv('DIAGNOSTICS_LEVEL', 'off')
+    # Доля событий со скриншотом для уровня sampled (0..1)
+    DIAGNOSTICS_SAMPLE_RATE: float = float(os.getenv('DIAGNOSTICS_SAMPLE_RATE', '0.05'))
+    # Кольцевой буфер артефактов в памяти: максимум штук и мегабайт
+    DIAGNOSTICS_BUFFER_SIZE: int = int(os.getenv('DIAGNOSTICS_BUFFER_SIZE', '50'))
+    DIAGNOSTICS_BUFFER_MB: float = float(os.getenv('DIAGNOSTICS_BUFFER_MB', '20'))
+    # Длительность трассировки пользователя по умолчанию, минут
+    DIAGNOSTICS_TRACE_MINUTES: float = float(os.getenv('DIAGNOSTICS_TRACE_MINUTES', '30'))
 
     @classmethod
     def validate(cls) -> None:
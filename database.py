@@ -7,33 +7,124 @@
 - suppliers: поставщики (мультиаккаунт)
 - wb_warehouses: кэш складов WB
 - redistribution_requests: заявки на перемещение
+- browser_sessions: браузерные сессии WB
+
+Схема создаётся и обновляется миграциями из db_migrations.
 """
 
 import json
 import sqlite3
 import logging
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
 from pathlib import Path
 
 from config import Config
+from utils.session_cache import SessionRow, get_session_phone, invalidate_session
+from utils.user_context import UserContext, invalidate_user_context
 
 logger = logging.getLogger(__name__)
 
+# Колонки заявки, общие для redistribution_requests и архива
+REQUEST_COLUMNS = '''
+    id, user_id, supplier_id, nm_id, product_name,
+    source_warehouse_id, source_warehouse_name,
+    target_warehouse_id, target_warehouse_name,
+    quantity, status, supply_id, created_at, completed_at
+'''
+
+# Файлы БД, для которых схема уже применена в этом процессе
+_schema_ready: set = set()
+_schema_lock = threading.Lock()
+
 
 class Database:
-    """Менеджер базы данных SQLite"""
+    """
+    Менеджер базы данных SQLite.
+
+    В tuned режиме (SQLITE_TUNED, по умолчанию) у каждого потока одно
+    долгоживущее подключение: WAL журнал, synchronous=NORMAL, увеличенный
+    кэш страниц и mmap, кэш подготовленных выражений, busy timeout.
+    Бот, API и воркеры тогда читают параллельно с записью и не получают
+    "database is locked" на коротких конфликтах.
+    """
 
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, tuned: bool = None):
+        """
+        Args:
+            db_path: Путь к файлу SQLite
+            tuned: Tuned режим (по умолчанию Config.SQLITE_TUNED)
+        """
         self.db_path = db_path or Config.DATABASE_PATH
-        self._init_db()
+        self.tuned = Config.SQLITE_TUNED if tuned is None else tuned
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        # DDL выполняем один раз на процесс
+        if self.db_path not in _schema_ready:
+            with _schema_lock:
+                if self.db_path not in _schema_ready:
+                    self._init_db()
+                    _schema_ready.add(self.db_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает подключение с настройками tuned режима"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=Config.SQLITE_BUSY_TIMEOUT / 1000,
+            cached_statements=Config.SQLITE_STATEMENT_CACHE,
+            # Подключение используется только своим потоком, но закрывается
+            # из потока, который останавливает сервис (close)
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT}')
+        conn.execute(f'PRAGMA cache_size=-{Config.SQLITE_CACHE_MB * 1024}')
+        conn.execute(f'PRAGMA mmap_size={Config.SQLITE_MMAP_MB * 1024 * 1024}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        """Долгоживущее подключение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
 
     @contextmanager
     def _get_connection(self):
         """Контекстный менеджер для соединения с БД"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        if not self.tuned:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Database error: {e}")
+                raise
+            finally:
+                conn.close()
+            return
+
+        conn = self._thread_connection()
+        if self._local.depth:
+            # Вложенный вызов - транзакцией управляет внешний
+            yield conn
+            return
+
+        self._local.depth += 1
         try:
             yield conn
             conn.commit()
@@ -42,129 +133,25 @@ class Database:
             logger.error(f"Database error: {e}")
             raise
         finally:
-            conn.close()
+            self._local.depth -= 1
+
+    def close(self) -> None:
+        """Закрывает подключения всех потоков (tuned режим)"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close SQLite connection: {e}")
+            self._connections.clear()
+        self._local = threading.local()
 
     def _init_db(self):
-        """Инициализация таблиц БД"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-
-            # Пользователи
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id INTEGER UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active INTEGER DEFAULT 1
-                )
-            ''')
-
-            # WB API токены (зашифрованные)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS wb_api_tokens (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT DEFAULT 'Основной',
-                    encrypted_token TEXT NOT NULL,
-                    is_active INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(telegram_id)
-                )
-            ''')
-
-            # Кэш складов WB
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS wb_warehouses (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    address TEXT,
-                    work_time TEXT,
-                    accept_types TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            # Поставщики (мультиаккаунт)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS suppliers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    token_id INTEGER NOT NULL,
-                    is_default INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(telegram_id),
-                    FOREIGN KEY (token_id) REFERENCES wb_api_tokens(id)
-                )
-            ''')
-
-            # Заявки на перемещение
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS redistribution_requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    supplier_id INTEGER NOT NULL,
-                    nm_id INTEGER NOT NULL,
-                    product_name TEXT,
-                    source_warehouse_id INTEGER NOT NULL,
-                    source_warehouse_name TEXT,
-                    target_warehouse_id INTEGER NOT NULL,
-                    target_warehouse_name TEXT,
-                    quantity INTEGER NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    supply_id TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(telegram_id),
-                    FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
-                )
-            ''')
-
-            # Browser sessions (для авторизации через SMS)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS browser_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    phone TEXT,
-                    phone_encrypted TEXT,
-                    phone_hash TEXT,
-                    phone_last4 TEXT,
-                    cookies_encrypted TEXT,
-                    supplier_name TEXT,
-                    status TEXT DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used_at TIMESTAMP,
-                    expires_at TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(telegram_id)
-                )
-            ''')
-
-            # Индексы для быстрого поиска
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_tokens_user
-                ON wb_api_tokens(user_id)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_suppliers_user
-                ON suppliers(user_id)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_redistribution_user
-                ON redistribution_requests(user_id, status)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_browser_sessions_user
-                ON browser_sessions(user_id, status)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_browser_sessions_phone_hash
-                ON browser_sessions(phone_hash)
-            ''')
+        """Инициализация схемы БД (версионированные миграции)"""
+        from db_migrations import apply_migrations
 
+        with self._get_connection() as conn:
+            apply_migrations(conn, 'sqlite')
             logger.info("Database initialized successfully")
 
     # ==================== USERS ====================
@@ -223,7 +210,10 @@ class Database:
                 INSERT INTO wb_api_tokens (user_id, name, encrypted_token)
                 VALUES (?, ?, ?)
             ''', (user_id, name, encrypted_token))
-            return cursor.lastrowid
+            token_id = cursor.lastrowid
+
+        invalidate_user_context(user_id)
+        return token_id
 
     def get_wb_tokens(self, user_id: int) -> List[Dict]:
         """Получает все токены пользователя"""
@@ -316,7 +306,10 @@ class Database:
                 UPDATE wb_api_tokens SET is_active = 0
                 WHERE id = ?
             ''', (token_id,))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        invalidate_user_context(token_id=token_id)
+        return updated
 
     def delete_token(self, token_id: int) -> bool:
         """Удаляет токен полностью"""
@@ -326,7 +319,10 @@ class Database:
             cursor.execute('''
                 DELETE FROM wb_api_tokens WHERE id = ?
             ''', (token_id,))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+
+        invalidate_user_context(token_id=token_id)
+        return deleted
 
     def delete_wb_token(self, user_id: int, token_id: int) -> bool:
         """Удаляет токен пользователя (с проверкой владельца)"""
@@ -343,7 +339,10 @@ class Database:
             cursor.execute('''
                 DELETE FROM wb_api_tokens WHERE id = ? AND user_id = ?
             ''', (token_id, user_id))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+
+        invalidate_user_context(user_id)
+        return deleted
 
     # ==================== WAREHOUSES ====================
 
@@ -418,25 +417,41 @@ class Database:
 
     # ==================== STATS ====================
 
-    def get_total_stats(self) -> Dict[str, int]:
-        """Получает общую статистику"""
+    def _get_counters(self, scope: str, scope_id: int = 0) -> Dict[str, int]:
+        """Денормализованные счётчики (stats_counters, ведутся триггерами)"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute('''
+                SELECT name, value FROM stats_counters
+                WHERE scope = ? AND scope_id = ?
+            ''', (scope, scope_id))
+            return {row['name']: row['value'] for row in cursor.fetchall()}
+
+    @staticmethod
+    def _requests_by_status(counters: Dict[str, int]) -> Dict[str, int]:
+        """Счётчики 'requests:<status>' -> {status: count}"""
+        return {
+            name.split(':', 1)[1]: value
+            for name, value in counters.items()
+            if name.startswith('requests:') and value
+        }
 
-            cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = 1')
-            total_users = cursor.fetchone()[0]
-
-            cursor.execute('SELECT COUNT(*) FROM wb_api_tokens WHERE is_active = 1')
-            total_tokens = cursor.fetchone()[0]
-
-            cursor.execute('SELECT COUNT(*) FROM redistribution_requests')
-            total_requests = cursor.fetchone()[0]
-
-            return {
-                'total_users': total_users,
-                'total_tokens': total_tokens,
-                'total_requests': total_requests
-            }
+    def get_total_stats(self) -> Dict[str, int]:
+        """Получает общую статистику"""
+        counters = self._get_counters('global')
+        return {
+            'total_users': counters.get('users', 0),
+            'total_tokens': counters.get('tokens', 0),
+            'total_requests': counters.get('requests', 0)
+        }
+
+    def get_user_stats(self, user_id: int) -> Dict:
+        """Получает статистику заявок пользователя"""
+        counters = self._get_counters('user', user_id)
+        return {
+            'requests_count': counters.get('requests', 0),
+            'requests_by_status': self._requests_by_status(counters)
+        }
 
     # ==================== SUPPLIERS ====================
 
@@ -454,7 +469,10 @@ class Database:
                 INSERT INTO suppliers (user_id, name, token_id, is_default)
                 VALUES (?, ?, ?, ?)
             ''', (user_id, name, token_id, 1 if is_default else 0))
-            return cursor.lastrowid
+            supplier_id = cursor.lastrowid
+
+        invalidate_user_context(user_id)
+        return supplier_id
 
     def get_suppliers(self, user_id: int) -> List[Dict]:
         """Получает список поставщиков пользователя"""
@@ -482,7 +500,10 @@ class Database:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM suppliers WHERE id = ?', (supplier_id,))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+
+        invalidate_user_context(supplier_id=supplier_id)
+        return deleted
 
     def get_user_suppliers(self, user_id: int) -> List[Dict]:
         """Получает всех поставщиков пользователя с информацией о токенах"""
@@ -511,7 +532,10 @@ class Database:
                 UPDATE suppliers SET is_default = 1
                 WHERE id = ? AND user_id = ?
             ''', (supplier_id, user_id))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        invalidate_user_context(user_id)
+        return updated
 
     def update_supplier_name(self, supplier_id: int, name: str) -> bool:
         """Переименовывает поставщика"""
@@ -521,20 +545,19 @@ class Database:
                 UPDATE suppliers SET name = ?
                 WHERE id = ?
             ''', (name, supplier_id))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        invalidate_user_context(supplier_id=supplier_id)
+        return updated
 
     def get_supplier_stats(self, supplier_id: int) -> Dict:
         """Получает статистику по поставщику"""
+        counters = self._get_counters('supplier', supplier_id)
+        redistributions_count = counters.get('requests', 0)
+
         with self._get_connection() as conn:
             cursor = conn.cursor()
 
-            # Количество операций
-            cursor.execute('''
-                SELECT COUNT(*) FROM redistribution_requests
-                WHERE supplier_id = ?
-            ''', (supplier_id,))
-            redistributions_count = cursor.fetchone()[0]
-
             # Последняя активность - берем из last_used токена
             cursor.execute('''
                 SELECT t.last_used
@@ -545,11 +568,12 @@ class Database:
             row = cursor.fetchone()
             last_used = dict(row)['last_used'] if row else None
 
-            return {
-                'operations_count': redistributions_count,
-                'redistributions_count': redistributions_count,
-                'last_used': last_used or 'никогда'
-            }
+        return {
+            'operations_count': redistributions_count,
+            'redistributions_count': redistributions_count,
+            'requests_by_status': self._requests_by_status(counters),
+            'last_used': last_used or 'никогда'
+        }
 
     # ==================== REDISTRIBUTION REQUESTS ====================
 
@@ -583,6 +607,60 @@ class Database:
             ))
             return cursor.lastrowid
 
+    def add_redistribution_requests(self, user_id: int, items: List[Dict]) -> List[int]:
+        """
+        Создаёт несколько заявок в одной транзакции.
+
+        Args:
+            user_id: Telegram ID пользователя
+            items: Поля заявок (как у add_redistribution_request)
+
+        Returns:
+            ID заявок в порядке items
+        """
+        if not items:
+            return []
+
+        ids = []
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            for item in items:
+                cursor.execute('''
+                    INSERT INTO redistribution_requests
+                    (user_id, supplier_id, nm_id, product_name,
+                     source_warehouse_id, source_warehouse_name,
+                     target_warehouse_id, target_warehouse_name,
+                     quantity)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    user_id, item['supplier_id'], item['nm_id'], item.get('product_name'),
+                    item['source_warehouse_id'], item.get('source_warehouse_name'),
+                    item['target_warehouse_id'], item.get('target_warehouse_name'),
+                    item['quantity']
+                ))
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def update_redistribution_requests_status(self, request_ids: List[int], status: str) -> int:
+        """
+        Меняет статус нескольких заявок одним запросом.
+
+        Returns:
+            Количество обновлённых заявок
+        """
+        if not request_ids:
+            return 0
+
+        placeholders = ', '.join('?' for _ in request_ids)
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                UPDATE redistribution_requests
+                SET status = ?
+                WHERE id IN ({placeholders})
+            ''', [status] + list(request_ids))
+            return cursor.rowcount
+
     def get_redistribution_requests(
         self,
         user_id: int,
@@ -704,7 +782,10 @@ class Database:
             ''', (user_id, None, phone_encrypted, phone_hash, phone_last4,
                   cookies_encrypted, supplier_name, expires_at))
 
-            return cursor.lastrowid
+            session_id = cursor.lastrowid
+
+        invalidate_user_context(user_id)
+        return session_id
 
     def get_browser_session(self, user_id: int) -> Optional[Dict]:
         """
@@ -727,10 +808,42 @@ class Database:
             if not row:
                 return None
 
-            result = dict(row)
-            # Расшифровываем телефон для обратной совместимости
-            result['phone'] = self._decrypt_session_phone(result)
-            return result
+            # Телефон расшифровывается при первом обращении к 'phone'
+            return SessionRow(row, self._decrypt_session_phone)
+
+    def get_user_context(self, user_id: int) -> UserContext:
+        """
+        Поставщики, токены и активная сессия пользователя одним запросом.
+
+        Используется API через кэш (utils.user_context.load_user_context).
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT s.*,
+                   t.id AS t_id, t.name AS t_name, t.encrypted_token AS t_encrypted_token,
+                   t.is_active AS t_is_active, t.last_used AS t_last_used,
+                   bs.id AS bs_id, bs.user_id AS bs_user_id, bs.phone AS bs_phone,
+                   bs.phone_encrypted AS bs_phone_encrypted, bs.phone_hash AS bs_phone_hash, bs.phone_last4 AS bs_phone_last4,
+                   bs.cookies_encrypted AS bs_cookies_encrypted, bs.supplier_name AS bs_supplier_name, bs.status AS bs_status,
+                   bs.created_at AS bs_created_at, bs.last_used_at AS bs_last_used_at, bs.expires_at AS bs_expires_at
+                FROM (SELECT ? AS user_id) u
+                LEFT JOIN suppliers s ON s.user_id = u.user_id
+                LEFT JOIN wb_api_tokens t ON t.id = s.token_id AND t.user_id = u.user_id
+                LEFT JOIN browser_sessions bs ON bs.id = (
+                    SELECT id FROM browser_sessions
+                    WHERE user_id = u.user_id AND status = 'active'
+                    AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                )
+                ORDER BY s.is_default DESC, s.created_at DESC
+            ''', (user_id,))
+            rows = cursor.fetchall()
+
+        return UserContext.from_rows(
+            user_id, rows, lambda session: SessionRow(session, self._decrypt_session_phone)
+        )
 
     def _decrypt_session_phone(self, session: Dict) -> str:
         """
@@ -738,12 +851,10 @@ class Database:
 
         Поддерживает обратную совместимость со старыми записями.
         """
-        from utils.encryption import decrypt_phone
-
         # Приоритет: зашифрованный телефон > старое поле phone > last4
         if session.get('phone_encrypted'):
             try:
-                return decrypt_phone(session['phone_encrypted'])
+                return get_session_phone(session['phone_encrypted'], session.get('id'))
             except Exception:
                 pass
 
@@ -774,13 +885,7 @@ class Database:
                     ORDER BY created_at DESC
                 ''', (user_id,))
 
-            results = []
-            for row in cursor.fetchall():
-                session = dict(row)
-                # Расшифровываем телефон для обратной совместимости
-                session['phone'] = self._decrypt_session_phone(session)
-                results.append(session)
-            return results
+            return [SessionRow(row, self._decrypt_session_phone) for row in cursor.fetchall()]
 
     def get_browser_session_by_id(self, session_id: int) -> Optional[Dict]:
         """Получает сессию по ID"""
@@ -790,9 +895,7 @@ class Database:
             row = cursor.fetchone()
             if not row:
                 return None
-            session = dict(row)
-            session['phone'] = self._decrypt_session_phone(session)
-            return session
+            return SessionRow(row, self._decrypt_session_phone)
 
     def update_browser_session_last_used(self, session_id: int) -> bool:
         """Обновляет время последнего использования сессии"""
@@ -827,7 +930,15 @@ class Database:
                 SET status = ?
                 WHERE id = ?
             ''', (status, session_id))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        if status != 'active':
+            invalidate_session(session_id)
+            invalidate_user_context(session_id=session_id)
+        else:
+            # Владелец сессии по ID неизвестен - сбрасываем все контексты
+            invalidate_user_context()
+        return updated
 
     def invalidate_browser_session(self, user_id: int) -> bool:
         """Деактивирует все сессии пользователя"""
@@ -838,14 +949,22 @@ class Database:
                 SET status = 'inactive'
                 WHERE user_id = ? AND status = 'active'
             ''', (user_id,))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        invalidate_user_context(user_id)
+        return updated
 
     def delete_browser_session(self, session_id: int) -> bool:
         """Удаляет сессию"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM browser_sessions WHERE id = ?', (session_id,))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+            cursor.execute('DELETE FROM browser_session_states WHERE session_id = ?', (session_id,))
+
+        invalidate_session(session_id)
+        invalidate_user_context(session_id=session_id)
+        return deleted
 
     def cleanup_expired_sessions(self) -> int:
         """
@@ -863,4 +982,226 @@ class Database:
                 AND expires_at IS NOT NULL
                 AND expires_at < CURRENT_TIMESTAMP
             ''')
-            return cursor.rowcount
+            expired = cursor.rowcount
+
+        if expired:
+            invalidate_user_context()
+        return expired
+
+    def get_sessions_due_for_refresh(
+        self,
+        ahead_hours: float,
+        stale_hours: float,
+        limit: int = 50
+    ) -> List[Dict]:
+        """
+        Активные сессии, которым пора обновить cookies.
+
+        Выбираются сессии, истекающие в ближайшие ahead_hours часов или не
+        обновлявшиеся дольше stale_hours. Первыми идут истекающие раньше,
+        затем недавно использованные.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM browser_sessions
+                WHERE status = 'active'
+                AND cookies_encrypted IS NOT NULL
+                AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+                AND (
+                    expires_at < datetime('now', ?)
+                    OR COALESCE(refreshed_at, created_at) < datetime('now', ?)
+                )
+                ORDER BY expires_at IS NULL, expires_at, last_used_at DESC
+                LIMIT ?
+            ''', (f'+{ahead_hours} hours', f'-{stale_hours} hours', limit))
+            return [SessionRow(row, self._decrypt_session_phone) for row in cursor.fetchall()]
+
+    def update_browser_session_cookies(
+        self,
+        session_id: int,
+        cookies_encrypted: str,
+        refresh_status: str,
+        expires_days: int = 7
+    ) -> bool:
+        """
+        Сохраняет обновлённые cookies сессии (ID сессии не меняется).
+
+        Args:
+            session_id: ID сессии
+            cookies_encrypted: Новые зашифрованные cookies
+            refresh_status: Способ обновления ('http', 'alive', 'browser')
+            expires_days: На сколько дней продлить сессию
+        """
+        expires_at = datetime.now() + timedelta(days=expires_days)
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE browser_sessions
+                SET cookies_encrypted = ?, expires_at = ?,
+                    refreshed_at = CURRENT_TIMESTAMP, refresh_status = ?,
+                    refresh_error = NULL, refresh_failures = 0
+                WHERE id = ?
+            ''', (cookies_encrypted, expires_at, refresh_status, session_id))
+            updated = cursor.rowcount > 0
+
+        invalidate_session(session_id)
+        invalidate_user_context(session_id=session_id)
+        return updated
+
+    def record_session_refresh_failure(
+        self,
+        session_id: int,
+        refresh_status: str,
+        error: str = None,
+        count: bool = True
+    ) -> int:
+        """
+        Записывает неудачное обновление cookies.
+
+        Args:
+            count: Учитывать в счётчике неудач подряд (False - сбой
+                инфраструктуры, а не признак истёкшей сессии)
+
+        Returns:
+            Количество неудач подряд
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE browser_sessions
+                SET refreshed_at = CURRENT_TIMESTAMP, refresh_status = ?, refresh_error = ?,
+                    refresh_failures = COALESCE(refresh_failures, 0) + ?
+                WHERE id = ?
+            ''', (refresh_status, error, 1 if count else 0, session_id))
+            cursor.execute('SELECT refresh_failures FROM browser_sessions WHERE id = ?', (session_id,))
+            row = cursor.fetchone()
+            return row['refresh_failures'] if row else 0
+
+    def save_browser_session_state(self, session_id: int, state_encrypted: str) -> None:
+        """Сохраняет снимок storage state сессии (заменяя прежний)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO browser_session_states (session_id, state_encrypted, state_size, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    state_encrypted = excluded.state_encrypted,
+                    state_size = excluded.state_size,
+                    updated_at = excluded.updated_at
+            ''', (session_id, state_encrypted, len(state_encrypted)))
+
+    def get_browser_session_state(self, session_id: int) -> Optional[str]:
+        """Зашифрованный снимок storage state сессии или None"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT state_encrypted FROM browser_session_states WHERE session_id = ?',
+                (session_id,)
+            )
+            row = cursor.fetchone()
+            return row['state_encrypted'] if row else None
+
+    # ==================== RETENTION ====================
+
+    def archive_requests(self, older_than_days: int, statuses: List[str], limit: int = 1000) -> int:
+        """
+        Переносит старые завершённые заявки в redistribution_requests_archive.
+
+        Args:
+            older_than_days: Завершены (или созданы) раньше стольких дней назад
+            statuses: Терминальные статусы
+            limit: Максимум заявок за вызов (одна короткая транзакция)
+
+        Returns:
+            Количество перенесённых заявок
+        """
+        status_list = ', '.join('?' for _ in statuses)
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id FROM redistribution_requests
+                WHERE status IN ({status_list})
+                AND COALESCE(completed_at, created_at) < datetime('now', ?)
+                ORDER BY id
+                LIMIT ?
+            ''', (*statuses, f'-{older_than_days} days', limit))
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+
+            # Без OR IGNORE: конфликт по id откатывает всю пачку,
+            # иначе DELETE удалил бы не попавшую в архив заявку
+            id_list = ', '.join('?' for _ in ids)
+            cursor.execute(f'''
+                INSERT INTO redistribution_requests_archive ({REQUEST_COLUMNS})
+                SELECT {REQUEST_COLUMNS} FROM redistribution_requests
+                WHERE id IN ({id_list})
+            ''', ids)
+            cursor.execute(f'DELETE FROM redistribution_requests WHERE id IN ({id_list})', ids)
+            return len(ids)
+
+    def purge_browser_sessions(self, older_than_days: int) -> int:
+        """
+        Удаляет неактивные сессии (inactive, expired, invalid), не использованные
+        дольше older_than_days дней.
+
+        Returns:
+            Количество удалённых сессий
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM browser_sessions
+                WHERE status != 'active'
+                AND COALESCE(last_used_at, created_at) < datetime('now', ?)
+            ''', (f'-{older_than_days} days',))
+            purged = cursor.rowcount
+
+            # Снимки удалённых сессий (внешние ключи в SQLite не включены)
+            if purged:
+                cursor.execute('''
+                    DELETE FROM browser_session_states
+                    WHERE session_id NOT IN (SELECT id FROM browser_sessions)
+                ''')
+            return purged
+
+    def get_table_sizes(self, tables: List[str]) -> Dict[str, int]:
+        """Количество строк в таблицах (для метрик retention)"""
+        sizes = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            for table in tables:
+                cursor.execute(f'SELECT COUNT(*) FROM {table}')
+                sizes[table] = cursor.fetchone()[0]
+        return sizes
+
+    def optimize(self, tables: List[str], vacuum_free_ratio: float = 0.25) -> Dict:
+        """
+        ANALYZE таблиц и VACUUM файла, если свободные страницы занимают
+        не меньше vacuum_free_ratio.
+
+        Returns:
+            Метрики: страницы, свободные страницы, был ли VACUUM
+        """
+        with self._get_connection() as conn:
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+            for table in tables:
+                conn.execute(f'ANALYZE {table}')
+
+        vacuumed = bool(page_count) and free_pages / page_count >= vacuum_free_ratio
+        if vacuumed:
+            # VACUUM нельзя выполнять внутри транзакции
+            with self._get_connection() as conn:
+                conn.commit()
+                conn.execute('VACUUM')
+
+        return {
+            'pages': page_count,
+            'free_pages': free_pages,
+            'vacuumed': vacuumed,
+        }
@@ -3,18 +3,181 @@ PostgreSQL Database для Railway.
 
 Использует тот же интерфейс что и database.py (SQLite),
 но работает с PostgreSQL.
+
+Подключения берутся из общего на процесс пула (по одному на DATABASE_URL),
+проверка схемы выполняется один раз при создании первого адаптера.
 """
 
 import os
+import threading
+import time
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from typing import List, Dict, Optional
 from contextlib import contextmanager
 import logging
 
+from config import Config
+from utils.session_cache import SessionRow, get_session_phone, invalidate_session
+from utils.user_context import UserContext, invalidate_user_context
+
 logger = logging.getLogger(__name__)
 
 
+class ConnectionPool:
+    """
+    Потокобезопасный пул подключений с ожиданием и метриками.
+
+    ThreadedConnectionPool сразу бросает PoolError, если свободных
+    подключений нет, поэтому доступ ограничен семафором: поток ждёт
+    освобождения подключения до timeout секунд.
+    """
+
+    def __init__(self, dsn: str, minconn: int, maxconn: int, timeout: float):
+        """
+        Args:
+            dsn: PostgreSQL connection string
+            minconn: Подключений, открываемых сразу
+            maxconn: Максимум подключений
+            timeout: Сколько секунд ждать свободное подключение
+        """
+        self.maxconn = maxconn
+        self.timeout = timeout
+
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            dsn,
+            cursor_factory=psycopg2.extras.RealDictCursor
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+
+        # Метрики
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_total_ms = 0
+        self._wait_max_ms = 0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def getconn(self):
+        """Взять подключение (ждёт, если все заняты)"""
+        started = time.monotonic()
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._waits += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._timeouts += 1
+                raise psycopg2.pool.PoolError(
+                    f"No free PostgreSQL connection in {self.timeout}s "
+                    f"(pool size {self.maxconn})"
+                )
+
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                # Сервер закрыл простаивающее подключение
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = int((time.monotonic() - started) * 1000)
+        with self._lock:
+            self._acquired += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._wait_total_ms += waited
+            self._wait_max_ms = max(self._wait_max_ms, waited)
+
+        return conn
+
+    def putconn(self, conn, close: bool = False) -> None:
+        """Вернуть подключение в пул (close=True - закрыть сломанное)"""
+        close = close or bool(conn.closed)
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                if close:
+                    self._discarded += 1
+            self._slots.release()
+
+    def closeall(self) -> None:
+        """Закрыть все подключения"""
+        self._pool.closeall()
+
+    def stats(self) -> Dict:
+        """Метрики заполненности пула"""
+        with self._lock:
+            return {
+                'max': self.maxconn,
+                'in_use': self._in_use,
+                'peak_in_use': self._peak_in_use,
+                'saturation': round(self._in_use / self.maxconn, 2),
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'wait_avg_ms': self._wait_total_ms // self._acquired if self._acquired else 0,
+                'wait_max_ms': self._wait_max_ms,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+            }
+
+
+# Колонки заявки, общие для redistribution_requests и архива
+REQUEST_COLUMNS = '''
+    id, user_id, supplier_id, nm_id, product_name,
+    source_warehouse_id, source_warehouse_name,
+    target_warehouse_id, target_warehouse_name,
+    quantity, status, supply_id, created_at, completed_at
+'''
+
+# Пулы и состояние схемы на процесс (ключ - DATABASE_URL)
+_pools: Dict[str, ConnectionPool] = {}
+_schema_ready: set = set()
+_registry_lock = threading.Lock()
+
+
+def get_pool(database_url: str) -> ConnectionPool:
+    """Получить (или создать) пул подключений для DATABASE_URL"""
+    with _registry_lock:
+        pool = _pools.get(database_url)
+        if pool is None:
+            pool = ConnectionPool(
+                database_url,
+                minconn=Config.DB_POOL_MIN,
+                maxconn=Config.DB_POOL_MAX,
+                timeout=Config.DB_POOL_TIMEOUT
+            )
+            _pools[database_url] = pool
+            logger.info(f"PostgreSQL pool created (max {Config.DB_POOL_MAX} connections)")
+        return pool
+
+
+def get_pool_stats() -> List[Dict]:
+    """Метрики всех пулов процесса"""
+    with _registry_lock:
+        return [pool.stats() for pool in _pools.values()]
+
+
+def close_pools() -> None:
+    """Закрыть все пулы (при завершении процесса)"""
+    with _registry_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+        _schema_ready.clear()
+    logger.info("PostgreSQL pools closed")
+
+
 class DatabasePostgres:
     """PostgreSQL адаптер с тем же интерфейсом что у Database (SQLite)"""
 
@@ -27,119 +190,43 @@ class DatabasePostgres:
         if not self.database_url:
             raise ValueError("DATABASE_URL not provided")
 
-        # Инициализируем схему если нужно
-        self._ensure_schema()
+        self._pool = get_pool(self.database_url)
+
+        # Инициализируем схему один раз на процесс
+        if self.database_url not in _schema_ready:
+            with _registry_lock:
+                if self.database_url not in _schema_ready:
+                    self._ensure_schema()
+                    _schema_ready.add(self.database_url)
 
     @contextmanager
     def _get_connection(self):
-        """Context manager для подключения к PostgreSQL"""
-        conn = psycopg2.connect(
-            self.database_url,
-            cursor_factory=psycopg2.extras.RealDictCursor
-        )
+        """Context manager для подключения из пула"""
+        conn = self._pool.getconn()
+        broken = False
         try:
             yield conn
             conn.commit()
-        except Exception:
-            conn.rollback()
+        except Exception as e:
+            # Разорванное подключение в пул не возвращаем
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not broken:
+                conn.rollback()
             raise
         finally:
-            conn.close()
+            self._pool.putconn(conn, close=broken)
+
+    def get_pool_stats(self) -> Dict:
+        """Метрики пула подключений"""
+        return self._pool.stats()
 
     def _ensure_schema(self):
-        """Убеждаемся что схема инициализирована"""
+        """Убеждаемся что схема инициализирована (версионированные миграции)"""
+        from db_migrations import apply_migrations
+
         try:
             with self._get_connection() as conn:
-                cursor = conn.cursor()
-                # Проверяем есть ли таблица users
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables
-                        WHERE table_name = 'users'
-                    )
-                """)
-                exists = cursor.fetchone()['exists']
-
-                if not exists:
-                    logger.info("Initializing PostgreSQL schema...")
-                    # Читаем и выполняем init_db.sql (используем абсолютный путь)
-                    sql_file = os.path.join(os.path.dirname(__file__), 'init_db.sql')
-                    with open(sql_file, 'r', encoding='utf-8') as f:
-                        sql_script = f.read()
-                    cursor.execute(sql_script)
-                    logger.info("Schema initialized")
-
-                # Проверяем есть ли таблица browser_sessions (добавлена позже)
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables
-                        WHERE table_name = 'browser_sessions'
-                    )
-                """)
-                bs_exists = cursor.fetchone()['exists']
-
-                if not bs_exists:
-                    logger.info("Creating browser_sessions table...")
-                    cursor.execute('''
-                        CREATE TABLE IF NOT EXISTS browser_sessions (
-                            id SERIAL PRIMARY KEY,
-                            user_id BIGINT NOT NULL REFERENCES users(telegram_id) ON DELETE CASCADE,
-                            phone VARCHAR(20),
-                            phone_encrypted TEXT,
-                            phone_hash VARCHAR(64),
-                            phone_last4 VARCHAR(4),
-                            cookies_encrypted TEXT,
-                            supplier_name VARCHAR(255),
-                            status VARCHAR(20) DEFAULT 'active',
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            last_used_at TIMESTAMP,
-                            expires_at TIMESTAMP
-                        )
-                    ''')
-                    cursor.execute('''
-                        CREATE INDEX IF NOT EXISTS idx_browser_sessions_user
-                        ON browser_sessions(user_id, status)
-                    ''')
-                    cursor.execute('''
-                        CREATE INDEX IF NOT EXISTS idx_browser_sessions_phone_hash
-                        ON browser_sessions(phone_hash)
-                    ''')
-                    logger.info("browser_sessions table created")
-                else:
-                    # Миграция: добавляем колонки для шифрования телефона если их нет
-                    logger.info("Checking browser_sessions schema for encryption columns...")
-
-                    # Проверяем есть ли колонка phone_encrypted
-                    cursor.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.columns
-                            WHERE table_name = 'browser_sessions' AND column_name = 'phone_encrypted'
-                        )
-                    """)
-                    has_phone_encrypted = cursor.fetchone()['exists']
-
-                    if not has_phone_encrypted:
-                        logger.info("Adding phone encryption columns to browser_sessions...")
-                        cursor.execute('ALTER TABLE browser_sessions ADD COLUMN phone_encrypted TEXT')
-                        cursor.execute('ALTER TABLE browser_sessions ADD COLUMN phone_hash VARCHAR(64)')
-                        cursor.execute('ALTER TABLE browser_sessions ADD COLUMN phone_last4 VARCHAR(4)')
-                        cursor.execute('''
-                            CREATE INDEX IF NOT EXISTS idx_browser_sessions_phone_hash
-                            ON browser_sessions(phone_hash)
-                        ''')
-                        logger.info("Phone encryption columns added")
-
-                    # Делаем phone nullable если он NOT NULL
-                    cursor.execute("""
-                        SELECT is_nullable FROM information_schema.columns
-                        WHERE table_name = 'browser_sessions' AND column_name = 'phone'
-                    """)
-                    row = cursor.fetchone()
-                    if row and row['is_nullable'] == 'NO':
-                        logger.info("Making phone column nullable for security...")
-                        cursor.execute('ALTER TABLE browser_sessions ALTER COLUMN phone DROP NOT NULL')
-                        logger.info("Phone column is now nullable")
-
+                apply_migrations(conn, 'postgres')
         except Exception as e:
             logger.error(f"Failed to ensure schema: {e}")
             raise
@@ -178,7 +265,10 @@ class DatabasePostgres:
                 VALUES (%s, %s, %s)
                 RETURNING id
             ''', (user_id, name, encrypted_token))
-            return cursor.fetchone()['id']
+            token_id = cursor.fetchone()['id']
+
+        invalidate_user_context(user_id)
+        return token_id
 
     def get_wb_tokens(self, user_id: int) -> List[Dict]:
         """Получает все токены пользователя"""
@@ -228,7 +318,10 @@ class DatabasePostgres:
                 SET is_active = FALSE
                 WHERE id = %s AND user_id = %s
             ''', (token_id, user_id))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+
+        invalidate_user_context(user_id)
+        return deleted
 
     # ==================== SUPPLIERS ====================
 
@@ -241,7 +334,10 @@ class DatabasePostgres:
                 VALUES (%s, %s, %s, %s)
                 RETURNING id
             ''', (user_id, name, token_id, is_default))
-            return cursor.fetchone()['id']
+            supplier_id = cursor.fetchone()['id']
+
+        invalidate_user_context(user_id)
+        return supplier_id
 
     def get_suppliers(self, user_id: int) -> List[Dict]:
         """Получает список поставщиков"""
@@ -268,14 +364,20 @@ class DatabasePostgres:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM suppliers WHERE id = %s', (supplier_id,))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+
+        invalidate_user_context(supplier_id=supplier_id)
+        return deleted
 
     def update_supplier_name(self, supplier_id: int, name: str) -> bool:
         """Переименовывает поставщика"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('UPDATE suppliers SET name = %s WHERE id = %s', (name, supplier_id))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        invalidate_user_context(supplier_id=supplier_id)
+        return updated
 
     # ==================== REDISTRIBUTION REQUESTS ====================
 
@@ -300,6 +402,62 @@ class DatabasePostgres:
             ))
             return cursor.fetchone()['id']
 
+    def add_redistribution_requests(self, user_id: int, items: List[Dict]) -> List[int]:
+        """
+        Создаёт несколько заявок одним INSERT ... VALUES (...), (...).
+
+        Args:
+            user_id: Telegram ID пользователя
+            items: Поля заявок (как у add_redistribution_request)
+
+        Returns:
+            ID заявок в порядке items
+        """
+        if not items:
+            return []
+
+        rows = [
+            (
+                user_id, item['supplier_id'], item['nm_id'], item.get('product_name'),
+                item['source_warehouse_id'], item.get('source_warehouse_name'),
+                item['target_warehouse_id'], item.get('target_warehouse_name'),
+                item['quantity'], item.get('status', 'pending')
+            )
+            for item in items
+        ]
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            result = psycopg2.extras.execute_values(cursor, '''
+                INSERT INTO redistribution_requests (
+                    user_id, supplier_id, nm_id, product_name,
+                    source_warehouse_id, source_warehouse_name,
+                    target_warehouse_id, target_warehouse_name,
+                    quantity, status
+                ) VALUES %s
+                RETURNING id
+            ''', rows, page_size=len(rows), fetch=True)
+            return [row['id'] for row in result]
+
+    def update_redistribution_requests_status(self, request_ids: List[int], status: str) -> int:
+        """
+        Меняет статус нескольких заявок одним запросом.
+
+        Returns:
+            Количество обновлённых заявок
+        """
+        if not request_ids:
+            return 0
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE redistribution_requests
+                SET status = %s
+                WHERE id = ANY(%s)
+            ''', (status, list(request_ids)))
+            return cursor.rowcount
+
     def get_redistribution_requests(self, user_id: int, status: str = None) -> List[Dict]:
         """Получает заявки пользователя"""
         with self._get_connection() as conn:
@@ -352,18 +510,64 @@ class DatabasePostgres:
 
     # ==================== STATS ====================
 
+    def _get_counters(self, scope: str, scope_id: int = 0) -> Dict[str, int]:
+        """Денормализованные счётчики (stats_counters, ведутся триггерами)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT name, value FROM stats_counters
+                WHERE scope = %s AND scope_id = %s
+            ''', (scope, scope_id))
+            return {row['name']: row['value'] for row in cursor.fetchall()}
+
+    @staticmethod
+    def _requests_by_status(counters: Dict[str, int]) -> Dict[str, int]:
+        """Счётчики 'requests:<status>' -> {status: count}"""
+        return {
+            name.split(':', 1)[1]: value
+            for name, value in counters.items()
+            if name.startswith('requests:') and value
+        }
+
     def get_total_stats(self) -> Dict:
         """Получает общую статистику"""
+        counters = self._get_counters('global')
+        return {
+            'total_users': counters.get('users', 0),
+            'total_tokens': counters.get('tokens', 0),
+            'total_requests': counters.get('requests', 0)
+        }
+
+    def get_user_stats(self, user_id: int) -> Dict:
+        """Получает статистику заявок пользователя"""
+        counters = self._get_counters('user', user_id)
+        return {
+            'requests_count': counters.get('requests', 0),
+            'requests_by_status': self._requests_by_status(counters)
+        }
+
+    def get_supplier_stats(self, supplier_id: int) -> Dict:
+        """Получает статистику по поставщику"""
+        counters = self._get_counters('supplier', supplier_id)
+        redistributions_count = counters.get('requests', 0)
+
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) as count FROM users')
-            users_count = cursor.fetchone()['count']
-            cursor.execute('SELECT COUNT(*) as count FROM redistribution_requests')
-            requests_count = cursor.fetchone()['count']
-            return {
-                'total_users': users_count,
-                'total_requests': requests_count
-            }
+            cursor.execute('''
+                SELECT t.last_used
+                FROM suppliers s
+                JOIN wb_api_tokens t ON s.token_id = t.id
+                WHERE s.id = %s
+            ''', (supplier_id,))
+            row = cursor.fetchone()
+            last_used = row['last_used'] if row else None
+
+        return {
+            'operations_count': redistributions_count,
+            'redistributions_count': redistributions_count,
+            'requests_by_status': self._requests_by_status(counters),
+            'last_used': last_used or 'никогда'
+        }
 
     # ==================== BROWSER SESSIONS ====================
 
@@ -407,17 +611,15 @@ class DatabasePostgres:
             ''', (user_id, None, phone_encrypted, phone_hash, phone_last4,
                   cookies_encrypted, supplier_name, expires_at))
 
-            return cursor.fetchone()['id']
+            session_id = cursor.fetchone()['id']
+
+        invalidate_user_context(user_id)
+        return session_id
 
     def get_browser_session(self, user_id: int) -> Optional[Dict]:
         """Получает активную браузерную сессию с расшифрованным телефоном"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            # Сначала проверим, есть ли вообще сессии для этого пользователя
-            cursor.execute('SELECT COUNT(*) as cnt FROM browser_sessions WHERE user_id = %s', (user_id,))
-            total = cursor.fetchone()['cnt']
-            logger.info(f"[DB] get_browser_session: user_id={user_id}, total_sessions={total}")
-
             cursor.execute('''
                 SELECT * FROM browser_sessions
                 WHERE user_id = %s AND status = 'active'
@@ -426,14 +628,46 @@ class DatabasePostgres:
                 LIMIT 1
             ''', (user_id,))
             row = cursor.fetchone()
-            logger.info(f"[DB] get_browser_session: found={row is not None}")
+            logger.debug(f"[DB] get_browser_session: user_id={user_id}, found={row is not None}")
             if not row:
                 return None
 
-            result = dict(row)
-            # Расшифровываем телефон для обратной совместимости
-            result['phone'] = self._decrypt_session_phone(result)
-            return result
+            # Телефон расшифровывается при первом обращении к 'phone'
+            return SessionRow(row, self._decrypt_session_phone)
+
+    def get_user_context(self, user_id: int) -> UserContext:
+        """
+        Поставщики, токены и активная сессия пользователя одним запросом.
+
+        Используется API через кэш (utils.user_context.load_user_context).
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT s.*,
+                   t.id AS t_id, t.name AS t_name, t.encrypted_token AS t_encrypted_token,
+                   t.is_active AS t_is_active, t.last_used AS t_last_used,
+                   bs.id AS bs_id, bs.user_id AS bs_user_id, bs.phone AS bs_phone,
+                   bs.phone_encrypted AS bs_phone_encrypted, bs.phone_hash AS bs_phone_hash, bs.phone_last4 AS bs_phone_last4,
+                   bs.cookies_encrypted AS bs_cookies_encrypted, bs.supplier_name AS bs_supplier_name, bs.status AS bs_status,
+                   bs.created_at AS bs_created_at, bs.last_used_at AS bs_last_used_at, bs.expires_at AS bs_expires_at
+                FROM (SELECT %s::BIGINT AS user_id) u
+                LEFT JOIN suppliers s ON s.user_id = u.user_id
+                LEFT JOIN wb_api_tokens t ON t.id = s.token_id AND t.user_id = u.user_id
+                LEFT JOIN browser_sessions bs ON bs.id = (
+                    SELECT id FROM browser_sessions
+                    WHERE user_id = u.user_id AND status = 'active'
+                    AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                )
+                ORDER BY s.is_default DESC, s.created_at DESC
+            ''', (user_id,))
+            rows = cursor.fetchall()
+
+        return UserContext.from_rows(
+            user_id, rows, lambda session: SessionRow(session, self._decrypt_session_phone)
+        )
 
     def _decrypt_session_phone(self, session: Dict) -> str:
         """
@@ -441,12 +675,10 @@ class DatabasePostgres:
 
         Поддерживает обратную совместимость со старыми записями.
         """
-        from utils.encryption import decrypt_phone
-
         # Приоритет: зашифрованный телефон > старое поле phone > last4
         if session.get('phone_encrypted'):
             try:
-                return decrypt_phone(session['phone_encrypted'])
+                return get_session_phone(session['phone_encrypted'], session.get('id'))
             except Exception:
                 pass
 
@@ -477,13 +709,17 @@ class DatabasePostgres:
                     ORDER BY created_at DESC
                 ''', (user_id,))
 
-            results = []
-            for row in cursor.fetchall():
-                session = dict(row)
-                # Расшифровываем телефон для обратной совместимости
-                session['phone'] = self._decrypt_session_phone(session)
-                results.append(session)
-            return results
+            return [SessionRow(row, self._decrypt_session_phone) for row in cursor.fetchall()]
+
+    def get_browser_session_by_id(self, session_id: int) -> Optional[Dict]:
+        """Получает сессию по ID"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM browser_sessions WHERE id = %s', (session_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return SessionRow(row, self._decrypt_session_phone)
 
     def update_browser_session_status(self, session_id: int, status: str) -> bool:
         """Обновляет статус сессии"""
@@ -494,7 +730,15 @@ class DatabasePostgres:
                 SET status = %s
                 WHERE id = %s
             ''', (status, session_id))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        if status != 'active':
+            invalidate_session(session_id)
+            invalidate_user_context(session_id=session_id)
+        else:
+            # Владелец сессии по ID неизвестен - сбрасываем все контексты
+            invalidate_user_context()
+        return updated
 
     def invalidate_browser_session(self, user_id: int) -> bool:
         """Деактивирует все сессии пользователя"""
@@ -505,4 +749,230 @@ class DatabasePostgres:
                 SET status = 'inactive'
                 WHERE user_id = %s AND status = 'active'
             ''', (user_id,))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        invalidate_user_context(user_id)
+        return updated
+
+    def cleanup_expired_sessions(self) -> int:
+        """
+        Помечает истекшие сессии.
+
+        Returns:
+            Количество истекших сессий
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE browser_sessions
+                SET status = 'expired'
+                WHERE status = 'active'
+                AND expires_at IS NOT NULL
+                AND expires_at < CURRENT_TIMESTAMP
+            ''')
+            expired = cursor.rowcount
+
+        if expired:
+            invalidate_user_context()
+        return expired
+
+    def get_sessions_due_for_refresh(
+        self,
+        ahead_hours: float,
+        stale_hours: float,
+        limit: int = 50
+    ) -> List[Dict]:
+        """
+        Активные сессии, которым пора обновить cookies.
+
+        Выбираются сессии, истекающие в ближайшие ahead_hours часов или не
+        обновлявшиеся дольше stale_hours. Первыми идут истекающие раньше,
+        затем недавно использованные.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM browser_sessions
+                WHERE status = 'active'
+                AND cookies_encrypted IS NOT NULL
+                AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+                AND (
+                    expires_at < CURRENT_TIMESTAMP + make_interval(secs => %s)
+                    OR COALESCE(refreshed_at, created_at) < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                )
+                ORDER BY expires_at ASC NULLS LAST, last_used_at DESC NULLS LAST
+                LIMIT %s
+            ''', (ahead_hours * 3600, stale_hours * 3600, limit))
+            return [SessionRow(row, self._decrypt_session_phone) for row in cursor.fetchall()]
+
+    def update_browser_session_cookies(
+        self,
+        session_id: int,
+        cookies_encrypted: str,
+        refresh_status: str,
+        expires_days: int = 7
+    ) -> bool:
+        """Сохраняет обновлённые cookies сессии (ID сессии не меняется)"""
+        from datetime import datetime, timedelta
+        expires_at = datetime.now() + timedelta(days=expires_days)
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE browser_sessions
+                SET cookies_encrypted = %s, expires_at = %s,
+                    refreshed_at = CURRENT_TIMESTAMP, refresh_status = %s,
+                    refresh_error = NULL, refresh_failures = 0
+                WHERE id = %s
+            ''', (cookies_encrypted, expires_at, refresh_status, session_id))
+            updated = cursor.rowcount > 0
+
+        invalidate_session(session_id)
+        invalidate_user_context(session_id=session_id)
+        return updated
+
+    def record_session_refresh_failure(
+        self,
+        session_id: int,
+        refresh_status: str,
+        error: str = None,
+        count: bool = True
+    ) -> int:
+        """
+        Записывает неудачное обновление cookies, возвращает число неудач подряд.
+
+        count=False - сбой инфраструктуры, в счётчик неудач не входит.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE browser_sessions
+                SET refreshed_at = CURRENT_TIMESTAMP, refresh_status = %s, refresh_error = %s,
+                    refresh_failures = COALESCE(refresh_failures, 0) + %s
+                WHERE id = %s
+                RETURNING refresh_failures
+            ''', (refresh_status, error, 1 if count else 0, session_id))
+            row = cursor.fetchone()
+            return row['refresh_failures'] if row else 0
+
+    def save_browser_session_state(self, session_id: int, state_encrypted: str) -> None:
+        """Сохраняет снимок storage state сессии (заменяя прежний)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO browser_session_states (session_id, state_encrypted, state_size, updated_at)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    state_encrypted = EXCLUDED.state_encrypted,
+                    state_size = EXCLUDED.state_size,
+                    updated_at = EXCLUDED.updated_at
+            ''', (session_id, state_encrypted, len(state_encrypted)))
+
+    def get_browser_session_state(self, session_id: int) -> Optional[str]:
+        """Зашифрованный снимок storage state сессии или None"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT state_encrypted FROM browser_session_states WHERE session_id = %s',
+                (session_id,)
+            )
+            row = cursor.fetchone()
+            return row['state_encrypted'] if row else None
+
+    # ==================== RETENTION ====================
+
+    def archive_requests(self, older_than_days: int, statuses: List[str], limit: int = 1000) -> int:
+        """
+        Переносит старые завершённые заявки в redistribution_requests_archive.
+
+        Один запрос DELETE ... RETURNING + INSERT; SKIP LOCKED позволяет
+        нескольким процессам архивировать одновременно. Конфликт по id
+        в архиве откатывает всю пачку (удалённые строки не теряются).
+
+        Args:
+            older_than_days: Завершены (или созданы) раньше стольких дней назад
+            statuses: Терминальные статусы
+            limit: Максимум заявок за вызов (одна короткая транзакция)
+
+        Returns:
+            Количество перенесённых заявок
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                WITH moved AS (
+                    DELETE FROM redistribution_requests
+                    WHERE id IN (
+                        SELECT id FROM redistribution_requests
+                        WHERE status = ANY(%s)
+                        AND COALESCE(completed_at, created_at) < NOW() - make_interval(days => %s)
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING {REQUEST_COLUMNS}
+                )
+                INSERT INTO redistribution_requests_archive ({REQUEST_COLUMNS})
+                SELECT {REQUEST_COLUMNS} FROM moved
+            ''', (list(statuses), older_than_days, limit))
+            return cursor.rowcount
+
+    def purge_browser_sessions(self, older_than_days: int) -> int:
+        """
+        Удаляет неактивные сессии (inactive, expired, invalid), не использованные
+        дольше older_than_days дней.
+
+        Returns:
+            Количество удалённых сессий
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM browser_sessions
+                WHERE status != 'active'
+                AND COALESCE(last_used_at, created_at) < NOW() - make_interval(days => %s)
+            ''', (older_than_days,))
+            return cursor.rowcount
+
+    def get_table_sizes(self, tables: List[str]) -> Dict[str, int]:
+        """Оценка количества строк в таблицах (pg_stat, без COUNT(*))"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT relname, n_live_tup FROM pg_stat_user_tables
+                WHERE relname = ANY(%s)
+            ''', (list(tables),))
+            return {row['relname']: row['n_live_tup'] for row in cursor.fetchall()}
+
+    def optimize(self, tables: List[str], vacuum_free_ratio: float = None) -> Dict:
+        """
+        VACUUM (ANALYZE) таблиц.
+
+        Returns:
+            Метрики: мёртвые строки до очистки по таблицам
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT relname, n_dead_tup FROM pg_stat_user_tables
+                WHERE relname = ANY(%s)
+            ''', (list(tables),))
+            dead_rows = {row['relname']: row['n_dead_tup'] for row in cursor.fetchall()}
+
+        # VACUUM нельзя выполнять внутри транзакции
+        conn = self._pool.getconn()
+        broken = False
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            for table in tables:
+                cursor.execute(f'VACUUM (ANALYZE) {table}')
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken:
+                conn.autocommit = False
+            self._pool.putconn(conn, close=broken)
+
+        return {'dead_rows': dead_rows, 'vacuumed': True}
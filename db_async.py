@@ -0,0 +1,94 @@
+"""
+Асинхронный доступ к БД для API и воркеров.
+
+AsyncDatabase повторяет методы адаптера из db_factory.get_database()
+(Database или DatabasePostgres), но каждый вызов - корутина, которая
+выполняется в отдельном пуле потоков и не блокирует event loop.
+
+Пример:
+    db = get_async_database()
+    session = await db.get_browser_session(user_id)
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Асинхронная обёртка над синхронным адаптером БД"""
+
+    def __init__(self, db: Any, max_workers: int = None):
+        """
+        Args:
+            db: Синхронный адаптер (Database или DatabasePostgres)
+            max_workers: Потоков для запросов (по умолчанию DB_POOL_MAX)
+        """
+        self.sync = db
+        self.max_workers = max_workers or Config.DB_POOL_MAX
+        # Один пул потоков на процесс: им пользуются event loop бота/воркеров
+        # и event loop API (uvicorn в отдельном потоке)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='db'
+        )
+        self._methods: Dict[str, Callable] = {}
+
+        # Метрики
+        self._calls = 0
+        self._queue_wait_total_ms = 0
+        self._queue_wait_max_ms = 0
+
+    def __getattr__(self, name: str):
+        """Возвращает корутину для метода синхронного адаптера"""
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        method = self._methods.get(name)
+        if method is not None:
+            return method
+
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            submitted = time.monotonic()
+
+            def run():
+                self._record_wait(submitted)
+                return attr(*args, **kwargs)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, run)
+
+        self._methods[name] = call
+        return call
+
+    def _record_wait(self, submitted: float) -> None:
+        """Учесть ожидание свободного потока"""
+        waited = int((time.monotonic() - submitted) * 1000)
+        self._calls += 1
+        self._queue_wait_total_ms += waited
+        self._queue_wait_max_ms = max(self._queue_wait_max_ms, waited)
+
+    def get_executor_stats(self) -> Dict:
+        """Метрики пула потоков"""
+        return {
+            'max_workers': self.max_workers,
+            'calls': self._calls,
+            'queue_wait_avg_ms': self._queue_wait_total_ms // self._calls if self._calls else 0,
+            'queue_wait_max_ms': self._queue_wait_max_ms,
+        }
+
+    def shutdown(self) -> None:
+        """Остановить пул потоков"""
+        self._executor.shutdown(wait=True)
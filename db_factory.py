@@ -3,21 +3,31 @@ Database Factory - выбирает правильную БД в зависим
 
 - Если DATABASE_URL установлен → PostgreSQL (Railway)
 - Иначе → SQLite (локально)
+
+Адаптер создаётся один раз на процесс (DDL схемы выполняется при создании).
+Жизненный цикл:
+- init_database() - при старте сервиса (run.py, bot.main, FastAPI lifespan)
+- close_database() - при остановке; ресурсы освобождаются, когда
+  остановлен последний сервис процесса
+
+Для async кода (API, воркеры) - get_async_database(): те же методы,
+но корутины, которые не блокируют event loop.
 """
 
 import os
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+_database = None
+_async_database = None
+_users = 0  # Сколько сервисов процесса вызвали init_database()
+_lock = threading.RLock()
 
-def get_database():
-    """
-    Возвращает экземпляр БД в зависимости от окружения.
 
-    Returns:
-        Database: SQLite или PostgreSQL адаптер
-    """
+def _create_database():
+    """Создаёт адаптер БД (выполняет DDL схемы)"""
     database_url = os.getenv('DATABASE_URL')
 
     if database_url:
@@ -31,3 +41,79 @@ def get_database():
         from database import Database
         from config import Config
         return Database(Config.DATABASE_PATH)
+
+
+def get_database():
+    """
+    Возвращает общий на процесс экземпляр БД.
+
+    Returns:
+        Database: SQLite или PostgreSQL адаптер
+    """
+    global _database
+
+    if _database is None:
+        with _lock:
+            if _database is None:
+                _database = _create_database()
+
+    return _database
+
+
+def get_async_database():
+    """
+    Возвращает общий на процесс асинхронный адаптер БД.
+
+    Returns:
+        AsyncDatabase поверх адаптера из get_database()
+    """
+    global _async_database
+
+    if _async_database is None:
+        with _lock:
+            if _async_database is None:
+                from db_async import AsyncDatabase
+                _async_database = AsyncDatabase(get_database())
+
+    return _async_database
+
+
+def init_database():
+    """
+    Startup hook: создаёт адаптер и применяет схему.
+
+    Returns:
+        Database: SQLite или PostgreSQL адаптер
+    """
+    global _users
+
+    with _lock:
+        db = get_database()
+        _users += 1
+
+    logger.info("Database initialized")
+    return db
+
+
+def close_database() -> None:
+    """Shutdown hook: освобождает пулы, когда БД больше никому не нужна"""
+    global _database, _async_database, _users
+
+    with _lock:
+        _users = max(_users - 1, 0)
+        if _users or _database is None:
+            return
+
+        if _async_database is not None:
+            _async_database.shutdown()
+            _async_database = None
+
+        if os.getenv('DATABASE_URL'):
+            from database_pg import close_pools
+            close_pools()
+        else:
+            _database.close()
+
+        _database = None
+
+    logger.info("Database closed")
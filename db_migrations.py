@@ -0,0 +1,652 @@
+"""
+Версионированные миграции схемы для SQLite и PostgreSQL.
+
+Каждая миграция - набор шагов для обоих бэкендов. Шаг - SQL строка
+или функция (cursor) для проверок, которые нельзя выразить в SQL
+(например, ADD COLUMN IF NOT EXISTS в SQLite).
+
+Применённые версии хранятся в таблице schema_migrations. Все новые
+миграции применяются в одной транзакции под блокировкой
+(BEGIN IMMEDIATE в SQLite, advisory lock в PostgreSQL), поэтому
+одновременный старт нескольких процессов безопасен.
+
+Новую миграцию добавляйте в конец MIGRATIONS со следующим номером.
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, List, Union
+
+logger = logging.getLogger(__name__)
+
+Step = Union[str, Callable]
+
+# Ключ advisory lock PostgreSQL для миграций
+PG_LOCK_ID = 7_310_001
+
+
+@dataclass
+class Migration:
+    """Миграция схемы"""
+    version: int
+    name: str
+    sqlite: List[Step] = field(default_factory=list)
+    postgres: List[Step] = field(default_factory=list)
+
+
+# ==================== ШАГИ ====================
+
+def _pg_init_script(cursor) -> None:
+    """Базовая схема PostgreSQL из init_db.sql"""
+    sql_file = os.path.join(os.path.dirname(__file__), 'init_db.sql')
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        cursor.execute(f.read())
+
+
+def _sqlite_add_phone_columns(cursor) -> None:
+    """Колонки шифрования телефона для БД, созданных до их появления"""
+    cursor.execute("PRAGMA table_info(browser_sessions)")
+    columns = {row[1] for row in cursor.fetchall()}
+
+    for column in ('phone_encrypted', 'phone_hash', 'phone_last4'):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE browser_sessions ADD COLUMN {column} TEXT")
+
+
+# Результат фонового обновления cookies (workers/session_refresh.py)
+SESSION_REFRESH_COLUMNS = [
+    ('refreshed_at', 'TIMESTAMP'),
+    ('refresh_status', 'TEXT'),
+    ('refresh_error', 'TEXT'),
+    ('refresh_failures', 'INTEGER DEFAULT 0'),
+]
+
+
+def _sqlite_add_refresh_columns(cursor) -> None:
+    """Колонки результата обновления cookies в browser_sessions"""
+    cursor.execute("PRAGMA table_info(browser_sessions)")
+    columns = {row[1] for row in cursor.fetchall()}
+
+    for column, column_type in SESSION_REFRESH_COLUMNS:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE browser_sessions ADD COLUMN {column} {column_type}")
+
+
+# Снимки storage state сессий (utils/session_state.py), отдельно от
+# browser_sessions: SELECT * по сессиям не тянет снимок
+SESSION_STATES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS browser_session_states (
+        session_id INTEGER PRIMARY KEY REFERENCES browser_sessions(id) ON DELETE CASCADE,
+        state_encrypted TEXT NOT NULL,
+        state_size INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+SQLITE_BASELINE = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER UNIQUE NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active INTEGER DEFAULT 1
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS wb_api_tokens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT DEFAULT 'Основной',
+        encrypted_token TEXT NOT NULL,
+        is_active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(telegram_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS wb_warehouses (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        address TEXT,
+        work_time TEXT,
+        accept_types TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS suppliers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        token_id INTEGER NOT NULL,
+        is_default INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(telegram_id),
+        FOREIGN KEY (token_id) REFERENCES wb_api_tokens(id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS redistribution_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        supplier_id INTEGER NOT NULL,
+        nm_id INTEGER NOT NULL,
+        product_name TEXT,
+        source_warehouse_id INTEGER NOT NULL,
+        source_warehouse_name TEXT,
+        target_warehouse_id INTEGER NOT NULL,
+        target_warehouse_name TEXT,
+        quantity INTEGER NOT NULL,
+        status TEXT DEFAULT 'pending',
+        supply_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(telegram_id),
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS browser_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        phone TEXT,
+        phone_encrypted TEXT,
+        phone_hash TEXT,
+        phone_last4 TEXT,
+        cookies_encrypted TEXT,
+        supplier_name TEXT,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used_at TIMESTAMP,
+        expires_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(telegram_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_tokens_user ON wb_api_tokens(user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_suppliers_user ON suppliers(user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_redistribution_user ON redistribution_requests(user_id, status)',
+    'CREATE INDEX IF NOT EXISTS idx_browser_sessions_user ON browser_sessions(user_id, status)',
+    'CREATE INDEX IF NOT EXISTS idx_browser_sessions_phone_hash ON browser_sessions(phone_hash)',
+]
+
+
+# Индексы горячих запросов (одинаковый синтаксис в обоих бэкендах)
+HOT_PATH_INDEXES = [
+    # get_browser_session / get_browser_sessions:
+    # WHERE user_id = ? AND status = ? ... ORDER BY created_at DESC
+    '''
+    CREATE INDEX IF NOT EXISTS idx_browser_sessions_user_status_created
+    ON browser_sessions(user_id, status, created_at)
+    ''',
+    # cleanup_expired_sessions: только активные сессии с истёкшим сроком
+    '''
+    CREATE INDEX IF NOT EXISTS idx_browser_sessions_active_expires
+    ON browser_sessions(expires_at) WHERE status = 'active'
+    ''',
+    # get_redistribution_requests с фильтром по статусу
+    '''
+    CREATE INDEX IF NOT EXISTS idx_requests_user_status_created
+    ON redistribution_requests(user_id, status, created_at)
+    ''',
+    # get_redistribution_requests без фильтра: WHERE user_id = ? ORDER BY created_at DESC
+    '''
+    CREATE INDEX IF NOT EXISTS idx_requests_user_created
+    ON redistribution_requests(user_id, created_at)
+    ''',
+    # get_supplier_stats: COUNT(*) по supplier_id
+    '''
+    CREATE INDEX IF NOT EXISTS idx_requests_supplier
+    ON redistribution_requests(supplier_id, status)
+    ''',
+]
+
+
+# Денормализованные счётчики для экранов статистики.
+# scope/scope_id: ('global', 0), ('user', telegram_id), ('supplier', supplier_id)
+# name: 'requests', 'requests:<status>', 'users', 'tokens'
+# Счётчики обновляются триггерами в той же транзакции, что и изменение строк.
+STATS_COUNTERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        scope VARCHAR(16) NOT NULL,
+        scope_id BIGINT NOT NULL,
+        name VARCHAR(64) NOT NULL,
+        value BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, scope_id, name)
+    )
+'''
+
+
+def _stats_backfill(users_filter: str) -> List[str]:
+    """Пересчёт счётчиков по текущим данным"""
+    status = "COALESCE(status, 'pending')"
+    return [
+        'DELETE FROM stats_counters',
+        f'''
+        INSERT INTO stats_counters (scope, scope_id, name, value)
+        SELECT 'global', 0, 'users', COUNT(*) FROM users {users_filter}
+        UNION ALL
+        SELECT 'global', 0, 'tokens', COUNT(*) FROM wb_api_tokens WHERE is_active
+        UNION ALL
+        SELECT 'global', 0, 'requests', COUNT(*) FROM redistribution_requests
+        UNION ALL
+        SELECT 'global', 0, 'requests:' || {status}, COUNT(*)
+        FROM redistribution_requests GROUP BY {status}
+        UNION ALL
+        SELECT 'user', user_id, 'requests', COUNT(*)
+        FROM redistribution_requests GROUP BY user_id
+        UNION ALL
+        SELECT 'user', user_id, 'requests:' || {status}, COUNT(*)
+        FROM redistribution_requests GROUP BY user_id, {status}
+        UNION ALL
+        SELECT 'supplier', supplier_id, 'requests', COUNT(*)
+        FROM redistribution_requests GROUP BY supplier_id
+        UNION ALL
+        SELECT 'supplier', supplier_id, 'requests:' || {status}, COUNT(*)
+        FROM redistribution_requests GROUP BY supplier_id, {status}
+        ''',
+    ]
+
+
+def _sqlite_bump(rows: List[str]) -> str:
+    """UPSERT счётчиков для тела триггера SQLite"""
+    return (
+        'INSERT INTO stats_counters (scope, scope_id, name, value) VALUES '
+        + ', '.join(rows)
+        + ' ON CONFLICT (scope, scope_id, name) DO UPDATE SET value = value + excluded.value;'
+    )
+
+
+def _sqlite_request_rows(row: str, delta: int) -> List[str]:
+    """Счётчики заявки row (NEW/OLD) с изменением delta"""
+    status = f"'requests:' || COALESCE({row}.status, 'pending')"
+    return [
+        f"('global', 0, 'requests', {delta})",
+        f"('global', 0, {status}, {delta})",
+        f"('user', {row}.user_id, 'requests', {delta})",
+        f"('user', {row}.user_id, {status}, {delta})",
+        f"('supplier', {row}.supplier_id, 'requests', {delta})",
+        f"('supplier', {row}.supplier_id, {status}, {delta})",
+    ]
+
+
+SQLITE_STATS_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_requests_stats_insert
+    AFTER INSERT ON redistribution_requests
+    BEGIN
+        {_sqlite_bump(_sqlite_request_rows('NEW', 1))}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_requests_stats_delete
+    AFTER DELETE ON redistribution_requests
+    BEGIN
+        {_sqlite_bump(_sqlite_request_rows('OLD', -1))}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_requests_stats_update
+    AFTER UPDATE OF status, user_id, supplier_id ON redistribution_requests
+    WHEN OLD.status IS NOT NEW.status
+      OR OLD.user_id IS NOT NEW.user_id
+      OR OLD.supplier_id IS NOT NEW.supplier_id
+    BEGIN
+        {_sqlite_bump(_sqlite_request_rows('OLD', -1))}
+        {_sqlite_bump(_sqlite_request_rows('NEW', 1))}
+    END
+    ''',
+    # В SQLite get_total_stats считает только активных пользователей и токены
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_users_stats_insert
+    AFTER INSERT ON users WHEN NEW.is_active
+    BEGIN
+        {_sqlite_bump(["('global', 0, 'users', 1)"])}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_users_stats_delete
+    AFTER DELETE ON users WHEN OLD.is_active
+    BEGIN
+        {_sqlite_bump(["('global', 0, 'users', -1)"])}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_users_stats_update
+    AFTER UPDATE OF is_active ON users
+    WHEN (OLD.is_active != 0) IS NOT (NEW.is_active != 0)
+    BEGIN
+        {_sqlite_bump(["('global', 0, 'users', CASE WHEN NEW.is_active THEN 1 ELSE -1 END)"])}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_tokens_stats_insert
+    AFTER INSERT ON wb_api_tokens WHEN NEW.is_active
+    BEGIN
+        {_sqlite_bump(["('global', 0, 'tokens', 1)"])}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_tokens_stats_delete
+    AFTER DELETE ON wb_api_tokens WHEN OLD.is_active
+    BEGIN
+        {_sqlite_bump(["('global', 0, 'tokens', -1)"])}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_tokens_stats_update
+    AFTER UPDATE OF is_active ON wb_api_tokens
+    WHEN (OLD.is_active != 0) IS NOT (NEW.is_active != 0)
+    BEGIN
+        {_sqlite_bump(["('global', 0, 'tokens', CASE WHEN NEW.is_active THEN 1 ELSE -1 END)"])}
+    END
+    ''',
+]
+
+
+PG_STATS_FUNCTIONS = [
+    '''
+    CREATE OR REPLACE FUNCTION stats_bump(p_scope TEXT, p_id BIGINT, p_name TEXT, p_delta INTEGER)
+    RETURNS void AS $$
+    BEGIN
+        INSERT INTO stats_counters (scope, scope_id, name, value)
+        VALUES (p_scope, p_id, p_name, p_delta)
+        ON CONFLICT (scope, scope_id, name)
+        DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION stats_bump_request(p_user BIGINT, p_supplier BIGINT, p_status TEXT, p_delta INTEGER)
+    RETURNS void AS $$
+    DECLARE
+        status_name TEXT := 'requests:' || COALESCE(p_status, 'pending');
+    BEGIN
+        PERFORM stats_bump('global', 0, 'requests', p_delta);
+        PERFORM stats_bump('global', 0, status_name, p_delta);
+        PERFORM stats_bump('user', p_user, 'requests', p_delta);
+        PERFORM stats_bump('user', p_user, status_name, p_delta);
+        PERFORM stats_bump('supplier', p_supplier, 'requests', p_delta);
+        PERFORM stats_bump('supplier', p_supplier, status_name, p_delta);
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION trg_requests_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE'
+           AND OLD.status IS NOT DISTINCT FROM NEW.status
+           AND OLD.user_id = NEW.user_id
+           AND OLD.supplier_id = NEW.supplier_id THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM stats_bump_request(OLD.user_id, OLD.supplier_id, OLD.status, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM stats_bump_request(NEW.user_id, NEW.supplier_id, NEW.status, 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION trg_users_stats() RETURNS trigger AS $$
+    BEGIN
+        PERFORM stats_bump('global', 0, 'users', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION trg_tokens_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND COALESCE(OLD.is_active, FALSE) THEN
+            PERFORM stats_bump('global', 0, 'tokens', -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND COALESCE(NEW.is_active, FALSE) THEN
+            PERFORM stats_bump('global', 0, 'tokens', 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS requests_stats ON redistribution_requests',
+    '''
+    CREATE TRIGGER requests_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, user_id, supplier_id ON redistribution_requests
+    FOR EACH ROW EXECUTE PROCEDURE trg_requests_stats()
+    ''',
+    'DROP TRIGGER IF EXISTS users_stats ON users',
+    '''
+    CREATE TRIGGER users_stats
+    AFTER INSERT OR DELETE ON users
+    FOR EACH ROW EXECUTE PROCEDURE trg_users_stats()
+    ''',
+    'DROP TRIGGER IF EXISTS tokens_stats ON wb_api_tokens',
+    '''
+    CREATE TRIGGER tokens_stats
+    AFTER INSERT OR DELETE OR UPDATE OF is_active ON wb_api_tokens
+    FOR EACH ROW EXECUTE PROCEDURE trg_tokens_stats()
+    ''',
+]
+
+
+# Архив завершённых заявок (retention): строки переносятся из
+# redistribution_requests с теми же id. Счётчики stats_counters учитывают
+# обе таблицы - перенос в архив их не меняет.
+SQLITE_REQUESTS_ARCHIVE = [
+    '''
+    CREATE TABLE IF NOT EXISTS redistribution_requests_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        supplier_id INTEGER NOT NULL,
+        nm_id INTEGER NOT NULL,
+        product_name TEXT,
+        source_warehouse_id INTEGER NOT NULL,
+        source_warehouse_name TEXT,
+        target_warehouse_id INTEGER NOT NULL,
+        target_warehouse_name TEXT,
+        quantity INTEGER NOT NULL,
+        status TEXT,
+        supply_id TEXT,
+        created_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_requests_archive_user_created
+    ON redistribution_requests_archive(user_id, created_at)
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_requests_archive_stats_insert
+    AFTER INSERT ON redistribution_requests_archive
+    BEGIN
+        {_sqlite_bump(_sqlite_request_rows('NEW', 1))}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_requests_archive_stats_delete
+    AFTER DELETE ON redistribution_requests_archive
+    BEGIN
+        {_sqlite_bump(_sqlite_request_rows('OLD', -1))}
+    END
+    ''',
+]
+
+PG_REQUESTS_ARCHIVE = [
+    '''
+    CREATE TABLE IF NOT EXISTS redistribution_requests_archive (
+        id INTEGER PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        supplier_id INTEGER NOT NULL,
+        nm_id BIGINT NOT NULL,
+        product_name TEXT,
+        source_warehouse_id INTEGER NOT NULL,
+        source_warehouse_name VARCHAR(255),
+        target_warehouse_id INTEGER NOT NULL,
+        target_warehouse_name VARCHAR(255),
+        quantity INTEGER NOT NULL,
+        status VARCHAR(50),
+        supply_id VARCHAR(255),
+        created_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_requests_archive_user_created
+    ON redistribution_requests_archive(user_id, created_at)
+    ''',
+    'DROP TRIGGER IF EXISTS requests_archive_stats ON redistribution_requests_archive',
+    '''
+    CREATE TRIGGER requests_archive_stats
+    AFTER INSERT OR DELETE ON redistribution_requests_archive
+    FOR EACH ROW EXECUTE PROCEDURE trg_requests_stats()
+    ''',
+]
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        version=1,
+        name='baseline',
+        sqlite=SQLITE_BASELINE,
+        postgres=[_pg_init_script],
+    ),
+    Migration(
+        version=2,
+        name='encrypt_phone_numbers',
+        sqlite=[
+            _sqlite_add_phone_columns,
+            'CREATE INDEX IF NOT EXISTS idx_browser_sessions_phone_hash ON browser_sessions(phone_hash)',
+        ],
+        postgres=[
+            'ALTER TABLE browser_sessions ADD COLUMN IF NOT EXISTS phone_encrypted TEXT',
+            'ALTER TABLE browser_sessions ADD COLUMN IF NOT EXISTS phone_hash VARCHAR(64)',
+            'ALTER TABLE browser_sessions ADD COLUMN IF NOT EXISTS phone_last4 VARCHAR(4)',
+            'CREATE INDEX IF NOT EXISTS idx_browser_sessions_phone_hash ON browser_sessions(phone_hash)',
+            'ALTER TABLE browser_sessions ALTER COLUMN phone DROP NOT NULL',
+        ],
+    ),
+    Migration(
+        version=3,
+        name='hot_path_indexes',
+        sqlite=HOT_PATH_INDEXES + [
+            # Префиксы новых составных индексов
+            'DROP INDEX IF EXISTS idx_redistribution_user',
+            'DROP INDEX IF EXISTS idx_browser_sessions_user',
+            'ANALYZE',
+        ],
+        postgres=HOT_PATH_INDEXES + [
+            'DROP INDEX IF EXISTS idx_requests_user_id',
+            'DROP INDEX IF EXISTS idx_browser_sessions_user',
+            'ANALYZE browser_sessions',
+            'ANALYZE redistribution_requests',
+        ],
+    ),
+    Migration(
+        version=4,
+        name='stats_counters',
+        # В SQLite пользователи считаются по is_active, в PostgreSQL колонки нет
+        sqlite=[STATS_COUNTERS_TABLE] + SQLITE_STATS_TRIGGERS + _stats_backfill('WHERE is_active'),
+        postgres=[STATS_COUNTERS_TABLE] + PG_STATS_FUNCTIONS + _stats_backfill(''),
+    ),
+    Migration(
+        version=5,
+        name='requests_archive',
+        sqlite=SQLITE_REQUESTS_ARCHIVE,
+        postgres=PG_REQUESTS_ARCHIVE,
+    ),
+    Migration(
+        version=6,
+        name='session_refresh',
+        sqlite=[_sqlite_add_refresh_columns],
+        postgres=[
+            f'ALTER TABLE browser_sessions ADD COLUMN IF NOT EXISTS {column} {column_type}'
+            for column, column_type in SESSION_REFRESH_COLUMNS
+        ],
+    ),
+    Migration(
+        version=7,
+        name='session_states',
+        sqlite=[SESSION_STATES_TABLE],
+        postgres=[SESSION_STATES_TABLE],
+    ),
+]
+
+
+# ==================== RUNNER ====================
+
+VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def current_version(cursor) -> int:
+    """Последняя применённая версия схемы"""
+    cursor.execute('SELECT MAX(version) AS version FROM schema_migrations')
+    row = cursor.fetchone()
+    version = row['version'] if isinstance(row, dict) else row[0]
+    return version or 0
+
+
+def apply_migrations(conn, backend: str) -> int:
+    """
+    Применяет недостающие миграции.
+
+    Args:
+        conn: Подключение sqlite3 или psycopg2
+        backend: 'sqlite' или 'postgres'
+
+    Returns:
+        Количество применённых миграций
+    """
+    cursor = conn.cursor()
+    placeholder = '%s' if backend == 'postgres' else '?'
+
+    try:
+        # Блокировка от параллельного применения другим процессом
+        if backend == 'postgres':
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (PG_LOCK_ID,))
+        else:
+            cursor.execute('BEGIN IMMEDIATE')
+
+        cursor.execute(VERSION_TABLE)
+        applied = current_version(cursor)
+
+        pending = [m for m in MIGRATIONS if m.version > applied]
+        for migration in pending:
+            logger.info(f"Applying {backend} migration {migration.version}: {migration.name}")
+            steps = migration.postgres if backend == 'postgres' else migration.sqlite
+
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+
+            cursor.execute(
+                f'INSERT INTO schema_migrations (version, name) VALUES ({placeholder}, {placeholder})',
+                (migration.version, migration.name)
+            )
+
+        conn.commit()
+
+        if pending:
+            logger.info(f"Schema migrated to version {pending[-1].version}")
+        return len(pending)
+
+    except Exception:
+        conn.rollback()
+        raise
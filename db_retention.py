@@ -0,0 +1,171 @@
+"""
+Retention: удержание горячих таблиц небольшими.
+
+Периодически (RETENTION_INTERVAL_HOURS):
+- помечает истекшие браузерные сессии (cleanup_expired_sessions)
+- удаляет неактивные сессии старше SESSIONS_PURGE_DAYS
+- переносит завершённые заявки старше REQUESTS_ARCHIVE_DAYS
+  в redistribution_requests_archive (пачками по RETENTION_BATCH_SIZE)
+- выполняет ANALYZE/VACUUM горячих таблиц
+
+Запускается из run.py вместе с воркерами. Метрики - get_stats()
+(GET /api/admin/retention).
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import Config
+from db_factory import get_async_database
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых заявка больше не меняется
+TERMINAL_STATUSES = ['completed', 'cancelled', 'failed']
+
+# Горячие таблицы, которые обслуживает retention
+HOT_TABLES = ['redistribution_requests', 'browser_sessions']
+ARCHIVE_TABLE = 'redistribution_requests_archive'
+
+
+class RetentionJob:
+    """Периодическая очистка и архивация"""
+
+    # Максимум пачек архивации за один запуск
+    MAX_BATCHES = 100
+
+    def __init__(self, interval_hours: float = None):
+        """
+        Args:
+            interval_hours: Период запуска (по умолчанию RETENTION_INTERVAL_HOURS)
+        """
+        self.interval = (interval_hours or Config.RETENTION_INTERVAL_HOURS) * 3600
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        # Метрики
+        self._runs = 0
+        self._errors = 0
+        self._last_run: Optional[Dict] = None
+        self._totals = {
+            'requests_archived': 0,
+            'sessions_expired': 0,
+            'sessions_purged': 0,
+        }
+
+    async def run_once(self) -> Dict:
+        """
+        Один проход retention.
+
+        Returns:
+            Метрики прохода
+        """
+        async with self._lock:
+            db = get_async_database()
+            started = time.monotonic()
+            result = {
+                'started_at': datetime.now().isoformat(),
+                'requests_archived': 0,
+                'sessions_expired': 0,
+                'sessions_purged': 0,
+                'error': None,
+            }
+
+            try:
+                result['sessions_expired'] = await db.cleanup_expired_sessions()
+                result['sessions_purged'] = await db.purge_browser_sessions(
+                    Config.SESSIONS_PURGE_DAYS
+                )
+
+                # Пачками, чтобы не держать долгую блокировку записи
+                for _ in range(self.MAX_BATCHES):
+                    moved = await db.archive_requests(
+                        Config.REQUESTS_ARCHIVE_DAYS,
+                        TERMINAL_STATUSES,
+                        Config.RETENTION_BATCH_SIZE
+                    )
+                    result['requests_archived'] += moved
+                    if moved < Config.RETENTION_BATCH_SIZE:
+                        break
+
+                result['optimize'] = await db.optimize(HOT_TABLES + [ARCHIVE_TABLE])
+                result['table_sizes'] = await db.get_table_sizes(HOT_TABLES + [ARCHIVE_TABLE])
+
+            except Exception as e:
+                logger.error(f"Retention failed: {e}", exc_info=True)
+                result['error'] = str(e)
+                self._errors += 1
+
+            result['duration_ms'] = int((time.monotonic() - started) * 1000)
+            self._runs += 1
+            for key in self._totals:
+                self._totals[key] += result[key]
+            self._last_run = result
+
+            logger.info(
+                f"Retention: archived {result['requests_archived']} requests, "
+                f"expired {result['sessions_expired']} and purged "
+                f"{result['sessions_purged']} sessions in {result['duration_ms']} ms"
+            )
+            return result
+
+    async def _run_loop(self) -> None:
+        """Запуск по расписанию"""
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Запустить периодический retention в текущем event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_loop())
+            logger.info(f"Retention scheduled every {self.interval / 3600:g} h")
+
+    async def stop(self) -> None:
+        """Остановить периодический retention"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict:
+        """Метрики retention"""
+        return {
+            'enabled': Config.RETENTION_ENABLED,
+            'interval_hours': self.interval / 3600,
+            'requests_archive_days': Config.REQUESTS_ARCHIVE_DAYS,
+            'sessions_purge_days': Config.SESSIONS_PURGE_DAYS,
+            'running': self._task is not None,
+            'runs': self._runs,
+            'errors': self._errors,
+            'totals': dict(self._totals),
+            'last_run': self._last_run,
+        }
+
+
+_retention_job: Optional[RetentionJob] = None
+
+
+def get_retention_job() -> RetentionJob:
+    """Общий на процесс retention"""
+    global _retention_job
+
+    if _retention_job is None:
+        _retention_job = RetentionJob()
+
+    return _retention_job
+
+
+async def shutdown_retention_job() -> None:
+    """Остановить retention"""
+    global _retention_job
+
+    if _retention_job:
+        await _retention_job.stop()
+        _retention_job = None
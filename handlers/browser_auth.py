@@ -17,9 +17,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from browser.auth import WBAuthService, AuthStatus, get_auth_service
+from browser.auth_slots import AuthSlotError
 from config import Config
 from db_factory import get_database
-from utils.encryption import encrypt_token, decrypt_token
+from utils.encryption import encrypt_token
+from utils.session_cache import get_session_cookies
+from utils.session_state import pack_storage_state
 
 logger = logging.getLogger(__name__)
 router = Router(name="browser_auth")
@@ -145,7 +148,22 @@ async def _process_phone_auth(message: Message, state: FSMContext, phone: str):
         reply_markup=ReplyKeyboardRemove()
     )
 
+    async def show_queue_position(position: int):
+        """Все слоты авторизации заняты - показываем место в очереди"""
+        try:
+            await progress_msg.edit_text(
+                f"📱 Номер: <code>{normalized_phone}</code>\n\n"
+                f"⏳ Сейчас много авторизаций, вы в очереди: <b>{position}</b>\n"
+                f"Авторизация начнётся автоматически, ничего не отправляйте.",
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.debug(f"Ошибка при редактировании сообщения (очередь): {e}")
+
     try:
+        # Ждём свободный слот авторизации (при перегрузке - в очереди)
+        await auth_service.acquire_auth_slot(user_id, show_queue_position)
+
         # Небольшая пауза чтобы пользователь увидел первый шаг
         await asyncio.sleep(0.5)
 
@@ -304,6 +322,19 @@ async def _process_phone_auth(message: Message, state: FSMContext, phone: str):
                 f"Попробуйте ещё раз: /auth"
             )
 
+    except AuthSlotError as e:
+        logger.warning(f"Auth slot not granted to user {user_id}: {e}")
+        try:
+            await progress_msg.delete()
+        except Exception:
+            pass
+
+        await state.clear()
+        await message.answer(
+            f"⏳ {e}.\n\n"
+            f"Попробуйте через несколько минут: /auth"
+        )
+
     except Exception as e:
         logger.error(f"Ошибка при авторизации: {e}")
         try:
@@ -312,6 +343,7 @@ async def _process_phone_auth(message: Message, state: FSMContext, phone: str):
             pass
 
         await state.clear()
+        await auth_service.close_session(user_id)
         await message.answer(
             f"Произошла ошибка при авторизации.\n"
             f"Попробуйте позже: /auth"
@@ -349,6 +381,13 @@ async def _handle_code_result(message: Message, state: FSMContext, session, phon
             supplier_name=session.supplier_name
         )
 
+        # Снимок localStorage/sessionStorage для восстановления сессии в браузере
+        if session.storage_state:
+            try:
+                db.save_browser_session_state(session_id, pack_storage_state(session.storage_state))
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить storage state сессии {session_id}: {e}")
+
         # Удаляем старых suppliers перед созданием новых
         old_suppliers = db.get_suppliers(user_id)
         if old_suppliers:
@@ -621,8 +660,22 @@ async def process_code(message: Message, state: FSMContext):
                         parse_mode="HTML"
                     )
 
+                    async def show_queue_position(position: int):
+                        """Все слоты авторизации заняты - показываем место в очереди"""
+                        try:
+                            await progress_msg.edit_text(
+                                f"📱 Номер: <code>{phone}</code>\n\n"
+                                f"⏳ Сейчас много авторизаций, вы в очереди: <b>{position}</b>\n"
+                                f"Авторизация начнётся автоматически, ничего не отправляйте.",
+                                parse_mode="HTML"
+                            )
+                        except Exception as e:
+                            logger.debug(f"Ошибка при редактировании сообщения (очередь): {e}")
+
                     # Запускаем авторизацию
-                    session = await auth_service.start_auth(user_id, phone)
+                    session = await auth_service.start_auth(
+                        user_id, phone, on_queue_position=show_queue_position
+                    )
 
                     if session.status == AuthStatus.PENDING_CODE:
                         await progress_msg.edit_text(
@@ -645,6 +698,7 @@ async def process_code(message: Message, state: FSMContext):
                                 "Введите новый код из SMS:"
                             )
                     else:
+                        await auth_service.close_session(user_id)
                         await progress_msg.delete()
                         await message.answer(
                             f"❌ Не удалось перезапустить авторизацию.\n\n"
@@ -653,6 +707,7 @@ async def process_code(message: Message, state: FSMContext):
                 except Exception as restart_error:
                     logger.error(f"Failed to restart auth: {restart_error}")
                     await state.clear()
+                    await auth_service.close_session(user_id)
                     await message.answer(
                         "❌ Не удалось автоматически перезапустить авторизацию.\n\n"
                         "Попробуйте заново: /auth"
@@ -881,7 +936,6 @@ async def callback_refresh_profiles(callback: CallbackQuery):
     Обновить названия поставщиков (перепарсить профили из WB).
     Использует существующие cookies без повторной авторизации.
     """
-    import json
     user_id = callback.from_user.id
     db = get_db()
 
@@ -908,8 +962,7 @@ async def callback_refresh_profiles(callback: CallbackQuery):
 
     try:
         # Расшифровываем cookies
-        cookies_json = decrypt_token(cookies_encrypted)
-        cookies = json.loads(cookies_json)
+        cookies = get_session_cookies(cookies_encrypted, session['id'])
 
         if not cookies:
             await callback.message.answer(
@@ -927,7 +980,9 @@ async def callback_refresh_profiles(callback: CallbackQuery):
 
         # Парсим профили
         auth_service = get_auth_service()
-        profiles = await auth_service.refresh_profiles_with_cookies(cookies)
+        profiles = await auth_service.refresh_profiles_with_cookies(
+            cookies, cookies_encrypted, session['id']
+        )
 
         if not profiles:
             await status_msg.edit_text(
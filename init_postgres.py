@@ -2,19 +2,22 @@
 Инициализация PostgreSQL базы данных для Railway.
 
 Запускается автоматически при первом старте, если DATABASE_URL установлен.
+Применяет версионированные миграции из db_migrations.
 """
 
 import os
 import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import psycopg2.extras
 import logging
 
+from db_migrations import apply_migrations
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 def init_postgres():
-    """Инициализирует PostgreSQL схему из init_db.sql"""
+    """Инициализирует PostgreSQL схему (миграции)"""
     database_url = os.getenv('DATABASE_URL')
 
     if not database_url:
@@ -25,23 +28,19 @@ def init_postgres():
         logger.info("Connecting to PostgreSQL...")
 
         # Подключаемся к PostgreSQL
-        conn = psycopg2.connect(database_url)
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cursor = conn.cursor()
-
-        # Читаем SQL скрипт
-        with open('init_db.sql', 'r', encoding='utf-8') as f:
-            sql_script = f.read()
-
-        logger.info("Executing schema initialization...")
+        conn = psycopg2.connect(
+            database_url,
+            cursor_factory=psycopg2.extras.RealDictCursor
+        )
 
-        # Выполняем SQL скрипт
-        cursor.execute(sql_script)
+        logger.info("Applying schema migrations...")
 
-        logger.info("✅ PostgreSQL schema initialized successfully")
+        try:
+            applied = apply_migrations(conn, 'postgres')
+        finally:
+            conn.close()
 
-        cursor.close()
-        conn.close()
+        logger.info(f"✅ PostgreSQL schema initialized successfully ({applied} migrations applied)")
 
     except Exception as e:
         logger.error(f"❌ Failed to initialize PostgreSQL: {e}")
@@ -23,6 +23,7 @@ from browser.auth import WBAuthService
 from browser.browser_service import get_browser_service
 from db_factory import get_database
 from utils.encryption import encrypt_token
+from utils.session_state import pack_storage_state
 
 
 async def main():
@@ -160,6 +161,11 @@ async def main():
         )
         print(f"   ✅ Browser session создан (ID: {session_id})")
 
+        # Снимок localStorage/sessionStorage ЛК
+        if result.storage_state:
+            db.save_browser_session_state(session_id, pack_storage_state(result.storage_state))
+            print("   ✅ Storage state сохранён")
+
         # Также создаем токен для совместимости
         token_id = db.add_wb_token(
             user_id=telegram_id,
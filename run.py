@@ -101,6 +101,12 @@ async def run_telegram_bot():
     await bot_main()
 
 
+def queue_backend_name() -> str:
+    """Название используемого бэкенда очереди задач"""
+    from workers.queue import get_queue_backend
+    return get_queue_backend()
+
+
 async def run_workers(num_workers: int = 3, bot=None):
     """
     Запускает пул воркеров для обработки задач.
@@ -125,6 +131,8 @@ async def run_workers(num_workers: int = 3, bot=None):
             notify_callback=notify_user if bot else None
         )
         await pool.start()
+        # start() только создаёт задачи воркеров - работаем, пока они не завершатся
+        await pool.wait()
     except Exception as e:
         logger.error(f"Worker pool error: {e}", exc_info=True)
     finally:
@@ -136,6 +144,10 @@ async def run_all_services():
     from aiogram import Bot
     from aiogram.client.default import DefaultBotProperties
     from aiogram.enums import ParseMode
+    from db_factory import init_database, close_database
+
+    # БД нужна и боту, и воркерам - держим её до остановки всех сервисов
+    init_database()
 
     # Создаём бота для уведомлений
     bot = None
@@ -146,23 +158,32 @@ async def run_all_services():
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
 
-    # Проверяем, нужны ли воркеры (только если Redis настроен)
-    workers_enabled = bool(Config.REDIS_URL)
-
     tasks = []
 
     # Telegram бот (основной)
     from bot import main as bot_main
     tasks.append(asyncio.create_task(bot_main()))
 
-    # Workers (если Redis настроен)
-    if workers_enabled:
-        logger.info("Redis configured - starting workers...")
-        num_workers = int(os.getenv('NUM_WORKERS', '3'))
-        tasks.append(asyncio.create_task(run_workers(num_workers, bot)))
+    # Workers (без Redis - встроенная очередь в этом процессе)
+    logger.info(f"Starting workers (queue: {queue_backend_name()})...")
+    num_workers = int(os.getenv('NUM_WORKERS', '3'))
+    tasks.append(asyncio.create_task(run_workers(num_workers, bot)))
 
-    else:
-        logger.warning("Redis not configured - workers disabled")
+    # Архивация заявок и очистка сессий по расписанию
+    from db_retention import get_retention_job, shutdown_retention_job
+    if Config.RETENTION_ENABLED:
+        get_retention_job().start()
+
+    # Обновление cookies сессий до истечения
+    from workers.session_refresh import get_session_refresh_job, shutdown_session_refresh_job
+    if Config.SESSION_REFRESH_ENABLED:
+        get_session_refresh_job().start()
+
+    # Фоновые импорты cookies прерываются при остановке
+    from workers.cookie_import import shutdown_cookie_import_pipeline
+
+    # SMS авторизации закрываются при остановке (их планировщик стартует сам)
+    from browser.auth import shutdown_auth_service
 
     try:
         # Ждём завершения любой задачи (или все)
@@ -173,6 +194,11 @@ async def run_all_services():
         # Cleanup
         if bot:
             await bot.session.close()
+        await shutdown_retention_job()
+        await shutdown_session_refresh_job()
+        await shutdown_cookie_import_pipeline()
+        await shutdown_auth_service()
+        close_database()
 
 
 def kill_old_bot_processes():
@@ -255,8 +281,6 @@ def main():
     except Exception as e:
         logger.error(f"Failed to kill old processes: {e}", exc_info=True)
 
-    workers_enabled = bool(Config.REDIS_URL)
-
     print("=" * 50)
     print("🚀 WB Redistribution Bot + API")
     print("=" * 50)
@@ -266,7 +290,7 @@ def main():
     print("📚 API Docs: http://localhost:8080/docs")
     print("🖥  Mini App: http://localhost:8080/webapp")
     print()
-    print(f"👷 Workers: {'Enabled' if workers_enabled else 'Disabled (no Redis)'}")
+    print(f"👷 Workers: Enabled (queue: {queue_backend_name()})")
     print()
     print("⏳ Press Ctrl+C to stop")
     print("=" * 50)
@@ -282,12 +306,7 @@ def main():
 
     # Запускаем все асинхронные сервисы
     try:
-        if workers_enabled:
-            # Режим с воркерами
-            asyncio.run(run_all_services())
-        else:
-            # Только бот (без воркеров)
-            asyncio.run(run_telegram_bot())
+        asyncio.run(run_all_services())
     except KeyboardInterrupt:
         logger.info("\n\n✅ Stopping services...")
         sys.exit(0)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: время создания browser context со stealth скриптами.
+
+Сравнивает два варианта подготовки страницы авторизации:
+    legacy - исходный stealth скрипт в контекст и детектор полей
+             отдельным add_init_script на страницу
+    bundle - один минифицированный init script контекста
+             (BrowserService.create_context(init_scripts=...))
+
+Для каждого варианта N раз создаётся контекст, страница и открывается
+about:blank (init scripts выполняются при каждой навигации).
+
+Использование:
+    python scripts/bench_browser_context.py --iterations 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем путь к модулям проекта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from browser.auth_fields import FIELD_DETECTOR_JS
+from browser.browser_service import BrowserService
+from browser.stealth import STEALTH_JS, get_init_bundle
+
+
+async def open_legacy(service: BrowserService) -> float:
+    """Контекст и страница с init scripts по отдельности"""
+    started = time.monotonic()
+    context = await service._browser.new_context()
+    await context.add_init_script(STEALTH_JS)
+    page = await context.new_page()
+    await page.add_init_script(FIELD_DETECTOR_JS)
+    await page.goto('about:blank')
+    elapsed = time.monotonic() - started
+    await context.close()
+    return elapsed
+
+
+async def open_bundle(service: BrowserService) -> float:
+    """Контекст и страница с одним init script"""
+    started = time.monotonic()
+    context = await service._browser.new_context()
+    await context.add_init_script(get_init_bundle((FIELD_DETECTOR_JS,)))
+    page = await context.new_page()
+    await page.goto('about:blank')
+    elapsed = time.monotonic() - started
+    await context.close()
+    return elapsed
+
+
+async def measure(name: str, opener, service: BrowserService, iterations: int) -> None:
+    """Прогон одного варианта"""
+    await opener(service)  # Прогрев
+    times = [await opener(service) * 1000 for _ in range(iterations)]
+    print(
+        f"{name:<7} avg {statistics.mean(times):.1f} ms, "
+        f"median {statistics.median(times):.1f} ms, max {max(times):.1f} ms"
+    )
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    """Прогон обоих вариантов"""
+    service = BrowserService(headless=True)
+    await service.start()
+    try:
+        print(f"init script: {len(STEALTH_JS) + len(FIELD_DETECTOR_JS)} -> "
+              f"{len(get_init_bundle((FIELD_DETECTOR_JS,)))} bytes")
+        await measure("legacy", open_legacy, service, args.iterations)
+        await measure("bundle", open_bundle, service, args.iterations)
+    finally:
+        await service.stop()
+
+
+def main() -> int:
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Время создания browser context")
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: задержка event loop при запросах к БД.
+
+Запускает N конкурентных корутин, каждая делает M чтений из БД,
+сначала синхронным адаптером (как вызывается из async кода напрямую),
+затем через AsyncDatabase. Во время прогона LoopLagMonitor измеряет,
+насколько event loop опаздывает с пробуждением задач.
+
+Использование:
+    python scripts/bench_db_loop_lag.py --user 123456789 --concurrency 50 --queries 20
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Добавляем путь к модулям проекта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db_factory import get_database, get_async_database
+from utils.loop_monitor import LoopLagMonitor
+
+
+async def run_sync(db, user_id: int, queries: int) -> None:
+    """Блокирующие вызовы прямо в корутине"""
+    for _ in range(queries):
+        db.get_browser_session(user_id)
+        db.get_redistribution_requests(user_id)
+        await asyncio.sleep(0)
+
+
+async def run_async(db, user_id: int, queries: int) -> None:
+    """Вызовы через AsyncDatabase"""
+    for _ in range(queries):
+        await db.get_browser_session(user_id)
+        await db.get_redistribution_requests(user_id)
+
+
+async def measure(name: str, worker, db, args: argparse.Namespace) -> None:
+    """Прогон одного варианта"""
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    started = time.monotonic()
+
+    await asyncio.gather(*[
+        worker(db, args.user, args.queries) for _ in range(args.concurrency)
+    ])
+
+    elapsed = time.monotonic() - started
+    await monitor.stop()
+    stats = monitor.stats()
+
+    total = args.concurrency * args.queries * 2
+    print(
+        f"{name:<6} {total} запросов за {elapsed:.2f}s | "
+        f"lag avg {stats['avg_ms']} ms, p95 {stats['p95_ms']} ms, max {stats['max_ms']} ms"
+    )
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    """Прогон обоих вариантов"""
+    await measure("sync", run_sync, get_database(), args)
+    await measure("async", run_async, get_async_database(), args)
+
+
+def main() -> int:
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Задержка event loop при запросах к БД")
+    parser.add_argument('--user', type=int, required=True, help="Telegram user ID для чтений")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
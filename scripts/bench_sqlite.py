@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк SQLite: подключение на каждый запрос против tuned режима.
+
+Смешанная нагрузка из нескольких потоков (как бот, API и воркеры
+в одном процессе): чтение списка заявок, создание и обновление заявок.
+Каждый режим работает со своим временным файлом БД.
+
+Использование:
+    python scripts/bench_sqlite.py --threads 8 --ops 500 --writes 0.3
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Добавляем путь к модулям проекта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import Database
+
+USER_ID = 1
+
+
+def worker(db: Database, ops: int, write_ratio: float, latencies: list, errors: list) -> None:
+    """Поток нагрузки"""
+    request_ids = []
+    for _ in range(ops):
+        started = time.perf_counter()
+        try:
+            if random.random() < write_ratio:
+                if request_ids and random.random() < 0.5:
+                    db.update_redistribution_request(random.choice(request_ids), status='searching')
+                else:
+                    request_ids.append(db.add_redistribution_request(
+                        user_id=USER_ID, supplier_id=1, nm_id=random.randint(1, 10**6),
+                        product_name="bench", source_warehouse_id=1, source_warehouse_name="A",
+                        target_warehouse_id=2, target_warehouse_name="B", quantity=1
+                    ))
+            else:
+                db.get_redistribution_requests(USER_ID)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - started)
+
+
+def run(tuned: bool, args: argparse.Namespace) -> None:
+    """Прогон одного режима"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "bench.db"), tuned=tuned)
+        db.add_user(USER_ID, "bench", "Bench")
+
+        latencies: list = []
+        errors: list = []
+        threads = [
+            threading.Thread(target=worker, args=(db, args.ops, args.writes, latencies, errors))
+            for _ in range(args.threads)
+        ]
+
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        db.close()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    name = "tuned" if tuned else "legacy"
+    print(
+        f"{name:<7} {len(latencies) / elapsed:8.0f} ops/s | "
+        f"p95 {p95:6.2f} ms | max {latencies[-1] * 1000:7.2f} ms | "
+        f"locked errors: {len(errors)}"
+    )
+
+
+def main() -> int:
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк режимов SQLite")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=500, help="Операций на поток")
+    parser.add_argument('--writes', type=float, default=0.3, help="Доля записей")
+    args = parser.parse_args()
+
+    run(False, args)
+    run(True, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Проверка, что горячие запросы используют индексы (EXPLAIN).
+
+Без DATABASE_URL схема SQLite создаётся миграциями во временном файле,
+с DATABASE_URL запросы проверяются на PostgreSQL (seq scan отключается,
+чтобы на маленьких таблицах планировщик показал доступный индекс).
+
+Использование:
+    python scripts/check_indexes.py
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+# Добавляем путь к модулям проекта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db_migrations import apply_migrations
+
+# (название, SQL, ожидаемый индекс или кортеж допустимых)
+HOT_QUERIES = [
+    (
+        "get_browser_session",
+        """
+        SELECT * FROM browser_sessions
+        WHERE user_id = {p} AND status = 'active'
+        AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+        ORDER BY created_at DESC LIMIT 1
+        """,
+        "idx_browser_sessions_user_status_created",
+    ),
+    (
+        "get_redistribution_requests(status)",
+        """
+        SELECT * FROM redistribution_requests
+        WHERE user_id = {p} AND status = {p}
+        ORDER BY created_at DESC
+        """,
+        "idx_requests_user_status_created",
+    ),
+    (
+        "get_redistribution_requests",
+        """
+        SELECT * FROM redistribution_requests
+        WHERE user_id = {p}
+        ORDER BY created_at DESC
+        """,
+        "idx_requests_user_created",
+    ),
+    (
+        "get_supplier_stats",
+        "SELECT name, value FROM stats_counters WHERE scope = 'supplier' AND scope_id = {p}",
+        # Первичный ключ: имя индекса в SQLite и PostgreSQL различается
+        ("sqlite_autoindex_stats_counters_1", "stats_counters_pkey"),
+    ),
+    (
+        "cleanup_expired_sessions",
+        """
+        SELECT id FROM browser_sessions
+        WHERE status = 'active' AND expires_at IS NOT NULL
+        AND expires_at < CURRENT_TIMESTAMP
+        """,
+        "idx_browser_sessions_active_expires",
+    ),
+]
+
+
+def sqlite_plans() -> dict:
+    """Планы запросов SQLite"""
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(str(Path(tmp) / "check.db"))
+        apply_migrations(conn, 'sqlite')
+
+        plans = {}
+        for name, sql, _ in HOT_QUERIES:
+            query = sql.format(p='?')
+            params = (1,) * query.count('?')
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            plans[name] = "\n".join(str(row[-1]) for row in rows)
+        conn.close()
+        return plans
+
+
+def postgres_plans(database_url: str) -> dict:
+    """Планы запросов PostgreSQL"""
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET enable_seqscan = off")
+
+        plans = {}
+        for name, sql, _ in HOT_QUERIES:
+            query = sql.format(p='%s')
+            cursor.execute(f"EXPLAIN {query}", (1,) * query.count('%s'))
+            plans[name] = "\n".join(row[0] for row in cursor.fetchall())
+        return plans
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def main() -> int:
+    """Главная функция"""
+    database_url = os.getenv('DATABASE_URL')
+    plans = postgres_plans(database_url) if database_url else sqlite_plans()
+    backend = "PostgreSQL" if database_url else "SQLite"
+    print(f"Backend: {backend}\n")
+
+    failed = 0
+    for name, _, index in HOT_QUERIES:
+        plan = plans[name]
+        indexes = index if isinstance(index, tuple) else (index,)
+        ok = any(i in plan for i in indexes)
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {name}: ожидается {' | '.join(indexes)}")
+        if not ok:
+            print("   " + plan.replace("\n", "\n   "))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
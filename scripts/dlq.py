@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Управление dead-letter очередью задач перемещения.
+
+Использование:
+    python scripts/dlq.py list [--user 123] [--reason "квот"] [--since 2026-01-01] [--limit 50]
+    python scripts/dlq.py show <entry_id>
+    python scripts/dlq.py screenshot <entry_id> --out /tmp/task.png
+    python scripts/dlq.py replay [--all | <entry_id> ...] [--user 123] [--reason ...] [--rate 30]
+    python scripts/dlq.py purge <entry_id> ...
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Добавляем путь к модулям проекта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from workers.queue import get_task_queue, shutdown_task_queue
+
+
+def print_entry(item: dict, verbose: bool = False) -> None:
+    """Печатает запись dead-letter очереди"""
+    print(
+        f"{item['entry_id']}  task={item['task_id']}  user={item['user_id']}  "
+        f"attempts={item['attempts']}  failed_at={item['failed_at']}"
+    )
+    print(f"    reason: {item['reason']}")
+    if verbose:
+        print(f"    session_id: {item['session_id']}  request_id: {item['request_id']}")
+        print(f"    duration: {item['duration_ms']} ms  screenshot: {item['screenshot_ref'] or '-'}")
+        print("    history:")
+        print(json.dumps(item['history'], ensure_ascii=False, indent=4))
+
+
+async def run(args: argparse.Namespace) -> int:
+    """Выполняет команду"""
+    queue = await get_task_queue()
+    if not queue.is_connected:
+        print("❌ Redis не подключён (проверьте REDIS_URL)")
+        return 1
+
+    try:
+        if args.command == 'list':
+            items = await queue.get_dead_letters(
+                user_id=args.user, reason=args.reason, since=args.since, limit=args.limit
+            )
+            for item in items:
+                print_entry(item)
+            print(f"\nВсего: {len(items)}")
+
+        elif args.command == 'show':
+            item = await queue.get_dead_letter(args.entry_id)
+            if not item:
+                print(f"❌ Запись {args.entry_id} не найдена")
+                return 1
+            print_entry(item, verbose=True)
+
+        elif args.command == 'screenshot':
+            item = await queue.get_dead_letter(args.entry_id)
+            screenshot = await queue.get_dead_letter_screenshot(item['screenshot_ref']) if item else None
+            if not screenshot:
+                print(f"❌ Скриншот для {args.entry_id} не найден")
+                return 1
+            Path(args.out).write_bytes(screenshot)
+            print(f"✅ Скриншот сохранён: {args.out}")
+
+        elif args.command == 'replay':
+            if args.entry_ids:
+                entry_ids = args.entry_ids
+            else:
+                items = await queue.get_dead_letters(
+                    user_id=args.user, reason=args.reason, since=args.since,
+                    limit=queue.DLQ_MAXLEN
+                )
+                entry_ids = [item['entry_id'] for item in reversed(items)]  # Старые первыми
+
+            if not entry_ids:
+                print("Нет записей для повторного запуска")
+                return 0
+
+            print(f"⏳ Повторный запуск {len(entry_ids)} задач (rate: {args.rate or '∞'}/мин)...")
+            skipped = [0]
+
+            def on_progress(processed: int, replayed: int, skipped_count: int) -> None:
+                skipped[0] = skipped_count
+
+            replayed = await queue.replay_dead_letters(
+                entry_ids, rate_per_minute=args.rate, on_progress=on_progress
+            )
+            print(f"✅ Поставлено в очередь: {replayed}")
+            if skipped[0]:
+                print(f"⚠️ Пропущено (нет активной сессии пользователя): {skipped[0]}")
+
+        elif args.command == 'purge':
+            purged = await queue.purge_dead_letters(args.entry_ids)
+            print(f"✅ Удалено записей: {purged}")
+
+        return 0
+
+    finally:
+        await shutdown_task_queue()
+
+
+def main() -> int:
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Dead-letter очередь задач перемещения")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_filters(p: argparse.ArgumentParser) -> None:
+        p.add_argument('--user', type=int, help="Telegram user ID")
+        p.add_argument('--reason', help="Подстрока причины ошибки")
+        p.add_argument('--since', help="Упавшие не раньше (ISO дата/время)")
+
+    p_list = sub.add_parser('list', help="Список записей")
+    add_filters(p_list)
+    p_list.add_argument('--limit', type=int, default=50)
+
+    p_show = sub.add_parser('show', help="Подробности записи")
+    p_show.add_argument('entry_id')
+
+    p_shot = sub.add_parser('screenshot', help="Сохранить последний скриншот")
+    p_shot.add_argument('entry_id')
+    p_shot.add_argument('--out', required=True)
+
+    p_replay = sub.add_parser('replay', help="Повторно поставить задачи в очередь")
+    p_replay.add_argument('entry_ids', nargs='*')
+    p_replay.add_argument('--all', action='store_true', help="Все записи по фильтрам")
+    p_replay.add_argument('--rate', type=int, default=30, help="Задач в минуту (0 - без ограничения)")
+    add_filters(p_replay)
+
+    p_purge = sub.add_parser('purge', help="Удалить записи")
+    p_purge.add_argument('entry_ids', nargs='+')
+
+    args = parser.parse_args()
+    if (args.command == 'replay' and not args.entry_ids and not args.all
+            and args.user is None and args.reason is None and args.since is None):
+        parser.error("replay: укажите entry_id, фильтр (--user/--reason/--since) или --all")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
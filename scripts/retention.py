@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Ручной запуск retention: архивация завершённых заявок, очистка
+сессий, ANALYZE/VACUUM.
+
+Использование:
+    python scripts/retention.py
+    python scripts/retention.py --archive-days 90 --purge-days 14
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Добавляем путь к модулям проекта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from db_factory import init_database, close_database
+from db_retention import RetentionJob
+
+
+async def run() -> dict:
+    """Один проход retention"""
+    init_database()
+    try:
+        return await RetentionJob().run_once()
+    finally:
+        close_database()
+
+
+def main() -> int:
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Архивация заявок и очистка сессий")
+    parser.add_argument("--archive-days", type=int, default=Config.REQUESTS_ARCHIVE_DAYS,
+                        help="Архивировать завершённые заявки старше N дней")
+    parser.add_argument("--purge-days", type=int, default=Config.SESSIONS_PURGE_DAYS,
+                        help="Удалять неактивные сессии старше N дней")
+    args = parser.parse_args()
+
+    Config.REQUESTS_ARCHIVE_DAYS = args.archive_days
+    Config.SESSIONS_PURGE_DAYS = args.purge_days
+
+    result = asyncio.run(run())
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    return 1 if result['error'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
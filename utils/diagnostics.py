@@ -0,0 +1,256 @@
+"""
+Диагностика браузерных сценариев и запросов к WB.
+
+Скриншоты страниц и подробные логи перехваченных API нужны только при
+разборе проблем - в обычной работе они не снимаются и не форматируются.
+Уровень (DIAGNOSTICS_LEVEL):
+    off     - ничего (по умолчанию)
+    sampled - скриншоты для доли DIAGNOSTICS_SAMPLE_RATE событий
+    full    - все скриншоты и подробные логи
+
+Независимо от уровня администратор может включить трассировку одного
+пользователя на DIAGNOSTICS_TRACE_MINUTES минут (POST
+/api/admin/diagnostics/trace/{user_id}): для его запросов диагностика
+полная. Пользователь текущего запроса задаётся bind_user() и
+наследуется всеми вызовами в той же asyncio задаче.
+
+Артефакты хранятся в памяти в кольцевом буфере (не больше
+DIAGNOSTICS_BUFFER_SIZE штук и DIAGNOSTICS_BUFFER_MB мегабайт), старые
+вытесняются - файлы в /tmp не перезаписываются и не копятся.
+
+Пример:
+    diagnostics = get_diagnostics()
+    await diagnostics.screenshot(page, 'session_expired')
+    if diagnostics.verbose():
+        logger.info(f"Keys: {list(data.keys())}")
+"""
+
+import logging
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('off', 'sampled', 'full')
+
+# Пользователь текущего запроса (для трассировки)
+_current_user: ContextVar[Optional[int]] = ContextVar('diagnostics_user', default=None)
+
+
+def bind_user(user_id: Optional[int]) -> None:
+    """Привязать диагностику текущей задачи к пользователю"""
+    _current_user.set(user_id)
+
+
+@dataclass
+class Artifact:
+    """Сохранённый артефакт диагностики"""
+    id: int
+    label: str
+    content: bytes
+    media_type: str = 'image/png'
+    user_id: Optional[int] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def info(self) -> Dict:
+        """Описание без содержимого"""
+        return {
+            'id': self.id,
+            'label': self.label,
+            'media_type': self.media_type,
+            'user_id': self.user_id,
+            'size': len(self.content),
+            'created_at': self.created_at,
+        }
+
+
+class Diagnostics:
+    """Уровень диагностики, трассировки пользователей и буфер артефактов"""
+
+    def __init__(
+        self,
+        level: str = None,
+        sample_rate: float = None,
+        buffer_size: int = None,
+        buffer_mb: float = None
+    ):
+        """
+        Args:
+            level: off / sampled / full (по умолчанию DIAGNOSTICS_LEVEL)
+            sample_rate: Доля событий для sampled (DIAGNOSTICS_SAMPLE_RATE)
+            buffer_size: Максимум артефактов (DIAGNOSTICS_BUFFER_SIZE)
+            buffer_mb: Максимум памяти под артефакты (DIAGNOSTICS_BUFFER_MB)
+        """
+        self.level = 'off'
+        self.sample_rate = 0.0
+        self.set_level(
+            level or Config.DIAGNOSTICS_LEVEL,
+            Config.DIAGNOSTICS_SAMPLE_RATE if sample_rate is None else sample_rate
+        )
+        self.buffer_size = max(1, Config.DIAGNOSTICS_BUFFER_SIZE if buffer_size is None else buffer_size)
+        self.buffer_bytes = int((Config.DIAGNOSTICS_BUFFER_MB if buffer_mb is None else buffer_mb) * 1024 * 1024)
+
+        self._artifacts: Deque[Artifact] = deque()
+        self._size = 0
+        self._next_id = 1
+        self._traces: Dict[int, float] = {}  # user_id -> monotonic время окончания
+
+        # Метрики
+        self._captured = 0
+        self._evicted = 0
+        self._failed = 0
+
+    def set_level(self, level: str, sample_rate: float = None) -> None:
+        """
+        Сменить уровень диагностики.
+
+        Raises:
+            ValueError: Неизвестный уровень
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown diagnostics level: {level} (expected one of {', '.join(LEVELS)})")
+        self.level = level
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+
+    def start_trace(self, user_id: int, minutes: float = None) -> float:
+        """
+        Включить полную диагностику для пользователя.
+
+        Returns:
+            Через сколько секунд трассировка выключится
+        """
+        seconds = (minutes or Config.DIAGNOSTICS_TRACE_MINUTES) * 60
+        self._traces[user_id] = time.monotonic() + seconds
+        logger.info(f"Diagnostics trace enabled for user {user_id} for {seconds / 60:g} min")
+        return seconds
+
+    def stop_trace(self, user_id: int) -> bool:
+        """Выключить трассировку пользователя"""
+        return self._traces.pop(user_id, None) is not None
+
+    def is_traced(self, user_id: int = None) -> bool:
+        """Включена ли трассировка пользователя (по умолчанию - текущего)"""
+        if not self._traces:
+            return False
+        if user_id is None:
+            user_id = _current_user.get()
+        expires = self._traces.get(user_id)
+        if expires is None:
+            return False
+        if time.monotonic() >= expires:
+            del self._traces[user_id]
+            return False
+        return True
+
+    def verbose(self, user_id: int = None) -> bool:
+        """Подробные логи: уровень full или трассировка пользователя"""
+        return self.level == 'full' or self.is_traced(user_id)
+
+    def should_capture(self, user_id: int = None) -> bool:
+        """Снимать ли артефакт для этого события"""
+        if self.verbose(user_id):
+            return True
+        return self.level == 'sampled' and random.random() < self.sample_rate
+
+    async def screenshot(self, page, label: str, user_id: int = None) -> Optional[int]:
+        """
+        Скриншот страницы в буфер, если событие попадает в диагностику.
+
+        Returns:
+            ID артефакта или None
+        """
+        if page is None or not self.should_capture(user_id):
+            return None
+        try:
+            content = await page.screenshot(full_page=False)
+        except Exception as e:
+            logger.debug(f"Diagnostics screenshot '{label}' failed: {e}")
+            self._failed += 1
+            return None
+        return self.add(label, content, 'image/png', user_id)
+
+    def add(
+        self,
+        label: str,
+        content: bytes,
+        media_type: str = 'image/png',
+        user_id: int = None
+    ) -> int:
+        """
+        Положить артефакт в буфер (старые вытесняются).
+
+        Returns:
+            ID артефакта
+        """
+        artifact = Artifact(
+            id=self._next_id,
+            label=label,
+            content=content,
+            media_type=media_type,
+            user_id=_current_user.get() if user_id is None else user_id
+        )
+        self._next_id += 1
+        self._artifacts.append(artifact)
+        self._size += len(content)
+        self._captured += 1
+
+        while len(self._artifacts) > 1 and (
+            len(self._artifacts) > self.buffer_size or self._size > self.buffer_bytes
+        ):
+            evicted = self._artifacts.popleft()
+            self._size -= len(evicted.content)
+            self._evicted += 1
+
+        logger.info(f"Diagnostics artifact #{artifact.id} '{label}' captured ({len(content)} bytes)")
+        return artifact.id
+
+    def get_artifact(self, artifact_id: int) -> Optional[Artifact]:
+        """Артефакт по ID (None, если уже вытеснен)"""
+        return next((a for a in self._artifacts if a.id == artifact_id), None)
+
+    def list_artifacts(self, user_id: int = None) -> List[Dict]:
+        """Артефакты в буфере, новые первыми"""
+        return [
+            a.info() for a in reversed(self._artifacts)
+            if user_id is None or a.user_id == user_id
+        ]
+
+    def get_stats(self) -> Dict:
+        """Уровень, трассировки и заполненность буфера"""
+        now = time.monotonic()
+        return {
+            'level': self.level,
+            'sample_rate': self.sample_rate,
+            'traces': {
+                user_id: round(expires - now)
+                for user_id, expires in self._traces.items() if expires > now
+            },
+            'artifacts': len(self._artifacts),
+            'buffer_size': self.buffer_size,
+            'buffer_mb': round(self._size / 1024 / 1024, 2),
+            'buffer_max_mb': round(self.buffer_bytes / 1024 / 1024, 2),
+            'captured': self._captured,
+            'evicted': self._evicted,
+            'failed': self._failed,
+        }
+
+
+_diagnostics: Optional[Diagnostics] = None
+
+
+def get_diagnostics() -> Diagnostics:
+    """Общая на процесс диагностика"""
+    global _diagnostics
+
+    if _diagnostics is None:
+        _diagnostics = Diagnostics()
+
+    return _diagnostics
@@ -95,6 +95,40 @@ def decrypt_token(encrypted_token: str) -> str:
         return encrypted_token
 
 
+def encrypt_bytes(data: bytes) -> str:
+    """
+    Шифрует двоичные данные (например, сжатый снимок storage state).
+
+    Returns:
+        Зашифрованные данные (base64)
+
+    Raises:
+        RuntimeError: Если шифрование не настроено
+    """
+    fernet = _get_fernet()
+    if fernet is None:
+        raise RuntimeError("WB_ENCRYPTION_KEY не настроен! Невозможно безопасно сохранить данные.")
+    return fernet.encrypt(data).decode()
+
+
+def decrypt_bytes(encrypted: str) -> Optional[bytes]:
+    """
+    Расшифровывает двоичные данные.
+
+    Returns:
+        Данные или None, если расшифровать не удалось
+    """
+    fernet = _get_fernet()
+    if fernet is None:
+        return None
+
+    try:
+        return fernet.decrypt(encrypted.encode())
+    except InvalidToken:
+        logger.warning("Данные не расшифрованы: неверный ключ или повреждены")
+        return None
+
+
 # ========================================
 # Функции для работы с номерами телефонов
 # ========================================
@@ -0,0 +1,74 @@
+"""
+Измерение задержки event loop.
+
+Если в корутине выполняется блокирующий вызов (например, синхронный
+запрос к БД), loop не может вовремя разбудить другие задачи. Монитор
+периодически засыпает на interval и измеряет, насколько позже он проснулся.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Монитор задержки event loop.
+
+    Использование:
+        monitor = LoopLagMonitor(interval=0.05)
+        monitor.start()
+        ...
+        await monitor.stop()
+        print(monitor.stats())
+    """
+
+    def __init__(self, interval: float = 0.05):
+        """
+        Args:
+            interval: Период измерения (секунды)
+        """
+        self.interval = interval
+        self._samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запустить измерение в текущем event loop"""
+        self._samples.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить измерение"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        """Цикл измерения"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - started - self.interval
+            self._samples.append(max(lag, 0.0) * 1000)
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика задержки в миллисекундах"""
+        if not self._samples:
+            return {'samples': 0, 'avg_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+
+        ordered = sorted(self._samples)
+        p95_index = min(len(ordered) - 1, int(len(ordered) * 0.95))
+
+        return {
+            'samples': len(ordered),
+            'avg_ms': round(sum(ordered) / len(ordered), 2),
+            'p95_ms': round(ordered[p95_index], 2),
+            'max_ms': round(ordered[-1], 2),
+        }
@@ -0,0 +1,287 @@
+"""
+Кэш расшифрованных данных браузерных сессий.
+
+Cookies сессии хранятся в БД зашифрованными (Fernet + JSON). Поиск товаров,
+воркеры и WBInternalClient расшифровывают их на каждый запрос - кэш
+избавляет от повторной расшифровки и разбора JSON.
+
+Там же на SESSION_PROBE_TTL секунд хранятся результаты HTTP проверки
+живости сессии (wb_api.internal_client.probe_session).
+
+Ключ записи - (ID сессии, хеш шифртекста): после обновления cookies
+шифртекст меняется и старая запись просто перестаёт использоваться.
+Размер ограничен (LRU), записи живут SESSION_CACHE_TTL секунд.
+
+Пример:
+    cookies = get_session_cookies(session['cookies_encrypted'], session['id'])
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from utils.encryption import decrypt_phone, decrypt_token
+
+
+class SessionCache:
+    """Ограниченный LRU кэш с TTL (потокобезопасный)"""
+
+    def __init__(self, max_entries: int = None, ttl: int = None):
+        """
+        Args:
+            max_entries: Максимум записей (по умолчанию SESSION_CACHE_SIZE)
+            ttl: Время жизни записи в секундах (по умолчанию SESSION_CACHE_TTL)
+        """
+        self.max_entries = Config.SESSION_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = Config.SESSION_CACHE_TTL if ttl is None else ttl
+        self._entries: 'OrderedDict[Tuple, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Метрики
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    @staticmethod
+    def _key(kind: str, session_id: Optional[int], ciphertext: str) -> Tuple:
+        digest = hashlib.blake2b(ciphertext.encode(), digest_size=16).digest()
+        return (kind, session_id, digest)
+
+    def get_or_load(
+        self,
+        kind: str,
+        session_id: Optional[int],
+        ciphertext: str,
+        loader: Callable[[str], Any]
+    ) -> Any:
+        """
+        Возвращает значение из кэша или вычисляет loader(ciphertext).
+
+        Ошибки loader не кэшируются и пробрасываются вызывающему.
+        """
+        if not self.enabled:
+            return loader(ciphertext)
+
+        key = self._key(kind, session_id, ciphertext)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+
+        # Расшифровка вне блокировки: параллельные промахи не ждут друг друга
+        value = loader(ciphertext)
+        self._store(key, value, now + self.ttl)
+        return value
+
+    def get(self, kind: str, session_id: Optional[int], ciphertext: str) -> Any:
+        """Значение из кэша или None"""
+        if not self.enabled:
+            return None
+
+        key = self._key(kind, session_id, ciphertext)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            return None
+
+    def put(self, kind: str, session_id: Optional[int], ciphertext: str, value: Any, ttl: float = None) -> None:
+        """Сохранить значение (ttl - своё время жизни записи в секундах)"""
+        if self.enabled:
+            ttl = self.ttl if ttl is None else ttl
+            self._store(self._key(kind, session_id, ciphertext), value, time.monotonic() + ttl)
+
+    def _store(self, key: Tuple, value: Any, expires: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, session_id: int) -> int:
+        """
+        Удаляет записи сессии (при удалении/деактивации сессии).
+
+        Returns:
+            Количество удалённых записей
+        """
+        with self._lock:
+            keys = [k for k in self._entries if k[1] == session_id]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """Метрики кэша"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+_cache: Optional[SessionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_session_cache() -> SessionCache:
+    """Общий на процесс кэш сессий"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SessionCache()
+
+    return _cache
+
+
+def _load_cookies(cookies_encrypted: str) -> Tuple[List[Dict], Dict[str, str]]:
+    """Расшифровка cookies: список Playwright и словарь name -> value"""
+    cookies = json.loads(decrypt_token(cookies_encrypted))
+
+    cookie_dict = {}
+    for cookie in cookies:
+        if isinstance(cookie, dict):
+            name = cookie.get('name')
+            value = cookie.get('value')
+            if name and value:
+                cookie_dict[name] = value
+
+    return cookies, cookie_dict
+
+
+def get_session_cookies(cookies_encrypted: str, session_id: int = None) -> List[Dict]:
+    """
+    Расшифрованные cookies сессии в формате Playwright.
+
+    Args:
+        cookies_encrypted: Зашифрованные cookies из browser_sessions
+        session_id: ID сессии (если известен)
+
+    Returns:
+        Список cookies (копия - его можно изменять)
+
+    Raises:
+        ValueError: Если cookies не удалось разобрать
+    """
+    cookies, _ = get_session_cache().get_or_load(
+        'cookies', session_id, cookies_encrypted, _load_cookies
+    )
+    return [dict(c) if isinstance(c, dict) else c for c in cookies]
+
+
+def get_session_cookie_dict(cookies_encrypted: str, session_id: int = None) -> Dict[str, str]:
+    """
+    Расшифрованные cookies сессии в виде name -> value (для aiohttp).
+
+    Args:
+        cookies_encrypted: Зашифрованные cookies из browser_sessions
+        session_id: ID сессии (если известен)
+
+    Returns:
+        Словарь cookies (копия)
+
+    Raises:
+        ValueError: Если cookies не удалось разобрать
+    """
+    _, cookie_dict = get_session_cache().get_or_load(
+        'cookies', session_id, cookies_encrypted, _load_cookies
+    )
+    return dict(cookie_dict)
+
+
+def get_session_phone(phone_encrypted: str, session_id: int = None) -> str:
+    """Расшифрованный номер телефона сессии"""
+    return get_session_cache().get_or_load(
+        'phone', session_id, phone_encrypted, decrypt_phone
+    )
+
+
+def get_session_probe(cookies_encrypted: str, session_id: int = None) -> Optional[bool]:
+    """
+    Закэшированный результат HTTP проверки живости сессии.
+
+    Returns:
+        True/False - результат проверки, None - проверки не было или она устарела
+    """
+    return get_session_cache().get('probe', session_id, cookies_encrypted)
+
+
+def set_session_probe(cookies_encrypted: str, session_id: Optional[int], alive: bool) -> None:
+    """Запомнить результат проверки живости на SESSION_PROBE_TTL секунд"""
+    get_session_cache().put('probe', session_id, cookies_encrypted, alive, Config.SESSION_PROBE_TTL)
+
+
+def invalidate_session(session_id: int) -> None:
+    """Забыть расшифрованные данные сессии"""
+    if _cache is not None:
+        _cache.invalidate(session_id)
+
+
+def get_session_cache_stats() -> Dict:
+    """Метрики кэша сессий"""
+    return get_session_cache().get_stats()
+
+
+class SessionRow(dict):
+    """
+    Строка browser_sessions с ленивой расшифровкой телефона.
+
+    Ключ 'phone' расшифровывается при первом обращении через [] или get(),
+    а не при чтении строки из БД.
+    """
+
+    def __init__(self, row, decrypt: Callable[[Dict], str]):
+        super().__init__(row)
+        self._decrypt = decrypt
+        self._phone_ready = False
+
+    def _ensure_phone(self) -> None:
+        if not self._phone_ready:
+            self._phone_ready = True
+            dict.__setitem__(self, 'phone', self._decrypt(self))
+
+    def __getitem__(self, key):
+        if key == 'phone':
+            self._ensure_phone()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key == 'phone':
+            self._ensure_phone()
+        return super().get(key, default)
+
+    def __setitem__(self, key, value):
+        if key == 'phone':
+            self._phone_ready = True
+        super().__setitem__(key, value)
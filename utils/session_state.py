@@ -0,0 +1,192 @@
+"""
+Снимки storage state браузерных сессий.
+
+Кроме cookies, SPA ЛК WB держит токены в localStorage и sessionStorage.
+Если восстанавливать сессию только из cookies, они теряются - отсюда
+лишние редиректы, а иногда и повторный вход. Поэтому после входа и после
+браузерного обновления сессии сохраняется снимок:
+    origins         - localStorage по origin (Playwright storage_state)
+    session_storage - sessionStorage открытой страницы по origin
+
+Снимок хранится отдельно от строки сессии (browser_session_states):
+JSON -> zlib -> Fernet. Cookies в снимок не входят - их источник
+по-прежнему browser_sessions.cookies_encrypted (обновляется и по HTTP).
+
+Новый контекст получает localStorage через storage_state, а
+sessionStorage - init script'ом до загрузки скриптов страницы.
+
+Пример:
+    snapshot = await load_session_state(session['id'])
+    context = await browser.create_context(cookies=cookies, **context_options(snapshot))
+    ...
+    await save_session_state(session['id'], context, page)
+"""
+
+import json
+import logging
+import zlib
+from typing import Any, Dict, Optional
+
+from config import Config
+from utils.encryption import decrypt_bytes, encrypt_bytes
+
+logger = logging.getLogger(__name__)
+
+# Версия формата снимка
+SNAPSHOT_VERSION = 1
+
+# Метрики
+_stats = {'saved': 0, 'save_failed': 0, 'loaded': 0, 'missing': 0, 'load_failed': 0, 'last_size': 0}
+_restores = {
+    kind: {'count': 0, 'expired': 0, 'warmup_count': 0, 'warmup_total_ms': 0}
+    for kind in ('snapshot', 'cookies')
+}
+
+
+def pack_storage_state(snapshot: Dict) -> str:
+    """Снимок -> JSON -> zlib -> Fernet"""
+    raw = json.dumps({'v': SNAPSHOT_VERSION, **snapshot}, ensure_ascii=False, separators=(',', ':'))
+    return encrypt_bytes(zlib.compress(raw.encode(), 6))
+
+
+def unpack_storage_state(encrypted: str) -> Optional[Dict]:
+    """Снимок из БД или None, если он повреждён или в другом формате"""
+    data = decrypt_bytes(encrypted)
+    if data is None:
+        return None
+    try:
+        snapshot = json.loads(zlib.decompress(data))
+    except (zlib.error, ValueError) as e:
+        logger.warning(f"Storage state snapshot is corrupted: {e}")
+        return None
+    if snapshot.get('v') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+async def capture_storage_state(context, page=None) -> Dict:
+    """
+    Снять localStorage контекста и sessionStorage страницы.
+
+    Args:
+        context: BrowserContext
+        page: Открытая страница ЛК (для sessionStorage)
+    """
+    state = await context.storage_state()
+    snapshot: Dict[str, Any] = {'origins': state.get('origins', []), 'session_storage': {}}
+
+    if page is not None:
+        origin, items = await page.evaluate(
+            '() => [location.origin, Object.fromEntries(Object.entries(sessionStorage))]'
+        )
+        if items and origin.startswith('http'):
+            snapshot['session_storage'][origin] = items
+
+    return snapshot
+
+
+def _session_storage_script(session_storage: Dict[str, Dict[str, str]]) -> str:
+    """Init script: заполнить sessionStorage своего origin (не перезаписывая)"""
+    # ensure_ascii: U+2028/U+2029 в значениях не должны попасть в JS как есть
+    return (
+        f'const data = {json.dumps(session_storage)}[location.origin];\n'
+        'if (data) for (const [k, v] of Object.entries(data)) '
+        'if (sessionStorage.getItem(k) === null) sessionStorage.setItem(k, v);'
+    )
+
+
+def context_options(snapshot: Optional[Dict]) -> Dict:
+    """
+    Параметры BrowserService.create_context для восстановления снимка.
+
+    Returns:
+        {'storage_state': ..., 'session_scripts': ...} или {} без снимка
+    """
+    if not snapshot:
+        return {}
+
+    options: Dict[str, Any] = {
+        'storage_state': {'cookies': [], 'origins': snapshot.get('origins', [])}
+    }
+    if snapshot.get('session_storage'):
+        options['session_scripts'] = (_session_storage_script(snapshot['session_storage']),)
+    return options
+
+
+async def load_session_state(session_id: Optional[int]) -> Optional[Dict]:
+    """Снимок сессии из БД (None - нет, выключено или не читается)"""
+    if not session_id or not Config.SESSION_STATE_ENABLED:
+        return None
+
+    from db_factory import get_async_database
+
+    try:
+        encrypted = await get_async_database().get_browser_session_state(session_id)
+    except Exception as e:
+        logger.warning(f"Failed to load storage state of session {session_id}: {e}")
+        _stats['load_failed'] += 1
+        return None
+
+    if not encrypted:
+        _stats['missing'] += 1
+        return None
+
+    snapshot = unpack_storage_state(encrypted)
+    _stats['loaded' if snapshot else 'load_failed'] += 1
+    return snapshot
+
+
+async def save_session_state(session_id: Optional[int], context, page=None) -> bool:
+    """
+    Снять и сохранить снимок сессии. Ошибки не пробрасываются -
+    без снимка сессия восстанавливается из cookies, как раньше.
+    """
+    if not session_id or not Config.SESSION_STATE_ENABLED:
+        return False
+
+    from db_factory import get_async_database
+
+    try:
+        encrypted = pack_storage_state(await capture_storage_state(context, page))
+        await get_async_database().save_browser_session_state(session_id, encrypted)
+    except Exception as e:
+        logger.warning(f"Failed to save storage state of session {session_id}: {e}")
+        _stats['save_failed'] += 1
+        return False
+
+    _stats['saved'] += 1
+    _stats['last_size'] = len(encrypted)
+    return True
+
+
+def record_restore(snapshot: bool, expired: bool, warmup_ms: int = None) -> None:
+    """
+    Учесть открытие ЛК восстановленной сессией.
+
+    Args:
+        snapshot: Контекст восстановлен из снимка (иначе только cookies)
+        expired: WB отправил на страницу входа
+        warmup_ms: Время первой навигации до готовой страницы
+    """
+    stats = _restores['snapshot' if snapshot else 'cookies']
+    stats['count'] += 1
+    stats['expired'] += int(expired)
+    if warmup_ms is not None:
+        stats['warmup_count'] += 1
+        stats['warmup_total_ms'] += warmup_ms
+
+
+def get_session_state_stats() -> Dict:
+    """Метрики снимков и восстановлений (снимок против только cookies)"""
+    return {
+        'enabled': Config.SESSION_STATE_ENABLED,
+        **_stats,
+        'restores': {
+            kind: {
+                'count': stats['count'],
+                'expired_rate': round(stats['expired'] / stats['count'], 3) if stats['count'] else 0,
+                'avg_warmup_ms': stats['warmup_total_ms'] // stats['warmup_count'] if stats['warmup_count'] else 0,
+            }
+            for kind, stats in _restores.items()
+        },
+    }
@@ -0,0 +1,222 @@
+"""
+Кэш контекста пользователя для API.
+
+Контекст - поставщики пользователя, их токены и активная браузерная
+сессия. Загружается одним запросом (get_user_context адаптера БД) и
+живёт USER_CONTEXT_TTL секунд. Адаптеры БД сбрасывают контекст при
+изменении поставщиков, токенов и сессий (invalidate_user_context).
+
+Пример:
+    ctx = await load_user_context(db, user_id)
+    supplier = ctx.get_supplier(supplier_id)
+    token = ctx.get_token(supplier)
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from config import Config
+from utils.encryption import decrypt_token
+
+
+@dataclass
+class UserContext:
+    """Поставщики, токены и активная сессия пользователя"""
+    user_id: int
+    suppliers: Dict[int, Dict] = field(default_factory=dict)   # supplier_id -> строка suppliers
+    tokens: Dict[int, Dict] = field(default_factory=dict)      # token_id -> строка wb_api_tokens
+    session: Optional[Dict] = None                              # Активная browser_session
+    _decrypted: Dict[int, str] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_rows(cls, user_id: int, rows: List[Dict], make_session: Callable[[Dict], Dict]) -> 'UserContext':
+        """
+        Собирает контекст из строк запроса get_user_context адаптера.
+
+        Колонки с префиксом t_ - токен, bs_ - сессия, остальные - поставщик
+        (поставщика нет, если id NULL).
+        """
+        context = cls(user_id=user_id)
+
+        for row in rows:
+            row = dict(row)
+            supplier = {k: v for k, v in row.items() if not k.startswith(('t_', 'bs_'))}
+            token = {k[2:]: v for k, v in row.items() if k.startswith('t_')}
+            session = {k[3:]: v for k, v in row.items() if k.startswith('bs_')}
+
+            if supplier['id'] is not None:
+                supplier['token_name'] = token['name']
+                context.suppliers[supplier['id']] = supplier
+            if token['id'] is not None:
+                context.tokens[token['id']] = token
+            if session['id'] is not None and context.session is None:
+                context.session = make_session(session)
+
+        return context
+
+    def get_supplier(self, supplier_id: int) -> Optional[Dict]:
+        """Поставщик пользователя или None (чужой или не существует)"""
+        return self.suppliers.get(supplier_id)
+
+    def get_token(self, supplier: Dict) -> Optional[str]:
+        """
+        Расшифрованный WB API токен поставщика.
+
+        Returns:
+            Токен или None, если токена нет
+        """
+        token_id = supplier['token_id']
+        if token_id not in self._decrypted:
+            token = self.tokens.get(token_id)
+            if not token or not token.get('encrypted_token'):
+                return None
+            self._decrypted[token_id] = decrypt_token(token['encrypted_token'])
+        return self._decrypted[token_id]
+
+
+class UserContextCache:
+    """Контексты пользователей с TTL (потокобезопасный)"""
+
+    def __init__(self, ttl: float = None, max_entries: int = 1024):
+        """
+        Args:
+            ttl: Время жизни контекста в секундах (по умолчанию USER_CONTEXT_TTL)
+            max_entries: Максимум контекстов в памяти
+        """
+        self.ttl = Config.USER_CONTEXT_TTL if ttl is None else ttl
+        self.max_entries = max_entries
+        self._entries: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        # Растёт при каждой инвалидации: загрузка, начатая до записи,
+        # не кладёт в кэш устаревшие данные
+        self._generation = 0
+
+        # Метрики
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_id: int) -> Optional[UserContext]:
+        """Контекст из кэша или None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            return None
+
+    def put(self, context: UserContext, generation: int) -> None:
+        """Сохранить контекст, если с начала загрузки не было инвалидаций"""
+        if self.ttl <= 0:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[context.user_id] = (time.monotonic() + self.ttl, context)
+
+    def invalidate(
+        self,
+        user_id: int = None,
+        supplier_id: int = None,
+        token_id: int = None,
+        session_id: int = None
+    ) -> None:
+        """
+        Сбросить контексты, которых касается изменение.
+
+        Без аргументов сбрасывает все контексты.
+        """
+        with self._lock:
+            self._generation += 1
+            self._invalidations += 1
+
+            if user_id is None and supplier_id is None and token_id is None and session_id is None:
+                self._entries.clear()
+                return
+
+            stale = [
+                uid for uid, (_, ctx) in self._entries.items()
+                if uid == user_id
+                or (supplier_id is not None and supplier_id in ctx.suppliers)
+                or (token_id is not None and token_id in ctx.tokens)
+                or (session_id is not None and ctx.session and ctx.session['id'] == session_id)
+            ]
+            for uid in stale:
+                del self._entries[uid]
+
+    def get_stats(self) -> Dict:
+        """Метрики кэша"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'invalidations': self._invalidations,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+_cache: Optional[UserContextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_user_context_cache() -> UserContextCache:
+    """Общий на процесс кэш контекстов"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UserContextCache()
+
+    return _cache
+
+
+async def load_user_context(db: Any, user_id: int) -> UserContext:
+    """
+    Контекст пользователя из кэша или из БД (один запрос).
+
+    Args:
+        db: AsyncDatabase
+        user_id: Telegram ID пользователя
+    """
+    cache = get_user_context_cache()
+    context = cache.get(user_id)
+    if context is not None:
+        return context
+
+    generation = cache.generation
+    context = await db.get_user_context(user_id)
+    cache.put(context, generation)
+    return context
+
+
+def invalidate_user_context(
+    user_id: int = None,
+    supplier_id: int = None,
+    token_id: int = None,
+    session_id: int = None
+) -> None:
+    """Сбросить закэшированные контексты (вызывается адаптерами БД при записи)"""
+    if _cache is not None:
+        _cache.invalidate(user_id, supplier_id, token_id, session_id)
+
+
+def get_user_context_stats() -> Dict:
+    """Метрики кэша контекстов"""
+    return get_user_context_cache().get_stats()
@@ -8,15 +8,95 @@
 import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any, List
+import time
+from email.utils import parsedate_to_datetime
+from http.cookies import Morsel
+from typing import Optional, Dict, Any, List, Tuple
 
 import aiohttp
 
-from utils.encryption import decrypt_token
+from config import Config
+from utils.diagnostics import get_diagnostics
+from utils.session_cache import (
+    get_session_cookie_dict,
+    get_session_cookies,
+    get_session_probe,
+    set_session_probe,
+)
 
 logger = logging.getLogger(__name__)
 
 
+class SessionExpiredError(Exception):
+    """Cookies браузерной сессии больше не действуют (401)"""
+    pass
+
+
+def _morsel_to_cookie(morsel: Morsel) -> Dict:
+    """Set-Cookie из ответа в формате cookie Playwright"""
+    cookie = {
+        'name': morsel.key,
+        'value': morsel.value,
+        'domain': morsel['domain'] or '.wildberries.ru',
+        'path': morsel['path'] or '/',
+        'httpOnly': bool(morsel['httponly']),
+        'secure': bool(morsel['secure']),
+    }
+    if morsel['max-age']:
+        cookie['expires'] = time.time() + int(morsel['max-age'])
+    elif morsel['expires']:
+        try:
+            cookie['expires'] = parsedate_to_datetime(morsel['expires']).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return cookie
+
+
+def merge_cookies(cookies: List[Dict], updates: List[Dict]) -> Tuple[List[Dict], int]:
+    """
+    Применяет Set-Cookie к списку cookies Playwright.
+
+    Cookie сопоставляются по имени и домену (без ведущей точки). Cookie с
+    пустым значением или истёкшим сроком удаляются.
+
+    Returns:
+        (новый список cookies, количество изменённых)
+    """
+    def key(cookie: Dict) -> Tuple[str, str]:
+        return cookie.get('name'), (cookie.get('domain') or '').lstrip('.')
+
+    merged = {key(c): dict(c) for c in cookies if isinstance(c, dict)}
+    changed = 0
+    now = time.time()
+
+    for update in updates:
+        k = key(update)
+        expired = not update['value'] or update.get('expires', now + 1) <= now
+        current = merged.get(k)
+        if expired:
+            if current is not None:
+                del merged[k]
+                changed += 1
+        elif current is None or current.get('value') != update['value'] \
+                or current.get('expires') != update.get('expires'):
+            merged[k] = {**(current or {}), **update}
+            changed += 1
+
+    return list(merged.values()), changed
+
+
+# Признаки страницы входа в URL редиректа
+LOGIN_URL_MARKERS = ('/login', '/auth', 'passport')
+
+# Метрики проверок живости сессий
+_probe_stats = {'probes': 0, 'cached': 0, 'alive': 0, 'dead': 0, 'unknown': 0}
+
+
+def is_login_url(url: str) -> bool:
+    """URL ведёт на страницу входа WB"""
+    return any(marker in url for marker in LOGIN_URL_MARKERS)
+
+
 class WBInternalClient:
     """
     Клиент для внутреннего API WB с использованием cookies.
@@ -36,6 +116,9 @@ class WBInternalClient:
         # Информация о поставщике
         'supplier_info': '/ns/supplier-data/api/v1/supplier/info',
 
+        # Кабинеты поставщиков пользователя (JSON-RPC getUserSuppliers)
+        'suppliers': '/ns/suppliers/suppliers-portal-core/suppliers',
+
         # Товары
         'products': '/ns/nomenclature-api/api/v1/nomenclatures/list',
         'product_cards': '/ns/products-api/api/v1/cards',
@@ -68,18 +151,7 @@ class WBInternalClient:
         # Расшифровываем cookies
         if self._cookies is None:
             try:
-                cookies_json = decrypt_token(self._cookies_encrypted)
-                cookies_list = json.loads(cookies_json)
-
-                # Преобразуем список cookies в словарь
-                self._cookies = {}
-                for cookie in cookies_list:
-                    if isinstance(cookie, dict):
-                        name = cookie.get('name')
-                        value = cookie.get('value')
-                        if name and value:
-                            self._cookies[name] = value
-
+                self._cookies = get_session_cookie_dict(self._cookies_encrypted)
                 logger.info(f"Загружено {len(self._cookies)} cookies")
             except Exception as e:
                 logger.error(f"Ошибка расшифровки cookies: {e}")
@@ -138,18 +210,19 @@ class WBInternalClient:
             ) as response:
                 response_text = await response.text()
 
-                logger.debug(f"Response status: {response.status}")
-                logger.debug(f"Response: {response_text[:500]}...")
+                # Превью ответа - только при включённой диагностике
+                if get_diagnostics().verbose():
+                    logger.info(f"WB Internal API {method} {endpoint} -> {response.status}: {response_text[:500]}")
 
                 if response.status == 200:
                     try:
-                        return await response.json()
-                    except Exception:
+                        return json.loads(response_text)
+                    except ValueError:
                         return {"success": True, "raw": response_text}
 
                 elif response.status == 401:
                     logger.error("Session expired - cookies invalid")
-                    raise Exception("Browser session expired. Please re-authenticate.")
+                    raise SessionExpiredError("Browser session expired. Please re-authenticate.")
 
                 elif response.status == 403:
                     logger.error(f"Access denied: {response_text[:200]}")
@@ -247,3 +320,138 @@ class WBInternalClient:
         except Exception as e:
             logger.error(f"Error getting stocks for {nm_id}: {e}")
             return []
+
+    async def get_user_suppliers(self) -> Any:
+        """
+        Кабинеты поставщиков, доступные пользователю (сырой ответ WB).
+
+        Тот же запрос делает переключатель профилей в шапке ЛК.
+
+        Raises:
+            SessionExpiredError: Cookies больше не действуют
+            Exception: Ошибка запроса
+        """
+        return await self._request(
+            'POST',
+            self.ENDPOINTS['suppliers'],
+            json_data=[{
+                'method': 'getUserSuppliers',
+                'params': {},
+                'id': 'json-rpc_1',
+                'jsonrpc': '2.0',
+            }]
+        )
+
+    async def check_session(self) -> Optional[bool]:
+        """
+        Проверка живости сессии одним HTTP запросом, без браузера.
+
+        Запрашивает данные поставщика без следования редиректам: 401 или
+        редирект на страницу входа - сессия мертва.
+
+        Returns:
+            True - сессия жива, False - мертва, None - не удалось определить
+            (сеть, 5xx, неизвестный ответ)
+        """
+        await self._ensure_session()
+        if not self._cookies:
+            # Cookies не расшифровались - это не значит, что сессия мертва
+            return None
+
+        url = f"{self.BASE_URL}{self.ENDPOINTS['supplier_info']}"
+        try:
+            async with self._session.get(
+                url,
+                allow_redirects=False,
+                timeout=aiohttp.ClientTimeout(total=Config.SESSION_PROBE_TIMEOUT)
+            ) as response:
+                if response.status == 200:
+                    return True
+                if response.status == 401:
+                    return False
+                if 300 <= response.status < 400:
+                    location = response.headers.get('Location', '')
+                    return False if is_login_url(location) else None
+                logger.debug(f"Session probe: unexpected status {response.status}")
+                return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Session probe failed: {e}")
+            return None
+
+    async def refresh_cookies(self) -> Tuple[List[Dict], bool]:
+        """
+        Обновить cookies сессии HTTP запросом, без браузера.
+
+        Запрашивает данные поставщика: если сессия жива, WB продлевает
+        cookies через Set-Cookie (но может и не прислать их).
+
+        Returns:
+            (cookies, changed): cookies сессии (формат Playwright) с учётом
+            Set-Cookie и признак, что сервер их обновил. Без исключения
+            сессия жива, даже если changed=False
+
+        Raises:
+            SessionExpiredError: Cookies больше не действуют
+            Exception: Сетевая или другая ошибка
+        """
+        await self._ensure_session()
+
+        url = f"{self.BASE_URL}{self.ENDPOINTS['supplier_info']}"
+        try:
+            async with self._session.get(url) as response:
+                updates = [
+                    _morsel_to_cookie(morsel)
+                    for r in (*response.history, response)
+                    for morsel in r.cookies.values()
+                ]
+                if response.status == 401:
+                    raise SessionExpiredError("Session rejected: 401")
+                if any(is_login_url(str(r.url)) for r in (*response.history, response)):
+                    raise SessionExpiredError("Session rejected: redirected to login")
+                if response.status != 200:
+                    raise Exception(f"WB Internal API error: {response.status}")
+        except aiohttp.ClientError as e:
+            raise Exception(f"Network error: {e}")
+
+        cookies, changed = merge_cookies(get_session_cookies(self._cookies_encrypted), updates)
+        logger.info(f"HTTP cookie refresh: {changed} cookies updated")
+        return cookies, bool(changed)
+
+
+async def probe_session(cookies_encrypted: str, session_id: int = None, use_cache: bool = True) -> Optional[bool]:
+    """
+    Проверка живости браузерной сессии перед дорогой работой (браузер, очередь).
+
+    Результат кэшируется на SESSION_PROBE_TTL секунд для пары (сессия,
+    cookies); неопределённый результат не кэшируется.
+
+    Args:
+        cookies_encrypted: Зашифрованные cookies из browser_sessions
+        session_id: ID сессии (если известен)
+        use_cache: Использовать закэшированный результат
+
+    Returns:
+        True - сессия жива, False - мертва, None - не удалось определить
+    """
+    if use_cache:
+        alive = get_session_probe(cookies_encrypted, session_id)
+        if alive is not None:
+            _probe_stats['cached'] += 1
+            return alive
+
+    async with WBInternalClient(cookies_encrypted) as client:
+        alive = await client.check_session()
+
+    _probe_stats['probes'] += 1
+    _probe_stats['unknown' if alive is None else 'alive' if alive else 'dead'] += 1
+
+    if alive is not None:
+        set_session_probe(cookies_encrypted, session_id, alive)
+    if alive is False:
+        logger.info(f"Session {session_id} is dead (HTTP probe)")
+    return alive
+
+
+def get_probe_stats() -> Dict:
+    """Метрики проверок живости сессий"""
+    return {'ttl': Config.SESSION_PROBE_TTL, **_probe_stats}
@@ -0,0 +1,155 @@
+"""
+Профили (кабинеты поставщиков) пользователя WB по HTTP.
+
+Список кабинетов запрашивается одним JSON запросом с cookies сессии
+(WBInternalClient.get_user_suppliers) - без браузера и разбора dropdown
+в шапке ЛК. Результат кэшируется на PROFILES_CACHE_TTL секунд для пары
+(сессия, cookies) и сбрасывается вместе с остальными данными сессии.
+
+Формат профиля тот же, что у разбора DOM (WBAuthService):
+    {'name': ФИО владельца, 'company': магазин, 'inn': ИНН,
+     'id': ID поставщика, 'is_active': текущий кабинет}
+
+Пример:
+    profiles = await get_profiles(session['cookies_encrypted'], session['id'])
+    if profiles is None:
+        ...  # fallback: разбор страницы в браузере
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from config import Config
+from utils.session_cache import get_session_cache, get_session_cookie_dict
+from .internal_client import SessionExpiredError, WBInternalClient
+
+logger = logging.getLogger(__name__)
+
+# Cookies с ID текущего кабинета
+ACTIVE_SUPPLIER_COOKIES = ('x-supplier-id', 'x-supplier-id-external')
+
+# Метрики
+_stats = {'cached': 0, 'http': 0, 'failed': 0, 'dom_fallback': 0}
+
+
+def _looks_like_supplier(item: Dict) -> bool:
+    return 'inn' in item or ('name' in item and any(k in item for k in ('id', 'oldID', 'supplierId')))
+
+
+def _find_suppliers(data: Any) -> Optional[List[Dict]]:
+    """Первый список кабинетов в ответе (JSON-RPC обёртка, result, suppliers...)"""
+    if isinstance(data, list):
+        if data and all(isinstance(item, dict) for item in data) \
+                and any(_looks_like_supplier(item) for item in data):
+            return data
+        items = data
+    elif isinstance(data, dict):
+        items = data.values()
+    else:
+        return None
+
+    for item in items:
+        found = _find_suppliers(item)
+        if found:
+            return found
+    return None
+
+
+def parse_profiles(data: Any, active_ids: Set[str] = frozenset()) -> List[Dict]:
+    """
+    Профили из ответа getUserSuppliers.
+
+    Args:
+        data: Ответ WB
+        active_ids: ID текущего кабинета (из cookies x-supplier-id)
+
+    Returns:
+        Профили без дубликатов по ИНН
+    """
+    profiles = []
+    seen_inns = set()
+
+    for item in _find_suppliers(data) or []:
+        inn = str(item.get('inn') or '')
+        if inn and inn in seen_inns:
+            continue
+        seen_inns.add(inn)
+
+        name = (item.get('fullName') or item.get('ownerName') or item.get('name') or '').strip()
+        company = (item.get('trademark') or item.get('brandName') or item.get('shortName')
+                   or item.get('name') or '').strip()
+        ids = {str(item[k]) for k in ('id', 'oldID', 'supplierId', 'externalId') if item.get(k)}
+
+        if not name:
+            continue
+        profiles.append({
+            'name': name,
+            'company': company if company != name else '',
+            'inn': inn,
+            'id': str(item.get('oldID') or item.get('supplierId') or item.get('id') or ''),
+            'is_active': bool(item.get('isActive') or item.get('selected') or ids & active_ids),
+        })
+
+    return profiles
+
+
+async def get_profiles(
+    cookies_encrypted: str,
+    session_id: int = None,
+    use_cache: bool = True
+) -> Optional[List[Dict]]:
+    """
+    Профили пользователя одним HTTP запросом (с кэшем на сессию).
+
+    Args:
+        cookies_encrypted: Зашифрованные cookies из browser_sessions
+        session_id: ID сессии (если известен)
+        use_cache: Использовать закэшированный список
+
+    Returns:
+        Список профилей или None, если получить его по HTTP не удалось
+
+    Raises:
+        SessionExpiredError: Cookies больше не действуют
+    """
+    cache = get_session_cache()
+    if use_cache:
+        profiles = cache.get('profiles', session_id, cookies_encrypted)
+        if profiles is not None:
+            _stats['cached'] += 1
+            return [dict(p) for p in profiles]
+
+    try:
+        async with WBInternalClient(cookies_encrypted) as client:
+            data = await client.get_user_suppliers()
+    except SessionExpiredError:
+        _stats['failed'] += 1
+        raise
+    except Exception as e:
+        logger.warning(f"Profiles over HTTP failed: {e}")
+        _stats['failed'] += 1
+        return None
+
+    cookies = get_session_cookie_dict(cookies_encrypted, session_id)
+    active_ids = {cookies[name] for name in ACTIVE_SUPPLIER_COOKIES if cookies.get(name)}
+    profiles = parse_profiles(data, active_ids)
+    if not profiles:
+        # У пользователя всегда есть хотя бы один кабинет - ответ не распознан
+        logger.warning(f"Profiles over HTTP: no suppliers in response {str(data)[:200]}")
+        _stats['failed'] += 1
+        return None
+
+    _stats['http'] += 1
+    cache.put('profiles', session_id, cookies_encrypted, profiles, Config.PROFILES_CACHE_TTL)
+    logger.info(f"Got {len(profiles)} profiles over HTTP")
+    return [dict(p) for p in profiles]
+
+
+def record_dom_fallback() -> None:
+    """Учесть получение профилей разбором страницы (HTTP не сработал)"""
+    _stats['dom_fallback'] += 1
+
+
+def get_profile_stats() -> Dict:
+    """Метрики получения профилей"""
+    return {'ttl': Config.PROFILES_CACHE_TTL, **_stats}
@@ -3,9 +3,16 @@ Workers модуль для обработки задач перемещения
 
 Компоненты:
 - queue: Redis очередь задач
+- stream_queue: Очередь на Redis Streams с consumer group (QUEUE_BACKEND=stream)
+- local_queue: Очередь в памяти процесса с SQLite (без Redis)
+- scheduler: Справедливая выдача задач между пользователями
 - task_worker: Обработчик задач
+- session_refresh: Фоновое обновление cookies сессий
 """
 
 from .queue import TaskQueue, Task, TaskStatus
+from .stream_queue import StreamTaskQueue
+from .local_queue import LocalTaskQueue
+from .scheduler import FairScheduler
 
-__all__ = ['TaskQueue', 'Task', 'TaskStatus']
+__all__ = ['TaskQueue', 'StreamTaskQueue', 'LocalTaskQueue', 'Task', 'TaskStatus', 'FairScheduler']
@@ -0,0 +1,483 @@
+"""
+Фоновый импорт cookies из браузера (Cookie-Editor).
+
+Обработчик (бот или POST /api/sessions/import-cookies) только разбирает
+JSON и отбирает cookies WB - это миллисекунды - и сразу отвечает
+пользователю. Остальное делает задача импорта в фоне:
+
+1. Параллельно: HTTP проверка живости cookies (probe_session) и список
+   кабинетов одним запросом (get_profiles)
+2. Мёртвые cookies не сохраняются. Иначе параллельно: новая сессия в
+   browser_sessions и suppliers по кабинетам (существующие с тем же ИНН
+   переименовываются, новые добавляются)
+3. Если кабинеты по HTTP получить не удалось - разбор страницы ЛК в
+   браузере, не больше одного браузера одновременно
+
+Импорт выполняется в event loop вызывающего: у бота и API (uvicorn в
+своём потоке) разные loop, поэтому у каждого свой экземпляр очереди
+импорта (семафоры и задачи asyncio привязаны к loop). В каждом loop
+одновременно выполняется не больше COOKIE_IMPORT_CONCURRENCY импортов.
+Прогресс передаётся в on_progress (бот редактирует сообщение) и доступен
+по ID задачи из любого loop (GET /api/sessions/import-cookies/{job_id}).
+
+Пример:
+    cookies = normalize_cookies(json.loads(text))
+    job = get_cookie_import_pipeline().submit(user_id, cookies, on_progress=notify)
+"""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from config import Config
+from db_factory import get_async_database
+from utils.encryption import encrypt_token
+from wb_api.internal_client import SessionExpiredError, probe_session
+from wb_api.profiles import get_profiles
+
+logger = logging.getLogger(__name__)
+
+# Cookies, без которых сессия WB скорее всего не заработает
+IMPORTANT_COOKIES = ('WILDAUTHNEW_V3', 'WBToken', 'x-supplier-id')
+
+# Срок импортированной сессии (как у WB)
+IMPORTED_SESSION_DAYS = 7
+
+# Статусы задачи: промежуточные и итоговые
+STAGES = ('queued', 'checking', 'saving', 'profiles')
+OUTCOMES = ('done', 'expired', 'failed')
+
+# Название токена-заглушки для suppliers браузерной сессии
+BROWSER_TOKEN = 'browser_session'
+
+ProgressCallback = Callable[['ImportJob'], Awaitable[None]]
+
+# Сколько последних задач хранить для запросов статуса (общий реестр процесса)
+MAX_JOBS = 500
+
+
+def normalize_cookies(items: List[Any]) -> List[Dict]:
+    """
+    Cookies WB в формате Playwright из экспорта Cookie-Editor.
+
+    Cookie-Editor пишет срок в expirationDate, Playwright требует sameSite
+    строго Strict|Lax|None. Записи без имени и чужие домены отбрасываются.
+
+    Raises:
+        ValueError: Не массив cookies
+    """
+    if not isinstance(items, list):
+        raise ValueError("Cookies JSON must be an array")
+
+    cookies = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get('name'):
+            continue
+        domain = str(item.get('domain') or '')
+        if 'wildberries' not in domain.lower():
+            continue
+
+        same_site = item.get('sameSite')
+        if same_site not in ('Strict', 'Lax', 'None'):
+            same_site = 'Lax'
+
+        cookies.append({
+            'name': str(item['name']),
+            'value': str(item.get('value') or ''),
+            'domain': domain,
+            'path': item.get('path') or '/',
+            'expires': item.get('expires') or item.get('expirationDate') or -1,
+            'httpOnly': bool(item.get('httpOnly')),
+            'secure': bool(item.get('secure')),
+            'sameSite': same_site,
+        })
+    return cookies
+
+
+def supplier_name(profile: Dict) -> str:
+    """Название supplier по профилю: ФИО владельца (приоритет) или магазин, плюс ИНН"""
+    name = profile.get('name') or profile.get('company') or 'Кабинет'
+    return f"{name} (ИНН: {profile['inn']})" if profile.get('inn') else name
+
+
+async def upsert_suppliers(db, user_id: int, profiles: List[Dict]) -> int:
+    """
+    Suppliers пользователя по кабинетам: с тем же ИНН - переименовать,
+    остальные - добавить (существующие не удаляются - на них ссылаются заявки).
+
+    Returns:
+        Сколько suppliers добавлено или переименовано
+    """
+    existing = await db.get_suppliers(user_id)
+    by_inn = {}
+    for supplier in existing:
+        inn_match = re.search(r'ИНН:\s*(\d{10,13})', supplier['name'])
+        if inn_match:
+            by_inn[inn_match.group(1)] = supplier
+
+    changed = 0
+    token_id = None
+    for i, profile in enumerate(profiles):
+        name = supplier_name(profile)
+        supplier = by_inn.get(profile.get('inn'))
+        if supplier:
+            if supplier['name'] != name:
+                await db.update_supplier_name(supplier['id'], name)
+                changed += 1
+            continue
+
+        if token_id is None:
+            token_id = next(
+                (s['token_id'] for s in existing if (s.get('token_name') or '').startswith('Browser Session')),
+                None
+            ) or await db.add_wb_token(
+                user_id=user_id, encrypted_token=BROWSER_TOKEN, name="Browser Session (cookies)"
+            )
+        await db.add_supplier(
+            user_id=user_id,
+            name=name,
+            token_id=token_id,
+            # Как при SMS входе: первый или активный кабинет - по умолчанию
+            is_default=not existing and (i == 0 or profile.get('is_active', False))
+        )
+        changed += 1
+
+    return changed
+
+
+@dataclass
+class ImportJob:
+    """Задача импорта cookies"""
+    id: str
+    user_id: int
+    cookies_count: int
+    important_cookies_found: List[str]
+    status: str = 'queued'
+    error: Optional[str] = None
+    session_id: Optional[int] = None
+    profiles: int = 0
+    profiles_source: Optional[str] = None   # 'http', 'browser' или None
+    suppliers_changed: int = 0
+    supplier_name: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    timings: Dict[str, int] = field(default_factory=dict)  # этап -> мс
+
+    @property
+    def finished(self) -> bool:
+        return self.status in OUTCOMES
+
+    def to_dict(self) -> Dict:
+        """Состояние для API"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'finished': self.finished,
+            'error': self.error,
+            'session_id': self.session_id,
+            'cookies_count': self.cookies_count,
+            'important_cookies_found': self.important_cookies_found,
+            'profiles': self.profiles,
+            'profiles_source': self.profiles_source,
+            'suppliers_changed': self.suppliers_changed,
+            'supplier_name': self.supplier_name,
+            'expires_days': IMPORTED_SESSION_DAYS,
+            'created_at': self.created_at,
+            'timings': dict(self.timings),
+        }
+
+
+_jobs: 'OrderedDict[str, ImportJob]' = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _remember_job(job: 'ImportJob') -> None:
+    """Добавить задачу в реестр процесса (старые вытесняются)"""
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+
+
+def get_cookie_import_job(job_id: str, user_id: int = None) -> Optional['ImportJob']:
+    """Задача по ID из любого event loop (только своя, если указан user_id)"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None or (user_id is not None and job.user_id != user_id):
+        return None
+    return job
+
+
+class CookieImportPipeline:
+    """Фоновые задачи импорта cookies одного event loop"""
+
+    # Разбор профилей в браузере запускает отдельный Chromium - не больше одного сразу
+    BROWSER_CONCURRENCY = 1
+
+    def __init__(self, concurrency: int = None):
+        """
+        Args:
+            concurrency: Импортов одновременно (по умолчанию COOKIE_IMPORT_CONCURRENCY)
+        """
+        self.concurrency = max(1, concurrency or Config.COOKIE_IMPORT_CONCURRENCY)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._browser_semaphore = asyncio.Semaphore(self.BROWSER_CONCURRENCY)
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Метрики
+        self._totals = {outcome: 0 for outcome in OUTCOMES}
+        self._browser_fallbacks = 0
+        self._duration_total_ms = 0
+
+    def submit(
+        self,
+        user_id: int,
+        cookies: List[Dict],
+        on_progress: ProgressCallback = None
+    ) -> ImportJob:
+        """
+        Поставить импорт в фон и сразу вернуть задачу.
+
+        Args:
+            user_id: Telegram ID пользователя
+            cookies: Cookies WB (normalize_cookies)
+            on_progress: Вызывается при каждой смене статуса
+
+        Raises:
+            ValueError: Нет cookies WB
+        """
+        if not cookies:
+            raise ValueError("No Wildberries cookies found")
+
+        names = {c['name'] for c in cookies}
+        job = ImportJob(
+            id=uuid.uuid4().hex[:12],
+            user_id=user_id,
+            cookies_count=len(cookies),
+            important_cookies_found=[name for name in IMPORTANT_COOKIES if name in names]
+        )
+        missing = [name for name in IMPORTANT_COOKIES if name not in names]
+        if missing:
+            logger.warning(f"Cookie import {job.id} for user {user_id}: missing important cookies {missing}")
+
+        _remember_job(job)
+
+        task = asyncio.create_task(self._run(job, cookies, on_progress))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        logger.info(f"Cookie import {job.id} queued for user {user_id} ({len(cookies)} cookies)")
+        return job
+
+    async def _set_status(
+        self,
+        job: ImportJob,
+        status: str,
+        on_progress: Optional[ProgressCallback]
+    ) -> None:
+        job.status = status
+        if on_progress:
+            try:
+                await on_progress(job)
+            except Exception as e:
+                logger.debug(f"Cookie import {job.id} progress callback failed: {e}")
+
+    async def _run(
+        self,
+        job: ImportJob,
+        cookies: List[Dict],
+        on_progress: Optional[ProgressCallback]
+    ) -> None:
+        """Импорт с ограничением параллельности; итог всегда передаётся в on_progress"""
+        started = time.monotonic()
+        async with self._semaphore:
+            job.timings['queued'] = int((time.monotonic() - started) * 1000)
+            try:
+                status = await self._import(job, cookies, on_progress)
+            except Exception as e:
+                logger.error(f"Cookie import {job.id} failed: {e}", exc_info=True)
+                job.error = str(e)
+                status = 'failed'
+
+        job.timings['total'] = int((time.monotonic() - started) * 1000)
+        self._totals[status] += 1
+        self._duration_total_ms += job.timings['total']
+        logger.info(
+            f"Cookie import {job.id} for user {job.user_id}: {status} in {job.timings['total']} ms "
+            f"(profiles: {job.profiles} via {job.profiles_source}, suppliers changed: {job.suppliers_changed})"
+        )
+        await self._set_status(job, status, on_progress)
+
+    async def _import(
+        self,
+        job: ImportJob,
+        cookies: List[Dict],
+        on_progress: Optional[ProgressCallback]
+    ) -> str:
+        """Этапы импорта; возвращает итоговый статус"""
+        db = get_async_database()
+        cookies_encrypted = encrypt_token(json.dumps(cookies))
+
+        # 1. Живость и кабинеты - параллельно, по HTTP
+        await self._set_status(job, 'checking', on_progress)
+        started = time.monotonic()
+        alive, profiles = await asyncio.gather(
+            probe_session(cookies_encrypted, use_cache=False),
+            get_profiles(cookies_encrypted, use_cache=False),
+            return_exceptions=True
+        )
+        job.timings['checking'] = int((time.monotonic() - started) * 1000)
+
+        if isinstance(alive, BaseException):
+            logger.warning(f"Cookie import {job.id}: liveness probe failed: {alive}")
+            alive = None
+        if isinstance(profiles, SessionExpiredError):
+            alive, profiles = False, None
+        elif isinstance(profiles, BaseException):
+            logger.warning(f"Cookie import {job.id}: profiles over HTTP failed: {profiles}")
+            profiles = None
+
+        if alive is False:
+            job.error = "Cookies expired"
+            return 'expired'
+
+        if profiles:
+            job.profiles_source = 'http'
+
+        # 2. Сессия и suppliers - параллельно
+        await self._set_status(job, 'saving', on_progress)
+        started = time.monotonic()
+        steps = [self._save_session(db, job, cookies_encrypted, profiles)]
+        if profiles:
+            steps.append(upsert_suppliers(db, job.user_id, profiles))
+        job.session_id, *changed = await asyncio.gather(*steps)
+        job.suppliers_changed = sum(changed)
+        job.timings['saving'] = int((time.monotonic() - started) * 1000)
+
+        # 3. Кабинеты не получены по HTTP - разбор страницы в браузере
+        if not profiles:
+            await self._set_status(job, 'profiles', on_progress)
+            started = time.monotonic()
+            profiles = await self._browser_profiles(job, cookies, cookies_encrypted)
+            job.timings['profiles'] = int((time.monotonic() - started) * 1000)
+            if profiles:
+                job.profiles_source = 'browser'
+                job.suppliers_changed = await upsert_suppliers(db, job.user_id, profiles)
+
+        job.profiles = len(profiles or [])
+        return 'done'
+
+    async def _save_session(
+        self,
+        db,
+        job: ImportJob,
+        cookies_encrypted: str,
+        profiles: Optional[List[Dict]]
+    ) -> int:
+        """Новая активная сессия пользователя (старые деактивируются)"""
+        active = next((p for p in profiles or [] if p.get('is_active')), None)
+        if active:
+            job.supplier_name = active.get('company') or active.get('name')
+
+        await db.invalidate_browser_session(job.user_id)
+        session_id = await db.add_browser_session(
+            user_id=job.user_id,
+            phone="",  # Телефон не требуется при импорте cookies
+            cookies_encrypted=cookies_encrypted,
+            supplier_name=job.supplier_name,
+            expires_days=IMPORTED_SESSION_DAYS
+        )
+        logger.info(f"Imported browser session {session_id} for user {job.user_id}")
+        return session_id
+
+    async def _browser_profiles(
+        self,
+        job: ImportJob,
+        cookies: List[Dict],
+        cookies_encrypted: str
+    ) -> Optional[List[Dict]]:
+        """Кабинеты разбором страницы ЛК (ошибки не прерывают импорт)"""
+        from browser.auth import get_auth_service
+
+        self._browser_fallbacks += 1
+        try:
+            async with self._browser_semaphore:
+                return await get_auth_service().refresh_profiles_with_cookies(
+                    cookies, cookies_encrypted, job.session_id
+                )
+        except Exception as e:
+            logger.warning(f"Cookie import {job.id}: browser profiles failed: {e}")
+            return None
+
+    async def stop(self) -> None:
+        """Прервать незавершённые импорты"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict:
+        """Метрики импорта cookies"""
+        finished = sum(self._totals.values())
+        return {
+            'concurrency': self.concurrency,
+            'running': len(self._tasks),
+            'totals': dict(self._totals),
+            'browser_fallbacks': self._browser_fallbacks,
+            'avg_duration_ms': self._duration_total_ms // finished if finished else 0,
+        }
+
+
+# Своя очередь импорта на каждый event loop (бот и API)
+_pipelines: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, CookieImportPipeline]' = weakref.WeakKeyDictionary()
+_pipelines_lock = threading.Lock()
+
+
+def get_cookie_import_pipeline() -> CookieImportPipeline:
+    """Импорт cookies текущего event loop"""
+    loop = asyncio.get_running_loop()
+
+    with _pipelines_lock:
+        pipeline = _pipelines.get(loop)
+        if pipeline is None:
+            pipeline = _pipelines[loop] = CookieImportPipeline()
+
+    return pipeline
+
+
+def get_cookie_import_stats() -> Dict:
+    """Метрики импорта cookies по всем event loop процесса"""
+    with _pipelines_lock:
+        pipelines = list(_pipelines.values())
+    with _jobs_lock:
+        jobs = len(_jobs)
+
+    totals = {outcome: sum(p._totals[outcome] for p in pipelines) for outcome in OUTCOMES}
+    finished = sum(totals.values())
+    duration_total_ms = sum(p._duration_total_ms for p in pipelines)
+    return {
+        'concurrency': Config.COOKIE_IMPORT_CONCURRENCY,
+        'loops': len(pipelines),
+        'running': sum(len(p._tasks) for p in pipelines),
+        'jobs': jobs,
+        'totals': totals,
+        'browser_fallbacks': sum(p._browser_fallbacks for p in pipelines),
+        'avg_duration_ms': duration_total_ms // finished if finished else 0,
+    }
+
+
+async def shutdown_cookie_import_pipeline() -> None:
+    """Прервать незавершённые импорты cookies текущего event loop"""
+    with _pipelines_lock:
+        pipeline = _pipelines.pop(asyncio.get_running_loop(), None)
+
+    if pipeline:
+        await pipeline.stop()
@@ -0,0 +1,772 @@
+"""
+Встроенная очередь задач без Redis.
+
+Используется, когда REDIS_URL не задан (или QUEUE_BACKEND=local):
+- Очереди пользователей - heap в памяти процесса, выдача через FairScheduler
+- Каждое изменение задачи сначала пишется в SQLite (WAL), затем в память,
+  поэтому после рестарта очередь восстанавливается из файла
+- Dead-letter очередь - таблица в том же файле
+
+Рассчитана на один процесс (run.py: бот, API и воркеры вместе).
+API работает в отдельном потоке со своим event loop, поэтому состояние
+защищено threading.RLock, а не asyncio примитивами.
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional, List, Dict, Set, Tuple
+
+from config import Config
+from .queue import TaskQueue, Task, TaskStatus
+from .scheduler import Candidate, FairScheduler, TenantStats, make_score, wait_ms
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS queue_tasks (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        score REAL,
+        data TEXT NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_queue_tasks_status ON queue_tasks(status);
+    CREATE INDEX IF NOT EXISTS idx_queue_tasks_user ON queue_tasks(user_id);
+
+    CREATE TABLE IF NOT EXISTS queue_dead_letters (
+        entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        screenshot BLOB
+    );
+'''
+
+
+class LocalTaskQueue(TaskQueue):
+    """Очередь задач в памяти процесса с персистентностью в SQLite"""
+
+    def __init__(self, db_path: str = None, scheduler: FairScheduler = None):
+        """
+        Инициализация очереди.
+
+        Args:
+            db_path: Путь к SQLite файлу очереди
+            scheduler: Планировщик выдачи задач
+        """
+        super().__init__(scheduler=scheduler)
+        self.redis_url = None
+        self.db_path = db_path or Config.QUEUE_DB_PATH
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+        self._tasks: Dict[str, Task] = {}                  # Задачи в очереди и в работе
+        self._queues: Dict[int, List[Tuple[float, str]]] = {}  # user_id -> heap (score, task_id)
+        self._processing: Set[str] = set()
+        self._active: Dict[int, int] = {}                  # session_id -> задач в работе
+        self._served: Dict[int, float] = {}                # user_id -> время последней выдачи
+        self._tenant_stats: Dict[int, TenantStats] = {}
+
+    async def connect(self) -> None:
+        """Открытие файла очереди и восстановление состояния"""
+        try:
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None  # autocommit: каждая запись сразу на диске
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+
+            restored = self._restore()
+            logger.info(f"Local task queue opened: {self.db_path} ({restored} tasks restored)")
+        except Exception as e:
+            logger.error(f"Failed to open local task queue: {e}")
+            self._conn = None
+
+    async def disconnect(self) -> None:
+        """Закрытие файла очереди"""
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+                logger.info("Local task queue closed")
+
+    @property
+    def is_connected(self) -> bool:
+        """Проверка подключения"""
+        return self._conn is not None
+
+    # ==================== ХРАНЕНИЕ ====================
+
+    def _restore(self) -> int:
+        """Загрузить незавершённые задачи из SQLite"""
+        rows = self._conn.execute(
+            "SELECT data, score FROM queue_tasks WHERE status IN (?, ?)",
+            (TaskStatus.PENDING.value, TaskStatus.PROCESSING.value)
+        ).fetchall()
+
+        for row in rows:
+            task = Task.from_json(row['data'])
+            if task.status == TaskStatus.PROCESSING:
+                # Процесс упал во время выполнения - попытка уже засчитана
+                logger.warning(f"Task {task.id} was processing at shutdown, requeueing")
+                task.status = TaskStatus.PENDING
+
+            score = row['score'] if row['score'] is not None else make_score(task.priority)
+            self._persist(task, score)
+            self._tasks[task.id] = task
+            heapq.heappush(self._queues.setdefault(task.user_id, []), (score, task.id))
+
+        return len(rows)
+
+    def _persist(self, task: Task, score: float = None) -> None:
+        """Записать задачу в SQLite"""
+        self._conn.execute(
+            '''
+            INSERT OR REPLACE INTO queue_tasks (id, user_id, status, score, data)
+            VALUES (?, ?, ?, ?, ?)
+            ''',
+            (task.id, task.user_id, task.status.value, score, task.to_json())
+        )
+
+    def _load_task(self, task_id: str) -> Optional[Task]:
+        """Задача из памяти или из SQLite"""
+        task = self._tasks.get(task_id)
+        if task:
+            return task
+
+        row = self._conn.execute(
+            "SELECT data FROM queue_tasks WHERE id = ?", (task_id,)
+        ).fetchone()
+        return Task.from_json(row['data']) if row else None
+
+    # ==================== ОЧЕРЕДЬ ====================
+
+    async def _enqueue(self, task: Task, priority: int) -> None:
+        """
+        Сохранить задачу и поставить в очередь пользователя.
+
+        Args:
+            task: Задача
+            priority: Эффективный приоритет (при retry снижается)
+        """
+        with self._lock:
+            now = time.time()
+            task.queued_at = datetime.fromtimestamp(now).isoformat()
+            score = make_score(priority, now)
+
+            self._persist(task, score)
+            self._tasks[task.id] = task
+            heapq.heappush(self._queues.setdefault(task.user_id, []), (score, task.id))
+
+    async def _enqueue_many(self, tasks: List[Task]) -> None:
+        """_enqueue для пачки задач в одной транзакции SQLite"""
+        with self._lock:
+            now = time.time()
+            scored = []
+
+            self._conn.execute('BEGIN')
+            try:
+                for i, task in enumerate(tasks):
+                    queued_ts = now + i / 1000
+                    task.queued_at = datetime.fromtimestamp(queued_ts).isoformat()
+                    score = make_score(task.priority, queued_ts)
+                    self._persist(task, score)
+                    scored.append((task, score))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+            for task, score in scored:
+                self._tasks[task.id] = task
+                heapq.heappush(self._queues.setdefault(task.user_id, []), (score, task.id))
+
+    def _is_queued(self, task_id: str) -> bool:
+        """Задача ещё ждёт в очереди (не отменена и не взята)"""
+        task = self._tasks.get(task_id)
+        return task is not None and task.status == TaskStatus.PENDING
+
+    def _candidates(self) -> List[Candidate]:
+        """Головы очередей всех пользователей с задачами"""
+        candidates = []
+
+        for user_id in list(self._queues):
+            heap = self._queues[user_id]
+            # Ленивое удаление отменённых задач
+            while heap and not self._is_queued(heap[0][1]):
+                heapq.heappop(heap)
+            if not heap:
+                del self._queues[user_id]
+                continue
+
+            score, task_id = heap[0]
+            candidates.append(Candidate(
+                task_id=task_id,
+                user_id=user_id,
+                session_id=self._tasks[task_id].session_id,
+                score=score
+            ))
+
+        return candidates
+
+    def _start_processing(self, task: Task) -> None:
+        """Перевести задачу в processing"""
+        waited = wait_ms(task.queued_at)
+        if waited is not None:
+            stats = self._tenant_stats.setdefault(task.user_id, TenantStats(user_id=task.user_id))
+            stats.wait_count += 1
+            stats.wait_total_ms += waited
+            stats.wait_max_ms = max(stats.wait_max_ms, waited)
+
+        task.status = TaskStatus.PROCESSING
+        task.started_at = datetime.now().isoformat()
+        task.attempts += 1
+
+        self._persist(task)
+        self._processing.add(task.id)
+        self._active[task.session_id] = self._active.get(task.session_id, 0) + 1
+
+    def _release_slot(self, task: Task) -> None:
+        """Освободить слот аккаунта"""
+        running = self._active.get(task.session_id, 0) - 1
+        if running <= 0:
+            self._active.pop(task.session_id, None)
+        else:
+            self._active[task.session_id] = running
+
+    def _claim_next(self) -> Optional[Task]:
+        """Выбрать и захватить следующую задачу (под блокировкой)"""
+        chosen = self.scheduler.select(self._candidates(), self._active, self._served)
+        if chosen is None:
+            return None
+
+        heapq.heappop(self._queues[chosen.user_id])
+        task = self._tasks[chosen.task_id]
+        self._start_processing(task)
+        self._served[task.user_id] = time.time()
+
+        logger.info(
+            f"Task {task.id} taken for processing "
+            f"(user {task.user_id}, session {task.session_id}, attempt {task.attempts})"
+        )
+        return task
+
+    async def get_next_task(self) -> Optional[Task]:
+        """
+        Получить следующую задачу из очереди.
+
+        Returns:
+            Task или None если очередь пуста или все аккаунты заняты
+        """
+        if not self.is_connected:
+            return None
+
+        try:
+            with self._lock:
+                return self._claim_next()
+        except Exception as e:
+            logger.error(f"Failed to get next task: {e}")
+            return None
+
+    async def get_next_batch(self, max_size: int = None) -> List[Task]:
+        """
+        Получить пачку задач одного аккаунта.
+
+        Args:
+            max_size: Максимальный размер пачки
+
+        Returns:
+            Список задач (пустой если очередь пуста)
+        """
+        if not self.is_connected:
+            return []
+
+        max_size = max_size or Config.WORKER_BATCH_SIZE
+
+        try:
+            with self._lock:
+                first = self._claim_next()
+                if not first:
+                    return []
+
+                batch = [first]
+                heap = self._queues.get(first.user_id, [])
+
+                taken = set()
+                for _, task_id in sorted(heap):
+                    if len(batch) >= max_size:
+                        break
+                    if not self._is_queued(task_id):
+                        continue
+                    task = self._tasks[task_id]
+                    if task.session_id != first.session_id:
+                        continue
+
+                    self._start_processing(task)
+                    batch.append(task)
+                    taken.add(task_id)
+
+                if taken:
+                    heap[:] = [entry for entry in heap if entry[1] not in taken]
+                    heapq.heapify(heap)
+                    logger.info(f"Batch of {len(batch)} tasks claimed for session {first.session_id}")
+
+                return batch
+
+        except Exception as e:
+            logger.error(f"Failed to get next batch: {e}")
+            return []
+
+    async def complete_task(
+        self,
+        task_id: str,
+        success: bool,
+        error_message: str = None,
+        screenshot: bytes = None
+    ) -> bool:
+        """
+        Завершить обработку задачи.
+
+        Args:
+            task_id: ID задачи
+            success: Успешно ли выполнена
+            error_message: Сообщение об ошибке (если не успешно)
+            screenshot: Скриншот страницы при ошибке (для dead-letter очереди)
+
+        Returns:
+            True если успешно обновлено
+        """
+        if not self.is_connected:
+            return False
+
+        try:
+            with self._lock:
+                task = self._load_task(task_id)
+                if not task:
+                    logger.warning(f"Task {task_id} not found")
+                    return False
+
+                if success:
+                    task.status = TaskStatus.COMPLETED
+                    task.completed_at = datetime.now().isoformat()
+                else:
+                    task.error_message = error_message
+                    task.history.append({
+                        'attempt': task.attempts,
+                        'error': error_message,
+                        'started_at': task.started_at,
+                        'finished_at': datetime.now().isoformat()
+                    })
+                    if task.attempts >= task.max_attempts:
+                        task.status = TaskStatus.FAILED
+                        task.completed_at = datetime.now().isoformat()
+                    else:
+                        task.status = TaskStatus.PENDING
+
+                if task_id in self._processing:
+                    self._processing.discard(task_id)
+                    self._release_slot(task)
+
+                if task.status == TaskStatus.PENDING:
+                    await self._enqueue(task, task.priority - task.attempts)
+                else:
+                    self._persist(task)
+                    self._tasks.pop(task_id, None)
+
+                if task.status == TaskStatus.FAILED:
+                    await self._dead_letter(task, screenshot)
+
+            logger.info(f"Task {task_id} completed with status: {task.status.value}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to complete task: {e}")
+            return False
+
+    async def _publish_result(self, task: Task, error_message: str = None) -> None:
+        """Подписчиков нет - результат доставляет notify_callback воркера"""
+
+    async def cancel_task(self, task_id: str) -> bool:
+        """
+        Отменить задачу.
+
+        Args:
+            task_id: ID задачи
+
+        Returns:
+            True если успешно отменена
+        """
+        if not self.is_connected:
+            return False
+
+        try:
+            with self._lock:
+                task = self._load_task(task_id)
+                if task:
+                    # Из heap задача удаляется лениво при следующей выборке
+                    self._tasks.pop(task_id, None)
+                    if task_id in self._processing:
+                        self._processing.discard(task_id)
+                        self._release_slot(task)
+
+                    task.status = TaskStatus.CANCELLED
+                    task.completed_at = datetime.now().isoformat()
+                    self._persist(task)
+
+            logger.info(f"Task {task_id} cancelled")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to cancel task: {e}")
+            return False
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        """Получить задачу по ID"""
+        if not self.is_connected:
+            return None
+
+        try:
+            with self._lock:
+                return self._load_task(task_id)
+        except Exception as e:
+            logger.error(f"Failed to get task: {e}")
+            return None
+
+    async def get_user_tasks(self, user_id: int) -> List[Task]:
+        """Получить все задачи пользователя"""
+        if not self.is_connected:
+            return []
+
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT data FROM queue_tasks WHERE user_id = ?", (user_id,)
+                ).fetchall()
+
+            tasks = [Task.from_json(row['data']) for row in rows]
+            return sorted(tasks, key=lambda t: t.created_at or "", reverse=True)
+
+        except Exception as e:
+            logger.error(f"Failed to get user tasks: {e}")
+            return []
+
+    # ==================== DEAD-LETTER ====================
+
+    async def _dead_letter(self, task: Task, screenshot: bytes = None) -> None:
+        """Записать окончательно упавшую задачу в dead-letter таблицу"""
+        duration_ms = 0
+        if task.created_at and task.completed_at:
+            created = datetime.fromisoformat(task.created_at)
+            completed = datetime.fromisoformat(task.completed_at)
+            duration_ms = int((completed - created).total_seconds() * 1000)
+
+        fields = {
+            'task_id': task.id,
+            'user_id': task.user_id,
+            'session_id': task.session_id,
+            'request_id': task.request_id,
+            'reason': task.error_message or '',
+            'attempts': task.attempts,
+            'history': json.dumps(task.history, ensure_ascii=False),
+            'screenshot_ref': f"{self.SCREENSHOT_KEY}:{task.id}" if screenshot else '',
+            'created_at': task.created_at or '',
+            'failed_at': task.completed_at or '',
+            'duration_ms': duration_ms,
+        }
+
+        with self._lock:
+            cursor = self._conn.execute(
+                '''
+                INSERT INTO queue_dead_letters (task_id, user_id, data, screenshot)
+                VALUES (?, ?, ?, ?)
+                ''',
+                (task.id, task.user_id, json.dumps(fields, ensure_ascii=False), screenshot)
+            )
+            self._conn.execute(
+                "DELETE FROM queue_dead_letters WHERE entry_id <= ?",
+                (cursor.lastrowid - self.DLQ_MAXLEN,)
+            )
+
+        logger.warning(f"Task {task.id} moved to dead-letter queue: {task.error_message}")
+
+    async def get_dead_letters(
+        self,
+        user_id: int = None,
+        reason: str = None,
+        since: str = None,
+        limit: int = 100
+    ) -> List[dict]:
+        """Получить записи dead-letter очереди (новые первыми)"""
+        if not self.is_connected:
+            return []
+
+        try:
+            with self._lock:
+                if user_id is not None:
+                    rows = self._conn.execute(
+                        "SELECT entry_id, data FROM queue_dead_letters "
+                        "WHERE user_id = ? ORDER BY entry_id DESC",
+                        (user_id,)
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT entry_id, data FROM queue_dead_letters ORDER BY entry_id DESC"
+                    ).fetchall()
+
+            result = []
+            reason_lower = reason.lower() if reason else None
+
+            for row in rows:
+                item = self._parse_dead_letter(str(row['entry_id']), json.loads(row['data']))
+                if reason_lower and reason_lower not in item['reason'].lower():
+                    continue
+                if since and (item['failed_at'] or '') < since:
+                    continue
+                result.append(item)
+                if len(result) >= limit:
+                    break
+
+            return result
+
+        except Exception as e:
+            logger.error(f"Failed to read dead-letter queue: {e}")
+            return []
+
+    async def get_dead_letter(self, entry_id: str) -> Optional[dict]:
+        """Получить запись dead-letter очереди по ID"""
+        if not self.is_connected:
+            return None
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT entry_id, data FROM queue_dead_letters WHERE entry_id = ?",
+                    (int(entry_id),)
+                ).fetchone()
+        except (ValueError, sqlite3.Error) as e:
+            logger.error(f"Failed to read dead-letter entry {entry_id}: {e}")
+            return None
+
+        return self._parse_dead_letter(str(row['entry_id']), json.loads(row['data'])) if row else None
+
+    async def get_dead_letter_screenshot(self, screenshot_ref: str) -> Optional[bytes]:
+        """Получить скриншот упавшей задачи по ссылке из dead-letter записи"""
+        if not self.is_connected or not screenshot_ref:
+            return None
+
+        task_id = screenshot_ref.rpartition(':')[2]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT screenshot FROM queue_dead_letters "
+                "WHERE task_id = ? AND screenshot IS NOT NULL "
+                "ORDER BY entry_id DESC LIMIT 1",
+                (task_id,)
+            ).fetchone()
+
+        return row['screenshot'] if row else None
+
+    async def replay_dead_letters(
+        self,
+        entry_ids: List[str],
+        rate_per_minute: int = None,
+        on_progress: Callable[[int, int, int], None] = None
+    ) -> int:
+        """Повторно поставить задачи из dead-letter очереди (см. TaskQueue.replay_dead_letters)"""
+        if not self.is_connected:
+            return 0
+
+        delay = 60.0 / rate_per_minute if rate_per_minute else 0
+        replayed = 0
+        skipped = 0
+
+        for processed, entry_id in enumerate(entry_ids, 1):
+            try:
+                with self._lock:
+                    row = self._conn.execute(
+                        "SELECT task_id FROM queue_dead_letters WHERE entry_id = ?",
+                        (int(entry_id),)
+                    ).fetchone()
+                    if not row:
+                        logger.warning(f"Dead-letter entry {entry_id} not found")
+                        continue
+
+                    task = self._load_task(row['task_id'])
+                    if not task or task.status != TaskStatus.FAILED:
+                        # Уже перезапущена или отменена
+                        self._conn.execute(
+                            "DELETE FROM queue_dead_letters WHERE entry_id = ?", (int(entry_id),)
+                        )
+                        continue
+
+                if not await self._rebind_session(task):
+                    logger.warning(f"Task {task.id}: user {task.user_id} has no active session, not replayed")
+                    skipped += 1
+                    continue
+
+                with self._lock:
+                    self._conn.execute(
+                        "DELETE FROM queue_dead_letters WHERE entry_id = ?", (int(entry_id),)
+                    )
+                    task.status = TaskStatus.PENDING
+                    task.attempts = 0
+                    task.error_message = None
+                    task.started_at = None
+                    task.completed_at = None
+                    await self._enqueue(task, task.priority)
+
+                await self._mark_replayed(task)
+                replayed += 1
+                logger.info(f"Task {task.id} replayed from dead-letter queue")
+
+                if delay:
+                    await asyncio.sleep(delay)
+
+            except Exception as e:
+                logger.error(f"Failed to replay dead-letter entry {entry_id}: {e}")
+
+            finally:
+                if on_progress:
+                    on_progress(processed, replayed, skipped)
+
+        return replayed
+
+    async def purge_dead_letters(self, entry_ids: List[str]) -> int:
+        """Удалить записи из dead-letter очереди"""
+        if not self.is_connected or not entry_ids:
+            return 0
+
+        try:
+            with self._lock:
+                placeholders = ','.join('?' * len(entry_ids))
+                cursor = self._conn.execute(
+                    f"DELETE FROM queue_dead_letters WHERE entry_id IN ({placeholders})",
+                    [int(entry_id) for entry_id in entry_ids]
+                )
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Failed to purge dead-letter entries: {e}")
+            return 0
+
+    # ==================== СТАТИСТИКА ====================
+
+    async def _pending_by_user(self) -> dict:
+        """Количество задач в очереди по пользователям"""
+        with self._lock:
+            counts = {}
+            for user_id, heap in self._queues.items():
+                count = sum(1 for _, task_id in heap if self._is_queued(task_id))
+                if count:
+                    counts[user_id] = count
+            return counts
+
+    async def get_queue_stats(self) -> dict:
+        """
+        Получить статистику очереди.
+
+        Returns:
+            Статистика {pending, processing, total, dead_letter}
+        """
+        if not self.is_connected:
+            return {'pending': 0, 'processing': 0, 'total': 0, 'dead_letter': 0}
+
+        try:
+            pending = sum((await self._pending_by_user()).values())
+            with self._lock:
+                total = self._conn.execute("SELECT COUNT(*) FROM queue_tasks").fetchone()[0]
+                dead_letter = self._conn.execute(
+                    "SELECT COUNT(*) FROM queue_dead_letters"
+                ).fetchone()[0]
+
+                return {
+                    'pending': pending,
+                    'processing': len(self._processing),
+                    'total': total,
+                    'dead_letter': dead_letter
+                }
+        except Exception as e:
+            logger.error(f"Failed to get queue stats: {e}")
+            return {'pending': 0, 'processing': 0, 'total': 0, 'dead_letter': 0}
+
+    async def get_pending_entries(self, count: int = 100) -> List[dict]:
+        """Задачи, взятые в обработку и ещё не завершённые"""
+        if not self.is_connected:
+            return []
+
+        with self._lock:
+            result = [
+                {
+                    'task_id': task.id,
+                    'user_id': task.user_id,
+                    'session_id': task.session_id,
+                    'consumer': None,
+                    'idle_ms': wait_ms(task.started_at),
+                    'deliveries': task.attempts
+                }
+                for task in (self._tasks[task_id] for task_id in self._processing)
+            ]
+
+        return sorted(result, key=lambda e: -(e['idle_ms'] or 0))[:count]
+
+    async def get_tenant_stats(self) -> dict:
+        """
+        Получить статистику по пользователям.
+
+        Returns:
+            {tenants: [...], active_sessions: {session_id: задач в работе}}
+        """
+        if not self.is_connected:
+            return {'tenants': [], 'active_sessions': {}}
+
+        pending = await self._pending_by_user()
+        with self._lock:
+            tenants: dict[int, TenantStats] = {}
+            for user_id, stats in self._tenant_stats.items():
+                tenants[user_id] = TenantStats(
+                    user_id=user_id,
+                    wait_count=stats.wait_count,
+                    wait_total_ms=stats.wait_total_ms,
+                    wait_max_ms=stats.wait_max_ms
+                )
+            for user_id, count in pending.items():
+                tenants.setdefault(user_id, TenantStats(user_id=user_id)).pending = count
+
+            return {
+                'tenants': [
+                    stats.to_dict()
+                    for stats in sorted(tenants.values(), key=lambda t: -t.pending)
+                ],
+                'active_sessions': dict(self._active)
+            }
+
+    async def cleanup_stale_tasks(self, timeout_seconds: int = 300) -> int:
+        """Вернуть в очередь задачи, которые в processing дольше timeout_seconds"""
+        if not self.is_connected:
+            return 0
+
+        with self._lock:
+            stale = [
+                task_id for task_id in self._processing
+                if (wait_ms(self._tasks[task_id].started_at) or 0) > timeout_seconds * 1000
+            ]
+
+        for task_id in stale:
+            await self.complete_task(task_id, success=False, error_message="Task timed out")
+
+        if stale:
+            logger.info(f"Cleaned {len(stale)} stale tasks")
+
+        return len(stale)
@@ -7,19 +7,29 @@ Redis очередь задач для перемещения остатков.
 - Обновление статуса задач
 - Приоритеты (VIP клиенты)
 - Retry логика
+- Справедливая выдача задач между пользователями (см. scheduler)
+- Dead-letter очередь (Redis Stream) и повторный запуск из неё
+
+Бэкенд выбирается через QUEUE_BACKEND (см. stream_queue для Redis Streams,
+local_queue для работы без Redis).
 """
 
 import asyncio
 import json
 import logging
-from dataclasses import dataclass, asdict
+import threading
+import time
+import weakref
+from dataclasses import dataclass, asdict, field
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List
+from typing import Callable, Optional, List, Dict
 
 import redis.asyncio as redis
 
 from config import Config
+from db_factory import get_async_database
+from .scheduler import Candidate, FairScheduler, TenantStats, make_score, wait_ms
 
 logger = logging.getLogger(__name__)
 
@@ -50,8 +60,10 @@ class Task:
     max_attempts: int = 3          # Максимум попыток
     error_message: Optional[str] = None
     created_at: Optional[str] = None
+    queued_at: Optional[str] = None    # Время последней постановки в очередь
     started_at: Optional[str] = None
     completed_at: Optional[str] = None
+    history: List[dict] = field(default_factory=list)  # Неудачные попытки
 
     def to_dict(self) -> dict:
         """Сериализация в dict"""
@@ -79,19 +91,34 @@ class TaskQueue:
     """Redis очередь задач"""
 
     # Ключи Redis
-    QUEUE_KEY = "wb:redistribution:queue"        # Основная очередь (sorted set по приоритету)
+    QUEUE_KEY = "wb:redistribution:queue"        # Префикс очередей пользователей (sorted set по приоритету)
+    TENANTS_KEY = "wb:redistribution:tenants"    # Пользователи с задачами в очереди (set)
     PROCESSING_KEY = "wb:redistribution:processing"  # Задачи в обработке
+    ACTIVE_KEY = "wb:redistribution:active"      # session_id -> задач в работе (hash)
+    SERVED_KEY = "wb:redistribution:served"      # user_id -> время последней выдачи (hash)
+    TENANT_STATS_KEY = "wb:redistribution:tenant_stats"  # Статистика ожидания (hash)
     TASKS_KEY = "wb:redistribution:tasks"        # Данные задач (hash)
     RESULTS_KEY = "wb:redistribution:results"    # Результаты (для уведомлений)
+    DLQ_KEY = "wb:redistribution:dlq"            # Dead-letter очередь (stream)
+    SCREENSHOT_KEY = "wb:redistribution:screenshot"  # Префикс скриншотов упавших задач
+
+    # Ограничения dead-letter очереди
+    DLQ_MAXLEN = 10000
+    SCREENSHOT_TTL = 7 * 24 * 3600  # 7 дней
 
-    def __init__(self, redis_url: str = None):
+    # Сколько раз пробуем захватить задачу при гонке между воркерами
+    CLAIM_RETRIES = 5
+
+    def __init__(self, redis_url: str = None, scheduler: FairScheduler = None):
         """
         Инициализация очереди.
 
         Args:
             redis_url: URL Redis (redis://localhost:6379/0)
+            scheduler: Планировщик выдачи задач
         """
         self.redis_url = redis_url or Config.REDIS_URL
+        self.scheduler = scheduler or FairScheduler()
         self._redis: Optional[redis.Redis] = None
 
     async def connect(self) -> None:
@@ -111,6 +138,46 @@ class TaskQueue:
         except Exception as e:
             logger.error(f"Failed to connect to Redis: {e}")
             self._redis = None
+            return
+
+        try:
+            await self._migrate_legacy_queue()
+        except Exception as e:
+            logger.error(f"Failed to migrate legacy queue: {e}")
+
+    async def _migrate_legacy_queue(self) -> None:
+        """
+        Перенести задачи из старой общей очереди в очереди пользователей.
+
+        Раньше все задачи лежали в одном sorted set QUEUE_KEY, теперь это
+        префикс ключей очередей пользователей. Оставшиеся в старом ключе
+        задачи никто не читал бы. Перенос идемпотентен (тот же score),
+        поэтому одновременный запуск в нескольких процессах безопасен.
+        """
+        if await self._redis.type(self.QUEUE_KEY) != 'zset':
+            return
+
+        entries = await self._redis.zrange(self.QUEUE_KEY, 0, -1, withscores=True)
+        task_jsons = await self._redis.hmget(
+            self.TASKS_KEY, [task_id for task_id, _ in entries]
+        ) if entries else []
+
+        moved = 0
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for (task_id, score), task_json in zip(entries, task_jsons):
+                if not task_json:
+                    continue
+                task = Task.from_json(task_json)
+                pipe.zadd(self._user_queue_key(task.user_id), {task_id: score})
+                pipe.sadd(self.TENANTS_KEY, task.user_id)
+                moved += 1
+            pipe.delete(self.QUEUE_KEY)
+            await pipe.execute()
+
+        logger.warning(
+            f"Migrated {moved} of {len(entries)} tasks from legacy queue "
+            f"{self.QUEUE_KEY} to per-user queues"
+        )
 
     async def disconnect(self) -> None:
         """Отключение от Redis"""
@@ -142,14 +209,8 @@ class TaskQueue:
             task.created_at = datetime.now().isoformat()
             task.status = TaskStatus.PENDING
 
-            # Сохраняем данные задачи
-            await self._redis.hset(self.TASKS_KEY, task.id, task.to_json())
-
-            # Добавляем в очередь с приоритетом (score = -priority для обратной сортировки)
-            await self._redis.zadd(
-                self.QUEUE_KEY,
-                {task.id: -task.priority}
-            )
+            # Сохраняем данные задачи и ставим в очередь пользователя
+            await self._enqueue(task, task.priority)
 
             logger.info(f"Task {task.id} added to queue (priority: {task.priority})")
             return True
@@ -158,51 +219,282 @@ class TaskQueue:
             logger.error(f"Failed to add task: {e}")
             return False
 
-    async def get_next_task(self) -> Optional[Task]:
+    async def add_tasks(self, tasks: List[Task]) -> bool:
         """
-        Получить следующую задачу из очереди.
+        Добавить несколько задач за одно обращение к хранилищу.
+
+        Args:
+            tasks: Задачи
 
         Returns:
-            Task или None если очередь пуста
+            True если поставлены все задачи (иначе ни одна)
         """
+        if not tasks:
+            return True
+
         if not self.is_connected:
-            return None
+            logger.warning("Task queue not connected, cannot add tasks")
+            return False
 
         try:
-            # Атомарно берём задачу с наивысшим приоритетом
-            result = await self._redis.zpopmin(self.QUEUE_KEY, 1)
-            if not result:
-                return None
+            created_at = datetime.now().isoformat()
+            for task in tasks:
+                task.created_at = created_at
+                task.status = TaskStatus.PENDING
 
-            task_id, _ = result[0]
+            await self._enqueue_many(tasks)
 
-            # Получаем данные задачи
+            logger.info(f"{len(tasks)} tasks added to queue")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to add tasks: {e}")
+            return False
+
+    def _user_queue_key(self, user_id: int) -> str:
+        """Ключ очереди пользователя"""
+        return f"{self.QUEUE_KEY}:{user_id}"
+
+    async def _enqueue(self, task: Task, priority: int) -> None:
+        """
+        Сохранить задачу и поставить в очередь пользователя.
+
+        Args:
+            task: Задача
+            priority: Эффективный приоритет (при retry снижается)
+        """
+        now = time.time()
+        task.queued_at = datetime.fromtimestamp(now).isoformat()
+
+        await self._redis.hset(self.TASKS_KEY, task.id, task.to_json())
+        await self._redis.zadd(
+            self._user_queue_key(task.user_id),
+            {task.id: make_score(priority, now)}
+        )
+        await self._redis.sadd(self.TENANTS_KEY, task.user_id)
+
+    async def _enqueue_many(self, tasks: List[Task]) -> None:
+        """_enqueue для пачки задач одним MULTI/EXEC pipeline"""
+        now = time.time()
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for i, task in enumerate(tasks):
+                # Сдвиг на 1 мс сохраняет порядок задач внутри пачки
+                queued_ts = now + i / 1000
+                task.queued_at = datetime.fromtimestamp(queued_ts).isoformat()
+
+                pipe.hset(self.TASKS_KEY, task.id, task.to_json())
+                pipe.zadd(
+                    self._user_queue_key(task.user_id),
+                    {task.id: make_score(task.priority, queued_ts)}
+                )
+                pipe.sadd(self.TENANTS_KEY, task.user_id)
+            await pipe.execute()
+
+    async def _release_slot(self, task: Task) -> None:
+        """Освободить слот аккаунта после завершения задачи"""
+        running = await self._redis.hincrby(self.ACTIVE_KEY, task.session_id, -1)
+        if running <= 0:
+            await self._redis.hdel(self.ACTIVE_KEY, task.session_id)
+
+    async def _load_candidates(self) -> List[Candidate]:
+        """Головы очередей всех пользователей с задачами"""
+        user_ids = list(await self._redis.smembers(self.TENANTS_KEY))
+        if not user_ids:
+            return []
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zrange(self._user_queue_key(user_id), 0, 0, withscores=True)
+            heads = await pipe.execute()
+
+        candidates = []
+        for user_id, head in zip(user_ids, heads):
+            if not head:
+                # Очередь пользователя опустела - убираем его из списка.
+                # Повторная проверка защищает от гонки с add_task.
+                queue_key = self._user_queue_key(user_id)
+                await self._redis.srem(self.TENANTS_KEY, user_id)
+                if await self._redis.zcard(queue_key):
+                    await self._redis.sadd(self.TENANTS_KEY, user_id)
+                continue
+
+            task_id, score = head[0]
             task_json = await self._redis.hget(self.TASKS_KEY, task_id)
             if not task_json:
-                logger.warning(f"Task {task_id} not found in storage")
-                return None
+                logger.warning(f"Task {task_id} not found in storage, dropping from queue")
+                await self._redis.zrem(self._user_queue_key(user_id), task_id)
+                continue
 
             task = Task.from_json(task_json)
-            task.status = TaskStatus.PROCESSING
-            task.started_at = datetime.now().isoformat()
-            task.attempts += 1
+            candidates.append(Candidate(
+                task_id=task.id,
+                user_id=task.user_id,
+                session_id=task.session_id,
+                score=score
+            ))
+
+        return candidates
+
+    async def _record_wait(self, task: Task) -> None:
+        """Учесть время ожидания задачи в статистике пользователя"""
+        waited = wait_ms(task.queued_at)
+        if waited is None:
+            return
+
+        prefix = str(task.user_id)
+        await self._redis.hincrby(self.TENANT_STATS_KEY, f"{prefix}:wait_count", 1)
+        await self._redis.hincrby(self.TENANT_STATS_KEY, f"{prefix}:wait_total_ms", waited)
+
+        current_max = await self._redis.hget(self.TENANT_STATS_KEY, f"{prefix}:wait_max_ms")
+        if waited > int(current_max or 0):
+            await self._redis.hset(self.TENANT_STATS_KEY, f"{prefix}:wait_max_ms", waited)
+
+    async def _start_processing(self, task: Task) -> None:
+        """Перевести захваченную задачу в processing"""
+        await self._record_wait(task)
+
+        task.status = TaskStatus.PROCESSING
+        task.started_at = datetime.now().isoformat()
+        task.attempts += 1
 
-            # Перемещаем в processing
-            await self._redis.sadd(self.PROCESSING_KEY, task_id)
-            await self._redis.hset(self.TASKS_KEY, task_id, task.to_json())
+        await self._redis.sadd(self.PROCESSING_KEY, task.id)
+        await self._redis.hset(self.TASKS_KEY, task.id, task.to_json())
 
-            logger.info(f"Task {task_id} taken for processing (attempt {task.attempts})")
-            return task
+    async def get_next_task(self) -> Optional[Task]:
+        """
+        Получить следующую задачу из очереди.
+
+        Учитывает лимит задач на аккаунт и справедливость между
+        пользователями (см. FairScheduler).
+
+        Returns:
+            Task или None если очередь пуста или все аккаунты заняты
+        """
+        if not self.is_connected:
+            return None
+
+        try:
+            for _ in range(self.CLAIM_RETRIES):
+                candidates = await self._load_candidates()
+                if not candidates:
+                    return None
+
+                session_ids = list({c.session_id for c in candidates})
+                user_ids = list({c.user_id for c in candidates})
+                active_values = await self._redis.hmget(self.ACTIVE_KEY, session_ids)
+                served_values = await self._redis.hmget(self.SERVED_KEY, user_ids)
+
+                active = {
+                    sid: int(v) for sid, v in zip(session_ids, active_values) if v
+                }
+                last_served = {
+                    uid: float(v) for uid, v in zip(user_ids, served_values) if v
+                }
+
+                chosen = self.scheduler.select(candidates, active, last_served)
+                if chosen is None:
+                    return None
+
+                # Резервируем слот аккаунта (increment-then-check)
+                running = await self._redis.hincrby(self.ACTIVE_KEY, chosen.session_id, 1)
+                if running > self.scheduler.max_per_session:
+                    await self._redis.hincrby(self.ACTIVE_KEY, chosen.session_id, -1)
+                    continue
+
+                # Атомарно забираем задачу из очереди пользователя
+                removed = await self._redis.zrem(
+                    self._user_queue_key(chosen.user_id), chosen.task_id
+                )
+                if not removed:
+                    # Задачу забрал другой воркер
+                    await self._redis.hincrby(self.ACTIVE_KEY, chosen.session_id, -1)
+                    continue
+
+                task_json = await self._redis.hget(self.TASKS_KEY, chosen.task_id)
+                if not task_json:
+                    logger.warning(f"Task {chosen.task_id} not found in storage")
+                    await self._redis.hincrby(self.ACTIVE_KEY, chosen.session_id, -1)
+                    continue
+
+                task = Task.from_json(task_json)
+                await self._start_processing(task)
+                await self._redis.hset(self.SERVED_KEY, task.user_id, time.time())
+
+                logger.info(
+                    f"Task {task.id} taken for processing "
+                    f"(user {task.user_id}, session {task.session_id}, attempt {task.attempts})"
+                )
+                return task
+
+            return None
 
         except Exception as e:
             logger.error(f"Failed to get next task: {e}")
             return None
 
+    async def get_next_batch(self, max_size: int = None) -> List[Task]:
+        """
+        Получить пачку задач одного аккаунта.
+
+        Первая задача выбирается как в get_next_task, затем к ней
+        добавляются другие ожидающие задачи той же сессии, чтобы
+        выполнить их в одном браузерном контексте.
+
+        Args:
+            max_size: Максимальный размер пачки
+
+        Returns:
+            Список задач (пустой если очередь пуста)
+        """
+        first = await self.get_next_task()
+        if not first:
+            return []
+
+        batch = [first]
+        max_size = max_size or Config.WORKER_BATCH_SIZE
+        if max_size <= 1:
+            return batch
+
+        try:
+            queue_key = self._user_queue_key(first.user_id)
+            # Смотрим немного дальше max_size: у пользователя могут быть задачи других сессий
+            task_ids = await self._redis.zrange(queue_key, 0, max_size * 4)
+
+            for task_id in task_ids:
+                if len(batch) >= max_size:
+                    break
+
+                task_json = await self._redis.hget(self.TASKS_KEY, task_id)
+                if not task_json:
+                    continue
+
+                task = Task.from_json(task_json)
+                if task.session_id != first.session_id:
+                    continue
+
+                if not await self._redis.zrem(queue_key, task_id):
+                    continue  # Задачу забрал другой воркер
+
+                # Задачи пачки занимают слоты аккаунта до своего завершения
+                await self._redis.hincrby(self.ACTIVE_KEY, task.session_id, 1)
+                await self._start_processing(task)
+                batch.append(task)
+
+        except Exception as e:
+            logger.error(f"Failed to extend batch for task {first.id}: {e}")
+
+        if len(batch) > 1:
+            logger.info(f"Batch of {len(batch)} tasks claimed for session {first.session_id}")
+
+        return batch
+
     async def complete_task(
         self,
         task_id: str,
         success: bool,
-        error_message: str = None
+        error_message: str = None,
+        screenshot: bytes = None
     ) -> bool:
         """
         Завершить обработку задачи.
@@ -211,6 +503,7 @@ class TaskQueue:
             task_id: ID задачи
             success: Успешно ли выполнена
             error_message: Сообщение об ошибке (если не успешно)
+            screenshot: Скриншот страницы при ошибке (для dead-letter очереди)
 
         Returns:
             True если успешно обновлено
@@ -232,33 +525,33 @@ class TaskQueue:
                 task.completed_at = datetime.now().isoformat()
             else:
                 task.error_message = error_message
+                task.history.append({
+                    'attempt': task.attempts,
+                    'error': error_message,
+                    'started_at': task.started_at,
+                    'finished_at': datetime.now().isoformat()
+                })
                 if task.attempts >= task.max_attempts:
                     task.status = TaskStatus.FAILED
                     task.completed_at = datetime.now().isoformat()
                 else:
-                    # Возвращаем в очередь для retry
+                    # Возвращаем в очередь для retry (снижаем приоритет)
                     task.status = TaskStatus.PENDING
-                    await self._redis.zadd(
-                        self.QUEUE_KEY,
-                        {task_id: -(task.priority - task.attempts)}  # Снижаем приоритет при retry
-                    )
 
-            # Обновляем данные
-            await self._redis.hset(self.TASKS_KEY, task_id, task.to_json())
+            # Убираем из processing и освобождаем слот аккаунта
+            if await self._redis.srem(self.PROCESSING_KEY, task_id):
+                await self._release_slot(task)
 
-            # Убираем из processing
-            await self._redis.srem(self.PROCESSING_KEY, task_id)
+            if task.status == TaskStatus.PENDING:
+                await self._enqueue(task, task.priority - task.attempts)
+            else:
+                await self._redis.hset(self.TASKS_KEY, task_id, task.to_json())
+
+            if task.status == TaskStatus.FAILED:
+                await self._dead_letter(task, screenshot)
 
             # Публикуем результат для уведомления
-            await self._redis.publish(
-                self.RESULTS_KEY,
-                json.dumps({
-                    'task_id': task_id,
-                    'user_id': task.user_id,
-                    'status': task.status.value,
-                    'error': error_message
-                })
-            )
+            await self._publish_result(task, error_message)
 
             logger.info(f"Task {task_id} completed with status: {task.status.value}")
             return True
@@ -267,6 +560,277 @@ class TaskQueue:
             logger.error(f"Failed to complete task: {e}")
             return False
 
+    async def _publish_result(self, task: Task, error_message: str = None) -> None:
+        """Опубликовать результат задачи (pub/sub)"""
+        await self._redis.publish(
+            self.RESULTS_KEY,
+            json.dumps({
+                'task_id': task.id,
+                'user_id': task.user_id,
+                'status': task.status.value,
+                'error': error_message
+            })
+        )
+
+    # ==================== DEAD-LETTER ====================
+
+    async def _dead_letter(self, task: Task, screenshot: bytes = None) -> None:
+        """
+        Записать окончательно упавшую задачу в dead-letter очередь.
+
+        Args:
+            task: Задача в статусе FAILED
+            screenshot: Последний скриншот (хранится отдельно с TTL)
+        """
+        screenshot_ref = ''
+        if screenshot:
+            screenshot_ref = f"{self.SCREENSHOT_KEY}:{task.id}"
+            # Скриншот бинарный - пишем через отдельный клиент без decode_responses
+            raw = redis.from_url(self.redis_url)
+            try:
+                await raw.set(screenshot_ref, screenshot, ex=self.SCREENSHOT_TTL)
+            finally:
+                await raw.close()
+
+        duration_ms = 0
+        if task.created_at and task.completed_at:
+            created = datetime.fromisoformat(task.created_at)
+            completed = datetime.fromisoformat(task.completed_at)
+            duration_ms = int((completed - created).total_seconds() * 1000)
+
+        await self._redis.xadd(
+            self.DLQ_KEY,
+            {
+                'task_id': task.id,
+                'user_id': task.user_id,
+                'session_id': task.session_id,
+                'request_id': task.request_id,
+                'reason': task.error_message or '',
+                'attempts': task.attempts,
+                'history': json.dumps(task.history, ensure_ascii=False),
+                'screenshot_ref': screenshot_ref,
+                'created_at': task.created_at or '',
+                'failed_at': task.completed_at or '',
+                'duration_ms': duration_ms,
+            },
+            maxlen=self.DLQ_MAXLEN,
+            approximate=True
+        )
+        logger.warning(f"Task {task.id} moved to dead-letter queue: {task.error_message}")
+
+    @staticmethod
+    def _parse_dead_letter(entry_id: str, fields: Dict[str, str]) -> dict:
+        """Преобразовать запись stream в dict"""
+        return {
+            'entry_id': entry_id,
+            'task_id': fields.get('task_id'),
+            'user_id': int(fields.get('user_id', 0)),
+            'session_id': int(fields.get('session_id', 0)),
+            'request_id': int(fields.get('request_id', 0)),
+            'reason': fields.get('reason', ''),
+            'attempts': int(fields.get('attempts', 0)),
+            'history': json.loads(fields.get('history') or '[]'),
+            'screenshot_ref': fields.get('screenshot_ref') or None,
+            'created_at': fields.get('created_at') or None,
+            'failed_at': fields.get('failed_at') or None,
+            'duration_ms': int(fields.get('duration_ms', 0)),
+        }
+
+    async def get_dead_letters(
+        self,
+        user_id: int = None,
+        reason: str = None,
+        since: str = None,
+        limit: int = 100
+    ) -> List[dict]:
+        """
+        Получить записи dead-letter очереди (новые первыми).
+
+        Args:
+            user_id: Фильтр по пользователю
+            reason: Фильтр по подстроке причины ошибки
+            since: Фильтр по времени падения (ISO, включительно)
+            limit: Максимум записей
+
+        Returns:
+            Список записей
+        """
+        if not self.is_connected:
+            return []
+
+        try:
+            entries = await self._redis.xrevrange(self.DLQ_KEY, count=self.DLQ_MAXLEN)
+            result = []
+            reason_lower = reason.lower() if reason else None
+
+            for entry_id, fields in entries:
+                item = self._parse_dead_letter(entry_id, fields)
+                if user_id is not None and item['user_id'] != user_id:
+                    continue
+                if reason_lower and reason_lower not in item['reason'].lower():
+                    continue
+                if since and (item['failed_at'] or '') < since:
+                    continue
+                result.append(item)
+                if len(result) >= limit:
+                    break
+
+            return result
+
+        except Exception as e:
+            logger.error(f"Failed to read dead-letter queue: {e}")
+            return []
+
+    async def get_dead_letter(self, entry_id: str) -> Optional[dict]:
+        """Получить запись dead-letter очереди по ID (XRANGE id id)"""
+        if not self.is_connected:
+            return None
+
+        try:
+            entries = await self._redis.xrange(self.DLQ_KEY, entry_id, entry_id)
+        except Exception as e:
+            logger.error(f"Failed to read dead-letter entry {entry_id}: {e}")
+            return None
+
+        return self._parse_dead_letter(*entries[0]) if entries else None
+
+    async def get_dead_letter_screenshot(self, screenshot_ref: str) -> Optional[bytes]:
+        """Получить скриншот упавшей задачи по ссылке из dead-letter записи"""
+        if not self.is_connected or not screenshot_ref:
+            return None
+
+        raw = redis.from_url(self.redis_url)
+        try:
+            return await raw.get(screenshot_ref)
+        finally:
+            await raw.close()
+
+    async def _mark_replayed(self, task: Task) -> None:
+        """
+        Вернуть заявку повторно запущенной задачи в статус 'searching':
+        иначе UI показывает её упавшей, а архивация может убрать её во время повтора.
+        """
+        try:
+            await get_async_database().update_redistribution_request(task.request_id, status='searching')
+        except Exception as e:
+            logger.warning(f"Failed to update request {task.request_id} of replayed task {task.id}: {e}")
+
+    async def _rebind_session(self, task: Task) -> bool:
+        """
+        Привязать задачу к текущей активной сессии пользователя.
+
+        Чаще всего задачи падают из-за истёкшей сессии; после повторной
+        авторизации старая сессия неактивна и повтор под ней сразу упадёт.
+
+        Returns:
+            False если активной сессии нет (повторять бессмысленно)
+        """
+        session = await get_async_database().get_browser_session(task.user_id)
+        if not session:
+            return False
+        if session['id'] != task.session_id:
+            logger.info(f"Task {task.id} rebound from session {task.session_id} to {session['id']}")
+            task.session_id = session['id']
+        return True
+
+    async def replay_dead_letters(
+        self,
+        entry_ids: List[str],
+        rate_per_minute: int = None,
+        on_progress: Callable[[int, int, int], None] = None
+    ) -> int:
+        """
+        Повторно поставить задачи из dead-letter очереди.
+
+        Задачи возвращаются в обычную очередь с обнулёнными попытками и
+        текущей активной сессией пользователя, поэтому на них действуют
+        лимиты планировщика по аккаунтам. Записи пользователей без активной
+        сессии пропускаются и остаются в dead-letter очереди.
+        rate_per_minute дополнительно ограничивает скорость постановки,
+        чтобы не обрушить на WB всю очередь разом после сбоя.
+
+        Args:
+            entry_ids: ID записей stream
+            rate_per_minute: Максимум задач в минуту (None - без ограничения)
+            on_progress: Вызывается после каждой записи (обработано, поставлено,
+                пропущено без активной сессии)
+
+        Returns:
+            Количество поставленных задач
+        """
+        if not self.is_connected:
+            return 0
+
+        delay = 60.0 / rate_per_minute if rate_per_minute else 0
+        replayed = 0
+        skipped = 0
+
+        for processed, entry_id in enumerate(entry_ids, 1):
+            try:
+                item = await self.get_dead_letter(entry_id)
+                if not item:
+                    logger.warning(f"Dead-letter entry {entry_id} not found")
+                    continue
+
+                task_json = await self._redis.hget(self.TASKS_KEY, item['task_id'])
+                if not task_json:
+                    logger.warning(f"Task {item['task_id']} for entry {entry_id} not found")
+                    continue
+
+                task = Task.from_json(task_json)
+                if task.status != TaskStatus.FAILED:
+                    # Уже перезапущена или отменена
+                    await self._redis.xdel(self.DLQ_KEY, entry_id)
+                    continue
+
+                if not await self._rebind_session(task):
+                    logger.warning(f"Task {task.id}: user {task.user_id} has no active session, not replayed")
+                    skipped += 1
+                    continue
+
+                task.status = TaskStatus.PENDING
+                task.attempts = 0
+                task.error_message = None
+                task.started_at = None
+                task.completed_at = None
+                await self._enqueue(task, task.priority)
+                await self._redis.xdel(self.DLQ_KEY, entry_id)
+                await self._mark_replayed(task)
+
+                replayed += 1
+                logger.info(f"Task {task.id} replayed from dead-letter queue")
+
+                if delay:
+                    await asyncio.sleep(delay)
+
+            except Exception as e:
+                logger.error(f"Failed to replay dead-letter entry {entry_id}: {e}")
+
+            finally:
+                if on_progress:
+                    on_progress(processed, replayed, skipped)
+
+        return replayed
+
+    async def purge_dead_letters(self, entry_ids: List[str]) -> int:
+        """
+        Удалить записи из dead-letter очереди.
+
+        Args:
+            entry_ids: ID записей stream
+
+        Returns:
+            Количество удалённых записей
+        """
+        if not self.is_connected or not entry_ids:
+            return 0
+
+        try:
+            return await self._redis.xdel(self.DLQ_KEY, *entry_ids)
+        except Exception as e:
+            logger.error(f"Failed to purge dead-letter entries: {e}")
+            return 0
+
     async def cancel_task(self, task_id: str) -> bool:
         """
         Отменить задачу.
@@ -281,14 +845,18 @@ class TaskQueue:
             return False
 
         try:
-            # Удаляем из очереди
-            await self._redis.zrem(self.QUEUE_KEY, task_id)
-            await self._redis.srem(self.PROCESSING_KEY, task_id)
-
-            # Обновляем статус
             task_json = await self._redis.hget(self.TASKS_KEY, task_id)
-            if task_json:
+            if not task_json:
+                await self._redis.srem(self.PROCESSING_KEY, task_id)
+            else:
                 task = Task.from_json(task_json)
+
+                # Удаляем из очереди
+                await self._redis.zrem(self._user_queue_key(task.user_id), task_id)
+                if await self._redis.srem(self.PROCESSING_KEY, task_id):
+                    await self._release_slot(task)
+
+                # Обновляем статус
                 task.status = TaskStatus.CANCELLED
                 task.completed_at = datetime.now().isoformat()
                 await self._redis.hset(self.TASKS_KEY, task_id, task.to_json())
@@ -351,29 +919,119 @@ class TaskQueue:
             logger.error(f"Failed to get user tasks: {e}")
             return []
 
+    async def _pending_by_user(self) -> dict:
+        """Количество задач в очереди по пользователям"""
+        user_ids = list(await self._redis.smembers(self.TENANTS_KEY))
+        if not user_ids:
+            return {}
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcard(self._user_queue_key(user_id))
+            counts = await pipe.execute()
+
+        return {int(uid): count for uid, count in zip(user_ids, counts) if count}
+
     async def get_queue_stats(self) -> dict:
         """
         Получить статистику очереди.
 
         Returns:
-            Статистика {pending, processing, total}
+            Статистика {pending, processing, total, dead_letter}
         """
         if not self.is_connected:
-            return {'pending': 0, 'processing': 0, 'total': 0}
+            return {'pending': 0, 'processing': 0, 'total': 0, 'dead_letter': 0}
 
         try:
-            pending = await self._redis.zcard(self.QUEUE_KEY)
+            pending = sum((await self._pending_by_user()).values())
             processing = await self._redis.scard(self.PROCESSING_KEY)
             total = await self._redis.hlen(self.TASKS_KEY)
+            dead_letter = await self._redis.xlen(self.DLQ_KEY)
 
             return {
                 'pending': pending,
                 'processing': processing,
-                'total': total
+                'total': total,
+                'dead_letter': dead_letter
             }
         except Exception as e:
             logger.error(f"Failed to get queue stats: {e}")
-            return {'pending': 0, 'processing': 0, 'total': 0}
+            return {'pending': 0, 'processing': 0, 'total': 0, 'dead_letter': 0}
+
+    async def get_pending_entries(self, count: int = 100) -> List[dict]:
+        """
+        Задачи, взятые в обработку и ещё не завершённые.
+
+        Args:
+            count: Максимум записей
+
+        Returns:
+            [{task_id, user_id, session_id, consumer, idle_ms, deliveries}]
+        """
+        if not self.is_connected:
+            return []
+
+        try:
+            processing_ids = list(await self._redis.smembers(self.PROCESSING_KEY))[:count]
+            result = []
+
+            for task_id in processing_ids:
+                task_json = await self._redis.hget(self.TASKS_KEY, task_id)
+                if not task_json:
+                    continue
+
+                task = Task.from_json(task_json)
+                result.append({
+                    'task_id': task.id,
+                    'user_id': task.user_id,
+                    'session_id': task.session_id,
+                    'consumer': None,  # Владелец не отслеживается
+                    'idle_ms': wait_ms(task.started_at),
+                    'deliveries': task.attempts
+                })
+
+            return sorted(result, key=lambda e: -(e['idle_ms'] or 0))
+
+        except Exception as e:
+            logger.error(f"Failed to get pending entries: {e}")
+            return []
+
+    async def get_tenant_stats(self) -> dict:
+        """
+        Получить статистику по пользователям.
+
+        Returns:
+            {tenants: [{user_id, pending, wait_count, wait_avg_ms, wait_max_ms}],
+             active_sessions: {session_id: задач в работе}}
+        """
+        if not self.is_connected:
+            return {'tenants': [], 'active_sessions': {}}
+
+        try:
+            pending = await self._pending_by_user()
+            raw_stats = await self._redis.hgetall(self.TENANT_STATS_KEY)
+            active = await self._redis.hgetall(self.ACTIVE_KEY)
+
+            tenants: dict[int, TenantStats] = {
+                user_id: TenantStats(user_id=user_id, pending=count)
+                for user_id, count in pending.items()
+            }
+            for key, value in raw_stats.items():
+                user_part, _, metric = key.partition(':')
+                user_id = int(user_part)
+                stats = tenants.setdefault(user_id, TenantStats(user_id=user_id))
+                setattr(stats, metric, int(value))
+
+            return {
+                'tenants': [
+                    stats.to_dict()
+                    for stats in sorted(tenants.values(), key=lambda t: -t.pending)
+                ],
+                'active_sessions': {int(k): int(v) for k, v in active.items()}
+            }
+        except Exception as e:
+            logger.error(f"Failed to get tenant stats: {e}")
+            return {'tenants': [], 'active_sessions': {}}
 
     async def cleanup_stale_tasks(self, timeout_seconds: int = 300) -> int:
         """
@@ -422,25 +1080,109 @@ class TaskQueue:
             return 0
 
 
-# Singleton instance
-_task_queue: Optional[TaskQueue] = None
+def get_queue_backend() -> str:
+    """Бэкенд очереди: redis, stream или local (без REDIS_URL - всегда local)"""
+    if not Config.REDIS_URL:
+        return 'local'
+    return Config.QUEUE_BACKEND
 
 
-async def get_task_queue() -> TaskQueue:
-    """Получить singleton instance TaskQueue"""
-    global _task_queue
+# Встроенная очередь одна на процесс (защищена threading.RLock), а клиент
+# redis.asyncio привязан к event loop, в котором подключился: под run.py
+# API работает в потоке uvicorn со своим loop - там своё подключение
+_local_queue: Optional[TaskQueue] = None
+_loop_queues: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TaskQueue]' = weakref.WeakKeyDictionary()
+_queues_lock = threading.Lock()
+
+# Воркеров, читающих очередь в этом процессе (WorkerPool)
+_local_workers = 0
 
-    if _task_queue is None:
-        _task_queue = TaskQueue()
-        await _task_queue.connect()
 
-    return _task_queue
+def _get_cached_queue() -> Optional[TaskQueue]:
+    if get_queue_backend() == 'local':
+        return _local_queue
+    return _loop_queues.get(asyncio.get_running_loop())
 
 
-async def shutdown_task_queue() -> None:
-    """Корректное завершение TaskQueue"""
-    global _task_queue
+def _store_queue(queue: TaskQueue) -> TaskQueue:
+    """Запомнить подключённую очередь; если параллельный вызов успел раньше - вернуть его"""
+    global _local_queue
 
-    if _task_queue:
-        await _task_queue.disconnect()
-        _task_queue = None
+    with _queues_lock:
+        existing = _get_cached_queue()
+        if existing is not None:
+            return existing
+        if get_queue_backend() == 'local':
+            _local_queue = queue
+        else:
+            _loop_queues[asyncio.get_running_loop()] = queue
+        return queue
+
+
+async def get_task_queue() -> TaskQueue:
+    """
+    Очередь задач: встроенная - общая на процесс, Redis - своя на event loop.
+
+    Очередь запоминается только после успешного подключения; без
+    подключения возвращается неподключённая (is_connected=False), и
+    следующий вызов пробует подключиться снова.
+    """
+    queue = _get_cached_queue()
+    if queue is not None:
+        return queue
+
+    backend = get_queue_backend()
+    if backend == 'local':
+        from .local_queue import LocalTaskQueue
+        queue = LocalTaskQueue()
+    elif backend == 'stream':
+        from .stream_queue import StreamTaskQueue
+        queue = StreamTaskQueue()
+    else:
+        queue = TaskQueue()
+    await queue.connect()
+
+    if not queue.is_connected:
+        return queue
+
+    stored = _store_queue(queue)
+    if stored is not queue:
+        await queue.disconnect()
+    return stored
+
+
+async def shutdown_task_queue(local: bool = True) -> None:
+    """
+    Корректное завершение очереди текущего event loop.
+
+    Args:
+        local: Закрыть и встроенную очередь (общую для всех loop процесса)
+    """
+    global _local_queue
+
+    with _queues_lock:
+        queues = [_loop_queues.pop(asyncio.get_running_loop(), None)]
+        if local:
+            queues.append(_local_queue)
+            _local_queue = None
+
+    for queue in queues:
+        if queue:
+            await queue.disconnect()
+
+
+def set_local_workers(delta: int) -> None:
+    """Учесть запуск (+N) или остановку (-N) воркеров в этом процессе"""
+    global _local_workers
+
+    with _queues_lock:
+        _local_workers = max(0, _local_workers + delta)
+
+
+def has_consumers() -> bool:
+    """
+    Есть ли кому выполнить задачу из очереди: воркеры в этом процессе или
+    общая очередь в Redis (воркеры могут работать в другом процессе).
+    Встроенную очередь без воркеров никто не читает.
+    """
+    return _local_workers > 0 or get_queue_backend() != 'local'
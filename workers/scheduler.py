@@ -0,0 +1,151 @@
+"""
+Планировщик задач для пула воркеров.
+
+Функционал:
+- Лимит одновременных задач на один WB аккаунт (session_id)
+- Round-robin между пользователями внутри одного приоритета
+- Статистика ожидания по пользователям (tenant)
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import Config
+
+
+# Множитель приоритета в score очереди.
+# score = -priority * PRIORITY_BAND + время постановки в очередь,
+# поэтому внутри одного приоритета задачи идут в порядке FIFO.
+PRIORITY_BAND = 1e10
+
+
+def make_score(priority: int, queued_ts: Optional[float] = None) -> float:
+    """
+    Рассчитать score задачи для sorted set.
+
+    Args:
+        priority: Приоритет (выше = важнее)
+        queued_ts: Время постановки в очередь (unix timestamp)
+
+    Returns:
+        Score (меньше = раньше в очереди)
+    """
+    if queued_ts is None:
+        queued_ts = time.time()
+    return -priority * PRIORITY_BAND + queued_ts
+
+
+def score_band(score: float) -> int:
+    """Приоритетная полоса задачи по её score"""
+    return math.floor(score / PRIORITY_BAND)
+
+
+@dataclass
+class Candidate:
+    """Голова очереди одного пользователя"""
+    task_id: str
+    user_id: int
+    session_id: int
+    score: float
+
+
+class FairScheduler:
+    """
+    Выбор следующей задачи с учётом справедливости.
+
+    Правила:
+    1. Задачи аккаунта, у которого уже max_per_session задач в работе, пропускаются
+    2. Берётся самая приоритетная полоса среди оставшихся
+    3. Внутри полосы - пользователь, которого обслуживали давнее всех
+    """
+
+    def __init__(self, max_per_session: int = None):
+        """
+        Args:
+            max_per_session: Максимум одновременных задач на одну сессию WB
+        """
+        self.max_per_session = max_per_session or Config.WORKER_MAX_PER_SESSION
+
+    def has_capacity(self, session_id: int, active: Dict[int, int]) -> bool:
+        """Есть ли свободный слот у аккаунта"""
+        return active.get(session_id, 0) < self.max_per_session
+
+    def select(
+        self,
+        candidates: List[Candidate],
+        active: Dict[int, int],
+        last_served: Dict[int, float]
+    ) -> Optional[Candidate]:
+        """
+        Выбрать задачу для обработки.
+
+        Args:
+            candidates: Головы очередей пользователей
+            active: session_id -> количество задач в работе
+            last_served: user_id -> время последней выдачи задачи
+
+        Returns:
+            Выбранный кандидат или None если все аккаунты заняты
+        """
+        eligible = [c for c in candidates if self.has_capacity(c.session_id, active)]
+        if not eligible:
+            return None
+
+        best_band = min(score_band(c.score) for c in eligible)
+        band = [c for c in eligible if score_band(c.score) == best_band]
+
+        return min(
+            band,
+            key=lambda c: (last_served.get(c.user_id, 0.0), c.score)
+        )
+
+
+@dataclass
+class TenantStats:
+    """Статистика очереди одного пользователя"""
+    user_id: int
+    pending: int = 0
+    wait_count: int = 0
+    wait_total_ms: int = 0
+    wait_max_ms: int = 0
+
+    @property
+    def wait_avg_ms(self) -> int:
+        """Среднее время ожидания в очереди"""
+        if not self.wait_count:
+            return 0
+        return self.wait_total_ms // self.wait_count
+
+    def to_dict(self) -> dict:
+        """Сериализация в dict"""
+        return {
+            'user_id': self.user_id,
+            'pending': self.pending,
+            'wait_count': self.wait_count,
+            'wait_avg_ms': self.wait_avg_ms,
+            'wait_max_ms': self.wait_max_ms,
+        }
+
+
+def wait_ms(queued_at: Optional[str], now: Optional[float] = None) -> Optional[int]:
+    """
+    Время ожидания задачи в очереди.
+
+    Args:
+        queued_at: ISO время постановки в очередь
+        now: Текущее время (unix timestamp)
+
+    Returns:
+        Миллисекунды ожидания или None если время неизвестно
+    """
+    if not queued_at:
+        return None
+    now = now if now is not None else time.time()
+    try:
+        queued_ts = datetime.fromisoformat(queued_at).timestamp()
+    except ValueError:
+        return None
+    return max(0, int((now - queued_ts) * 1000))
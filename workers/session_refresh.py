@@ -0,0 +1,249 @@
+"""
+Фоновое обновление cookies браузерных сессий до их истечения.
+
+Периодически (SESSION_REFRESH_INTERVAL_MINUTES) выбирает активные сессии,
+истекающие в ближайшие SESSION_REFRESH_AHEAD_HOURS часов или не
+обновлявшиеся дольше SESSION_REFRESH_STALE_HOURS, и обновляет их cookies:
+
+1. HTTP запросом с текущими cookies (WBInternalClient.refresh_cookies) -
+   дёшево, без запуска браузера. Ответ 200 без Set-Cookie значит, что
+   сессия жива: она продлевается с прежними cookies ('alive')
+2. Если WB не ответил по HTTP - через браузер
+   (WBRedistributionService.refresh_session), не больше одного браузера
+   одновременно
+
+Одновременно обрабатывается не больше SESSION_REFRESH_CONCURRENCY сессий.
+Результат пишется в browser_sessions (refresh_status, refresh_error,
+refresh_failures). Сессия, отклонённая WB (401), или с
+SESSION_REFRESH_MAX_FAILURES неудачами подряд помечается expired. Неудачей
+считается только редирект на логин в браузере; сбои браузера и сети в
+счётчик не входят.
+
+Метрики - get_stats() (GET /api/admin/session-refresh).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import Config
+from db_factory import get_async_database
+from utils.encryption import encrypt_token
+from wb_api.internal_client import SessionExpiredError, WBInternalClient
+
+logger = logging.getLogger(__name__)
+
+# Результаты обновления одной сессии
+OUTCOMES = ('http', 'alive', 'browser', 'expired', 'failed')
+
+
+class SessionRefreshJob:
+    """Периодическое обновление cookies сессий"""
+
+    # Браузерное обновление запускает отдельный Chromium - не больше одного сразу
+    BROWSER_CONCURRENCY = 1
+
+    def __init__(self, interval_minutes: float = None, concurrency: int = None):
+        """
+        Args:
+            interval_minutes: Период запуска (по умолчанию SESSION_REFRESH_INTERVAL_MINUTES)
+            concurrency: Сессий одновременно (по умолчанию SESSION_REFRESH_CONCURRENCY)
+        """
+        self.interval = (interval_minutes or Config.SESSION_REFRESH_INTERVAL_MINUTES) * 60
+        self.concurrency = max(1, concurrency or Config.SESSION_REFRESH_CONCURRENCY)
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._browser_semaphore = asyncio.Semaphore(self.BROWSER_CONCURRENCY)
+
+        # Метрики
+        self._runs = 0
+        self._errors = 0
+        self._last_run: Optional[Dict] = None
+        self._totals = {outcome: 0 for outcome in OUTCOMES}
+
+    async def run_once(self) -> Dict:
+        """
+        Один проход: обновить все сессии, которым пора.
+
+        Returns:
+            Метрики прохода
+        """
+        async with self._lock:
+            db = get_async_database()
+            started = time.monotonic()
+            result = {
+                'started_at': datetime.now().isoformat(),
+                'due': 0,
+                'error': None,
+                **{outcome: 0 for outcome in OUTCOMES},
+            }
+
+            try:
+                sessions = await db.get_sessions_due_for_refresh(
+                    Config.SESSION_REFRESH_AHEAD_HOURS,
+                    Config.SESSION_REFRESH_STALE_HOURS,
+                    Config.SESSION_REFRESH_BATCH
+                )
+                result['due'] = len(sessions)
+
+                semaphore = asyncio.Semaphore(self.concurrency)
+
+                async def refresh(session: Dict) -> str:
+                    async with semaphore:
+                        return await self.refresh_session(session)
+
+                for outcome in await asyncio.gather(*(refresh(s) for s in sessions)):
+                    result[outcome] += 1
+
+            except Exception as e:
+                logger.error(f"Session refresh failed: {e}", exc_info=True)
+                result['error'] = str(e)
+                self._errors += 1
+
+            result['duration_ms'] = int((time.monotonic() - started) * 1000)
+            self._runs += 1
+            for outcome in OUTCOMES:
+                self._totals[outcome] += result[outcome]
+            self._last_run = result
+
+            if result['due']:
+                logger.info(
+                    f"Session refresh: {result['due']} due, {result['http']} via HTTP, "
+                    f"{result['alive']} alive unchanged, {result['browser']} via browser, {result['expired']} expired, "
+                    f"{result['failed']} failed in {result['duration_ms']} ms"
+                )
+            return result
+
+    async def refresh_session(self, session: Dict) -> str:
+        """
+        Обновить cookies одной сессии и записать результат.
+
+        Returns:
+            Результат: 'http', 'alive', 'browser', 'expired' или 'failed'
+        """
+        db = get_async_database()
+        session_id = session['id']
+
+        try:
+            # 1. HTTP: без запуска браузера
+            try:
+                async with WBInternalClient(session['cookies_encrypted']) as client:
+                    cookies, changed = await client.refresh_cookies()
+            except SessionExpiredError:
+                raise
+            except Exception as e:
+                # WB не ответил - живость неизвестна, проверяем браузером
+                logger.info(f"Session {session_id} HTTP refresh error, trying browser: {e}")
+            else:
+                if changed:
+                    await db.update_browser_session_cookies(
+                        session_id,
+                        encrypt_token(json.dumps(cookies, ensure_ascii=False)),
+                        'http',
+                        Config.SESSION_REFRESH_EXTEND_DAYS
+                    )
+                    return 'http'
+
+                # WB ответил 200 без Set-Cookie: сессия жива, cookies прежние
+                await db.update_browser_session_cookies(
+                    session_id, session['cookies_encrypted'], 'alive',
+                    Config.SESSION_REFRESH_EXTEND_DAYS
+                )
+                return 'alive'
+
+            # 2. Браузер: WB обновляет cookies скриптами страницы
+            from browser.redistribution import WBRedistributionService
+
+            async with self._browser_semaphore:
+                cookies_encrypted = await WBRedistributionService().refresh_session(
+                    session['cookies_encrypted'], session_id, raise_errors=True
+                )
+
+            if cookies_encrypted:
+                await db.update_browser_session_cookies(
+                    session_id, cookies_encrypted, 'browser', Config.SESSION_REFRESH_EXTEND_DAYS
+                )
+                return 'browser'
+
+            error = "Browser refresh redirected to login"
+
+        except SessionExpiredError as e:
+            logger.info(f"Session {session_id} of user {session['user_id']} rejected by WB: {e}")
+            await db.record_session_refresh_failure(session_id, 'expired', str(e))
+            await db.update_browser_session_status(session_id, 'expired')
+            return 'expired'
+
+        except Exception as e:
+            # Сбой браузера или таймаут - не признак истёкшей сессии
+            logger.warning(f"Session {session_id} refresh error: {e}")
+            await db.record_session_refresh_failure(session_id, 'failed', str(e)[:500], count=False)
+            return 'failed'
+
+        failures = await db.record_session_refresh_failure(session_id, 'failed', error)
+        if failures >= Config.SESSION_REFRESH_MAX_FAILURES:
+            logger.warning(f"Session {session_id} failed to refresh {failures} times, marking expired")
+            await db.update_browser_session_status(session_id, 'expired')
+            return 'expired'
+        return 'failed'
+
+    async def _run_loop(self) -> None:
+        """Запуск по расписанию"""
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Запустить периодическое обновление в текущем event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_loop())
+            logger.info(f"Session refresh scheduled every {self.interval / 60:g} min")
+
+    async def stop(self) -> None:
+        """Остановить периодическое обновление"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict:
+        """Метрики обновления сессий"""
+        return {
+            'enabled': Config.SESSION_REFRESH_ENABLED,
+            'interval_minutes': self.interval / 60,
+            'ahead_hours': Config.SESSION_REFRESH_AHEAD_HOURS,
+            'stale_hours': Config.SESSION_REFRESH_STALE_HOURS,
+            'concurrency': self.concurrency,
+            'running': self._task is not None,
+            'runs': self._runs,
+            'errors': self._errors,
+            'totals': dict(self._totals),
+            'last_run': self._last_run,
+        }
+
+
+_session_refresh_job: Optional[SessionRefreshJob] = None
+
+
+def get_session_refresh_job() -> SessionRefreshJob:
+    """Общий на процесс планировщик обновления сессий"""
+    global _session_refresh_job
+
+    if _session_refresh_job is None:
+        _session_refresh_job = SessionRefreshJob()
+
+    return _session_refresh_job
+
+
+async def shutdown_session_refresh_job() -> None:
+    """Остановить обновление сессий"""
+    global _session_refresh_job
+
+    if _session_refresh_job:
+        await _session_refresh_job.stop()
+        _session_refresh_job = None
@@ -0,0 +1,418 @@
+"""
+Очередь задач на Redis Streams с consumer group.
+
+Отличия от TaskQueue (sorted set):
+- Задача выдаётся через XREADGROUP и остаётся в pending своего consumer
+  до XACK, поэтому доставка at-least-once и при рестарте контейнера
+  задачи не теряются
+- Зависшие у упавшего consumer записи забираются через XAUTOCLAIM
+- Воркеры можно запускать в нескольких контейнерах (уникальный consumer
+  на процесс)
+- Результаты дублируются в stream, чтобы их не терял pub/sub
+
+Данные задач, dead-letter очередь и статистика хранятся как в TaskQueue.
+Порядок выдачи - FIFO по stream. Справедливой ротации по пользователям
+(как у TaskQueue с очередью на пользователя) здесь нет: пользователь с
+большой пачкой задач задерживает остальных. Лимит задач на аккаунт
+соблюдается переносом записи в конец stream (_defer) - при каждом опросе
+занятого аккаунта запись пересоздаётся с новым ID. Если важна
+справедливость между пользователями, используйте QUEUE_BACKEND=redis.
+
+Включается через QUEUE_BACKEND=stream.
+"""
+
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Optional, List, Tuple
+
+from redis.exceptions import ResponseError
+
+from config import Config
+from .queue import TaskQueue, Task, TaskStatus
+from .scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class StreamTaskQueue(TaskQueue):
+    """Очередь задач на Redis Streams"""
+
+    STREAM_KEY = "wb:redistribution:stream"      # Задачи к выдаче (stream)
+    GROUP_NAME = "workers"                       # Consumer group воркеров
+    ENTRIES_KEY = "wb:redistribution:stream:entries"  # task_id -> ID записи stream (hash)
+    RESULTS_STREAM_KEY = "wb:redistribution:results:stream"  # Результаты (stream)
+
+    RESULTS_MAXLEN = 10000
+
+    def __init__(
+        self,
+        redis_url: str = None,
+        scheduler: FairScheduler = None,
+        consumer_name: str = None,
+        claim_idle: int = None
+    ):
+        """
+        Инициализация очереди.
+
+        Args:
+            redis_url: URL Redis
+            scheduler: Планировщик (используется лимит задач на аккаунт)
+            consumer_name: Имя consumer в группе (уникально для процесса)
+            claim_idle: Через сколько секунд без ACK запись забирается у consumer
+        """
+        super().__init__(redis_url, scheduler)
+        self.consumer_name = (
+            consumer_name
+            or Config.QUEUE_CONSUMER_NAME
+            or f"{socket.gethostname()}-{os.getpid()}"
+        )
+        self.claim_idle = claim_idle or Config.QUEUE_CLAIM_IDLE
+
+    async def connect(self) -> None:
+        """Подключение к Redis и создание consumer group"""
+        await super().connect()
+        if not self.is_connected:
+            return
+
+        try:
+            await self._redis.xgroup_create(
+                self.STREAM_KEY, self.GROUP_NAME, id='0', mkstream=True
+            )
+            logger.info(f"Created consumer group {self.GROUP_NAME}")
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                logger.error(f"Failed to create consumer group: {e}")
+                await self.disconnect()
+                return
+
+        logger.info(f"Stream queue consumer: {self.consumer_name}")
+
+    async def _migrate_legacy_queue(self) -> None:
+        """Очереди пользователей (sorted set) stream бэкенд не использует"""
+
+    async def _enqueue(self, task: Task, priority: int) -> None:
+        """
+        Сохранить задачу и добавить запись в stream.
+
+        Args:
+            task: Задача
+            priority: Эффективный приоритет (сохраняется в записи для справки)
+        """
+        task.queued_at = datetime.now().isoformat()
+
+        await self._redis.hset(self.TASKS_KEY, task.id, task.to_json())
+        await self._redis.xadd(self.STREAM_KEY, self._entry_fields(task, priority))
+
+    async def _enqueue_many(self, tasks: List[Task]) -> None:
+        """_enqueue для пачки задач одним MULTI/EXEC pipeline"""
+        queued_at = datetime.now().isoformat()
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for task in tasks:
+                task.queued_at = queued_at
+                pipe.hset(self.TASKS_KEY, task.id, task.to_json())
+                pipe.xadd(self.STREAM_KEY, self._entry_fields(task, task.priority))
+            await pipe.execute()
+
+    @staticmethod
+    def _entry_fields(task: Task, priority: int) -> dict:
+        """Поля записи stream"""
+        return {
+            'task_id': task.id,
+            'user_id': task.user_id,
+            'session_id': task.session_id,
+            'priority': priority,
+        }
+
+    async def _ack(self, entry_id: str) -> None:
+        """Подтвердить и удалить запись (в stream остаются только невыполненные)"""
+        await self._redis.xack(self.STREAM_KEY, self.GROUP_NAME, entry_id)
+        await self._redis.xdel(self.STREAM_KEY, entry_id)
+
+    async def _next_entry(self) -> Optional[Tuple[str, Optional[dict], bool]]:
+        """
+        Следующая запись для этого consumer.
+
+        Сначала забирает записи, зависшие у других consumer дольше claim_idle,
+        затем читает новые.
+
+        Returns:
+            (entry_id, fields, reclaimed) или None
+        """
+        claimed = await self._redis.xautoclaim(
+            self.STREAM_KEY,
+            self.GROUP_NAME,
+            self.consumer_name,
+            min_idle_time=self.claim_idle * 1000,
+            start_id='0-0',
+            count=1
+        )
+        if claimed[1]:
+            entry_id, fields = claimed[1][0]
+            logger.warning(f"Entry {entry_id} reclaimed by {self.consumer_name}")
+            return entry_id, fields, True
+
+        response = await self._redis.xreadgroup(
+            self.GROUP_NAME,
+            self.consumer_name,
+            {self.STREAM_KEY: '>'},
+            count=1
+        )
+        if not response or not response[0][1]:
+            return None
+
+        entry_id, fields = response[0][1][0]
+        return entry_id, fields, False
+
+    async def _defer(self, entry_id: str, fields: dict) -> None:
+        """
+        Перенести запись в конец stream (аккаунт занят).
+
+        Запись получает новый ID; ENTRIES_KEY заполняется только при выдаче
+        задачи, поэтому на отмену и завершение это не влияет.
+        """
+        await self._redis.xadd(self.STREAM_KEY, fields)
+        await self._ack(entry_id)
+
+    async def get_next_task(self) -> Optional[Task]:
+        """
+        Получить следующую задачу из stream.
+
+        Returns:
+            Task или None если новых записей нет или все аккаунты заняты
+        """
+        if not self.is_connected:
+            return None
+
+        try:
+            for _ in range(self.CLAIM_RETRIES):
+                next_entry = await self._next_entry()
+                if not next_entry:
+                    return None
+
+                entry_id, fields, reclaimed = next_entry
+                task_id = fields.get('task_id') if fields else None
+                task_json = await self._redis.hget(self.TASKS_KEY, task_id) if task_id else None
+                if not task_json:
+                    logger.warning(f"Task for entry {entry_id} not found, acknowledging")
+                    await self._ack(entry_id)
+                    continue
+
+                task = Task.from_json(task_json)
+
+                if reclaimed and task.status == TaskStatus.PROCESSING:
+                    # Прошлый владелец не завершил задачу - считаем попытку неудачной
+                    await self._redis.hset(self.ENTRIES_KEY, task.id, entry_id)
+                    await self.complete_task(
+                        task.id,
+                        success=False,
+                        error_message="Task timed out"
+                    )
+                    continue
+
+                if task.status != TaskStatus.PENDING:
+                    # Отменена или уже завершена
+                    await self._ack(entry_id)
+                    continue
+
+                # Резервируем слот аккаунта (increment-then-check)
+                running = await self._redis.hincrby(self.ACTIVE_KEY, task.session_id, 1)
+                if running > self.scheduler.max_per_session:
+                    await self._redis.hincrby(self.ACTIVE_KEY, task.session_id, -1)
+                    await self._defer(entry_id, fields)
+                    continue
+
+                await self._redis.hset(self.ENTRIES_KEY, task.id, entry_id)
+                await self._start_processing(task)
+                await self._redis.hset(self.SERVED_KEY, task.user_id, time.time())
+
+                logger.info(
+                    f"Task {task.id} taken for processing by {self.consumer_name} "
+                    f"(entry {entry_id}, attempt {task.attempts})"
+                )
+                return task
+
+            return None
+
+        except Exception as e:
+            logger.error(f"Failed to get next task: {e}")
+            return None
+
+    async def get_next_batch(self, max_size: int = None) -> List[Task]:
+        """
+        Получить пачку задач.
+
+        Группа выдаёт записи по порядку, забрать из середины stream задачи
+        того же аккаунта нельзя, поэтому пачка состоит из одной задачи.
+        """
+        task = await self.get_next_task()
+        return [task] if task else []
+
+    async def complete_task(
+        self,
+        task_id: str,
+        success: bool,
+        error_message: str = None,
+        screenshot: bytes = None
+    ) -> bool:
+        """Завершить задачу и подтвердить её запись в stream"""
+        if not self.is_connected:
+            return False
+
+        try:
+            entry_id = await self._redis.hget(self.ENTRIES_KEY, task_id)
+            completed = await super().complete_task(
+                task_id, success, error_message, screenshot
+            )
+
+            # Retry уже добавлен в stream новой записью - старую подтверждаем
+            if completed and entry_id:
+                await self._ack(entry_id)
+                await self._redis.hdel(self.ENTRIES_KEY, task_id)
+
+            return completed
+
+        except Exception as e:
+            logger.error(f"Failed to complete task: {e}")
+            return False
+
+    async def cancel_task(self, task_id: str) -> bool:
+        """Отменить задачу (невыданная запись будет пропущена при чтении)"""
+        if not self.is_connected:
+            return False
+
+        try:
+            entry_id = await self._redis.hget(self.ENTRIES_KEY, task_id)
+            cancelled = await super().cancel_task(task_id)
+
+            if cancelled and entry_id:
+                await self._ack(entry_id)
+                await self._redis.hdel(self.ENTRIES_KEY, task_id)
+
+            return cancelled
+
+        except Exception as e:
+            logger.error(f"Failed to cancel task: {e}")
+            return False
+
+    async def _publish_result(self, task: Task, error_message: str = None) -> None:
+        """Опубликовать результат в pub/sub и сохранить в stream результатов"""
+        await super()._publish_result(task, error_message)
+        await self._redis.xadd(
+            self.RESULTS_STREAM_KEY,
+            {
+                'task_id': task.id,
+                'user_id': task.user_id,
+                'status': task.status.value,
+                'error': error_message or '',
+            },
+            maxlen=self.RESULTS_MAXLEN,
+            approximate=True
+        )
+
+    async def _pending_by_user(self) -> dict:
+        """Количество ожидающих задач по пользователям"""
+        counts: dict = {}
+        for task_json in (await self._redis.hgetall(self.TASKS_KEY)).values():
+            task = Task.from_json(task_json)
+            if task.status == TaskStatus.PENDING:
+                counts[task.user_id] = counts.get(task.user_id, 0) + 1
+        return counts
+
+    async def get_pending_entries(self, count: int = 100) -> List[dict]:
+        """
+        Записи, выданные consumer и ещё не подтверждённые (XPENDING).
+
+        Args:
+            count: Максимум записей
+
+        Returns:
+            [{entry_id, task_id, user_id, session_id, consumer, idle_ms, deliveries}]
+        """
+        if not self.is_connected:
+            return []
+
+        try:
+            pending = await self._redis.xpending_range(
+                self.STREAM_KEY, self.GROUP_NAME, min='-', max='+', count=count
+            )
+            if not pending:
+                return []
+
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for entry in pending:
+                    pipe.xrange(self.STREAM_KEY, entry['message_id'], entry['message_id'])
+                ranges = await pipe.execute()
+
+            result = []
+            for entry, found in zip(pending, ranges):
+                fields = found[0][1] if found else {}
+                result.append({
+                    'entry_id': entry['message_id'],
+                    'task_id': fields.get('task_id'),
+                    'user_id': int(fields['user_id']) if fields.get('user_id') else None,
+                    'session_id': int(fields['session_id']) if fields.get('session_id') else None,
+                    'consumer': entry['consumer'],
+                    'idle_ms': entry['time_since_delivered'],
+                    'deliveries': entry['times_delivered'],
+                })
+
+            return sorted(result, key=lambda e: -(e['idle_ms'] or 0))
+
+        except Exception as e:
+            logger.error(f"Failed to get pending entries: {e}")
+            return []
+
+    async def get_stream_stats(self) -> dict:
+        """
+        Статистика stream и consumer group.
+
+        Returns:
+            {length, lag, pending, consumers: [{name, pending, idle_ms}]}
+        """
+        if not self.is_connected:
+            return {'length': 0, 'lag': 0, 'pending': 0, 'consumers': []}
+
+        try:
+            length = await self._redis.xlen(self.STREAM_KEY)
+            groups = await self._redis.xinfo_groups(self.STREAM_KEY)
+            group = next((g for g in groups if g['name'] == self.GROUP_NAME), {})
+            consumers = await self._redis.xinfo_consumers(self.STREAM_KEY, self.GROUP_NAME)
+
+            pending = group.get('pending', 0)
+            # lag есть в XINFO только с Redis 7; подтверждённые записи удаляются,
+            # поэтому без него lag = длина stream - pending
+            lag = group.get('lag')
+            if lag is None:
+                lag = max(length - pending, 0)
+
+            return {
+                'length': length,
+                'lag': lag,
+                'pending': pending,
+                'consumers': [
+                    {
+                        'name': c['name'],
+                        'pending': c['pending'],
+                        'idle_ms': c['idle']
+                    }
+                    for c in consumers
+                ]
+            }
+        except Exception as e:
+            logger.error(f"Failed to get stream stats: {e}")
+            return {'length': 0, 'lag': 0, 'pending': 0, 'consumers': []}
+
+    async def get_queue_stats(self) -> dict:
+        """
+        Получить статистику очереди.
+
+        Returns:
+            Статистика {pending, processing, total, dead_letter, stream}
+        """
+        stats = await super().get_queue_stats()
+        stats['stream'] = await self.get_stream_stats()
+        return stats
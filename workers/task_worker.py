@@ -3,17 +3,26 @@ Worker для обработки задач перемещения из очер
 
 Функционал:
 - Получение задач из Redis очереди
-- Выполнение перемещений через браузер
+- Выполнение перемещений через браузер (пачками по аккаунту)
 - Отправка уведомлений о результате
 """
 
 import asyncio
 import logging
-from typing import Optional, Callable, Awaitable
-
-from .queue import TaskQueue, Task, TaskStatus, get_task_queue
-from browser.redistribution import WBRedistributionService, RedistributionStatus, get_redistribution_service
-from db_factory import get_database
+from typing import Optional, Callable, Awaitable, List
+
+from .queue import TaskQueue, Task, TaskStatus, get_task_queue, set_local_workers
+from browser.redistribution import (
+    WBRedistributionService,
+    RedistributionItem,
+    RedistributionResult,
+    RedistributionStatus,
+    get_redistribution_service,
+)
+from config import Config
+from db_factory import get_async_database
+from utils.diagnostics import bind_user
+from wb_api.internal_client import probe_session
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +34,8 @@ class TaskWorker:
         self,
         worker_id: str = "worker-1",
         poll_interval: float = 1.0,
-        notify_callback: Optional[Callable[[int, str], Awaitable[None]]] = None
+        notify_callback: Optional[Callable[[int, str], Awaitable[None]]] = None,
+        batch_size: int = None
     ):
         """
         Инициализация воркера.
@@ -34,9 +44,11 @@ class TaskWorker:
             worker_id: Уникальный ID воркера
             poll_interval: Интервал опроса очереди (секунды)
             notify_callback: Функция для отправки уведомлений (user_id, message)
+            batch_size: Максимум задач одного аккаунта за один запуск браузера
         """
         self.worker_id = worker_id
         self.poll_interval = poll_interval
+        self.batch_size = batch_size or Config.WORKER_BATCH_SIZE
         self.notify_callback = notify_callback
 
         self._running = False
@@ -51,7 +63,7 @@ class TaskWorker:
         self._redistribution_service = get_redistribution_service()
 
         if not self._task_queue.is_connected:
-            logger.error("Redis not connected, worker cannot start")
+            logger.error("Task queue not connected, worker cannot start")
             return
 
         self._running = True
@@ -68,11 +80,11 @@ class TaskWorker:
 
         while self._running:
             try:
-                # Получаем следующую задачу
-                task = await self._task_queue.get_next_task()
+                # Получаем пачку задач одного аккаунта
+                tasks = await self._task_queue.get_next_batch(self.batch_size)
 
-                if task:
-                    await self._process_task(task)
+                if tasks:
+                    await self._process_batch(tasks)
                 else:
                     # Очередь пуста - ждём
                     await asyncio.sleep(self.poll_interval)
@@ -93,86 +105,136 @@ class TaskWorker:
         Args:
             task: Задача для обработки
         """
-        logger.info(f"Processing task {task.id} (attempt {task.attempts}/{task.max_attempts})")
+        await self._process_batch([task])
+
+    async def _process_batch(self, tasks: List[Task]) -> None:
+        """
+        Обработка пачки задач одной сессии в одном браузерном контексте.
+
+        Args:
+            tasks: Задачи с одинаковым session_id
+        """
+        first = tasks[0]
+        bind_user(first.user_id)
+        for task in tasks:
+            logger.info(f"Processing task {task.id} (attempt {task.attempts}/{task.max_attempts})")
 
-        db = get_database()
+        db = get_async_database()
 
         try:
-            # Получаем сессию браузера
-            session = db.get_browser_session(task.session_id)
+            # Сессия, под которую поставлены задачи (общая для всей пачки)
+            session = await db.get_browser_session_by_id(first.session_id)
+            if not session or session.get('status') != 'active':
+                # Пользователь авторизовался заново после постановки задач
+                # (SMS, импорт cookies, refresh) - старая сессия деактивирована,
+                # выполняем под текущей активной
+                current = await db.get_browser_session(first.user_id)
+                if current:
+                    logger.info(
+                        f"Session {first.session_id} replaced, running {len(tasks)} "
+                        f"tasks of user {first.user_id} under session {current['id']}"
+                    )
+                    session = current
+            error = None
             if not session:
-                await self._complete_task(task, False, "Сессия не найдена")
+                error = "Сессия не найдена"
+            elif session.get('status') != 'active':
+                error = "Сессия истекла. Авторизуйтесь заново: /auth"
+            elif not session.get('cookies_encrypted'):
+                error = "Cookies не найдены"
+
+            elif await probe_session(session['cookies_encrypted'], session['id']) is False:
+                # Мёртвую сессию видно по HTTP - браузер не запускаем
+                await db.update_browser_session_status(session['id'], 'expired')
+                error = "Сессия истекла. Авторизуйтесь заново: /auth"
+
+            if error:
+                for task in tasks:
+                    await self._complete_task(task, False, error)
                 return
 
-            if session.get('status') != 'active':
-                await self._complete_task(task, False, "Сессия истекла. Авторизуйтесь заново: /auth")
-                return
+            # Выполняем перемещения
+            results = await self._redistribution_service.execute_batch(
+                cookies_encrypted=session['cookies_encrypted'],
+                session_id=session['id'],
+                items=[
+                    RedistributionItem(
+                        nm_id=task.nm_id,
+                        source_warehouse_id=task.source_warehouse_id,
+                        target_warehouse_id=task.target_warehouse_id,
+                        quantity=task.quantity
+                    )
+                    for task in tasks
+                ]
+            )
 
-            cookies_encrypted = session.get('cookies_encrypted')
-            if not cookies_encrypted:
-                await self._complete_task(task, False, "Cookies не найдены")
-                return
+            for task, result in zip(tasks, results):
+                await self._handle_result(task, result, db)
+
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(tasks)} tasks: {e}", exc_info=True)
+            for task in tasks:
+                await self._complete_task(task, False, f"Внутренняя ошибка: {str(e)}")
+
+    async def _handle_result(self, task: Task, result: RedistributionResult, db) -> None:
+        """
+        Обработка результата одного перемещения.
 
-            # Выполняем перемещение
-            result = await self._redistribution_service.execute_redistribution(
-                cookies_encrypted=cookies_encrypted,
-                nm_id=task.nm_id,
-                source_warehouse_id=task.source_warehouse_id,
-                target_warehouse_id=task.target_warehouse_id,
-                quantity=task.quantity
+        Args:
+            task: Задача
+            result: Результат перемещения
+            db: Асинхронный адаптер БД
+        """
+        if result.status == RedistributionStatus.SUCCESS:
+            # Успех
+            await self._complete_task(
+                task,
+                success=True,
+                message=f"Перемещение выполнено! ID: {result.supply_id or 'N/A'}"
             )
 
-            # Обрабатываем результат
-            if result.status == RedistributionStatus.SUCCESS:
-                # Успех
-                await self._complete_task(
-                    task,
-                    success=True,
-                    message=f"Перемещение выполнено! ID: {result.supply_id or 'N/A'}"
-                )
-
-                # Обновляем статус в БД
-                db.update_redistribution_request(
-                    task.request_id,
-                    status='completed',
-                    supply_id=result.supply_id
-                )
-
-            elif result.status == RedistributionStatus.NO_QUOTA:
-                # Нет квоты - ставим в очередь повторно
-                await self._complete_task(
-                    task,
-                    success=False,
-                    error_message="Нет квоты. Задача вернётся в очередь при появлении слотов."
-                )
-
-            elif result.status == RedistributionStatus.SESSION_EXPIRED:
-                # Сессия истекла - деактивируем
-                db.deactivate_browser_session(task.session_id)
-                await self._complete_task(
-                    task,
-                    success=False,
-                    error_message="Сессия истекла. Авторизуйтесь заново: /auth"
-                )
+            # Обновляем статус в БД
+            await db.update_redistribution_request(
+                task.request_id,
+                status='completed',
+                supply_id=result.supply_id
+            )
 
-            else:
-                # Другая ошибка
-                await self._complete_task(
-                    task,
-                    success=False,
-                    error_message=result.message
-                )
+        elif result.status == RedistributionStatus.NO_QUOTA:
+            # Нет квоты - ставим в очередь повторно
+            await self._complete_task(
+                task,
+                success=False,
+                error_message="Нет квоты. Задача вернётся в очередь при появлении слотов.",
+                screenshot=result.screenshot
+            )
 
-        except Exception as e:
-            logger.error(f"Error processing task {task.id}: {e}", exc_info=True)
-            await self._complete_task(task, False, f"Внутренняя ошибка: {str(e)}")
+        elif result.status == RedistributionStatus.SESSION_EXPIRED:
+            # Сессия истекла - деактивируем
+            await db.update_browser_session_status(task.session_id, 'expired')
+            await self._complete_task(
+                task,
+                success=False,
+                error_message="Сессия истекла. Авторизуйтесь заново: /auth",
+                screenshot=result.screenshot
+            )
+
+        else:
+            # Другая ошибка
+            await self._complete_task(
+                task,
+                success=False,
+                error_message=result.message,
+                screenshot=result.screenshot
+            )
 
     async def _complete_task(
         self,
         task: Task,
         success: bool,
         message: str = None,
-        error_message: str = None
+        error_message: str = None,
+        screenshot: bytes = None
     ) -> None:
         """
         Завершение задачи.
@@ -182,12 +244,14 @@ class TaskWorker:
             success: Успешно ли выполнена
             message: Сообщение для пользователя (при успехе)
             error_message: Сообщение об ошибке
+            screenshot: Скриншот страницы при ошибке
         """
         # Обновляем статус в очереди
         await self._task_queue.complete_task(
             task.id,
             success=success,
-            error_message=error_message or message
+            error_message=error_message or message,
+            screenshot=screenshot
         )
 
         # Отправляем уведомление пользователю
@@ -203,9 +267,9 @@ class TaskWorker:
                 logger.error(f"Failed to send notification: {e}")
 
         # Обновляем статус в БД
-        db = get_database()
+        db = get_async_database()
         status = 'completed' if success else 'failed'
-        db.update_redistribution_request(task.request_id, status=status)
+        await db.update_redistribution_request(task.request_id, status=status)
 
         logger.info(f"Task {task.id} completed: success={success}")
 
@@ -244,10 +308,19 @@ class WorkerPool:
             task = asyncio.create_task(worker.start())
             self._tasks.append(task)
 
+        # API ставит задачи в очередь, только если их есть кому выполнить
+        set_local_workers(self.num_workers)
+
+    async def wait(self) -> None:
+        """Дождаться завершения воркеров (остановка или нет подключения к очереди)"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
     async def stop(self) -> None:
         """Остановка всех воркеров"""
         logger.info("Stopping worker pool")
 
+        if self._tasks:
+            set_local_workers(-len(self._tasks))
         for worker in self._workers:
             await worker.stop()
 
@@ -266,11 +339,13 @@ class WorkerPool:
         """Получить статистику пула"""
         queue = await get_task_queue()
         queue_stats = await queue.get_queue_stats()
+        tenant_stats = await queue.get_tenant_stats()
 
         return {
             'workers': self.num_workers,
             'active_workers': len([w for w in self._workers if w._running]),
-            **queue_stats
+            **queue_stats,
+            **tenant_stats
         }
 
 